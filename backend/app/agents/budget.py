@@ -0,0 +1,78 @@
+"""
+Per-task budgets for agent runs.
+
+Steps and wall time are enforced by the AgentExecutor itself
+(max_iterations / max_execution_time, stopping with a final message).
+The token budget is enforced by a callback that stops the run once the
+LLM turns of the task have used more tokens than allowed.
+"""
+import logging
+import os
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+
+class AgentBudgetExceeded(Exception):
+    """Raised when a task uses more tokens than its budget allows"""
+
+
+class AgentBudget:
+    def __init__(self, max_steps: int = 15, max_tokens: Optional[int] = 60000, max_seconds: Optional[float] = 300):
+        self.max_steps = max_steps
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+
+    @classmethod
+    def from_env(cls) -> "AgentBudget":
+        max_tokens = int(os.getenv("AGENT_MAX_TOKENS", "60000"))
+        max_seconds = float(os.getenv("AGENT_MAX_SECONDS", "300"))
+        return cls(
+            max_steps=int(os.getenv("AGENT_MAX_STEPS", "15")),
+            max_tokens=max_tokens if max_tokens > 0 else None,
+            max_seconds=max_seconds if max_seconds > 0 else None,
+        )
+
+    def override(self, max_steps: Optional[int] = None, max_tokens: Optional[int] = None,
+                 max_seconds: Optional[float] = None) -> "AgentBudget":
+        """Copy of this budget with per-request limits, never above the configured ones"""
+        def lower(value, limit):
+            if value is None or value <= 0:
+                return limit
+            return value if limit is None else min(value, limit)
+
+        return AgentBudget(
+            max_steps=lower(max_steps, self.max_steps),
+            max_tokens=lower(max_tokens, self.max_tokens),
+            max_seconds=lower(max_seconds, self.max_seconds),
+        )
+
+
+class TokenBudgetCallbackHandler(BaseCallbackHandler):
+    """Stops the agent run once the token budget is used up"""
+
+    # Exceptions from this handler must abort the run instead of being logged
+    raise_error = True
+    run_inline = True
+
+    def __init__(self, max_tokens: Optional[int]):
+        self.max_tokens = max_tokens
+        self.used_tokens = 0
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        total = usage.get("total_tokens")
+        if total is None and response.generations and response.generations[0]:
+            message = getattr(response.generations[0][0], "message", None)
+            total = (getattr(message, "usage_metadata", None) or {}).get("total_tokens")
+        self.used_tokens += total or 0
+
+        if self.max_tokens is not None and self.used_tokens > self.max_tokens:
+            logger.warning(f"Agent token budget exceeded: {self.used_tokens} > {self.max_tokens}")
+            raise AgentBudgetExceeded(
+                f"Agent stopped: token budget exceeded ({self.used_tokens} of {self.max_tokens} tokens used)"
+            )
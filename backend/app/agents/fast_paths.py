@@ -0,0 +1,109 @@
+"""
+Direct implementations of deterministic agent tasks.
+
+Adding a component only needs the component code and one file write, so
+instead of running the agent loop (several LLM turns plus tool calls) it
+is done with a single completion and a direct tool call. Callers fall back
+to the agent when the fast path cannot produce a result.
+"""
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.services.groq_client import post_chat_completion
+from app.services.llm_scheduler import INTERACTIVE
+from app.services.metrics import AGENT_TASKS, AGENT_TASK_DURATION
+from app.services.tracing import span
+from .memory import remember_action
+from .shell_agent import AGENT_MODEL, CreateReactComponentTool
+
+logger = logging.getLogger(__name__)
+
+COMPONENT_NAME_PATTERN = re.compile(r"^[A-Z][A-Za-z0-9]*$")
+
+
+def _extract_code(content: str) -> str:
+    match = re.search(r"```(?:jsx|tsx|javascript|typescript|js|ts)?\s*\n(.*?)```", content, re.DOTALL)
+    return (match.group(1) if match else content).strip()
+
+
+def generate_component_code(app_name: str, component_name: str, description: str,
+                            is_typescript: bool = False, priority: int = INTERACTIVE) -> Optional[str]:
+    """
+    Generate the code of one React component with a single completion.
+
+    Returns:
+        The component source, or None if the call failed or returned unusable code
+    """
+    language = "TypeScript (.tsx)" if is_typescript else "JavaScript (.jsx)"
+    payload = {
+        "model": AGENT_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are an expert React developer. You write functional components with hooks, "
+                                          "prop validation, organized imports and meaningful comments."},
+            {"role": "user", "content": f"Write a React component named {component_name} in {language} for the "
+                                        f"{app_name} application with the following description: {description}\n"
+                                        f"The component is saved as src/components/{component_name}"
+                                        f"{'.tsx' if is_typescript else '.jsx'} and must be the default export. "
+                                        f"Only return the complete code without any explanations."}
+        ],
+        "temperature": 0.2,
+        "max_tokens": 4000
+    }
+    try:
+        response = post_chat_completion(payload, span_name="llm.component", priority=priority)
+    except Exception as e:
+        logger.warning(f"Component generation for {component_name} failed: {e}")
+        return None
+    if response.status_code != 200:
+        logger.warning(f"Component generation for {component_name} got Groq status {response.status_code}")
+        return None
+
+    code = _extract_code(response.json()["choices"][0]["message"]["content"])
+    if component_name not in code:
+        logger.warning(f"Component generation for {component_name} returned unusable code")
+        return None
+    return code
+
+
+def add_component_direct(workspace_dir: str, app_name: str, component_name: str,
+                         description: str) -> Optional[Dict[str, Any]]:
+    """
+    Generate and write a React component without the agent loop.
+
+    Returns:
+        A result dictionary like run_agent_task, or None if the caller
+        should fall back to the agent
+    """
+    if not COMPONENT_NAME_PATTERN.match(component_name):
+        return None
+
+    app_path = Path(workspace_dir) / app_name
+    is_typescript = (app_path / "tsconfig.json").exists()
+
+    start = time.perf_counter()
+    with span("agent.fast_path", task="add_component", workspace=workspace_dir):
+        code = generate_component_code(app_name, component_name, description, is_typescript)
+        if code is None:
+            logger.warning("Fast path for add-component failed, falling back to the agent")
+            return None
+
+        output = CreateReactComponentTool(workspace_dir=workspace_dir).invoke({
+            "app_name": app_name,
+            "component_name": component_name,
+            "component_code": code,
+            "is_typescript": is_typescript,
+        })
+
+    remember_action(
+        workspace_dir, f"Add component {component_name} to {app_name}: {description}", output,
+        [f"create_react_component(app_name={app_name}, component_name={component_name})"]
+    )
+    AGENT_TASK_DURATION.observe(time.perf_counter() - start)
+    success = not output.startswith("Error")
+    AGENT_TASKS.labels("success" if success else "error").inc()
+    if not success:
+        return {"success": False, "error": output, "workspace_dir": workspace_dir}
+    return {"success": True, "output": output, "workspace_dir": workspace_dir}
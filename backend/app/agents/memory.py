@@ -0,0 +1,238 @@
+"""
+Persistent agent memory per workspace.
+
+Stored in ``<workspace>/.codegen/agent_memory.json`` and injected into the
+agent prompt so follow-up tasks do not rediscover the project by reading
+files and listing directories. It holds:
+
+- a compact project map (files grouped by directory),
+- per-file summaries (exports, local imports, dependencies, ...) keyed by
+  content hash, so only changed files are re-summarized,
+- the most recent actions (task, tool calls, outcome).
+
+The rendered text is trimmed to a token budget, most useful parts first.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from ..services.workspace_files import estimate_tokens, exported_names, scan, unchanged
+
+logger = logging.getLogger(__name__)
+
+MEMORY_DIR = ".codegen"
+MEMORY_FILE = "agent_memory.json"
+MEMORY_VERSION = 1
+
+# Approximate prompt budget for the rendered memory
+DEFAULT_MEMORY_TOKENS = int(os.getenv("AGENT_MEMORY_TOKENS", "1500"))
+MAX_RECENT_ACTIONS = 10
+MAX_FILES = 400
+MAX_SUMMARY_BYTES = 256 * 1024
+
+SUMMARIZED_SUFFIXES = {".js", ".jsx", ".ts", ".tsx", ".css", ".json", ".html", ".md"}
+
+LOCAL_IMPORT_PATTERN = re.compile(r"import\s+(?:[^'\"]+\s+from\s+)?['\"](\.{1,2}/[^'\"]+)['\"]")
+HOOK_PATTERN = re.compile(r"\b(use[A-Z]\w*)\(")
+CSS_SELECTOR_PATTERN = re.compile(r"^\s*([^{}@/][^{}]*?)\s*\{", re.MULTILINE)
+
+_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_locks_guard = threading.Lock()
+
+
+def _summarize(path: Path, content: str) -> str:
+    """One-line, deterministic summary of a source file"""
+    suffix = path.suffix.lower()
+    if path.name == "package.json":
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return "package.json (invalid JSON)"
+        deps = sorted(data.get("dependencies") or {})
+        scripts = sorted(data.get("scripts") or {})
+        return f"deps: {', '.join(deps) or '-'}; scripts: {', '.join(scripts) or '-'}"
+    if suffix in {".js", ".jsx", ".ts", ".tsx"}:
+        exports = exported_names(content)
+        imports = list(dict.fromkeys(LOCAL_IMPORT_PATTERN.findall(content)))
+        hooks = sorted(set(HOOK_PATTERN.findall(content)))
+        parts = []
+        if exports:
+            parts.append(f"exports {', '.join(exports)}")
+        if imports:
+            parts.append(f"imports {', '.join(imports)}")
+        if hooks:
+            parts.append(f"hooks {', '.join(hooks)}")
+        parts.append(f"{content.count(chr(10)) + 1} lines")
+        return "; ".join(parts)
+    if suffix == ".css":
+        selectors = [s.strip() for s in CSS_SELECTOR_PATTERN.findall(content)]
+        shown = ", ".join(selectors[:8]) + (", ..." if len(selectors) > 8 else "")
+        return f"{len(selectors)} rules: {shown}"
+    return f"{content.count(chr(10)) + 1} lines"
+
+
+class WorkspaceMemory:
+    def __init__(self, workspace_dir: str, data: Optional[Dict[str, Any]] = None):
+        self.workspace_dir = Path(workspace_dir)
+        data = data or {}
+        self.files: Dict[str, Dict[str, Any]] = data.get("files", {})
+        self.actions: List[Dict[str, Any]] = data.get("actions", [])
+
+    @property
+    def path(self) -> Path:
+        return self.workspace_dir / MEMORY_DIR / MEMORY_FILE
+
+    @classmethod
+    def load(cls, workspace_dir: str) -> "WorkspaceMemory":
+        path = Path(workspace_dir) / MEMORY_DIR / MEMORY_FILE
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("version") != MEMORY_VERSION:
+                data = None
+        except (OSError, ValueError):
+            data = None
+        return cls(workspace_dir, data)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"version": MEMORY_VERSION, "files": self.files, "actions": self.actions}
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def refresh(self) -> int:
+        """Update the project map and re-summarize changed files; return how many changed"""
+        seen = {}
+        changed = 0
+        files, _ = scan(self.workspace_dir, MAX_FILES)
+        for rel, path, stat in files:
+            entry = self.files.get(rel)
+            if unchanged(entry, stat):
+                seen[rel] = entry
+                continue
+
+            entry = {"mtime": stat.st_mtime, "size": stat.st_size}
+            if path.suffix.lower() in SUMMARIZED_SUFFIXES and stat.st_size <= MAX_SUMMARY_BYTES:
+                try:
+                    raw = path.read_bytes()
+                except OSError:
+                    continue
+                entry["hash"] = hashlib.sha1(raw).hexdigest()
+                previous = self.files.get(rel)
+                if previous and previous.get("hash") == entry["hash"] and "summary" in previous:
+                    # Touched but unchanged
+                    entry["summary"] = previous["summary"]
+                else:
+                    entry["summary"] = _summarize(path, raw.decode("utf-8", errors="replace"))
+                    changed += 1
+            seen[rel] = entry
+        self.files = seen
+        return changed
+
+    def record_action(self, task: str, outcome: str, tool_calls: Optional[List[str]] = None):
+        self.actions.append({
+            "time": round(time.time()),
+            "task": task[:300],
+            "tool_calls": (tool_calls or [])[:20],
+            "outcome": outcome[:300],
+        })
+        self.actions = self.actions[-MAX_RECENT_ACTIONS:]
+
+    def _project_map(self) -> List[str]:
+        by_dir: Dict[str, List[str]] = defaultdict(list)
+        for rel in self.files:
+            directory, _, name = rel.rpartition("/")
+            by_dir[directory or "."].append(name)
+        return [f"{directory}/: {', '.join(names)}" for directory, names in sorted(by_dir.items())]
+
+    def render(self, max_tokens: int = DEFAULT_MEMORY_TOKENS) -> str:
+        """Prompt text within max_tokens: recent actions, project map, then file summaries"""
+        if not self.files and not self.actions:
+            return ""
+
+        sections = []
+        if self.actions:
+            lines = ["Recent actions (oldest first):"]
+            for action in self.actions[-5:]:
+                tools = f" [{'; '.join(action['tool_calls'])}]" if action.get("tool_calls") else ""
+                lines.append(f"- {action['task']}{tools} -> {action['outcome']}")
+            sections.append(lines)
+        if self.files:
+            sections.append(["Project files:"] + self._project_map())
+            summaries = [f"- {rel}: {entry['summary']}" for rel, entry in sorted(
+                self.files.items(), key=lambda item: (Path(item[0]).name != "package.json", item[0])
+            ) if entry.get("summary")]
+            if summaries:
+                sections.append(["File summaries:"] + summaries)
+
+        budget = max_tokens
+        rendered = []
+        for lines in sections:
+            for index, line in enumerate(lines):
+                cost = estimate_tokens(line)
+                if cost > budget:
+                    if index > 0:
+                        rendered.append("...")
+                    return "\n".join(rendered)
+                rendered.append(line)
+                budget -= cost
+        return "\n".join(rendered)
+
+
+@contextmanager
+def open_memory(workspace_dir: str) -> Iterator[WorkspaceMemory]:
+    """Load a workspace's memory, exclusive per workspace, and save it afterwards"""
+    key = str(Path(workspace_dir).resolve())
+    with _locks_guard:
+        lock = _locks[key]
+    with lock:
+        memory = WorkspaceMemory.load(workspace_dir)
+        yield memory
+        try:
+            memory.save()
+        except OSError as e:
+            logger.warning(f"Could not save agent memory for {workspace_dir}: {e}")
+
+
+def memory_context(workspace_dir: str, max_tokens: int = DEFAULT_MEMORY_TOKENS) -> str:
+    """Refresh the memory of a workspace and render it for the prompt"""
+    try:
+        with open_memory(workspace_dir) as memory:
+            changed = memory.refresh()
+            if changed:
+                logger.info(f"Agent memory: re-summarized {changed} files in {workspace_dir}")
+            return memory.render(max_tokens)
+    except Exception as e:
+        logger.warning(f"Could not load agent memory for {workspace_dir}: {e}")
+        return ""
+
+
+def remember_action(workspace_dir: str, task: str, outcome: str, tool_calls: Optional[List[str]] = None):
+    """Record a finished task and refresh the project map"""
+    try:
+        with open_memory(workspace_dir) as memory:
+            memory.record_action(task, outcome, tool_calls)
+            memory.refresh()
+    except Exception as e:
+        logger.warning(f"Could not update agent memory for {workspace_dir}: {e}")
+
+
+def describe_tool_call(tool: str, tool_input: Any, max_chars: int = 80) -> str:
+    """Short description of a tool call for the action log (file contents are left out)"""
+    if isinstance(tool_input, dict):
+        shown = {k: v for k, v in tool_input.items() if k not in {"file_content", "component_code", "text"}}
+        text = ", ".join(f"{k}={v}" for k, v in shown.items())
+    else:
+        text = str(tool_input)
+    text = " ".join(text.split())
+    if len(text) > max_chars:
+        text = text[:max_chars - 3] + "..."
+    return f"{tool}({text})"
@@ -0,0 +1,224 @@
+"""
+Async subprocess execution for the agent tools.
+
+Commands run without blocking the event loop, with output streamed as it is
+produced instead of buffered until exit. Captured output is bounded: the
+first ``head_chars`` and the last ``tail_chars`` are kept and the middle is
+dropped, which also keeps tool observations small enough for the LLM
+context. Commands are killed (with their whole process group) on timeout or
+when the awaiting task is cancelled.
+"""
+import asyncio
+import codecs
+import concurrent.futures
+import logging
+import os
+import signal
+import time
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Union
+
+from app.services.event_bus import event_bus
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable per call
+DEFAULT_TIMEOUT = float(os.getenv("AGENT_COMMAND_TIMEOUT", "600"))
+DEFAULT_HEAD_CHARS = 4000
+DEFAULT_TAIL_CHARS = 8000
+
+OutputCallback = Callable[[str, str], None]
+
+
+class OutputBuffer:
+    """Keeps the first head_chars and a ring buffer of the last tail_chars"""
+
+    def __init__(self, head_chars: int = DEFAULT_HEAD_CHARS, tail_chars: int = DEFAULT_TAIL_CHARS):
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self._head: List[str] = []
+        self._head_size = 0
+        self._tail: Deque[str] = deque()
+        self._tail_size = 0
+        self.total_chars = 0
+
+    def write(self, text: str):
+        self.total_chars += len(text)
+
+        if self._head_size < self.head_chars:
+            take = text[:self.head_chars - self._head_size]
+            self._head.append(take)
+            self._head_size += len(take)
+            text = text[len(take):]
+
+        if not text or self.tail_chars <= 0:
+            return
+
+        self._tail.append(text)
+        self._tail_size += len(text)
+        while self._tail_size > self.tail_chars:
+            overflow = self._tail_size - self.tail_chars
+            first = self._tail[0]
+            if len(first) <= overflow:
+                self._tail.popleft()
+                self._tail_size -= len(first)
+            else:
+                self._tail[0] = first[overflow:]
+                self._tail_size -= overflow
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_chars > self._head_size + self._tail_size
+
+    def render(self) -> str:
+        """Captured output with an omission marker where the middle was dropped"""
+        head = "".join(self._head)
+        tail = "".join(self._tail)
+        if not self.truncated:
+            return head + tail
+        omitted = self.total_chars - self._head_size - self._tail_size
+        return f"{head}\n... [{omitted} characters omitted] ...\n{tail}"
+
+
+class CommandResult:
+    def __init__(self, command: str, returncode: Optional[int], output: str, duration: float,
+                 total_chars: int, truncated: bool, timed_out: bool = False):
+        self.command = command
+        self.returncode = returncode
+        self.output = output
+        self.duration = duration
+        self.total_chars = total_chars
+        self.truncated = truncated
+        self.timed_out = timed_out
+
+    def observation(self) -> str:
+        """Text returned to the LLM as the tool result"""
+        text = self.output
+        if self.timed_out:
+            text += f"\nCommand timed out after {self.duration:.0f}s and was killed"
+        elif self.returncode:
+            text += f"\nCommand exited with return code {self.returncode}"
+        return text
+
+
+def _kill(process: asyncio.subprocess.Process):
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == "nt":
+            process.kill()
+        else:
+            # The command runs in its own session, so this also kills its children (npm, node, ...)
+            os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def run_command(
+    command: Union[str, List[str]],
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+    on_output: Optional[OutputCallback] = None,
+    log_channel: Optional[str] = None,
+    head_chars: int = DEFAULT_HEAD_CHARS,
+    tail_chars: int = DEFAULT_TAIL_CHARS,
+    preexec_fn: Optional[Callable[[], None]] = None,
+) -> CommandResult:
+    """
+    Run a command and stream its output.
+
+    Args:
+        command: Shell string, or an argv list to run without a shell
+        cwd: Working directory for the command
+        env: Full environment for the command (defaults to the current one)
+        timeout: Wall-clock limit in seconds; the process group is killed after it
+        on_output: Called with (stream, text) for every chunk of output
+        log_channel: Event bus channel that receives live output events
+        head_chars / tail_chars: How much output to keep for the result
+        preexec_fn: Runs in the child before exec (POSIX only), e.g. to apply limits
+
+    Returns:
+        A CommandResult with bounded, interleaved stdout/stderr
+    """
+    display = command if isinstance(command, str) else " ".join(command)
+    command_id = uuid.uuid4().hex[:8]
+    buffer = OutputBuffer(head_chars, tail_chars)
+    popen_kwargs = {"cwd": cwd, "env": env, "stdout": asyncio.subprocess.PIPE, "stderr": asyncio.subprocess.PIPE}
+    if os.name != "nt":
+        popen_kwargs["start_new_session"] = True
+        if preexec_fn is not None:
+            popen_kwargs["preexec_fn"] = preexec_fn
+
+    def emit(event: Dict):
+        if log_channel:
+            event_bus.publish(log_channel, {"command_id": command_id, **event})
+
+    logger.info(f"Running command: {display}")
+    emit({"type": "command_started", "command": display, "cwd": cwd})
+    start = time.perf_counter()
+
+    if isinstance(command, str):
+        process = await asyncio.create_subprocess_shell(command, **popen_kwargs)
+    else:
+        process = await asyncio.create_subprocess_exec(*command, **popen_kwargs)
+
+    async def pump(stream: asyncio.StreamReader, name: str):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            chunk = await stream.read(4096)
+            text = decoder.decode(chunk, final=not chunk)
+            if text:
+                buffer.write(text)
+                if on_output:
+                    on_output(name, text)
+                emit({"type": "command_output", "stream": name, "data": text})
+            if not chunk:
+                break
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(pump(process.stdout, "stdout"), pump(process.stderr, "stderr"), process.wait()),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        timed_out = True
+        _kill(process)
+        await process.wait()
+    except asyncio.CancelledError:
+        _kill(process)
+        emit({"type": "command_finished", "cancelled": True})
+        raise
+
+    duration = time.perf_counter() - start
+    result = CommandResult(
+        display, process.returncode, buffer.render(), duration,
+        buffer.total_chars, buffer.truncated, timed_out,
+    )
+    emit({
+        "type": "command_finished",
+        "returncode": result.returncode,
+        "timed_out": timed_out,
+        "duration": round(duration, 3),
+        "output_chars": buffer.total_chars,
+    })
+    return result
+
+
+_sync_executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="agent-cmd")
+
+
+def run_command_sync(command: Union[str, List[str]], **kwargs) -> CommandResult:
+    """
+    Blocking wrapper around run_command for synchronous tool code.
+
+    Runs on a private event loop; if the calling thread already has a running
+    loop, the command is driven from a helper thread instead.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(run_command(command, **kwargs))
+    return _sync_executor.submit(asyncio.run, run_command(command, **kwargs)).result()
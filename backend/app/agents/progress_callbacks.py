@@ -0,0 +1,57 @@
+import uuid
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.services.event_bus import event_bus
+
+
+class ProgressCallbackHandler(BaseCallbackHandler):
+    """
+    Publishes the steps of an agent run on the workspace's event channel, so
+    clients watching the workspace (see app.services.live_updates) can show
+    what the agent is doing.
+    """
+
+    # Run synchronously even inside async agent runs, so events are published in order
+    run_inline = True
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.job_id = uuid.uuid4().hex[:12]
+        self.step = 0
+
+    def publish(self, event_type: str, **fields: Any):
+        if event_bus.has_subscribers(self.channel):
+            event_bus.publish(self.channel, {"type": event_type, "job_id": self.job_id, **fields})
+
+    def _progress(self, stage: str, **fields: Any):
+        self.publish("agent_progress", stage=stage, step=self.step, **fields)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *,
+                            run_id: UUID, **kwargs: Any) -> None:
+        self.step += 1
+        self._progress("llm")
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self.step += 1
+        self._progress("llm")
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._progress("tool", tool=(serialized or {}).get("name") or "tool", input=(input_str or "")[:200])
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._progress("tool_finished", success=True, output_chars=len(str(output)))
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._progress("tool_finished", success=False, error=str(error))
+
+    def started(self, task: str):
+        self.publish("agent_started", task=task)
+
+    def finished(self, error: Optional[BaseException] = None):
+        if error is not None:
+            self.publish("agent_finished", success=False, steps=self.step, error=str(error))
+        else:
+            self.publish("agent_finished", success=True, steps=self.step)
@@ -0,0 +1,67 @@
+import asyncio
+import os
+from collections import deque
+from typing import Any, Deque, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from app.services.llm_scheduler import BACKGROUND, LLMRateLimited, Reservation, llm_scheduler
+
+from .tracing_callbacks import token_usage
+
+# Agent prompts carry the tool schemas and the scratchpad, so a turn is
+# reserved at a fixed size rather than estimated from the messages; the
+# reservation is settled with the reported usage when the turn ends
+AGENT_TOKENS_PER_CALL = int(os.getenv("AGENT_TOKENS_PER_CALL", "3000"))
+
+
+class SchedulerRateLimiter(BaseRateLimiter, BaseCallbackHandler):
+    """
+    Admits the LLM calls of agent runs through the shared Groq scheduler
+    (app.services.llm_scheduler), at background priority so interactive
+    generation is served first.
+
+    Also register it as a callback of the model it limits: each call's
+    reservation is settled with the tokens the API reports when the call
+    ends. The turns of a model are sequential, so reservations are settled
+    in the order they were made.
+
+    Raises LLMRateLimited when a turn cannot be admitted within the
+    background maximum wait; the agent task then fails like any other error.
+    """
+
+    # Settle before the next turn is admitted, also in async agent runs
+    run_inline = True
+
+    def __init__(self, priority: int = BACKGROUND, tokens_per_call: int = AGENT_TOKENS_PER_CALL):
+        self.priority = priority
+        self.tokens_per_call = tokens_per_call
+        self._reservations: Deque[Reservation] = deque()
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        if blocking:
+            reservation = llm_scheduler.acquire(self.tokens_per_call, self.priority)
+        else:
+            try:
+                reservation = llm_scheduler.acquire(self.tokens_per_call, self.priority, max_wait=0.0)
+            except LLMRateLimited:
+                return False
+        self._reservations.append(reservation)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        return await asyncio.to_thread(self.acquire, blocking=blocking)
+
+    def _settle(self, used_tokens: Optional[int]):
+        if self._reservations:
+            llm_scheduler.settle(self._reservations.popleft(), used_tokens)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        self._settle(token_usage(response).get("total_tokens"))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        # Whether the failed call used tokens is unknown; keep the reservation
+        self._settle(None)
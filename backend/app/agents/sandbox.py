@@ -0,0 +1,460 @@
+"""
+Sandboxed execution of agent commands.
+
+Every command an agent tool starts goes through here. It is:
+
+- scheduled by a node-wide fair scheduler: a global cap on concurrent
+  commands, commands of one workspace run one at a time, waiting
+  workspaces are served round-robin, and heavy commands (npm install,
+  builds, create-react-app) can only take part of the slots so interactive
+  commands always find one free;
+- run in its own process group with a scrubbed environment (API keys and
+  other server secrets are not passed through), rlimits on CPU time,
+  memory, file size and core dumps, a wall-time limit and bounded output;
+- optionally placed in a per-workspace cgroup v2 (memory, CPU quota and
+  process count for the whole process tree) when ``AGENT_CGROUP_ROOT``
+  points at a writable, delegated cgroup directory.
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+
+from app.services.metrics import COMMAND_QUEUE_WAIT, COMMANDS_RUNNING
+from .process_runner import CommandResult, DEFAULT_TIMEOUT, run_command, run_command_sync
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Environment variables passed through to commands; everything else is dropped
+ENV_PASSTHROUGH = (
+    "PATH", "HOME", "USER", "LOGNAME", "SHELL", "LANG", "LC_ALL", "LC_CTYPE",
+    "TERM", "TMPDIR", "TZ", "NVM_DIR", "NODE_PATH", "SYSTEMROOT", "COMSPEC", "PATHEXT",
+)
+
+# Commands that install packages or build/test a project
+HEAVY_COMMAND_PATTERN = re.compile(
+    r"\b(npm|pnpm|yarn)\s+(install|i|ci|add|run\s+build|build|test)\b"
+    r"|\bnpx\s+create-react-app\b|\bpip\s+install\b|\bwebpack\b|\bvite\s+build\b"
+)
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    value = int(value)
+    return value if value > 0 else None
+
+
+class ResourceLimits:
+    """Per-command limits; None disables a limit"""
+
+    def __init__(
+        self,
+        cpu_seconds: Optional[int] = 600,
+        memory_mb: Optional[int] = 4096,
+        max_file_mb: Optional[int] = 1024,
+        max_processes: Optional[int] = 512,
+        wall_time: Optional[float] = DEFAULT_TIMEOUT,
+        output_chars: int = 12000,
+        heavy_nice: int = 10,
+    ):
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_file_mb = max_file_mb
+        self.max_processes = max_processes
+        self.wall_time = wall_time
+        self.output_chars = output_chars
+        self.heavy_nice = heavy_nice
+
+    @classmethod
+    def from_env(cls) -> "ResourceLimits":
+        return cls(
+            cpu_seconds=_env_int("AGENT_CPU_SECONDS", 600),
+            memory_mb=_env_int("AGENT_MEMORY_MB", 4096),
+            max_file_mb=_env_int("AGENT_MAX_FILE_MB", 1024),
+            max_processes=_env_int("AGENT_MAX_PROCESSES", 512),
+            wall_time=DEFAULT_TIMEOUT,
+            output_chars=_env_int("AGENT_OUTPUT_CHARS", 12000) or 12000,
+        )
+
+
+def is_heavy_command(command: Union[str, List[str]]) -> bool:
+    text = command if isinstance(command, str) else " ".join(command)
+    return bool(HEAVY_COMMAND_PATTERN.search(text))
+
+
+def workspace_key(workspace_dir: Optional[str]) -> str:
+    """Scheduling and cgroup key of a workspace"""
+    return Path(workspace_dir).resolve().name if workspace_dir else "default"
+
+
+def sandbox_environment(workspace_dir: Optional[str] = None) -> Dict[str, str]:
+    """
+    Environment for commands started by agent tools.
+
+    Built per call from an allowlist of the process environment, so secrets
+    such as GROQ_API_KEY never reach model-chosen commands and tools never
+    need to mutate os.environ (which is shared by all concurrent tasks).
+    Extra variables can be allowed with AGENT_ENV_PASSTHROUGH (comma separated).
+    """
+    allowed = set(ENV_PASSTHROUGH)
+    allowed.update(name.strip() for name in os.getenv("AGENT_ENV_PASSTHROUGH", "").split(",") if name.strip())
+
+    env = {name: value for name, value in os.environ.items()
+           if name in allowed or name.lower().startswith("npm_config_")}
+    # Keep npm/create-react-app non-interactive
+    env["CI"] = "true"
+    env["BROWSER"] = "none"
+    if workspace_dir:
+        env["WORKSPACE_DIR"] = str(Path(workspace_dir).resolve())
+    return env
+
+
+class CgroupManager:
+    """Per-workspace cgroup v2 groups below a delegated root directory"""
+
+    def __init__(self, root: Optional[str]):
+        self.root = Path(root) if root else None
+        self.enabled = bool(self.root and self.root.is_dir() and os.access(self.root, os.W_OK))
+        self._prepared: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if root and not self.enabled:
+            logger.warning(f"AGENT_CGROUP_ROOT {root} is not a writable directory; cgroup limits disabled")
+        elif self.enabled:
+            # Let child groups use the controllers; fails harmlessly if already enabled or not delegated
+            self._write(self.root / "cgroup.subtree_control", "+memory +cpu +pids")
+
+    @staticmethod
+    def _write(path: Path, value: str) -> bool:
+        try:
+            path.write_text(value)
+            return True
+        except OSError as e:
+            logger.debug(f"Could not write {value!r} to {path}: {e}")
+            return False
+
+    def prepare(self, key: str, limits: ResourceLimits) -> Optional[str]:
+        """Create the workspace group if needed and return its cgroup.procs path"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key in self._prepared:
+                return self._prepared[key]
+            name = "ws-" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+            group = self.root / name
+            try:
+                group.mkdir(exist_ok=True)
+            except OSError as e:
+                logger.warning(f"Could not create cgroup {group}: {e}")
+                return None
+            if limits.memory_mb:
+                self._write(group / "memory.max", str(limits.memory_mb * 1024 * 1024))
+            if limits.max_processes:
+                self._write(group / "pids.max", str(limits.max_processes))
+            cpus = _env_int("AGENT_CGROUP_CPUS", 1)
+            if cpus:
+                self._write(group / "cpu.max", f"{cpus * 100000} 100000")
+            procs = str(group / "cgroup.procs")
+            self._prepared[key] = procs
+            return procs
+
+
+def _setrlimit(kind: int, value: int):
+    # Never ask for more than the current hard limit, which would fail the spawn
+    _, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(kind, (value, value if hard == resource.RLIM_INFINITY else hard))
+
+
+def _make_preexec(limits: ResourceLimits, heavy: bool, cgroup_procs: Optional[str]) -> Optional[Callable[[], None]]:
+    if os.name == "nt":
+        return None
+
+    def preexec():
+        # Runs in the forked child: keep it to plain syscalls
+        if cgroup_procs:
+            try:
+                with open(cgroup_procs, "w") as f:
+                    f.write(str(os.getpid()))
+            except OSError:
+                pass
+        if resource is not None:
+            _setrlimit(resource.RLIMIT_CORE, 0)
+            if limits.cpu_seconds:
+                _setrlimit(resource.RLIMIT_CPU, limits.cpu_seconds)
+            if limits.memory_mb and not cgroup_procs:
+                # DATA rather than AS: node reserves far more address space than it uses
+                _setrlimit(resource.RLIMIT_DATA, limits.memory_mb * 1024 * 1024)
+            if limits.max_file_mb:
+                _setrlimit(resource.RLIMIT_FSIZE, limits.max_file_mb * 1024 * 1024)
+        if heavy and limits.heavy_nice:
+            os.nice(limits.heavy_nice)
+
+    return preexec
+
+
+class _Waiter:
+    __slots__ = ("workspace", "heavy", "future")
+
+    def __init__(self, workspace: str, heavy: bool):
+        self.workspace = workspace
+        self.heavy = heavy
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+
+
+class FairScheduler:
+    """
+    Grants command slots across workspaces.
+
+    Usable from threads and from any event loop: a slot request is a
+    concurrent Future that is resolved when the slot is granted.
+    Interactive commands are granted before heavy ones; within each kind
+    waiting workspaces are served round-robin.
+    """
+
+    def __init__(self, max_concurrent: int, max_heavy: int, per_workspace: int = 1):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_heavy = max(1, min(max_heavy, self.max_concurrent))
+        self.per_workspace = max(1, per_workspace)
+        self._lock = threading.Lock()
+        self._queues: "OrderedDict[str, deque[_Waiter]]" = OrderedDict()
+        self._running: Dict[str, int] = defaultdict(int)
+        self._total = 0
+        self._heavy = 0
+
+    def _eligible(self, waiter: _Waiter) -> bool:
+        if self._running[waiter.workspace] >= self.per_workspace:
+            return False
+        return not waiter.heavy or self._heavy < self.max_heavy
+
+    def _dispatch(self) -> List[_Waiter]:
+        """Pick waiters to grant; called with the lock held"""
+        granted = []
+        while self._total < self.max_concurrent:
+            chosen = None
+            for want_heavy in (False, True):
+                for workspace, queue in self._queues.items():
+                    # Drop requests that were cancelled while waiting
+                    while queue and queue[0].future.cancelled():
+                        queue.popleft()
+                    if queue and queue[0].heavy == want_heavy and self._eligible(queue[0]):
+                        chosen = workspace
+                        break
+                if chosen is not None:
+                    break
+            if chosen is None:
+                break
+
+            queue = self._queues[chosen]
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(chosen)
+            else:
+                del self._queues[chosen]
+            if not waiter.future.set_running_or_notify_cancel():
+                continue
+            self._running[waiter.workspace] += 1
+            self._total += 1
+            self._heavy += waiter.heavy
+            granted.append(waiter)
+
+        for workspace in [w for w, q in self._queues.items() if not q]:
+            del self._queues[workspace]
+        return granted
+
+    def request(self, workspace: str, heavy: bool = False) -> concurrent.futures.Future:
+        """Queue a slot request; the future resolves to the slot once granted"""
+        waiter = _Waiter(workspace, heavy)
+        with self._lock:
+            self._queues.setdefault(workspace, deque()).append(waiter)
+            granted = self._dispatch()
+        # Resolve outside the lock: done callbacks may call release()
+        for item in granted:
+            item.future.set_result(item)
+        return waiter.future
+
+    def release(self, slot: _Waiter):
+        with self._lock:
+            self._running[slot.workspace] -= 1
+            if self._running[slot.workspace] <= 0:
+                del self._running[slot.workspace]
+            self._total -= 1
+            self._heavy -= slot.heavy
+            granted = self._dispatch()
+        for item in granted:
+            item.future.set_result(item)
+
+    def _release_when_granted(self, future: concurrent.futures.Future):
+        """Give back a slot whose requester stopped waiting for it"""
+        if not future.cancel():
+            future.add_done_callback(lambda f: None if f.cancelled() else self.release(f.result()))
+
+    @contextmanager
+    def slot(self, workspace: str, heavy: bool = False) -> Iterator[None]:
+        future = self.request(workspace, heavy)
+        try:
+            granted = future.result()
+        except BaseException:
+            self._release_when_granted(future)
+            raise
+        try:
+            yield
+        finally:
+            self.release(granted)
+
+    @asynccontextmanager
+    async def aslot(self, workspace: str, heavy: bool = False) -> AsyncIterator[None]:
+        future = self.request(workspace, heavy)
+        try:
+            granted = await asyncio.wrap_future(future)
+        except BaseException:
+            self._release_when_granted(future)
+            raise
+        try:
+            yield
+        finally:
+            self.release(granted)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "running": self._total,
+                "running_heavy": self._heavy,
+                "waiting": sum(len(q) for q in self._queues.values()),
+                "waiting_workspaces": len(self._queues),
+            }
+
+
+_max_concurrent = _env_int("AGENT_MAX_CONCURRENT_COMMANDS", max(2, os.cpu_count() or 2))
+scheduler = FairScheduler(
+    max_concurrent=_max_concurrent,
+    max_heavy=_env_int("AGENT_MAX_HEAVY_COMMANDS", max(1, _max_concurrent // 2)),
+    per_workspace=_env_int("AGENT_COMMANDS_PER_WORKSPACE", 1),
+)
+default_limits = ResourceLimits.from_env()
+cgroups = CgroupManager(os.getenv("AGENT_CGROUP_ROOT"))
+
+
+def _prepare(workspace_dir: Optional[str], cwd: Optional[str], env: Optional[Dict[str, str]],
+             timeout: Optional[float], limits: ResourceLimits, heavy: bool) -> Dict:
+    """Keyword arguments for run_command under the given limits"""
+    head_chars = limits.output_chars // 3
+    return {
+        "cwd": cwd or workspace_dir,
+        "env": env if env is not None else sandbox_environment(workspace_dir),
+        "timeout": timeout if timeout is not None else limits.wall_time,
+        "head_chars": head_chars,
+        "tail_chars": limits.output_chars - head_chars,
+        "preexec_fn": _make_preexec(limits, heavy, cgroups.prepare(workspace_key(workspace_dir), limits)),
+    }
+
+
+@contextmanager
+def _running(kind: str, queued_at: float) -> Iterator[None]:
+    COMMAND_QUEUE_WAIT.labels(kind).observe(time.perf_counter() - queued_at)
+    COMMANDS_RUNNING.labels(kind).inc()
+    try:
+        yield
+    finally:
+        COMMANDS_RUNNING.labels(kind).dec()
+
+
+async def run_sandboxed(
+    command: Union[str, List[str]],
+    workspace_dir: Optional[str] = None,
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    timeout: Optional[float] = None,
+    heavy: Optional[bool] = None,
+    log_channel: Optional[str] = None,
+    limits: Optional[ResourceLimits] = None,
+) -> CommandResult:
+    """
+    Run an agent command under the scheduler and resource limits.
+
+    Args:
+        command: Shell string, or an argv list to run without a shell
+        workspace_dir: Workspace the command belongs to (scheduling key, default cwd)
+        cwd: Working directory if different from the workspace directory
+        env: Environment override (defaults to the scrubbed sandbox environment)
+        timeout: Wall-time override in seconds
+        heavy: Treat as a heavy command; detected from the command when None
+        log_channel: Event bus channel that receives live output events
+        limits: Limits override (defaults to the limits from the environment)
+    """
+    limits = limits or default_limits
+    heavy = is_heavy_command(command) if heavy is None else heavy
+    kind = "heavy" if heavy else "interactive"
+    queued_at = time.perf_counter()
+    async with scheduler.aslot(workspace_key(workspace_dir), heavy):
+        with _running(kind, queued_at):
+            return await run_command(
+                command, log_channel=log_channel,
+                **_prepare(workspace_dir, cwd, env, timeout, limits, heavy)
+            )
+
+
+def run_sandboxed_sync(
+    command: Union[str, List[str]],
+    workspace_dir: Optional[str] = None,
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    timeout: Optional[float] = None,
+    heavy: Optional[bool] = None,
+    log_channel: Optional[str] = None,
+    limits: Optional[ResourceLimits] = None,
+) -> CommandResult:
+    """Blocking variant of run_sandboxed for synchronous tool code"""
+    limits = limits or default_limits
+    heavy = is_heavy_command(command) if heavy is None else heavy
+    kind = "heavy" if heavy else "interactive"
+    queued_at = time.perf_counter()
+    with scheduler.slot(workspace_key(workspace_dir), heavy):
+        with _running(kind, queued_at):
+            return run_command_sync(
+                command, log_channel=log_channel,
+                **_prepare(workspace_dir, cwd, env, timeout, limits, heavy)
+            )
+
+
+async def start_sandboxed(
+    command: List[str],
+    workspace_dir: Optional[str] = None,
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    limits: Optional[ResourceLimits] = None,
+) -> asyncio.subprocess.Process:
+    """
+    Start a long-running process (a dev server) in the sandbox.
+
+    Unlike run_sandboxed this takes no scheduler slot and sets no wall-time
+    limit: the caller owns the process and must kill its process group.
+    stdout and stderr are merged into process.stdout.
+    """
+    limits = limits or default_limits
+    kwargs = {
+        "cwd": cwd or workspace_dir,
+        "env": env if env is not None else sandbox_environment(workspace_dir),
+        "stdin": asyncio.subprocess.DEVNULL,
+        "stdout": asyncio.subprocess.PIPE,
+        "stderr": asyncio.subprocess.STDOUT,
+    }
+    if os.name != "nt":
+        kwargs["start_new_session"] = True
+        kwargs["preexec_fn"] = _make_preexec(limits, False, cgroups.prepare(workspace_key(workspace_dir), limits))
+    return await asyncio.create_subprocess_exec(*command, **kwargs)
@@ -0,0 +1,177 @@
+"""
+Deterministic React project scaffolding.
+
+Creating a project from a structured request does not need the agent to
+decide anything: the app is created with create-react-app, every requested
+component is generated by one completion, and App renders them. The
+component completions run as one parallel batch, concurrently with
+create-react-app, so the cost is a single fan-out instead of a multi-turn
+agent conversation.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.services.event_bus import workspace_channel
+from app.services.llm_scheduler import BACKGROUND
+from app.services.metrics import AGENT_TASKS, AGENT_TASK_DURATION, record_subprocess
+from app.services.tracing import span
+from .fast_paths import generate_component_code
+from .memory import remember_action
+from .sandbox import run_sandboxed
+from .shell_agent import CreateReactComponentTool, ModifyReactAppTool
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on concurrent component completions per project
+MAX_PARALLEL_COMPONENTS = int(os.getenv("SCAFFOLD_MAX_PARALLEL", "8"))
+
+
+def component_identifier(name: str) -> str:
+    """Turn a free-form component name ("hero section") into a PascalCase identifier"""
+    words = re.findall(r"[A-Za-z0-9]+", name)
+    identifier = "".join(word[:1].upper() + word[1:] for word in words)
+    if not identifier or identifier[0].isdigit():
+        identifier = f"Component{identifier}"
+    return identifier
+
+
+def _placeholder_component(component_name: str, description: str) -> str:
+    return (
+        "import React from 'react';\n\n"
+        f"// {' '.join(description.split())}\n"
+        f"export default function {component_name}() {{\n"
+        f"    return <section className=\"{component_name.lower()}\">{component_name}</section>;\n"
+        "}\n"
+    )
+
+
+def _app_source(app_name: str, components: List[str], description: Optional[str]) -> str:
+    imports = "".join(f"import {name} from './components/{name}';\n" for name in components)
+    body = "".join(f"      <{name} />\n" for name in components) or f"      <h1>{app_name}</h1>\n"
+    comment = f"// {' '.join(description.split())}\n" if description else ""
+    return (
+        "import React from 'react';\n"
+        f"{imports}"
+        "import './App.css';\n\n"
+        f"{comment}"
+        "function App() {\n"
+        "  return (\n"
+        "    <div className=\"App\">\n"
+        f"{body}"
+        "    </div>\n"
+        "  );\n"
+        "}\n\n"
+        "export default App;\n"
+    )
+
+
+async def _create_app(workspace_dir: str, app_name: str, use_typescript: bool) -> Optional[str]:
+    """Run create-react-app unless the app already exists; return an error message on failure"""
+    if (Path(workspace_dir) / app_name / "package.json").exists():
+        return None
+
+    cmd = ["npx", "create-react-app", app_name]
+    if use_typescript:
+        cmd.append("--template=typescript")
+    result = await run_sandboxed(
+        cmd, workspace_dir=workspace_dir, heavy=True,
+        log_channel=workspace_channel(Path(workspace_dir).name)
+    )
+    record_subprocess("create_react_app", result.duration, None if result.timed_out else result.returncode)
+    if result.returncode != 0 or result.timed_out:
+        return f"Error creating React app: {result.observation()}"
+    return None
+
+
+async def _generate_components(app_name: str, components: Dict[str, str], description: Optional[str],
+                               use_typescript: bool) -> Dict[str, Optional[str]]:
+    """Generate all component bodies in one bounded parallel batch"""
+    semaphore = asyncio.Semaphore(max(1, MAX_PARALLEL_COMPONENTS))
+
+    async def generate(identifier: str, requested: str) -> Optional[str]:
+        component_description = f"{requested}. Part of an application described as: {description}" if description else requested
+        async with semaphore:
+            return await asyncio.to_thread(
+                generate_component_code, app_name, identifier, component_description, use_typescript, BACKGROUND
+            )
+
+    codes = await asyncio.gather(*(generate(identifier, requested) for identifier, requested in components.items()))
+    return dict(zip(components, codes))
+
+
+async def scaffold_react_project(workspace_dir: str, app_name: str, use_typescript: bool = False,
+                                 description: Optional[str] = None,
+                                 components: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Create a React project with its components without the agent loop.
+
+    Args:
+        workspace_dir: Directory where the app is created
+        app_name: Name of the React application
+        use_typescript: Whether to use the TypeScript template
+        description: Optional description of the application
+        components: Names or short descriptions of the components to create
+
+    Returns:
+        A result dictionary like run_agent_task, plus the created component names
+    """
+    start = time.perf_counter()
+    # Identifier -> requested name, de-duplicated in request order
+    requested = {}
+    for name in components or []:
+        requested.setdefault(component_identifier(name), name)
+
+    with span("agent.scaffold", workspace=workspace_dir, components=len(requested)) as scaffold_span:
+        create_error, codes = await asyncio.gather(
+            _create_app(workspace_dir, app_name, use_typescript),
+            _generate_components(app_name, requested, description, use_typescript),
+        )
+        if create_error:
+            AGENT_TASK_DURATION.observe(time.perf_counter() - start)
+            AGENT_TASKS.labels("error").inc()
+            return {"success": False, "error": create_error, "workspace_dir": workspace_dir}
+
+        output = [f"Created React app '{app_name}' in {workspace_dir}"]
+        placeholders = []
+        for identifier, code in codes.items():
+            if code is None:
+                placeholders.append(identifier)
+                code = _placeholder_component(identifier, requested[identifier])
+            # Tool writes are fsync'd workspace commits: keep them off the event loop
+            output.append(await asyncio.to_thread(CreateReactComponentTool(workspace_dir=workspace_dir).invoke, {
+                "app_name": app_name,
+                "component_name": identifier,
+                "component_code": code,
+                "is_typescript": use_typescript,
+            }))
+
+        if requested:
+            app_file = "src/App.tsx" if use_typescript else "src/App.js"
+            output.append(await asyncio.to_thread(ModifyReactAppTool(workspace_dir=workspace_dir).invoke, {
+                "app_name": app_name,
+                "file_path": app_file,
+                "file_content": _app_source(app_name, list(requested), description),
+            }))
+        if placeholders:
+            output.append(f"Generation failed for {', '.join(placeholders)}; placeholder components were written")
+        scaffold_span.set_attribute("scaffold.placeholders", len(placeholders))
+        await asyncio.to_thread(
+            remember_action, workspace_dir,
+            f"Create React app {app_name}" + (f" with components {', '.join(requested)}" if requested else ""),
+            f"Created app with {len(requested)} components" + (f" ({len(placeholders)} placeholders)" if placeholders else ""),
+            ["create_react_app"] + [f"create_react_component({name})" for name in requested]
+        )
+
+    AGENT_TASK_DURATION.observe(time.perf_counter() - start)
+    AGENT_TASKS.labels("success").inc()
+    return {
+        "success": True,
+        "output": "\n".join(output),
+        "components": list(requested),
+        "workspace_dir": workspace_dir
+    }
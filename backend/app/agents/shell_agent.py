@@ -1,16 +1,17 @@
+import asyncio
 import os
-import subprocess
 import sys
 import tempfile
 from pathlib import Path
 import logging
 import json
 import shutil
-from typing import List, Dict, Any, Optional, Type, Union, Callable
-from langchain.agents import tool
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional, Type, Union, Callable
 from langchain.agents import AgentExecutor
 from langchain_community.agent_toolkits.base import BaseToolkit
-from langchain_community.tools.file_management.write import WriteFileTool
+from langchain_community.tools.file_management.write import WriteFileInput, WriteFileTool
 from langchain_community.tools.file_management.read import ReadFileTool
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
@@ -20,6 +21,19 @@ from langchain.agents.format_scratchpad.tools import format_to_tool_messages
 from langchain.agents.output_parsers.tools import ToolsAgentOutputParser
 from langchain_groq import ChatGroq
 from dotenv import load_dotenv
+from app.services.metrics import AGENT_STEPS, AGENT_TASKS, AGENT_TASK_DURATION, record_subprocess
+from app.services.tracing import span
+from app.services.event_bus import workspace_channel
+from app.services.llm_scheduler import LLMRateLimited
+from app.services.workspace_store import WorkspacePathError, workspace_store
+from .budget import AgentBudget, AgentBudgetExceeded, TokenBudgetCallbackHandler
+from .memory import describe_tool_call, memory_context, remember_action
+from .process_runner import CommandResult
+from .progress_callbacks import ProgressCallbackHandler
+from .rate_limiting import SchedulerRateLimiter
+from .sandbox import run_sandboxed, run_sandboxed_sync, sandbox_environment
+from .tool_cache import ToolResultCache, memoize_tools
+from .tracing_callbacks import TracingCallbackHandler
 
 # Load environment variables
 load_dotenv()
@@ -33,6 +47,11 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     logger.warning("GROQ_API_KEY not found in environment variables")
 
+AGENT_MODEL = "llama3-8b-8192"
+
+# Default per-task budget; requests may lower it
+DEFAULT_BUDGET = AgentBudget.from_env()
+
 # Custom Shell Tool implementation
 class ShellTool(BaseTool):
     """Tool to run shell commands."""
@@ -41,223 +60,266 @@ class ShellTool(BaseTool):
     description: str = """
     Executes shell commands and returns the output.
     Use this when you need to run commands in the system's shell.
+    Long output is truncated to its beginning and end.
     """
     return_direct: bool = False
+    # Wall-time limit in seconds; None uses the sandbox default
+    timeout: Optional[float] = None
+    log_channel: Optional[str] = None
+    cwd: Optional[str] = None
+    env: Optional[Dict[str, str]] = None
+    
+    def _record(self, result: CommandResult) -> str:
+        record_subprocess(self.name, result.duration, None if result.timed_out else result.returncode)
+        return result.observation()
     
     def _run(self, command: str) -> str:
         """Run the shell command and return the output."""
         try:
-            logger.info(f"Running shell command: {command}")
-            result = subprocess.run(
-                command, 
-                shell=True, 
-                check=False,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
+            result = run_sandboxed_sync(
+                command, workspace_dir=self.cwd, env=self.env, timeout=self.timeout, log_channel=self.log_channel
             )
-            
-            # Combine stdout and stderr
-            output = result.stdout
-            if result.stderr:
-                if output:
-                    output += "\n" + result.stderr
-                else:
-                    output = result.stderr
-                    
-            if result.returncode != 0:
-                output += f"\nCommand exited with return code {result.returncode}"
-                
-            return output
+            return self._record(result)
         except Exception as e:
             return f"Error running command: {str(e)}"
     
     async def _arun(self, command: str) -> str:
         """Run the shell command asynchronously."""
-        return self._run(command)
+        try:
+            result = await run_sandboxed(
+                command, workspace_dir=self.cwd, env=self.env, timeout=self.timeout, log_channel=self.log_channel
+            )
+            return self._record(result)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return f"Error running command: {str(e)}"
+
+class WorkspaceWriteFileTool(BaseTool):
+    """
+    write_file for agents working in a workspace.
+
+    Writes go through workspace_store, so they are atomic and journaled,
+    and clients watching the workspace get files_changed events.
+    """
+    
+    name: str = "write_file"
+    description: str = "Write file to disk"
+    args_schema: Type[BaseModel] = WriteFileInput
+    workspace_dir: str
+    
+    def _run(self, file_path: str, text: str, append: bool = False) -> str:
+        try:
+            if append and workspace_store.resolve(self.workspace_dir, file_path).exists():
+                text = workspace_store.read_text(self.workspace_dir, file_path) + text
+            workspace_store.write_file(self.workspace_dir, file_path, text)
+            return f"File written successfully to {file_path}."
+        except WorkspacePathError as e:
+            return f"Error: {e}"
+        except Exception as e:
+            return f"Error writing file: {str(e)}"
+    
+    async def _arun(self, file_path: str, text: str, append: bool = False) -> str:
+        return await asyncio.to_thread(self._run, file_path, text, append)
 
 class CreateReactAppInput(BaseModel):
     """Inputs for creating a React app"""
-    workspace_dir: str = Field(..., description="Directory where to create the React app")
     app_name: str = Field(..., description="Name of the React application")
     use_typescript: bool = Field(False, description="Whether to use TypeScript")
 
-@tool
-def create_react_app(workspace_dir: str, app_name: str, use_typescript: bool = False) -> str:
+class InstallReactDependenciesInput(BaseModel):
+    """Inputs for installing npm packages"""
+    app_name: str = Field(..., description="Name of the React application")
+    packages: List[str] = Field(..., description="List of npm packages to install")
+
+class CreateReactComponentInput(BaseModel):
+    """Inputs for creating a component"""
+    app_name: str = Field(..., description="Name of the React application")
+    component_name: str = Field(..., description="Name of the component to create")
+    component_code: str = Field(..., description="The code content for the component")
+    is_typescript: bool = Field(False, description="Whether the component is TypeScript")
+
+class ModifyReactAppInput(BaseModel):
+    """Inputs for replacing a file of an app"""
+    app_name: str = Field(..., description="Name of the React application")
+    file_path: str = Field(..., description="Path to the file relative to the app's root")
+    file_content: str = Field(..., description="The new content for the file")
+
+class WorkspaceTool(BaseTool):
+    """
+    Base of the React tools: each instance is bound to one workspace, so
+    the model names apps and files within it but never the directory.
     """
-    Creates a new React application using create-react-app in the specified workspace directory.
     
-    Args:
-        workspace_dir: Directory where to create the React app
-        app_name: Name of the React application
-        use_typescript: Whether to use TypeScript (defaults to False)
+    workspace_dir: str
     
-    Returns:
-        A message indicating the result of the operation
-    """
-    try:
-        workspace_path = Path(workspace_dir)
-        if not workspace_path.exists():
-            workspace_path.mkdir(parents=True)
-        
-        # Change to workspace directory
-        original_dir = os.getcwd()
-        os.chdir(workspace_path)
-        
-        # Build the command
-        cmd = ["npx", "create-react-app", app_name]
-        if use_typescript:
-            cmd.append("--template=typescript")
-            
-        # Run the command
-        logger.info(f"Running command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        # Return to original directory
-        os.chdir(original_dir)
-        
-        if result.returncode == 0:
-            return f"Successfully created React app '{app_name}' in {workspace_dir}"
-        else:
-            return f"Error creating React app: {result.stderr}"
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-@tool
-def install_react_dependencies(workspace_dir: str, app_name: str, packages: List[str]) -> str:
-    """
-    Installs npm packages in the React application.
+    def _app_path(self, app_name: str) -> Path:
+        """Directory of an app; raises WorkspacePathError for names leaving the workspace"""
+        return workspace_store.resolve(self.workspace_dir, app_name)
     
-    Args:
-        workspace_dir: Directory where the React app is located
-        app_name: Name of the React application
-        packages: List of npm packages to install
+    async def _arun(self, **kwargs: Any) -> str:
+        return await asyncio.to_thread(self._run, **kwargs)
+
+class CreateReactAppTool(WorkspaceTool):
+    name: str = "create_react_app"
+    description: str = "Creates a new React application using create-react-app in the workspace."
+    args_schema: Type[BaseModel] = CreateReactAppInput
     
-    Returns:
-        A message indicating the result of the operation
-    """
-    try:
-        app_path = Path(workspace_dir) / app_name
-        if not app_path.exists():
-            return f"Error: React app '{app_name}' not found in {workspace_dir}"
-        
-        # Change to app directory
-        original_dir = os.getcwd()
-        os.chdir(app_path)
-        
-        # Build the command
-        cmd = ["npm", "install", "--save"]
-        cmd.extend(packages)
+    def _run(self, app_name: str, use_typescript: bool = False) -> str:
+        try:
+            self._app_path(app_name)
+            workspace_path = Path(self.workspace_dir)
+            if not workspace_path.exists():
+                workspace_path.mkdir(parents=True)
             
-        # Run the command
-        logger.info(f"Running command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        # Return to original directory
-        os.chdir(original_dir)
-        
-        if result.returncode == 0:
-            return f"Successfully installed packages {', '.join(packages)} in React app '{app_name}'"
-        else:
-            return f"Error installing packages: {result.stderr}"
-    except Exception as e:
-        return f"Error: {str(e)}"
+            # Build the command
+            cmd = ["npx", "create-react-app", app_name]
+            if use_typescript:
+                cmd.append("--template=typescript")
+                
+            # Run the command in the workspace directory
+            result = run_sandboxed_sync(
+                cmd, workspace_dir=str(workspace_path), heavy=True,
+                log_channel=workspace_channel(workspace_path.name)
+            )
+            record_subprocess("create_react_app", result.duration, None if result.timed_out else result.returncode)
+            
+            if result.returncode == 0 and not result.timed_out:
+                return f"Successfully created React app '{app_name}' in {self.workspace_dir}"
+            else:
+                return f"Error creating React app: {result.observation()}"
+        except Exception as e:
+            return f"Error: {str(e)}"
 
-@tool
-def create_react_component(workspace_dir: str, app_name: str, component_name: str, component_code: str, is_typescript: bool = False) -> str:
-    """
-    Creates a new React component file in the React application.
+class InstallReactDependenciesTool(WorkspaceTool):
+    name: str = "install_react_dependencies"
+    description: str = "Installs npm packages in a React application of the workspace."
+    args_schema: Type[BaseModel] = InstallReactDependenciesInput
     
-    Args:
-        workspace_dir: Directory where the React app is located
-        app_name: Name of the React application
-        component_name: Name of the component to create
-        component_code: The code content for the component
-        is_typescript: Whether the component is TypeScript
-    
-    Returns:
-        A message indicating the result of the operation
-    """
-    try:
-        app_path = Path(workspace_dir) / app_name / "src" / "components"
-        if not app_path.exists():
-            app_path.mkdir(parents=True)
-        
-        # Determine file extension
-        ext = ".tsx" if is_typescript else ".jsx"
-        
-        # Create component file
-        component_path = app_path / f"{component_name}{ext}"
-        with open(component_path, "w", encoding="utf-8") as f:
-            f.write(component_code)
-        
-        return f"Successfully created component '{component_name}' in {component_path}"
-    except Exception as e:
-        return f"Error creating component: {str(e)}"
+    def _run(self, app_name: str, packages: List[str]) -> str:
+        try:
+            app_path = self._app_path(app_name)
+            if not app_path.exists():
+                return f"Error: React app '{app_name}' not found in {self.workspace_dir}"
+            
+            # Build the command
+            cmd = ["npm", "install", "--save"]
+            cmd.extend(packages)
+                
+            # Run the command in the app directory
+            result = run_sandboxed_sync(
+                cmd, workspace_dir=self.workspace_dir, cwd=str(app_path), heavy=True,
+                log_channel=workspace_channel(Path(self.workspace_dir).name)
+            )
+            record_subprocess("install_react_dependencies", result.duration, None if result.timed_out else result.returncode)
+            
+            if result.returncode == 0 and not result.timed_out:
+                return f"Successfully installed packages {', '.join(packages)} in React app '{app_name}'"
+            else:
+                return f"Error installing packages: {result.observation()}"
+        except Exception as e:
+            return f"Error: {str(e)}"
 
-@tool
-def modify_react_app(workspace_dir: str, app_name: str, file_path: str, file_content: str) -> str:
-    """
-    Modifies a file in the React application.
+class CreateReactComponentTool(WorkspaceTool):
+    name: str = "create_react_component"
+    description: str = "Creates a new React component file in src/components of a React application."
+    args_schema: Type[BaseModel] = CreateReactComponentInput
     
-    Args:
-        workspace_dir: Directory where the React app is located
-        app_name: Name of the React application
-        file_path: Path to the file relative to the app's root
-        file_content: The new content for the file
+    def _run(self, app_name: str, component_name: str, component_code: str, is_typescript: bool = False) -> str:
+        try:
+            # Determine file extension
+            ext = ".tsx" if is_typescript else ".jsx"
+            
+            # Create component file
+            rel_path = f"{app_name}/src/components/{component_name}{ext}"
+            workspace_store.write_file(self.workspace_dir, rel_path, component_code)
+            
+            return f"Successfully created component '{component_name}' in {workspace_store.resolve(self.workspace_dir, rel_path)}"
+        except Exception as e:
+            return f"Error creating component: {str(e)}"
+
+class ModifyReactAppTool(WorkspaceTool):
+    name: str = "modify_react_app"
+    description: str = "Replaces the content of a file of a React application (path relative to the app's root)."
+    args_schema: Type[BaseModel] = ModifyReactAppInput
     
-    Returns:
-        A message indicating the result of the operation
-    """
-    try:
-        full_path = Path(workspace_dir) / app_name / file_path
-        parent_dir = full_path.parent
-        
-        if not parent_dir.exists():
-            parent_dir.mkdir(parents=True)
-        
-        with open(full_path, "w", encoding="utf-8") as f:
-            f.write(file_content)
-        
-        return f"Successfully modified file '{file_path}' in React app"
-    except Exception as e:
-        return f"Error modifying file: {str(e)}"
+    def _run(self, app_name: str, file_path: str, file_content: str) -> str:
+        try:
+            workspace_store.write_file(self.workspace_dir, f"{app_name}/{file_path}", file_content)
+            
+            return f"Successfully modified file '{file_path}' in React app"
+        except Exception as e:
+            return f"Error modifying file: {str(e)}"
 
 class ReactToolkit(BaseToolkit):
     """Toolkit for working with React applications"""
     
+    workspace_dir: Optional[str] = None
+    
     def get_tools(self) -> List[BaseTool]:
         """Return the tools in the toolkit."""
+        if not self.workspace_dir:
+            # The React tools need a workspace; without one they work in the current directory
+            workspace_dir = os.getcwd()
+            return [
+                CreateReactAppTool(workspace_dir=workspace_dir),
+                InstallReactDependenciesTool(workspace_dir=workspace_dir),
+                CreateReactComponentTool(workspace_dir=workspace_dir),
+                ModifyReactAppTool(workspace_dir=workspace_dir),
+                ShellTool(),
+                WriteFileTool(),
+                ReadFileTool()
+            ]
+        
+        # Every tool is bound to this workspace explicitly; the model names apps
+        # and files within it, never the directory itself. Nothing depends on
+        # the process working directory, so tasks can run concurrently.
+        # Shell output is streamed live to clients watching this workspace.
         return [
-            create_react_app,
-            install_react_dependencies,
-            create_react_component,
-            modify_react_app,
-            ShellTool(),
-            WriteFileTool(),
-            ReadFileTool()
+            CreateReactAppTool(workspace_dir=self.workspace_dir),
+            InstallReactDependenciesTool(workspace_dir=self.workspace_dir),
+            CreateReactComponentTool(workspace_dir=self.workspace_dir),
+            ModifyReactAppTool(workspace_dir=self.workspace_dir),
+            ShellTool(
+                cwd=self.workspace_dir,
+                env=sandbox_environment(self.workspace_dir),
+                log_channel=workspace_channel(Path(self.workspace_dir).name)
+            ),
+            # Relative paths resolve against the workspace, as in the shell;
+            # paths outside it are rejected. Writes are workspace commits
+            WorkspaceWriteFileTool(workspace_dir=self.workspace_dir),
+            ReadFileTool(root_dir=self.workspace_dir)
         ]
 
-def create_react_agent(workspace_dir: str) -> AgentExecutor:
+def create_react_agent(workspace_dir: str, budget: Optional[AgentBudget] = None,
+                       tool_cache: Optional[ToolResultCache] = None, memory: str = "") -> AgentExecutor:
     """
     Creates a LangChain agent that can work with React applications
     
     Args:
         workspace_dir: Directory where the agent will operate
+        budget: Step and time limits for the task (defaults to DEFAULT_BUDGET)
+        tool_cache: Cache for read-only tool results, shared by all tools of the task
+        memory: Rendered workspace memory from previous tasks
     
     Returns:
         An AgentExecutor instance
     """
-    # Initialize the LLM
+    budget = budget or DEFAULT_BUDGET
+    
+    # Initialize the LLM; the limiter settles each turn's reservation from its callbacks
+    rate_limiter = SchedulerRateLimiter()
     llm = ChatGroq(
         api_key=GROQ_API_KEY,
-        model="llama3-8b-8192",
-        temperature=0.2
+        model=AGENT_MODEL,
+        temperature=0.2,
+        rate_limiter=rate_limiter,
+        callbacks=[rate_limiter]
     )
     
-    # Get tools
-    toolkit = ReactToolkit()
-    tools = toolkit.get_tools()
+    # Get tools; repeated reads within the task are served from the cache
+    toolkit = ReactToolkit(workspace_dir=workspace_dir)
+    tools = memoize_tools(toolkit.get_tools(), tool_cache)
     
     # Create the system message
     system_message = """You are an expert React developer assistant. You help users create, modify, and manage React applications.
@@ -283,13 +345,16 @@ Workspace directory: {workspace_dir}
 Tools:
 {tools}
 
+What is already known about this workspace from previous tasks (file summaries are current; only read a file when you need its exact content):
+{memory}
+
 Always verify that your code would run correctly before returning it.
 """
     
-    # Create the prompt template with the updated format
+    # Create the prompt template (role tuples, so {input}, {workspace_dir} and {tools} are filled in)
     prompt = ChatPromptTemplate.from_messages([
-        SystemMessage(content=system_message),
-        HumanMessage(content="{input}"),
+        ("system", system_message),
+        ("human", "{input}"),
         MessagesPlaceholder(variable_name="agent_scratchpad")
     ])
     
@@ -299,10 +364,11 @@ Always verify that your code would run correctly before returning it.
             "input": lambda x: x["input"],
             "agent_scratchpad": lambda x: format_to_tool_messages(x["intermediate_steps"]),
             "workspace_dir": lambda x: workspace_dir,
+            "memory": lambda x: memory or "Nothing yet; this is the first task in this workspace.",
             "tools": lambda x: "\n".join([f"{tool.name}: {tool.description}" for tool in tools])
         }
         | prompt
-        | llm
+        | llm.bind_tools(tools)
         | ToolsAgentOutputParser()
     )
     
@@ -310,35 +376,128 @@ Always verify that your code would run correctly before returning it.
     agent_executor = AgentExecutor(
         agent=agent,
         tools=tools,
-        verbose=True
+        verbose=True,
+        max_iterations=budget.max_steps,
+        max_execution_time=budget.max_seconds,
+        early_stopping_method="force",
+        return_intermediate_steps=True
     )
     
     return agent_executor
 
-def run_agent_task(workspace_dir: str, task: str) -> Dict[str, Any]:
+class _TaskContext:
+    def __init__(self, tracing: TracingCallbackHandler, budget: AgentBudget, progress: ProgressCallbackHandler):
+        self.budget = budget
+        self.tool_cache = ToolResultCache()
+        self.tracing = tracing
+        self.progress = progress
+        self.token_budget = TokenBudgetCallbackHandler(budget.max_tokens)
+    
+    @property
+    def callbacks(self) -> List[Any]:
+        return [self.tracing, self.token_budget, self.progress]
+
+@contextmanager
+def _instrumented_task(workspace_dir: str, task: str, budget: Optional[AgentBudget]) -> Iterator[_TaskContext]:
+    """Span, callbacks, budget, progress events and step metrics shared by the sync and async task runners"""
+    with span("agent.task", workspace=workspace_dir) as task_span:
+        progress = ProgressCallbackHandler(workspace_channel(Path(workspace_dir).name))
+        context = _TaskContext(TracingCallbackHandler(task_span), budget or DEFAULT_BUDGET, progress)
+        progress.started(task)
+        try:
+            yield context
+        except Exception as e:
+            progress.finished(e)
+            raise
+        else:
+            progress.finished()
+        finally:
+            callbacks = context.tracing
+            task_span.set_attributes({
+                "agent.llm_turns": callbacks.llm_turns,
+                "agent.tool_calls": callbacks.tool_calls,
+                "agent.tool_cache_hits": context.tool_cache.hits,
+                "agent.max_steps": context.budget.max_steps,
+                "llm.prompt_tokens": callbacks.prompt_tokens,
+                "llm.completion_tokens": callbacks.completion_tokens,
+            })
+            AGENT_STEPS.observe(callbacks.llm_turns)
+
+def _task_result(workspace_dir: str, start: float, result: Optional[Dict[str, Any]] = None,
+                 error: Optional[Exception] = None) -> Dict[str, Any]:
+    AGENT_TASK_DURATION.observe(time.perf_counter() - start)
+    if error is not None:
+        logger.error(f"Error running agent task: {error}")
+        if isinstance(error, AgentBudgetExceeded):
+            outcome = "budget_exceeded"
+        elif isinstance(error, LLMRateLimited):
+            outcome = "rate_limited"
+        else:
+            outcome = "error"
+        AGENT_TASKS.labels(outcome).inc()
+        return {
+            "success": False,
+            "error": str(error),
+            "workspace_dir": workspace_dir
+        }
+    
+    AGENT_TASKS.labels("success").inc()
+    return {
+        "success": True,
+        "output": result["output"],
+        "workspace_dir": workspace_dir
+    }
+
+def _remember(workspace_dir: str, task: str, result: Optional[Dict[str, Any]] = None,
+              error: Optional[Exception] = None):
+    """Add the finished task to the workspace memory"""
+    if error is not None:
+        remember_action(workspace_dir, task, f"failed: {error}")
+        return
+    tool_calls = [describe_tool_call(action.tool, action.tool_input)
+                  for action, _ in result.get("intermediate_steps") or []]
+    remember_action(workspace_dir, task, str(result.get("output", "")), tool_calls)
+
+def run_agent_task(workspace_dir: str, task: str, budget: Optional[AgentBudget] = None) -> Dict[str, Any]:
     """
     Runs a task using the React agent
     
     Args:
         workspace_dir: Directory where the agent will operate
         task: The task description for the agent
+        budget: Step, token and time limits (defaults to DEFAULT_BUDGET)
     
     Returns:
         A dictionary with the task result and any output
     """
+    start = time.perf_counter()
     try:
-        agent = create_react_agent(workspace_dir)
-        result = agent.invoke({"input": task})
-        
-        return {
-            "success": True,
-            "output": result["output"],
-            "workspace_dir": workspace_dir
-        }
+        with _instrumented_task(workspace_dir, task, budget) as context:
+            memory = memory_context(workspace_dir)
+            agent = create_react_agent(workspace_dir, context.budget, context.tool_cache, memory)
+            result = agent.invoke({"input": task}, config={"callbacks": context.callbacks})
+        _remember(workspace_dir, task, result=result)
+        return _task_result(workspace_dir, start, result=result)
     except Exception as e:
-        logger.error(f"Error running agent task: {e}")
-        return {
-            "success": False,
-            "error": str(e),
-            "workspace_dir": workspace_dir
-        } 
\ No newline at end of file
+        _remember(workspace_dir, task, error=e)
+        return _task_result(workspace_dir, start, error=e)
+
+async def arun_agent_task(workspace_dir: str, task: str, budget: Optional[AgentBudget] = None) -> Dict[str, Any]:
+    """
+    Async variant of run_agent_task for request handlers.
+    
+    LLM calls and shell commands are awaited instead of blocking the event
+    loop, and cancelling the request kills any running command.
+    """
+    start = time.perf_counter()
+    try:
+        with _instrumented_task(workspace_dir, task, budget) as context:
+            # Memory files are read and written off the event loop
+            memory = await asyncio.to_thread(memory_context, workspace_dir)
+            agent = create_react_agent(workspace_dir, context.budget, context.tool_cache, memory)
+            result = await agent.ainvoke({"input": task}, config={"callbacks": context.callbacks})
+        await asyncio.to_thread(_remember, workspace_dir, task, result)
+        return _task_result(workspace_dir, start, result=result)
+    except Exception as e:
+        await asyncio.to_thread(_remember, workspace_dir, task, None, e)
+        return _task_result(workspace_dir, start, error=e)
@@ -0,0 +1,152 @@
+"""
+Memoization of idempotent tool calls within one agent task.
+
+Models often re-read the same file or re-run ``ls`` / ``cat package.json``
+several times in one task. Read-only calls (file reads, directory listings,
+read-only shell commands) are answered from a per-task cache; any other
+tool call may change the workspace and clears it.
+"""
+import json
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from langchain.tools import BaseTool
+
+from app.services.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Tools that never modify the workspace
+READ_ONLY_TOOLS = {"read_file", "list_directory", "file_search"}
+
+# Shell commands that only read; pipelines of these are read-only as well
+READ_ONLY_COMMANDS = {"ls", "cat", "pwd", "head", "tail", "find", "tree", "wc", "grep", "stat", "du", "file"}
+SHELL_SEPARATORS = re.compile(r"\|\||&&|[|;]")
+# Redirection, substitution and backgrounding can write or run anything
+UNSAFE_SHELL = re.compile(r"[<>`&]|\$\(|\n")
+# find actions that modify files
+UNSAFE_FIND = re.compile(r"-(delete|exec|execdir|ok|okdir|fprint\w*|fls)\b")
+
+
+def is_read_only_command(command: str) -> bool:
+    if not command or UNSAFE_SHELL.search(SHELL_SEPARATORS.sub(" ", command)):
+        return False
+    for segment in SHELL_SEPARATORS.split(command):
+        words = segment.split()
+        if not words or words[0] not in READ_ONLY_COMMANDS:
+            return False
+        if words[0] == "find" and UNSAFE_FIND.search(segment):
+            return False
+    return True
+
+
+def _is_failure(output: str) -> bool:
+    return (
+        output.startswith("Error")
+        or "Command exited with return code" in output
+        or "Command timed out" in output
+    )
+
+
+class ToolResultCache:
+    """Results of read-only tool calls, valid until the next mutating call"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: Dict[str, str] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(tool_name: str, arguments: Dict[str, Any]) -> str:
+        return f"{tool_name}:{json.dumps(arguments, sort_keys=True, default=str)}"
+
+    def lookup(self, key: str):
+        """Return (cached result or None, generation the lookup was made in)"""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result, self._generation
+
+    def store(self, key: str, result: str, generation: int):
+        with self._lock:
+            # A write that happened while the read ran makes the result stale
+            if generation != self._generation:
+                return
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = result
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+class MemoizedTool(BaseTool):
+    """Wraps a tool so its read-only calls go through a ToolResultCache"""
+
+    tool: BaseTool
+    cache: ToolResultCache
+
+    def __init__(self, tool: BaseTool, cache: ToolResultCache):
+        super().__init__(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.get_input_schema(),
+            return_direct=tool.return_direct,
+            tool=tool,
+            cache=cache,
+        )
+
+    def _is_read_only(self, arguments: Dict[str, Any]) -> bool:
+        if self.name in READ_ONLY_TOOLS:
+            return True
+        if self.name == "shell":
+            return is_read_only_command(arguments.get("command", ""))
+        return False
+
+    def _before(self, arguments: Dict[str, Any]):
+        """Return (cached result, cache key, generation); key is None for mutating calls"""
+        if not self._is_read_only(arguments):
+            self.cache.invalidate()
+            return None, None, None
+        key = self.cache.key(self.name, arguments)
+        result, generation = self.cache.lookup(key)
+        CACHE_REQUESTS.labels("agent_tool", "hit" if result is not None else "miss").inc()
+        return result, key, generation
+
+    def _after(self, key: Optional[str], generation: Optional[int], result: Any) -> Any:
+        if key is None:
+            # Invalidate again in case a concurrent read cached a pre-write result
+            self.cache.invalidate()
+        elif isinstance(result, str) and not _is_failure(result):
+            self.cache.store(key, result, generation)
+        return result
+
+    def _run(self, **kwargs: Any) -> Any:
+        cached, key, generation = self._before(kwargs)
+        if cached is not None:
+            logger.info(f"Tool cache hit: {self.name} {kwargs}")
+            return cached
+        return self._after(key, generation, self.tool.invoke(kwargs))
+
+    async def _arun(self, **kwargs: Any) -> Any:
+        cached, key, generation = self._before(kwargs)
+        if cached is not None:
+            logger.info(f"Tool cache hit: {self.name} {kwargs}")
+            return cached
+        return self._after(key, generation, await self.tool.ainvoke(kwargs))
+
+
+def memoize_tools(tools: List[BaseTool], cache: Optional[ToolResultCache] = None) -> List[BaseTool]:
+    """Wrap every tool of a task around one shared cache"""
+    cache = cache or ToolResultCache()
+    return [MemoizedTool(tool, cache) for tool in tools]
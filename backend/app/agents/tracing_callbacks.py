@@ -0,0 +1,118 @@
+import logging
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.services.llm_scheduler import LLMRateLimited
+from app.services.metrics import AGENT_TOOL_CALLS, AGENT_TOOL_DURATION, llm_status, record_llm_call
+from app.services.tracing import Span, tracer
+
+logger = logging.getLogger(__name__)
+
+
+def token_usage(response: LLMResult) -> Dict[str, Optional[int]]:
+    """Prompt, completion and total tokens reported for an LLM call"""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if not usage and response.generations and response.generations[0]:
+        message = getattr(response.generations[0][0], "message", None)
+        metadata = getattr(message, "usage_metadata", None) or {}
+        usage = {
+            "prompt_tokens": metadata.get("input_tokens"),
+            "completion_tokens": metadata.get("output_tokens"),
+            "total_tokens": metadata.get("total_tokens"),
+        }
+    return usage
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Records a span (and Prometheus samples) for every LLM turn and tool call
+    of an agent run.
+
+    Spans are parented explicitly to the task span because LangChain may
+    invoke callbacks outside the context the task was started in.
+    """
+
+    # Run synchronously even inside async agent runs, so events are recorded in order
+    run_inline = True
+
+    def __init__(self, parent: Span):
+        self.parent = parent
+        self.llm_turns = 0
+        self.tool_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._spans: Dict[UUID, Span] = {}
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None) -> Optional[Span]:
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return None
+        if error is not None:
+            span.record_error(error)
+        span.end()
+
+        if span.name == "agent.llm":
+            # Same labels as groq_client: a completed turn was answered with 200, failed ones carry
+            # the API's status when there was a response; turns shed by the scheduler never reached it
+            if not isinstance(error, LLMRateLimited):
+                status = llm_status(200 if error is None else getattr(error, "status_code", None))
+                record_llm_call(
+                    "agent", status, span.duration_ms / 1000.0,
+                    span.attributes.get("llm.prompt_tokens"), span.attributes.get("llm.completion_tokens")
+                )
+        else:
+            status = "error" if error is not None else "ok"
+            tool = span.attributes.get("tool.name", "tool")
+            AGENT_TOOL_CALLS.labels(tool, status).inc()
+            AGENT_TOOL_DURATION.labels(tool).observe(span.duration_ms / 1000.0)
+        return span
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *,
+                            run_id: UUID, **kwargs: Any) -> None:
+        self.llm_turns += 1
+        model = (kwargs.get("invocation_params") or {}).get("model") or (kwargs.get("invocation_params") or {}).get("model_name")
+        self._spans[run_id] = tracer.start_span(
+            "agent.llm", parent=self.parent,
+            **{"llm.model": model, "llm.turn": self.llm_turns, "llm.messages": sum(len(m) for m in messages)}
+        )
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self.llm_turns += 1
+        self._spans[run_id] = tracer.start_span("agent.llm", parent=self.parent, **{"llm.turn": self.llm_turns})
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        usage = token_usage(response)
+        self.prompt_tokens += usage.get("prompt_tokens") or 0
+        self.completion_tokens += usage.get("completion_tokens") or 0
+
+        span = self._spans.get(run_id)
+        if span is not None:
+            span.set_attributes({
+                "llm.prompt_tokens": usage.get("prompt_tokens"),
+                "llm.completion_tokens": usage.get("completion_tokens"),
+                "llm.total_tokens": usage.get("total_tokens"),
+            })
+        self._end(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self.tool_calls += 1
+        name = (serialized or {}).get("name") or "tool"
+        self._spans[run_id] = tracer.start_span(
+            f"agent.tool.{name}", parent=self.parent,
+            **{"tool.name": name, "tool.input_chars": len(input_str or "")}
+        )
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self._spans.get(run_id)
+        if span is not None:
+            span.set_attribute("tool.output_chars", len(str(output)))
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
@@ -1,13 +1,27 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+import asyncio
 import os
 import shutil
 from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
 
 from app.routers import generation
+from app.routers import live
 from app.routers import shell_agent
+from app.services.cluster import WorkspaceAffinityMiddleware, cluster
+from app.services.deduplication import DeduplicationMiddleware
+from app.services.dev_servers import dev_servers
+from app.services.llm_scheduler import llm_scheduler
+from app.services.loop_monitor import loop_monitor
+from app.services.metrics import HTTP_REQUESTS, IN_FLIGHT_REQUESTS, render_metrics
+from app.services.prompts import describe_prompts
+from app.services.storage import open_workspace
+from app.services.tiering import workspace_tiering
+from app.services.tracing import span
+from app.services.workspace_store import workspace_store
 
 # Load environment variables
 load_dotenv()
@@ -15,18 +29,60 @@ load_dotenv()
 # Create app
 app = FastAPI(title="CodeGen Web App")
 
-# Add CORS middleware
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Wrap each request in a root span and report stage timings via Server-Timing
+    """
+    IN_FLIGHT_REQUESTS.inc()
+    try:
+        with span(f"{request.method} {request.url.path}", **{"http.method": request.method}) as root:
+            response = await call_next(request)
+            root.set_attribute("http.status_code", response.status_code)
+    finally:
+        IN_FLIGHT_REQUESTS.dec()
+
+    # Label by route template (e.g. /api/workspace/{workspace_name}/files) to keep cardinality bounded
+    route = request.scope.get("route")
+    HTTP_REQUESTS.labels(
+        request.method, getattr(route, "path", "unmatched"), str(response.status_code)
+    ).observe(root.duration_ms / 1000.0)
+
+    response.headers["Server-Timing"] = root.trace.server_timing()
+    response.headers["X-Trace-Id"] = root.trace.trace_id
+    return response
+
+@app.middleware("http")
+async def rehydrate_static_workspaces(request: Request, call_next):
+    """
+    Rehydrate or pull workspaces before their files are served from /workspaces
+    """
+    parts = request.url.path.split("/")
+    if len(parts) > 2 and parts[1] == "workspaces":
+        await open_workspace(parts[2])
+    return await call_next(request)
+
+# Route workspace requests to their instance and lock mutated workspaces
+# (added after the middlewares above so it runs before them)
+app.add_middleware(WorkspaceAffinityMiddleware)
+
+# Replay idempotent retries and coalesce duplicate generations before the workspace lock serializes them
+app.add_middleware(DeduplicationMiddleware)
+
+# Add CORS middleware (outermost, so forwarded and rejected responses get CORS headers too)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Trace-Id", "Idempotent-Replayed"],
 )
 
 # Include routers - Note: generation router already has prefix="/api"
 app.include_router(generation.router)
 app.include_router(shell_agent.router)
+app.include_router(live.router)
 
 # Create workspaces directory if it doesn't exist
 workspaces_dir = Path("workspaces")
@@ -38,6 +94,81 @@ agents_dir = Path("app/agents")
 if not agents_dir.exists():
     agents_dir.mkdir(parents=True)
 
+@app.on_event("startup")
+async def start_loop_monitor():
+    loop_monitor.start()
+
+@app.on_event("startup")
+async def recover_workspace_writes():
+    # Finish or discard writes and archive operations interrupted by a crash before serving files
+    workspace_store.recover_all(workspaces_dir)
+    workspace_tiering.recover()
+
+@app.on_event("startup")
+async def start_workspace_tiering():
+    workspace_tiering.start()
+
+@app.on_event("startup")
+async def start_dev_servers():
+    dev_servers.start()
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    await loop_monitor.stop()
+
+@app.on_event("shutdown")
+async def flush_workspace_writes():
+    workspace_store.flush()
+
+@app.on_event("shutdown")
+async def stop_workspace_tiering():
+    await workspace_tiering.stop()
+
+@app.on_event("shutdown")
+async def stop_dev_servers():
+    await dev_servers.stop()
+
+@app.on_event("shutdown")
+async def stop_prefetches():
+    generation.prefetcher.stop()
+
+@app.on_event("shutdown")
+async def close_cluster_client():
+    await cluster.close()
+
+@app.get("/api/health")
+async def health(reset: bool = False):
+    """
+    Liveness check with event loop lag statistics
+    """
+    stats = loop_monitor.stats()
+    if reset:
+        loop_monitor.reset()
+    return {"status": "ok", "event_loop_lag": stats, "llm_scheduler": llm_scheduler.snapshot()}
+
+@app.get("/api/prompts")
+async def prompts():
+    """
+    Prompt templates with their versions and estimated static (cacheable) token counts
+    """
+    return describe_prompts()
+
+@app.get("/api/cluster")
+async def cluster_info(workspace: Optional[str] = None):
+    """
+    Instances, their reachability and (optionally) the instance owning a workspace
+    """
+    return cluster.describe(workspace)
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics
+    """
+    # Collecting may walk the workspaces (at most once per cache TTL)
+    body, content_type = await asyncio.to_thread(render_metrics)
+    return Response(content=body, media_type=content_type)
+
 # Mount workspaces directory for serving static files
 app.mount("/workspaces", StaticFiles(directory="workspaces"), name="workspaces")
 
@@ -9,14 +9,26 @@ class GenerationRequest(BaseModel):
     prompt: str
     workspace_name: str
     
+class PrefetchRequest(BaseModel):
+    # Draft of the prompt the user is typing
+    prompt: str
+    # Workspace the draft will be generated into, so the prefetch lands on the same instance
+    workspace_name: Optional[str] = None
+    # Identifies the typing client; a new draft supersedes the client's previous one
+    client_id: Optional[str] = None
+
 class GenerationResponse(BaseModel):
     workspace_name: str
     files: List[File]
+    # Snapshot version recorded for the generated files
+    version: Optional[int] = None
 
 class UpdateFileRequest(BaseModel):
     workspace_name: str
     file_name: str
     content: str
+    # Buffer the write and commit it with other rapid edits instead of immediately
+    autosave: bool = False
     
 class UpdatePromptRequest(BaseModel):
     workspace_name: str
@@ -1,18 +1,42 @@
-from fastapi import APIRouter, HTTPException, Body
-from app.models.workspace import GenerationRequest, GenerationResponse, File, UpdateFileRequest, UpdatePromptRequest
+from fastapi import APIRouter, HTTPException, Body, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from app.models.workspace import (
+    GenerationRequest, GenerationResponse, File, PrefetchRequest, UpdateFileRequest, UpdatePromptRequest,
+)
 from app.models.template import Template, TemplateMatch
 from app.services.template_manager import TemplateManager
+from app.services.code_index import get_index, render_snippets
+from app.services.dev_servers import DevServersBusy, dev_servers
+from app.services.groq_client import post_chat_completion
+from app.services.live_updates import GenerationJob
+from app.services.llm_scheduler import LLMRateLimited
+from app.services.locks import WorkspaceBusy, workspace_locks
+from app.services.metrics import WORKSPACE_MUTATIONS
+from app.services.prefetch import create_prefetcher
+from app.services.prompts import (
+    AGENT_MODIFY_FILE, GENERATE_CSS, GENERATE_HTML, MODIFY_TEMPLATE_CSS, MODIFY_TEMPLATE_HTML, UPDATE_FILE, UPDATE_PAGE,
+)
+from app.services.preview import PreviewError, preview_service
+from app.services.storage import (
+    list_workspace_names, open_workspace, sync_workspace, workspace_exists, workspace_path as workspace_path_for,
+    workspace_state,
+)
+from app.services.tiering import workspace_tiering
+from app.services.snapshots import VersionNotFound, get_snapshots, record_version
+from app.services.tracing import span
+from app.services.workspace_store import WorkspacePathError, workspace_store
+import asyncio
 import os
 from pathlib import Path
 import shutil
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
 from dotenv import load_dotenv
 import requests
 import json
 
 # Import the agent task handler
-from ..agents.shell_agent import run_agent_task
+from ..agents.shell_agent import arun_agent_task
 
 # Load environment variables
 load_dotenv()
@@ -26,38 +50,81 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     logger.warning("GROQ_API_KEY not found in environment variables")
 
-# Groq API configuration
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
-GROQ_HEADERS = {
-    "Authorization": f"Bearer {GROQ_API_KEY}",
-    "Content-Type": "application/json"
-}
+# Groq API configuration (endpoint and headers live in app.services.groq_client)
 GROQ_MODEL = "llama-3.3-70b-versatile"  # You can also use "mixtral-8x7b-32768" or other Groq models
 
 router = APIRouter(prefix="/api", tags=["generation"])
 
 # Initialize template manager
 template_manager = TemplateManager()
+# Speculative template matching for prompts being typed
+prefetcher = create_prefetcher(template_manager)
+
+# Token budget for project context retrieved for single-file edits
+CONTEXT_TOKENS = int(os.getenv("EDIT_CONTEXT_TOKENS", "1500"))
+
+# Preview bundle URLs are content-addressed
+PREVIEW_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def rate_limited_error(e: LLMRateLimited) -> HTTPException:
+    """429 telling the client when the Groq budget allows a retry"""
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+
+def busy_error(e: WorkspaceBusy) -> HTTPException:
+    """409 for a commit or agent run that could not get its workspace lock in time"""
+    return HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header lists the ETag (weak comparison)"""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+def retrieve_context(workspace_path: Path, query: str, target_file: Optional[str] = None,
+                     max_tokens: int = CONTEXT_TOKENS) -> str:
+    """Relevant snippets from the rest of the workspace, rendered for a prompt"""
+    with span("retrieve_context", workspace=workspace_path.name) as context_span:
+        snippets = get_index(str(workspace_path)).retrieve(query, max_tokens=max_tokens, target_file=target_file)
+        context_span.set_attribute("context.snippets", len(snippets))
+    return render_snippets(snippets)
+
+@router.post("/prefetch", status_code=202)
+async def prefetch(request: PrefetchRequest, http_request: Request):
+    """
+    Prepare the generation of a prompt that is still being typed (template
+    match, warm API connection). Call it with debounced drafts; a newer
+    draft from the same client supersedes the previous one.
+    """
+    client_id = request.client_id or (http_request.client.host if http_request.client else "anonymous")
+    return {"scheduled": prefetcher.schedule(client_id, request.prompt)}
 
 @router.post("/generate", response_model=GenerationResponse)
 async def generate_code(request: GenerationRequest):
     """
     Generate HTML and CSS files based on prompt and create workspace
     """
-    # Create workspace directory
-    workspace_path = Path("workspaces") / request.workspace_name
-    if workspace_path.exists():
-        # If workspace exists, use a new name
-        counter = 1
-        while workspace_path.exists():
-            workspace_path = Path("workspaces") / f"{request.workspace_name}_{counter}"
-            counter += 1
+    # Create workspace directory; if the workspace exists (hot or archived), use a new name.
+    # The directory is claimed with an exclusive mkdir, since generation does not hold the workspace lock
+    workspace_path = workspace_path_for(request.workspace_name)
+    counter = 0
+    while True:
+        if not workspace_exists(workspace_path.name):
+            try:
+                workspace_path.mkdir(parents=True)
+                break
+            except FileExistsError:
+                pass
+        counter += 1
+        workspace_path = workspace_path_for(f"{request.workspace_name}_{counter}")
     
-    workspace_path.mkdir(parents=True, exist_ok=True)
+    WORKSPACE_MUTATIONS.labels("generate").inc()
+    job = GenerationJob(request.workspace_name, "generate")
+    job.start()
     
     try:
         # First, try to find a matching template
-        template_match = await template_manager.find_matching_template(request.prompt)
+        with span("template_match") as match_span:
+            template_match = await template_manager.find_matching_template(request.prompt)
+            match_span.set_attribute("template.matched", template_match.template_name if template_match else None)
         
         if template_match:
             logger.info(f"Found matching template: {template_match.template_name} with score {template_match.match_score}")
@@ -66,67 +133,28 @@ async def generate_code(request: GenerationRequest):
             if template:
                 # Use template as base and modify it according to the prompt
                 print("Template Matched")
-                html_prompt = f"""
-                Modify this existing HTML template to match the user's requirements:
-                
-                Original template HTML:
-                ```html
-                {template.html_content}
-                ```
-                
-                User's requirements:
-                {request.prompt}
-                
-                Return the modified HTML code only.
-                Keep the same structure but update content, classes, and elements as needed.
-                """
-                
-                css_prompt = f"""
-                Modify this existing CSS template to match the user's requirements:
-                
-                Original template CSS:
-                ```css
-                {template.css_content}
-                ```
-                
-                User's requirements:
-                {request.prompt}
-                
-                Return the modified CSS code only.
-                Keep the same structure but update styles, colors, and layouts as needed.
-                """
+                html_messages = MODIFY_TEMPLATE_HTML.messages(
+                    template_html=template.html_content, requirements=request.prompt
+                )
+                css_messages = MODIFY_TEMPLATE_CSS.messages(
+                    template_css=template.css_content, requirements=request.prompt
+                )
                 
         else:
             logger.info("No matching template found, generating from scratch")
             # Generate from scratch as before
-            html_prompt = f"""
-            Generate a clean, modern HTML file based on this description:
-            {request.prompt}
-            
-            Include proper HTML5 structure with doctype, html, head, body tags.
-            Add viewport meta tags and other necessary head elements.
-            Only return the complete HTML code without any explanations.
-            Use semantic HTML elements where appropriate.
-            Add comments to explain the structure.
-            Don't include any styling in the HTML file itself (no inline styles or style tags).
-            Use class names that work well with CSS.
-            Use Bootstrap Css and make the design interactive and user friendly.
-            Use relevant icons from BootStrap in different sizes in place of images.
-            """
+            html_messages = GENERATE_HTML.messages(description=request.prompt)
             
         try:
             # Using Groq API for HTML generation
             payload = {
                 "model": GROQ_MODEL,
-                "messages": [
-                    {"role": "system", "content": "You are a professional web developer who creates clean, semantic HTML using Bootstrap Css."},
-                    {"role": "user", "content": html_prompt}
-                ],
+                "messages": html_messages,
                 "temperature": 0.7,
                 "max_tokens": 4000
             }
             
-            response = requests.post(GROQ_API_URL, headers=GROQ_HEADERS, json=payload)
+            response = await asyncio.to_thread(post_chat_completion, payload, "llm.html", job.tokens("html"))
             
             if response.status_code != 200:
                 logger.error(f"Groq API error: {response.status_code} - {response.text}")
@@ -136,44 +164,25 @@ async def generate_code(request: GenerationRequest):
             html_content = response_data['choices'][0]['message']['content']
             
             # Clean up the response to extract just the HTML code
-            if "```html" in html_content:
-                html_content = html_content.split("```html")[1].split("```")[0].strip()
-            elif "```" in html_content:
-                html_content = html_content.split("```")[1].split("```")[0].strip()
+            with span("extract_code", language="html"):
+                if "```html" in html_content:
+                    html_content = html_content.split("```html")[1].split("```")[0].strip()
+                elif "```" in html_content:
+                    html_content = html_content.split("```")[1].split("```")[0].strip()
                 
             # Now, generate the CSS content
             if not template_match:
-                css_prompt = f"""
-                Generate a modern, clean CSS file for this HTML:
-                ```html
-                {html_content}
-                ```
-                
-                Based on this description:
-                {request.prompt}
-                
-                Create a responsive design that looks good on all devices.
-                Use modern CSS features like flexbox and grid where appropriate.
-                Add hover effects and transitions for interactive elements.
-                Include media queries for responsive design.
-                Add comments to explain the CSS sections.
-                Only return the complete CSS code without any explanations.
-                Use Bootstrap Css and make the design interactive and user friendly.
-                Use relevant icons from BootStrap in different sizes in place of images.
-                """
+                css_messages = GENERATE_CSS.messages(html=html_content, description=request.prompt)
             
             # Using Groq API for CSS generation
             payload = {
                 "model": GROQ_MODEL,
-                "messages": [
-                    {"role": "system", "content": "You are a professional web developer who creates clean, modern CSS using Bootstrap Css."},
-                    {"role": "user", "content": css_prompt}
-                ],
+                "messages": css_messages,
                 "temperature": 0.7,
                 "max_tokens": 4000
             }
             
-            response = requests.post(GROQ_API_URL, headers=GROQ_HEADERS, json=payload)
+            response = await asyncio.to_thread(post_chat_completion, payload, "llm.css", job.tokens("css"))
             
             if response.status_code != 200:
                 logger.error(f"Groq API error: {response.status_code} - {response.text}")
@@ -183,40 +192,11 @@ async def generate_code(request: GenerationRequest):
             css_content = response_data['choices'][0]['message']['content']
             
             # Clean up the response to extract just the CSS code
-            if "```css" in css_content:
-                css_content = css_content.split("```css")[1].split("```")[0].strip()
-            elif "```" in css_content:
-                css_content = css_content.split("```")[1].split("```")[0].strip()
-                
-            # Write the HTML and CSS files
-            html_file_path = workspace_path / "index.html"
-            css_file_path = workspace_path / "styles.css"
-            
-            with open(html_file_path, "w", encoding="utf-8") as f:
-                f.write(html_content)
-                
-            with open(css_file_path, "w", encoding="utf-8") as f:
-                f.write(css_content)
-                
-            # Create a preview.html file that includes both HTML and CSS
-            preview_html = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{request.workspace_name} - Preview</title>
-    <style>
-{css_content}
-    </style>
-</head>
-<body>
-{html_content}
-</body>
-</html>"""
-            
-            preview_path = workspace_path / "preview.html"
-            with open(preview_path, "w", encoding="utf-8") as f:
-                f.write(preview_html)
+            with span("extract_code", language="css"):
+                if "```css" in css_content:
+                    css_content = css_content.split("```css")[1].split("```")[0].strip()
+                elif "```" in css_content:
+                    css_content = css_content.split("```")[1].split("```")[0].strip()
                 
             # Create a README with instructions
             template_info = f"\nBased on template: {template_match.template_name}" if template_match else ""
@@ -228,15 +208,19 @@ This workspace contains a web project generated based on the following descripti
 ## Files
 - index.html: The HTML structure of the website
 - styles.css: The CSS styling for the website
-- preview.html: A combined file with both HTML and CSS for easy previewing
 
 ## Preview
-Open the preview.html file in a web browser to see the rendered website.
+Open index.html in a web browser to see the rendered website.
 """
             
-            readme_path = workspace_path / "README.md"
-            with open(readme_path, "w", encoding="utf-8") as f:
-                f.write(readme_content)
+            # Write all files in one transaction so the workspace never holds
+            # a new index.html next to an old styles.css
+            with span("write_files", files=3):
+                await asyncio.to_thread(workspace_store.write_files, workspace_path, {
+                    "index.html": html_content,
+                    "styles.css": css_content,
+                    "README.md": readme_content,
+                })
                 
             # Return the generated files
             files = [
@@ -245,11 +229,19 @@ Open the preview.html file in a web browser to see the rendered website.
                 File(name="README.md", content=readme_content)
             ]
             
+            version = await asyncio.to_thread(record_version, workspace_path, "generate_code", request.prompt)
+            
+            await sync_workspace(workspace_path.name)
+            job.finish(workspace_name=workspace_path.name, version=version)
+            
             return GenerationResponse(
                 workspace_name=workspace_path.name,
-                files=files
+                files=files,
+                version=version
             )
             
+        except (LLMRateLimited, WorkspaceBusy):
+            raise
         except Exception as e:
             logger.error(f"Error during HTML/CSS generation: {e}")
             raise HTTPException(status_code=500, detail=f"Error during HTML/CSS generation: {str(e)}")
@@ -258,6 +250,11 @@ Open the preview.html file in a web browser to see the rendered website.
         # Clean up in case of error
         if workspace_path.exists():
             shutil.rmtree(workspace_path)
+        job.finish(error=e)
+        if isinstance(e, LLMRateLimited):
+            raise rate_limited_error(e)
+        if isinstance(e, WorkspaceBusy):
+            raise busy_error(e)
         logger.error(f"Error generating HTML/CSS: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating HTML/CSS: {str(e)}")
         
@@ -266,22 +263,25 @@ async def update_file(request: UpdateFileRequest):
     """
     Update file content in a workspace
     """
-    workspace_path = Path("workspaces") / request.workspace_name
+    workspace_path = await open_workspace(request.workspace_name)
     if not workspace_path.exists():
         raise HTTPException(status_code=404, detail=f"Workspace {request.workspace_name} not found")
     
-    # Handle relative paths in the file name
-    file_parts = request.file_name.split('/')
-    file_path = workspace_path
-    
-    # Traverse the path to find the file
-    for part in file_parts:
-        file_path = file_path / part
-    
     try:
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(request.content)
-        return {"message": f"File {request.file_name} updated successfully"}
+        if request.autosave:
+            # Editor autosaves are buffered and committed together once typing pauses
+            workspace_store.write_coalesced(workspace_path, request.file_name, request.content)
+        else:
+            await asyncio.to_thread(workspace_store.write_file, workspace_path, request.file_name, request.content)
+        WORKSPACE_MUTATIONS.labels("update_file").inc()
+        # Autosaves are not versioned one by one; the next version includes them
+        version = None
+        if not request.autosave:
+            version = await asyncio.to_thread(record_version, workspace_path, "update_file", request.file_name)
+            await sync_workspace(workspace_path.name)
+        return {"message": f"File {request.file_name} updated successfully", "version": version}
+    except WorkspacePathError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error updating file: {e}")
         raise HTTPException(status_code=500, detail=f"Error updating file: {str(e)}")
@@ -291,7 +291,7 @@ async def update_from_prompt(request: UpdatePromptRequest):
     """
     Update file based on prompt using the agent
     """
-    workspace_path = Path("workspaces") / request.workspace_name
+    workspace_path = await open_workspace(request.workspace_name)
     if not workspace_path.exists():
         raise HTTPException(status_code=404, detail=f"Workspace {request.workspace_name} not found")
 
@@ -303,40 +303,31 @@ async def update_from_prompt(request: UpdatePromptRequest):
     if not file_path.exists():
         raise HTTPException(status_code=404, detail=f"File {request.file_name} not found")
 
+    WORKSPACE_MUTATIONS.labels("update_from_prompt").inc()
+    # Commit buffered autosaves first so they cannot land on top of this edit,
+    # and keep them as a version of their own
+    await asyncio.to_thread(workspace_store.flush, workspace_path)
+    await asyncio.to_thread(record_version, workspace_path, "autosave")
+    job = GenerationJob(workspace_path.name, "update")
+    job.start()
     try:
         # If updating index.html or styles.css, regenerate both files
         if request.file_name in ["index.html", "styles.css"]:
             # Read previous HTML and CSS
             html_path = workspace_path / "index.html"
             css_path = workspace_path / "styles.css"
-            prev_html = html_path.read_text(encoding="utf-8") if html_path.exists() else ""
-            prev_css = css_path.read_text(encoding="utf-8") if css_path.exists() else ""
-
-            # Build prompt for HTML and CSS update
-            html_prompt = f"""
-            Here is the previous index.html:
-            ```html\n{prev_html}\n```
-            Here is the previous styles.css:
-            ```css\n{prev_css}\n```
-            Update BOTH files according to this request:\n{request.prompt}\n
-            Return ONLY the new index.html and styles.css code blocks.
-            """
-            # Build messages array, including chat_history if present
-            messages = [
-                {"role": "system", "content": "You are a professional web developer who updates HTML and CSS files together and uses only Bootstrap Css."}
-            ]
-            if request.chat_history:
-                for msg in request.chat_history:
-                    if "role" in msg and "content" in msg:
-                        messages.append({"role": msg["role"], "content": msg["content"]})
-            messages.append({"role": "user", "content": html_prompt})
+            prev_html = workspace_store.read_text(workspace_path, "index.html") if html_path.exists() else ""
+            prev_css = workspace_store.read_text(workspace_path, "styles.css") if css_path.exists() else ""
+
+            # Prompt for the HTML and CSS update, after the chat history if present
+            messages = UPDATE_PAGE.messages(request.chat_history, html=prev_html, css=prev_css, request=request.prompt)
             payload = {
                 "model": GROQ_MODEL,
                 "messages": messages,
                 "temperature": 0.7,
                 "max_tokens": 4000
             }
-            response = requests.post(GROQ_API_URL, headers=GROQ_HEADERS, json=payload)
+            response = await asyncio.to_thread(post_chat_completion, payload, "llm.update", job.tokens("update"))
             if response.status_code != 200:
                 logger.error(f"Groq API error: {response.status_code} - {response.text}")
                 raise HTTPException(status_code=response.status_code, detail=f"Groq API error: {response.text}")
@@ -348,20 +339,24 @@ async def update_from_prompt(request: UpdatePromptRequest):
             css_match = re.search(r"```css(.*?)```", content, re.DOTALL)
             new_html = html_match.group(1).strip() if html_match else prev_html
             new_css = css_match.group(1).strip() if css_match else prev_css
-            # Save both files
-            html_path.write_text(new_html, encoding="utf-8")
-            css_path.write_text(new_css, encoding="utf-8")
+            # Save both files together
+            await asyncio.to_thread(
+                workspace_store.write_files, workspace_path, {"index.html": new_html, "styles.css": new_css}
+            )
+            version = await asyncio.to_thread(record_version, workspace_path, "update_from_prompt", request.prompt)
+            await sync_workspace(workspace_path.name)
+            job.finish(version=version)
             return {
                 "message": "index.html and styles.css updated successfully",
+                "version": version,
                 "files": [
                     {"name": "index.html", "content": new_html},
                     {"name": "styles.css", "content": new_css}
                 ]
             }
         # Otherwise, fallback to previous logic
-        # Read current file content
-        with open(file_path, "r", encoding="utf-8") as f:
-            current_content = f.read()
+        # Read current file content (including unsaved autosaves)
+        current_content = workspace_store.read_text(workspace_path, request.file_name)
         
         # Build a task for the agent
         react_app_name = None
@@ -371,29 +366,35 @@ async def update_from_prompt(request: UpdatePromptRequest):
                 react_app_name = item.name
                 break
                 
+        # Snippets from related files (imports, components, CSS classes) so the
+        # edit has the project context without extra exploration
+        project_context = await asyncio.to_thread(
+            retrieve_context, workspace_path, f"{request.file_name}\n{request.prompt}", request.file_name
+        )
+        
         if react_app_name:
             # If we found a React app dir, use agent to modify
-            modification_task = f"""
-            In the React application '{react_app_name}', modify the file '{request.file_name}' according to this request:
-            {request.prompt}
-            
-            The current content of the file is:
-            ```
-            {current_content}
-            ```
-            """
+            modification_task = AGENT_MODIFY_FILE.render(
+                app_name=react_app_name, file_name=request.file_name, request=request.prompt,
+                content=current_content, project_context=project_context,
+            )
             
-            result = run_agent_task(str(workspace_path), modification_task)
+            # One agent run per workspace at a time; saves are not blocked
+            async with workspace_locks.hold_agent(workspace_path.name):
+                result = await arun_agent_task(str(workspace_path), modification_task)
             
             if not result["success"]:
                 raise HTTPException(status_code=500, detail=f"Error modifying file: {result.get('error', 'Unknown error')}")
                 
             # Read the updated content
-            with open(file_path, "r", encoding="utf-8") as f:
-                updated_content = f.read()
+            updated_content = workspace_store.read_text(workspace_path, request.file_name)
+            version = await asyncio.to_thread(record_version, workspace_path, "update_from_prompt", request.prompt)
+            await sync_workspace(workspace_path.name)
+            job.finish(version=version)
                 
             return {
                 "message": f"File {request.file_name} updated successfully",
+                "version": version,
                 "files": [
                     {"name": request.file_name, "content": updated_content}
                 ]
@@ -402,28 +403,12 @@ async def update_from_prompt(request: UpdatePromptRequest):
         else:
             # Fall back to Groq API if React app not found
             # Generate updated content based on prompt
-            prompt = f"""
-            I have the following {request.file_name} file:
-            ```
-            {current_content}
-            ```
-            
-            Please modify the file according to this request:
-            {request.prompt}
-            
-            Return only the updated code.
-            """
-            
             try:
                 # Using Groq API
-                messages = [
-                    {"role": "system", "content": "You are a helpful assistant that modifies code."}
-                ]
-                if request.chat_history:
-                    for msg in request.chat_history:
-                        if "role" in msg and "content" in msg:
-                            messages.append({"role": msg["role"], "content": msg["content"]})
-                messages.append({"role": "user", "content": prompt})
+                messages = UPDATE_FILE.messages(
+                    request.chat_history, file_name=request.file_name, content=current_content,
+                    project_context=project_context, request=request.prompt,
+                )
                 payload = {
                     "model": GROQ_MODEL,
                     "messages": messages,
@@ -431,7 +416,7 @@ async def update_from_prompt(request: UpdatePromptRequest):
                     "max_tokens": 4000
                 }
                 
-                response = requests.post(GROQ_API_URL, headers=GROQ_HEADERS, json=payload)
+                response = await asyncio.to_thread(post_chat_completion, payload, "llm.update", job.tokens("update"))
                 
                 if response.status_code != 200:
                     logger.error(f"Groq API error: {response.status_code} - {response.text}")
@@ -440,6 +425,8 @@ async def update_from_prompt(request: UpdatePromptRequest):
                 response_data = response.json()
                 updated_content = response_data['choices'][0]['message']['content']
                 
+            except LLMRateLimited:
+                raise
             except Exception as e:
                 logger.error(f"Error calling Groq API: {e}")
                 raise HTTPException(status_code=500, detail=f"Error updating file: {str(e)}")
@@ -456,16 +443,24 @@ async def update_from_prompt(request: UpdatePromptRequest):
                         updated_content = updated_content.split("```")[0].strip()
             
             # Write updated content
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(updated_content)
+            await asyncio.to_thread(workspace_store.write_file, workspace_path, request.file_name, updated_content)
+            version = await asyncio.to_thread(record_version, workspace_path, "update_from_prompt", request.prompt)
+            await sync_workspace(workspace_path.name)
+            job.finish(version=version)
             return {
                 "message": f"File {request.file_name} updated successfully",
+                "version": version,
                 "files": [
                     {"name": request.file_name, "content": updated_content}
                 ]
             }
             
     except Exception as e:
+        job.finish(error=e)
+        if isinstance(e, LLMRateLimited):
+            raise rate_limited_error(e)
+        if isinstance(e, WorkspaceBusy):
+            raise busy_error(e)
         logger.error(f"Error updating file from prompt: {e}")
         raise HTTPException(status_code=500, detail=f"Error updating file from prompt: {str(e)}")
 
@@ -478,15 +473,51 @@ async def list_workspaces():
     if not workspaces_path.exists():
         workspaces_path.mkdir(parents=True, exist_ok=True)
         
-    workspaces = [d.name for d in workspaces_path.iterdir() if d.is_dir()]
+    # Archived workspaces stay listed and are rehydrated on first access
+    workspaces = list_workspace_names()
     return workspaces
 
+@router.get("/workspaces/status")
+async def list_workspace_states():
+    """
+    Storage tier of every workspace (hot, archived or rehydrating), without rehydrating any
+    """
+    names = await asyncio.to_thread(list_workspace_names)
+    states = await asyncio.to_thread(lambda: [workspace_state(name) for name in names])
+    return {"workspaces": states}
+
+@router.get("/workspace/{workspace_name}/status")
+async def get_workspace_status(workspace_name: str):
+    """
+    Storage tier of a workspace, with rehydration progress; does not rehydrate
+    """
+    state = await asyncio.to_thread(workspace_state, workspace_name)
+    if state["state"] == "missing":
+        raise HTTPException(status_code=404, detail=f"Workspace {workspace_name} not found")
+    return state
+
+@router.post("/workspace/{workspace_name}/archive")
+async def archive_workspace(workspace_name: str):
+    """
+    Move a workspace to the archive tier now
+    """
+    if not workspace_exists(workspace_name):
+        raise HTTPException(status_code=404, detail=f"Workspace {workspace_name} not found")
+    try:
+        # Pending autosaves must reach the disk before the files are packed
+        await asyncio.to_thread(workspace_store.flush, workspace_path_for(workspace_name))
+        await asyncio.to_thread(workspace_tiering.archive, workspace_name)
+        return await asyncio.to_thread(workspace_state, workspace_name)
+    except Exception as e:
+        logger.error(f"Error archiving workspace: {e}")
+        raise HTTPException(status_code=500, detail=f"Error archiving workspace: {str(e)}")
+
 @router.get("/workspace/{workspace_name}/files", response_model=List[str])
 async def list_workspace_files(workspace_name: str):
     """
     List all files in a workspace
     """
-    workspace_path = Path("workspaces") / workspace_name
+    workspace_path = await open_workspace(workspace_name)
     if not workspace_path.exists():
         raise HTTPException(status_code=404, detail=f"Workspace {workspace_name} not found")
     
@@ -517,34 +548,229 @@ async def list_workspace_files(workspace_name: str):
                 
         return files
     else:
-        # Regular workspace - list all files recursively
+        # Regular workspace - list all files recursively (without internal metadata)
         files = []
         for file in workspace_path.glob("**/*"):
-            if file.is_file():
+            if file.is_file() and ".codegen" not in file.relative_to(workspace_path).parts:
                 # Create relative path from workspace
                 rel_path = file.relative_to(workspace_path)
                 files.append(str(rel_path))
         return files
 
+@router.get("/workspace/{workspace_name}/context")
+async def get_workspace_context(workspace_name: str, query: str, file: Optional[str] = None,
+                                max_tokens: int = CONTEXT_TOKENS):
+    """
+    Retrieve the code snippets of a workspace most relevant to a prompt
+    """
+    workspace_path = await open_workspace(workspace_name)
+    if not workspace_path.exists():
+        raise HTTPException(status_code=404, detail=f"Workspace {workspace_name} not found")
+    try:
+        index = get_index(str(workspace_path))
+        snippets = await asyncio.to_thread(index.retrieve, query, max_tokens, file)
+        return {"workspace_name": workspace_name, "snippets": snippets}
+    except Exception as e:
+        logger.error(f"Error retrieving workspace context: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/workspace/{workspace_name}/symbols")
+async def get_workspace_symbols(workspace_name: str):
+    """
+    Symbol table of a workspace: exports, imports, components and CSS classes per file
+    """
+    workspace_path = await open_workspace(workspace_name)
+    if not workspace_path.exists():
+        raise HTTPException(status_code=404, detail=f"Workspace {workspace_name} not found")
+    try:
+        index = get_index(str(workspace_path))
+        await asyncio.to_thread(index.refresh)
+        return {"workspace_name": workspace_name, "files": index.symbols()}
+    except Exception as e:
+        logger.error(f"Error reading workspace symbols: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/workspace/{workspace_name}/versions")
+async def list_versions(workspace_name: str):
+    """
+    Version history of a workspace, newest first
+    """
+    workspace_path = await open_workspace(workspace_name)
+    if not workspace_path.exists():
+        raise HTTPException(status_code=404, detail=f"Workspace {workspace_name} not found")
+    try:
+        versions = await asyncio.to_thread(get_snapshots(str(workspace_path)).summaries)
+        return {"workspace_name": workspace_name, "versions": versions}
+    except Exception as e:
+        logger.error(f"Error listing versions: {e}")
+        raise HTTPException(status_code=500, detail=f"Error listing versions: {str(e)}")
+
+@router.get("/workspace/{workspace_name}/versions/{version_id}/diff")
+async def diff_version(workspace_name: str, version_id: int, against: Optional[int] = None,
+                       file: Optional[str] = None):
+    """
+    Unified diffs of a version against another one (default: the version before it)
+    """
+    workspace_path = await open_workspace(workspace_name)
+    if not workspace_path.exists():
+        raise HTTPException(status_code=404, detail=f"Workspace {workspace_name} not found")
+    try:
+        diffs = await asyncio.to_thread(get_snapshots(str(workspace_path)).diff, version_id, against, file)
+        return {"workspace_name": workspace_name, "version": version_id, "against": against, "files": diffs}
+    except VersionNotFound as e:
+        raise HTTPException(status_code=404, detail=f"Version {e.args[0]} not found")
+    except Exception as e:
+        logger.error(f"Error diffing versions: {e}")
+        raise HTTPException(status_code=500, detail=f"Error diffing versions: {str(e)}")
+
+@router.get("/workspace/{workspace_name}/versions/{version_id}/file/{file_name:path}")
+async def get_version_file(workspace_name: str, version_id: int, file_name: str):
+    """
+    Content of a file as of a version
+    """
+    workspace_path = await open_workspace(workspace_name)
+    if not workspace_path.exists():
+        raise HTTPException(status_code=404, detail=f"Workspace {workspace_name} not found")
+    try:
+        content = await asyncio.to_thread(get_snapshots(str(workspace_path)).file_content, version_id, file_name)
+        return {"name": file_name, "version": version_id, "content": content}
+    except VersionNotFound:
+        raise HTTPException(status_code=404, detail=f"Version {version_id} not found")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"File {file_name} not found in version {version_id}")
+    except Exception as e:
+        logger.error(f"Error reading versioned file: {e}")
+        raise HTTPException(status_code=500, detail=f"Error reading versioned file: {str(e)}")
+
+@router.post("/workspace/{workspace_name}/versions/{version_id}/restore")
+async def restore_version(workspace_name: str, version_id: int, file: Optional[str] = Body(None, embed=True)):
+    """
+    Restore a workspace, or a single file of it, to a version
+    """
+    workspace_path = await open_workspace(workspace_name)
+    if not workspace_path.exists():
+        raise HTTPException(status_code=404, detail=f"Workspace {workspace_name} not found")
+    try:
+        result = await asyncio.to_thread(get_snapshots(str(workspace_path)).restore, version_id, file)
+        await sync_workspace(workspace_name)
+        WORKSPACE_MUTATIONS.labels("restore").inc()
+        return {"workspace_name": workspace_name, **result}
+    except VersionNotFound:
+        raise HTTPException(status_code=404, detail=f"Version {version_id} not found")
+    except Exception as e:
+        logger.error(f"Error restoring version: {e}")
+        raise HTTPException(status_code=500, detail=f"Error restoring version: {str(e)}")
+
+@router.get("/workspace/{workspace_name}/preview")
+async def get_preview(workspace_name: str, app: Optional[str] = None):
+    """
+    Preview bundle of the current workspace version, built on the first request.
+    `app` selects a React app directory when the workspace has several.
+    """
+    workspace_path = await open_workspace(workspace_name)
+    if not workspace_path.exists():
+        raise HTTPException(status_code=404, detail=f"Workspace {workspace_name} not found")
+    try:
+        return await preview_service.get(workspace_path, app)
+    except PreviewError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except WorkspacePathError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error building preview: {e}")
+        raise HTTPException(status_code=500, detail=f"Error building preview: {str(e)}")
+
+@router.get("/workspace/{workspace_name}/preview/{bundle_hash}/{file_name:path}")
+async def get_preview_file(workspace_name: str, bundle_hash: str, file_name: str, request: Request):
+    """
+    File of a preview bundle. Bundle URLs never change content, so they are cached as immutable.
+    """
+    workspace_path = await open_workspace(workspace_name)
+    try:
+        path, media_type, encoding = await asyncio.to_thread(
+            preview_service.asset, workspace_path, bundle_hash, file_name, request.headers.get("accept-encoding", "")
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"File {file_name} not found in preview {bundle_hash}")
+    etag = f'"{bundle_hash}-{encoding or "identity"}"'
+    headers = {
+        "Cache-Control": PREVIEW_CACHE_CONTROL,
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+@router.get("/dev-servers")
+async def list_dev_servers():
+    """
+    Dev servers running on this instance
+    """
+    return {"servers": dev_servers.list(), "max_servers": dev_servers.max_servers}
+
+@router.delete("/workspace/{workspace_name}/dev-server")
+async def stop_dev_server(workspace_name: str):
+    """
+    Stop the dev servers of a workspace
+    """
+    return {"stopped": await dev_servers.stop_workspace(workspace_name)}
+
+@router.get("/workspace/{workspace_name}/dev")
+async def open_dev_server(workspace_name: str, request: Request):
+    """
+    Entry page of the dev server; relative URLs need the trailing slash
+    """
+    url = request.url.path + "/"
+    if request.url.query:
+        url += "?" + request.url.query
+    return RedirectResponse(url)
+
+@router.get("/workspace/{workspace_name}/dev/{file_name:path}")
+async def proxy_dev_server(workspace_name: str, file_name: str, request: Request, app: Optional[str] = None):
+    """
+    Live preview of a React app served by a warm dev server, started on the first request.
+    `app` selects the app directory when the workspace has several.
+    """
+    workspace_path = await open_workspace(workspace_name)
+    if not workspace_path.exists():
+        raise HTTPException(status_code=404, detail=f"Workspace {workspace_name} not found")
+    try:
+        server = await dev_servers.get(workspace_path, app)
+        status, headers, body = await dev_servers.fetch(server, file_name, request.url.query, request.headers)
+    except DevServersBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except PreviewError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except WorkspacePathError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error proxying dev server: {e}")
+        raise HTTPException(status_code=502, detail=f"Error proxying dev server: {str(e)}")
+    return StreamingResponse(body, status_code=status, headers=headers)
+
 @router.get("/workspace/{workspace_name}/file/{file_name:path}")
 async def get_file_content(workspace_name: str, file_name: str):
     """
     Get content of a file, supporting nested paths
     """
-    workspace_path = Path("workspaces") / workspace_name
+    workspace_path = await open_workspace(workspace_name)
     if not workspace_path.exists():
         raise HTTPException(status_code=404, detail=f"Workspace {workspace_name} not found")
     
     # Handle paths with slashes
     file_path = workspace_path / Path(file_name)
     
-    if not file_path.exists():
+    if not file_path.exists() and file_name not in workspace_store.pending(workspace_path):
         raise HTTPException(status_code=404, detail=f"File {file_name} not found")
         
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
+        content = workspace_store.read_text(workspace_path, file_name)
         return {"name": file_name, "content": content}
+    except WorkspacePathError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error reading file: {e}")
         raise HTTPException(status_code=500, detail=f"Error reading file: {str(e)}")
@@ -559,8 +785,8 @@ async def list_workspaces_compat():
         if not workspaces_dir.exists():
             workspaces_dir.mkdir(parents=True)
             
-        # Get all directories in workspaces directory
-        workspaces = [d.name for d in workspaces_dir.iterdir() if d.is_dir()]
+        # Get all workspaces, including archived ones
+        workspaces = list_workspace_names()
         
         return {
             "success": True,
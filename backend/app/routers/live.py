@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+from typing import List
+import logging
+
+from ..services.live_updates import LiveConnection
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.websocket("/api/ws")
+async def live_updates(websocket: WebSocket, workspace: List[str] = Query([])):
+    """
+    Push channel for file changes, generation output and agent progress of the
+    subscribed workspaces (initial ones via ?workspace=..., more via subscribe messages)
+    """
+    await websocket.accept()
+    connection = LiveConnection(websocket)
+    try:
+        for name in workspace:
+            await connection.subscribe(name)
+        await connection.run()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        try:
+            await websocket.close()
+        except RuntimeError:
+            # Already closed by the client
+            pass
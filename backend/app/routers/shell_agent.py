@@ -1,12 +1,19 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional
+import asyncio
 import os
 import shutil
 from pathlib import Path
 import logging
 import json
-from ..agents.shell_agent import run_agent_task
+from ..agents.fast_paths import add_component_direct
+from ..agents.scaffold import scaffold_react_project
+from ..agents.shell_agent import DEFAULT_BUDGET, arun_agent_task
+from ..services.event_bus import event_bus, workspace_channel
+from ..services.metrics import WORKSPACE_MUTATIONS
+from ..services.storage import open_workspace, sync_workspace
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -17,6 +24,10 @@ router = APIRouter()
 class AgentTaskRequest(BaseModel):
     workspace_name: str
     task: str
+    # Optional per-task limits; they can only lower the server defaults
+    max_steps: Optional[int] = None
+    max_tokens: Optional[int] = None
+    max_seconds: Optional[float] = None
 
 class CreateReactProjectRequest(BaseModel):
     workspace_name: str
@@ -24,6 +35,29 @@ class CreateReactProjectRequest(BaseModel):
     description: Optional[str] = None
     components: Optional[List[str]] = None
     use_typescript: bool = False
+    # Use the agent loop instead of the deterministic scaffolding pipeline
+    use_agent: bool = False
+
+@router.get("/agent/logs/{workspace_name}")
+async def stream_logs(workspace_name: str, request: Request):
+    """
+    Stream live output of agent shell commands in a workspace as Server-Sent Events
+    """
+    subscription = event_bus.subscribe(workspace_channel(workspace_name))
+    
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                event = await subscription.get(timeout=15)
+                if event is None:
+                    # Keep the connection open through proxies
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @router.post("/agent/run")
 async def run_task(request: AgentTaskRequest):
@@ -31,15 +65,19 @@ async def run_task(request: AgentTaskRequest):
     Run an agent task in a workspace
     """
     try:
-        # Get workspace directory
-        workspace_dir = os.path.join("workspaces", request.workspace_name)
+        # Get workspace directory (rehydrated or pulled from storage if needed)
+        workspace_dir = str(await open_workspace(request.workspace_name))
         
         # Ensure workspace exists
         if not os.path.exists(workspace_dir):
             os.makedirs(workspace_dir)
             
         # Run the agent task
-        result = run_agent_task(workspace_dir, request.task)
+        WORKSPACE_MUTATIONS.labels("agent_run").inc()
+        budget = DEFAULT_BUDGET.override(request.max_steps, request.max_tokens, request.max_seconds)
+        result = await arun_agent_task(workspace_dir, request.task, budget)
+        # Publish whatever the task changed, also when it failed halfway
+        await sync_workspace(Path(workspace_dir).name)
         
         if result["success"]:
             return {
@@ -64,34 +102,48 @@ async def create_react_project(request: CreateReactProjectRequest):
     Create a new React project in a workspace
     """
     try:
-        # Get workspace directory
-        workspace_dir = os.path.join("workspaces", request.workspace_name)
+        # Get workspace directory (rehydrated or pulled from storage if needed)
+        workspace_dir = str(await open_workspace(request.workspace_name))
         
         # Ensure workspace exists
         if not os.path.exists(workspace_dir):
             os.makedirs(workspace_dir)
             
-        # Build the task description
-        task = f"Create a new React application named {request.app_name}"
-        
-        if request.use_typescript:
-            task += " using TypeScript"
-            
-        if request.description:
-            task += f" with the following description: {request.description}"
-            
-        if request.components and len(request.components) > 0:
-            components_str = ", ".join(request.components)
-            task += f". Include the following components: {components_str}"
+        WORKSPACE_MUTATIONS.labels("create_react_project").inc()
+        if not request.use_agent:
+            # Create the app and generate all components directly
+            result = await scaffold_react_project(
+                workspace_dir,
+                request.app_name,
+                use_typescript=request.use_typescript,
+                description=request.description,
+                components=request.components
+            )
+        else:
+            # Build the task description
+            task = f"Create a new React application named {request.app_name}"
             
-        # Run the agent task
-        result = run_agent_task(workspace_dir, task)
+            if request.use_typescript:
+                task += " using TypeScript"
+                
+            if request.description:
+                task += f" with the following description: {request.description}"
+                
+            if request.components and len(request.components) > 0:
+                components_str = ", ".join(request.components)
+                task += f". Include the following components: {components_str}"
+                
+            # Run the agent task
+            result = await arun_agent_task(workspace_dir, task)
+        # Publish whatever the task changed, also when it failed halfway
+        await sync_workspace(Path(workspace_dir).name)
         
         if result["success"]:
             return {
                 "success": True,
                 "workspace_name": request.workspace_name,
                 "app_name": request.app_name,
+                "components": result.get("components"),
                 "output": result["output"]
             }
         else:
@@ -110,25 +162,37 @@ async def add_component(
     workspace_name: str = Body(...),
     app_name: str = Body(...),
     component_name: str = Body(...),
-    description: str = Body(...)
+    description: str = Body(...),
+    use_agent: bool = Body(False)
 ):
     """
     Add a new component to a React application
+    
+    The component is generated with a single LLM call and written directly;
+    the agent loop is only used when requested or as a fallback.
     """
     try:
-        # Get workspace directory
-        workspace_dir = os.path.join("workspaces", workspace_name)
+        # Get workspace directory (rehydrated or pulled from storage if needed)
+        workspace_dir = str(await open_workspace(workspace_name))
         
         # Ensure workspace and app exist
         app_path = os.path.join(workspace_dir, app_name)
         if not os.path.exists(app_path):
             raise HTTPException(status_code=404, detail=f"React app '{app_name}' not found in workspace '{workspace_name}'")
             
-        # Build the task description
-        task = f"Create a new React component named {component_name} for the {app_name} application with the following description: {description}"
+        WORKSPACE_MUTATIONS.labels("add_component").inc()
+        result = None
+        if not use_agent:
+            result = await asyncio.to_thread(add_component_direct, workspace_dir, app_name, component_name, description)
             
-        # Run the agent task
-        result = run_agent_task(workspace_dir, task)
+        if result is None:
+            # Build the task description
+            task = f"Create a new React component named {component_name} for the {app_name} application with the following description: {description}"
+            
+            # Run the agent task
+            result = await arun_agent_task(workspace_dir, task)
+        # Publish whatever the task changed, also when it failed halfway
+        await sync_workspace(Path(workspace_dir).name)
         
         if result["success"]:
             return {
@@ -160,8 +224,8 @@ async def modify_file(
     Modify a file in a React application
     """
     try:
-        # Get workspace directory
-        workspace_dir = os.path.join("workspaces", workspace_name)
+        # Get workspace directory (rehydrated or pulled from storage if needed)
+        workspace_dir = str(await open_workspace(workspace_name))
         
         # Ensure workspace and app exist
         app_path = os.path.join(workspace_dir, app_name)
@@ -176,7 +240,10 @@ async def modify_file(
         task = f"Modify the file at '{file_path}' in the '{app_name}' React application according to these instructions: {instructions}"
             
         # Run the agent task
-        result = run_agent_task(workspace_dir, task)
+        WORKSPACE_MUTATIONS.labels("modify_file").inc()
+        result = await arun_agent_task(workspace_dir, task)
+        # Publish whatever the task changed, also when it failed halfway
+        await sync_workspace(Path(workspace_dir).name)
         
         if result["success"]:
             return {
@@ -0,0 +1,344 @@
+"""
+Workspace-affinity routing across several app instances.
+
+Every instance (one uvicorn process per core and/or per node) is listed in
+``CLUSTER_NODES`` as a comma-separated list of base URLs, and ``CLUSTER_SELF``
+is the URL of the instance itself. Workspaces are mapped to a preferred
+instance with a consistent-hash ring (``CLUSTER_VNODES`` virtual nodes per
+instance), so adding or removing an instance only moves the workspaces of
+that instance. Any instance accepts any request. Requests for a workspace
+owned by another instance are forwarded there and the response is streamed
+back, so the local copy, in-memory caches and live event stream of a
+workspace stay on one instance. An unreachable owner is skipped for
+``CLUSTER_RETRY_SECONDS`` and the next instance on the ring serves its
+workspaces.
+
+Routing only improves locality. Mutually exclusive access comes from the
+workspace locks, which the middleware holds for every mutating request it
+serves locally.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from contextlib import AsyncExitStack
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from .locks import WorkspaceBusy, workspace_locks
+from .metrics import ROUTED_REQUESTS
+from .storage import valid_workspace_name
+
+logger = logging.getLogger(__name__)
+
+ROUTED_HEADER = b"x-codegen-routed-by"
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Requests spending minutes in LLM calls; only their commits take the workspace lock
+LONG_RUNNING_PATHS = {"/api/generate", "/api/update-from-prompt"}
+# Agent requests hold the agent lease instead of the workspace lock
+AGENT_PATH_PREFIX = "/agent/"
+MAX_JSON_BODY = 16 * 1024 * 1024
+# Headers that describe one connection and are not forwarded
+HOP_BY_HOP = {
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"te", b"trailer", b"trailers", b"transfer-encoding", b"upgrade",
+}
+WORKSPACE_PATHS = [
+    re.compile(r"^/api/workspace/([^/]+)"),
+    re.compile(r"^/workspaces/([^/]+)/"),
+    re.compile(r"^/agent/logs/([^/]+)"),
+]
+
+
+class HashRing:
+    """Consistent-hash ring of nodes with virtual nodes"""
+
+    def __init__(self, nodes: List[str], vnodes: int = 100):
+        self.nodes = list(nodes)
+        points = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    def walk(self, key: str) -> Iterator[str]:
+        """Distinct nodes in ring order starting at the owner of key"""
+        if not self._points:
+            return
+        start = bisect.bisect(self._points, self._hash(key))
+        seen = set()
+        for i in range(len(self._points)):
+            node = self._owners[(start + i) % len(self._points)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
+
+    def node_for(self, key: str) -> Optional[str]:
+        return next(self.walk(key), None)
+
+
+class Cluster:
+    """
+    Membership and routing decisions of this instance.
+
+    Args:
+        nodes: Base URLs of all instances (empty: routing disabled)
+        self_url: Base URL of this instance
+        vnodes: Virtual nodes per instance on the ring
+        retry_seconds: How long an unreachable instance is skipped
+    """
+
+    def __init__(self, nodes: List[str], self_url: Optional[str], vnodes: int = 100, retry_seconds: float = 10.0):
+        self.nodes = [node.rstrip("/") for node in nodes if node.strip()]
+        self.self_url = (self_url or "").rstrip("/")
+        if self.nodes and self.self_url not in self.nodes:
+            raise ValueError(f"CLUSTER_SELF {self_url!r} is not one of CLUSTER_NODES")
+        self.ring = HashRing(self.nodes, vnodes)
+        self.retry_seconds = retry_seconds
+        self._down_until: Dict[str, float] = {}
+        self._client = None
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.nodes) > 1
+
+    def is_down(self, node: str) -> bool:
+        return self._down_until.get(node, 0.0) > time.monotonic()
+
+    def mark_down(self, node: str):
+        logger.warning(f"Instance {node} is unreachable; serving its workspaces elsewhere for {self.retry_seconds}s")
+        self._down_until[node] = time.monotonic() + self.retry_seconds
+
+    def owner(self, workspace_name: str) -> str:
+        """Instance that should serve a workspace: the first reachable one on the ring"""
+        for node in self.ring.walk(workspace_name):
+            if node == self.self_url or not self.is_down(node):
+                return node
+        return self.self_url
+
+    def describe(self, workspace_name: Optional[str] = None) -> Dict[str, Any]:
+        info: Dict[str, Any] = {
+            "enabled": self.enabled,
+            "self": self.self_url or None,
+            "nodes": [{"url": node, "down": self.is_down(node)} for node in self.nodes],
+            "locks": workspace_locks.backend.name,
+        }
+        if workspace_name is not None:
+            info["workspace"] = workspace_name
+            info["owner"] = self.owner(workspace_name) if self.enabled else self.self_url or None
+        return info
+
+    def client(self):
+        if self._client is None:
+            # Only needed when several instances are configured
+            import httpx
+
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=2.0))
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _create_cluster() -> Cluster:
+    return Cluster(
+        nodes=os.getenv("CLUSTER_NODES", "").split(","),
+        self_url=os.getenv("CLUSTER_SELF"),
+        vnodes=int(os.getenv("CLUSTER_VNODES", "100")),
+        retry_seconds=float(os.getenv("CLUSTER_RETRY_SECONDS", "10")),
+    )
+
+
+cluster = _create_cluster()
+
+
+def _workspace_from_path(path: str) -> Optional[str]:
+    for pattern in WORKSPACE_PATHS:
+        match = pattern.match(path)
+        if match:
+            return match.group(1)
+    return None
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key.lower() == name:
+            return value
+    return None
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+def _replay(body: bytes, receive):
+    """receive() that yields an already read body, then defers to the client"""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
+
+
+async def _send_json(send, status: int, payload: Dict[str, Any], headers: List[Tuple[bytes, bytes]] = ()):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class WorkspaceAffinityMiddleware:
+    """
+    Routes workspace requests to their owning instance and serializes
+    mutating requests served locally:
+
+    - agent requests (``/agent/*``) hold the workspace's agent lease, so
+      agent runs exclude each other but not saves;
+    - generation and prompt edits (LONG_RUNNING_PATHS) take no lock here;
+      their commits take the workspace lock (workspace_store.commit_guard);
+    - other mutating requests (saves, restores, archiving) are short and
+      hold the workspace lock for their whole read-modify-write.
+
+    The workspace is taken from the path (``/api/workspace/{name}/...``,
+    ``/workspaces/{name}/...``, ``/agent/logs/{name}``), the
+    ``workspace_name`` query parameter, or the ``workspace_name`` field of a
+    JSON body.
+    """
+
+    def __init__(self, app, cluster: Cluster = cluster):
+        self.app = app
+        self.cluster = cluster
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        body: Optional[bytes] = None
+        name = _workspace_from_path(scope["path"])
+        if name is None:
+            name = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("workspace_name", [None])[0]
+        content_type = _header(scope, b"content-type") or b""
+        if name is None and method in MUTATING_METHODS and content_type.startswith(b"application/json"):
+            body = await _read_body(receive)
+            receive = _replay(body, receive)
+            if len(body) <= MAX_JSON_BODY:
+                try:
+                    payload = json.loads(body) if body else None
+                except ValueError:
+                    payload = None
+                if isinstance(payload, dict) and isinstance(payload.get("workspace_name"), str):
+                    name = payload["workspace_name"]
+
+        if name is None or not valid_workspace_name(name):
+            await self.app(scope, receive, send)
+            return
+
+        if self.cluster.enabled and _header(scope, ROUTED_HEADER) is None:
+            owner = self.cluster.owner(name)
+            if owner != self.cluster.self_url:
+                if body is None:
+                    body = await _read_body(receive)
+                    receive = _replay(body, receive)
+                if await self._forward(owner, scope, body, receive, send):
+                    ROUTED_REQUESTS.labels("forwarded").inc()
+                    return
+                ROUTED_REQUESTS.labels("fallback").inc()
+            else:
+                ROUTED_REQUESTS.labels("local").inc()
+
+        if method not in MUTATING_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["path"] in LONG_RUNNING_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        async with AsyncExitStack() as stack:
+            try:
+                if scope["path"].startswith(AGENT_PATH_PREFIX):
+                    await stack.enter_async_context(workspace_locks.hold_agent(name))
+                else:
+                    await stack.enter_async_context(workspace_locks.hold(name))
+            except WorkspaceBusy as e:
+                await _send_json(send, 409, {"detail": str(e)}, [(b"retry-after", b"1")])
+                return
+            await self.app(scope, receive, send)
+
+    async def _forward(self, owner: str, scope, body: bytes, receive, send) -> bool:
+        """Proxy the request to owner; False if the owner could not be reached"""
+        import httpx
+
+        client = self.cluster.client()
+        headers = [
+            (key, value) for key, value in scope["headers"]
+            if key.lower() not in HOP_BY_HOP and key.lower() not in (b"host", b"content-length")
+        ]
+        headers.append((ROUTED_HEADER, self.cluster.self_url.encode("latin-1")))
+        url = owner + scope.get("root_path", "") + scope["path"]
+        if scope.get("query_string"):
+            url += "?" + scope["query_string"].decode("latin-1")
+        request = client.build_request(scope["method"], url, headers=headers, content=body)
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.TransportError as e:
+            logger.warning(f"Could not forward {scope['method']} {scope['path']} to {owner}: {e}")
+            self.cluster.mark_down(owner)
+            return False
+
+        async def stream():
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [(k, v) for k, v in response.headers.raw if k.lower() not in HOP_BY_HOP],
+            })
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def disconnected():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        # Long-lived responses (event streams) end when the client goes away
+        streaming = asyncio.create_task(stream())
+        watcher = asyncio.create_task(disconnected())
+        try:
+            await asyncio.wait([streaming, watcher], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (streaming, watcher):
+                task.cancel()
+            await response.aclose()
+        if streaming.done() and not streaming.cancelled() and streaming.exception() is not None:
+            logger.warning(f"Forwarded response from {owner} ended early: {streaming.exception()}")
+        return True
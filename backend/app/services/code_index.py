@@ -0,0 +1,333 @@
+"""
+Per-workspace code index for retrieval-augmented edits.
+
+For every source file the index keeps a symbol table (exported names,
+imports, JSX components used, CSS classes used and defined) and splits the
+file into chunks at top-level declarations/rules. Each chunk gets a sparse
+embedding: a hashed bag of identifier sub-words (``NavBarLink`` ->
+``nav``, ``bar``, ``link``), L2-normalized, weighted with IDF at query time.
+No model download or extra dependency is needed and results are
+deterministic.
+
+The index is stored in ``<workspace>/.codegen/code_index.json`` and
+refreshed incrementally: only files whose size/mtime and content hash
+changed are re-indexed. ``retrieve`` ranks chunks by similarity to the
+prompt, boosted along the import graph and CSS class usage of the target
+file, and packs the best ones into a token budget.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import posixpath
+import re
+import threading
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .workspace_files import estimate_tokens, exported_names, scan, unchanged
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = ".codegen"
+INDEX_FILE = "code_index.json"
+INDEX_VERSION = 1
+
+INDEXED_SUFFIXES = {".js", ".jsx", ".ts", ".tsx", ".css", ".html", ".json"}
+MAX_FILE_BYTES = 256 * 1024
+MAX_FILES = 2000
+CHUNK_MAX_LINES = 60
+EMBEDDING_DIM = 1 << 20
+RESOLVE_EXTENSIONS = ("", ".js", ".jsx", ".ts", ".tsx", ".css", "/index.js", "/index.jsx", "/index.ts", "/index.tsx")
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_$][\w$-]*")
+SUBWORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+IMPORT_PATTERN = re.compile(r"import\s+(?:[^'\"]+\s+from\s+)?['\"]([^'\"]+)['\"]")
+JSX_COMPONENT_PATTERN = re.compile(r"<([A-Z][\w.]*)")
+CLASS_ATTRIBUTE_PATTERN = re.compile(r"\bclass(?:Name)?\s*=\s*(?:\{\s*)?[\"'`]([^\"'`]+)[\"'`]")
+CSS_CLASS_PATTERN = re.compile(r"\.(-?[_a-zA-Z][\w-]*)")
+JS_BOUNDARY_PATTERN = re.compile(r"^(export\s|function\s|async\s+function\s|class\s|const\s|let\s|var\s)")
+
+
+def terms(text: str) -> List[str]:
+    """Lowercased identifiers plus their camelCase / kebab-case sub-words"""
+    result = []
+    for identifier in IDENTIFIER_PATTERN.findall(text):
+        lowered = identifier.lower()
+        result.append(lowered)
+        parts = [p.lower() for p in SUBWORD_PATTERN.findall(identifier)]
+        if len(parts) > 1:
+            result.extend(parts)
+    return result
+
+
+def embed(text: str) -> Dict[int, float]:
+    """Sparse hashed term-frequency vector, L2-normalized"""
+    counts = Counter(zlib.crc32(term.encode("utf-8")) % EMBEDDING_DIM for term in terms(text))
+    norm = math.sqrt(sum(c * c for c in counts.values())) or 1.0
+    return {index: count / norm for index, count in counts.items()}
+
+
+def extract_symbols(path: str, content: str) -> Dict[str, List[str]]:
+    suffix = posixpath.splitext(path)[1].lower()
+    symbols: Dict[str, List[str]] = {}
+    if suffix in {".js", ".jsx", ".ts", ".tsx"}:
+        symbols["exports"] = exported_names(content)
+        symbols["imports"] = list(dict.fromkeys(IMPORT_PATTERN.findall(content)))
+        symbols["components"] = sorted(set(JSX_COMPONENT_PATTERN.findall(content)))
+    if suffix in {".js", ".jsx", ".ts", ".tsx", ".html"}:
+        classes = {name for value in CLASS_ATTRIBUTE_PATTERN.findall(content) for name in value.split()}
+        symbols["classes_used"] = sorted(classes)
+    if suffix == ".css":
+        selectors = re.sub(r"\{[^{}]*\}", "{}", re.sub(r"/\*.*?\*/", "", content, flags=re.DOTALL))
+        symbols["classes_defined"] = sorted(set(CSS_CLASS_PATTERN.findall(selectors)))
+        symbols["imports"] = re.findall(r"@import\s+(?:url\()?['\"]([^'\"]+)['\"]", content)
+    return {key: value for key, value in symbols.items() if value}
+
+
+def split_chunks(path: str, content: str) -> List[Dict[str, int]]:
+    """Line ranges (1-based, inclusive) split at top-level declarations or rules"""
+    lines = content.split("\n")
+    suffix = posixpath.splitext(path)[1].lower()
+    if suffix in {".js", ".jsx", ".ts", ".tsx"}:
+        is_boundary = lambda line: bool(JS_BOUNDARY_PATTERN.match(line))
+    elif suffix == ".css":
+        # A new rule starts at column 0 after the previous one closed
+        is_boundary = lambda line: bool(line) and not line[0].isspace() and line[0] != "}"
+    else:
+        is_boundary = lambda line: False
+
+    chunks = []
+    start = 0
+    for index in range(1, len(lines) + 1):
+        at_end = index == len(lines)
+        too_long = index - start >= CHUNK_MAX_LINES
+        if at_end or too_long or (is_boundary(lines[index]) and index - start >= 3):
+            if any(line.strip() for line in lines[start:index]):
+                chunks.append({"start": start + 1, "end": index})
+            start = index
+    return chunks
+
+
+class CodeIndex:
+    def __init__(self, workspace_dir: str):
+        self.workspace_dir = Path(workspace_dir)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self._vectors: Dict[str, List[Dict[int, float]]] = {}
+        self._load()
+
+    @property
+    def path(self) -> Path:
+        return self.workspace_dir / INDEX_DIR / INDEX_FILE
+
+    def _load(self):
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION:
+            self.files = data.get("files", {})
+
+    def save(self):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps({"version": INDEX_VERSION, "files": self.files}), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+
+    def _read(self, rel: str) -> Optional[str]:
+        try:
+            return (self.workspace_dir / rel).read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            return None
+
+    def refresh(self) -> int:
+        """Re-index changed files and drop deleted ones; return how many files were re-indexed"""
+        with self._lock:
+            seen = {}
+            changed = 0
+            files, _ = scan(self.workspace_dir, MAX_FILES, INDEXED_SUFFIXES)
+            for rel, _, stat in files:
+                if stat.st_size > MAX_FILE_BYTES:
+                    continue
+                entry = self.files.get(rel)
+                if unchanged(entry, stat):
+                    seen[rel] = entry
+                    continue
+
+                content = self._read(rel)
+                if content is None:
+                    continue
+                digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+                if entry and entry["hash"] == digest:
+                    entry.update(mtime=stat.st_mtime, size=stat.st_size)
+                    seen[rel] = entry
+                    continue
+
+                seen[rel] = {
+                    "mtime": stat.st_mtime,
+                    "size": stat.st_size,
+                    "hash": digest,
+                    "symbols": extract_symbols(rel, content),
+                    "chunks": split_chunks(rel, content),
+                }
+                self._vectors.pop(rel, None)
+                changed += 1
+
+            removed = set(self.files) - set(seen)
+            for rel in removed:
+                self._vectors.pop(rel, None)
+            self.files = seen
+            if changed or removed:
+                self.save()
+            return changed
+
+    def _chunk_texts(self, rel: str) -> List[str]:
+        content = self._read(rel) or ""
+        lines = content.split("\n")
+        return [f"{rel}\n" + "\n".join(lines[c["start"] - 1:c["end"]]) for c in self.files[rel]["chunks"]]
+
+    def _chunk_vectors(self, rel: str) -> List[Dict[int, float]]:
+        # Vectors are derived from file content, so they are cached in memory only
+        if rel not in self._vectors:
+            self._vectors[rel] = [embed(text) for text in self._chunk_texts(rel)]
+        return self._vectors[rel]
+
+    def symbols(self) -> Dict[str, Dict[str, List[str]]]:
+        with self._lock:
+            return {rel: entry["symbols"] for rel, entry in self.files.items()}
+
+    def find_symbol(self, name: str) -> List[str]:
+        """Files exporting a symbol or defining a CSS class of that name"""
+        with self._lock:
+            return [rel for rel, entry in self.files.items()
+                    if name in entry["symbols"].get("exports", []) or name in entry["symbols"].get("classes_defined", [])]
+
+    def resolve_import(self, from_file: str, specifier: str) -> Optional[str]:
+        if not specifier.startswith("."):
+            return None
+        base = posixpath.normpath(posixpath.join(posixpath.dirname(from_file), specifier))
+        for extension in RESOLVE_EXTENSIONS:
+            if base + extension in self.files:
+                return base + extension
+        return None
+
+    def _related(self, target: str) -> Dict[str, float]:
+        """Boosts for files connected to the target by imports or CSS classes"""
+        boosts: Dict[str, float] = defaultdict(float)
+        entry = self.files.get(target)
+        if not entry:
+            return boosts
+        for specifier in entry["symbols"].get("imports", []):
+            resolved = self.resolve_import(target, specifier)
+            if resolved:
+                boosts[resolved] += 0.3
+        used = set(entry["symbols"].get("classes_used", []))
+        for rel, other in self.files.items():
+            if rel == target:
+                continue
+            if any(self.resolve_import(rel, s) == target for s in other["symbols"].get("imports", [])):
+                boosts[rel] += 0.2
+            if used and used & set(other["symbols"].get("classes_defined", [])):
+                boosts[rel] += 0.3
+        return boosts
+
+    def retrieve(self, query: str, max_tokens: int = 1500, target_file: Optional[str] = None,
+                 max_snippets: int = 8) -> List[Dict[str, Any]]:
+        """
+        Select the most relevant chunks for a prompt within a token budget.
+
+        Args:
+            query: The user's request
+            max_tokens: Budget for the returned snippets
+            target_file: Workspace-relative file being edited; it is excluded
+                (callers include it in full) and its neighbours are boosted
+            max_snippets: Upper bound on the number of snippets
+
+        Returns:
+            Snippets with path, line range, text and score, best first
+        """
+        with self._lock:
+            self.refresh()
+            candidates = [rel for rel in self.files if rel != target_file and self.files[rel]["chunks"]]
+            if not candidates:
+                return []
+
+            # IDF over all chunks of the workspace
+            vectors = {rel: self._chunk_vectors(rel) for rel in candidates}
+            document_frequency: Counter = Counter()
+            total_chunks = 0
+            for chunk_vectors in vectors.values():
+                for vector in chunk_vectors:
+                    document_frequency.update(vector.keys())
+                    total_chunks += 1
+
+            query_vector = embed(query)
+            idf = {index: math.log(1 + total_chunks / (1 + document_frequency[index])) for index in query_vector}
+            boosts = self._related(target_file) if target_file else {}
+            mentioned = {term for term in IDENTIFIER_PATTERN.findall(query)}
+
+            scored = []
+            for rel in candidates:
+                exports = set(self.files[rel]["symbols"].get("exports", []))
+                symbol_boost = 0.5 if exports & mentioned else 0.0
+                for position, vector in enumerate(vectors[rel]):
+                    similarity = sum(weight * idf[index] * vector.get(index, 0.0) for index, weight in query_vector.items())
+                    score = similarity + boosts.get(rel, 0.0) + symbol_boost
+                    if score > 0:
+                        scored.append((score, rel, position))
+            scored.sort(key=lambda item: (-item[0], item[1], item[2]))
+
+            snippets = []
+            budget = max_tokens
+            texts: Dict[str, List[str]] = {}
+            for score, rel, position in scored:
+                if len(snippets) >= max_snippets:
+                    break
+                if rel not in texts:
+                    texts[rel] = self._chunk_texts(rel)
+                text = texts[rel][position].split("\n", 1)[1]
+                cost = estimate_tokens(text) + 10
+                if cost > budget:
+                    continue
+                chunk = self.files[rel]["chunks"][position]
+                snippets.append({
+                    "path": rel,
+                    "start_line": chunk["start"],
+                    "end_line": chunk["end"],
+                    "score": round(score, 4),
+                    "text": text,
+                })
+                budget -= cost
+            return snippets
+
+
+def render_snippets(snippets: List[Dict[str, Any]]) -> str:
+    """Snippets as prompt text"""
+    return "\n\n".join(
+        f"{s['path']} (lines {s['start_line']}-{s['end_line']}):\n```\n{s['text']}\n```" for s in snippets
+    )
+
+
+_indexes: "OrderedDict[str, CodeIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+MAX_OPEN_INDEXES = 32
+
+
+def get_index(workspace_dir: str) -> CodeIndex:
+    """Shared index of a workspace, kept in memory for the most recently used workspaces"""
+    key = str(Path(workspace_dir).resolve())
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = CodeIndex(workspace_dir)
+            _indexes[key] = index
+            if len(_indexes) > MAX_OPEN_INDEXES:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(key)
+        return index
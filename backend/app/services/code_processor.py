@@ -3,25 +3,17 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 import logging
 from app.models.template import Template
 import json
-import requests
 import re
 from bs4 import BeautifulSoup
 
 # Add missing imports for Groq API
 from dotenv import load_dotenv
-import os
+from app.services.groq_client import post_chat_completion
+from app.services.prompts import PROCESS_CSS_CHUNK, PROCESS_HTML_CHUNK
 
 # Load environment variables
 load_dotenv()
 
-# Set up Groq API configuration
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
-GROQ_HEADERS = {
-    "Authorization": f"Bearer {GROQ_API_KEY}",
-    "Content-Type": "application/json"
-}
-
 logger = logging.getLogger(__name__)
 
 class CodeProcessor:
@@ -77,7 +69,7 @@ class CodeProcessor:
         
         for i, chunk in enumerate(chunks):
             # Create a focused prompt for each chunk
-            prompt = self._create_html_chunk_prompt(
+            messages = self._create_html_chunk_prompt(
                 chunk, 
                 structure_context,
                 user_requirements,
@@ -86,7 +78,7 @@ class CodeProcessor:
             )
             
             # Process chunk with LLM
-            processed_chunk = self._process_chunk_with_llm(prompt, "html")
+            processed_chunk = self._process_chunk_with_llm(messages, "html")
             processed_chunks.append(processed_chunk)
         
         return self._merge_html_chunks(processed_chunks)
@@ -98,7 +90,7 @@ class CodeProcessor:
         
         for i, chunk in enumerate(chunks):
             # Create a focused prompt for each chunk
-            prompt = self._create_css_chunk_prompt(
+            messages = self._create_css_chunk_prompt(
                 chunk,
                 style_context,
                 user_requirements,
@@ -107,7 +99,7 @@ class CodeProcessor:
             )
             
             # Process chunk with LLM
-            processed_chunk = self._process_chunk_with_llm(prompt, "css")
+            processed_chunk = self._process_chunk_with_llm(messages, "css")
             processed_chunks.append(processed_chunk)
         
         return self._merge_css_chunks(processed_chunks)
@@ -122,67 +114,39 @@ class CodeProcessor:
         # Extract key style elements like color schemes, main layout styles
         return self._summarize_styles(first_chunk)
 
-    def _create_html_chunk_prompt(self, chunk: str, structure_context: str, 
-                                user_requirements: str, is_first: bool, 
-                                is_last: bool) -> str:
-        """Create a focused prompt for processing an HTML chunk"""
-        return f"""Process this HTML chunk while maintaining the overall structure and incorporating user requirements.
-        
-        Structure Context: {structure_context}
-        User Requirements: {user_requirements}
-        
-        Special Instructions:
-        {f'This is the first chunk - maintain DOCTYPE and head section' if is_first else ''}
-        {f'This is the last chunk - ensure proper closing of all elements' if is_last else ''}
-        
-        Original Chunk:
-        {chunk}
-        
-        Modify the chunk to meet user requirements while maintaining structure and compatibility with other chunks.
-        Return only the modified HTML, no explanations.
-        """
+    def _create_html_chunk_prompt(self, chunk: str, structure_context: str,
+                                user_requirements: str, is_first: bool,
+                                is_last: bool) -> List[Dict[str, str]]:
+        """Create the messages for processing an HTML chunk"""
+        position = ("This is the first chunk - maintain DOCTYPE and head section" if is_first else "",
+                    "This is the last chunk - ensure proper closing of all elements" if is_last else "")
+        return PROCESS_HTML_CHUNK.messages(
+            context=structure_context, requirements=user_requirements,
+            position="\n".join(filter(None, position)), chunk=chunk,
+        )
 
     def _create_css_chunk_prompt(self, chunk: str, style_context: str,
                                user_requirements: str, is_first: bool,
-                               is_last: bool) -> str:
-        """Create a focused prompt for processing a CSS chunk"""
-        return f"""Process this CSS chunk while maintaining the overall style scheme and incorporating user requirements.
-        
-        Style Context: {style_context}
-        User Requirements: {user_requirements}
-        
-        Special Instructions:
-        {f'This is the first chunk - maintain global styles and variables' if is_first else ''}
-        {f'This is the last chunk - ensure all styles are properly closed' if is_last else ''}
-        
-        Original Chunk:
-        {chunk}
-        
-        Modify the chunk to meet user requirements while maintaining style consistency and compatibility with other chunks.
-        Return only the modified CSS, no explanations.
-        """
+                               is_last: bool) -> List[Dict[str, str]]:
+        """Create the messages for processing a CSS chunk"""
+        position = ("This is the first chunk - maintain global styles and variables" if is_first else "",
+                    "This is the last chunk - ensure all styles are properly closed" if is_last else "")
+        return PROCESS_CSS_CHUNK.messages(
+            context=style_context, requirements=user_requirements,
+            position="\n".join(filter(None, position)), chunk=chunk,
+        )
 
-    def _process_chunk_with_llm(self, prompt: str, chunk_type: str) -> str:
+    def _process_chunk_with_llm(self, messages: List[Dict[str, str]], chunk_type: str) -> str:
         """Process a single chunk with the LLM"""
         try:
             payload = {
                 "model": "llama-3.3-70b-versatile",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": f"You are a specialized {chunk_type.upper()} processor. Return only valid {chunk_type.upper()} code, no explanations."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
+                "messages": messages,
                 "temperature": 0.3,
                 "max_tokens": 1500
             }
             
-            response = requests.post(
-                GROQ_API_URL,
-                headers=GROQ_HEADERS,
-                json=payload
-            )
+            response = post_chat_completion(payload, span_name=f"llm.chunk_{chunk_type}")
             
             if response.status_code == 200:
                 return response.json()['choices'][0]['message']['content'].strip()
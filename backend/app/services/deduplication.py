@@ -0,0 +1,265 @@
+"""
+Deduplication of mutating requests.
+
+Two mechanisms, both applied before the workspace lock is taken (the lock
+would otherwise just run the duplicates one after the other):
+
+- Idempotency keys: a mutating request with an ``Idempotency-Key`` header
+  is executed once per key. Retries with the same key get the stored
+  response (marked ``Idempotent-Replayed: true``) for
+  ``IDEMPOTENCY_TTL_SECONDS``, or wait for the first attempt if it is still
+  running. Reusing a key for a different request body is rejected with 422.
+  Server errors are not stored, so a retry can succeed. At most
+  ``IDEMPOTENCY_MAX_ENTRIES`` responses (``IDEMPOTENCY_MAX_MB`` in total)
+  are kept.
+- Coalescing: concurrent identical requests to the expensive endpoints
+  (generation and agent runs, compared by their JSON body with prompt
+  whitespace normalized) join the request already in flight and receive
+  its response instead of running another completion.
+
+State is per instance. Cluster routing sends all requests of a workspace to
+one instance, so duplicates meet there.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import DUPLICATE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+MAX_KEY_LENGTH = 255
+# Larger responses are passed through but not stored or shared
+MAX_STORED_RESPONSE = 1024 * 1024
+# Endpoints whose duplicates are coalesced without an idempotency key
+COALESCED_PATHS = {
+    "/api/generate",
+    "/api/update-from-prompt",
+    "/agent/run",
+    "/agent/create-react-project",
+    "/agent/add-component",
+    "/agent/modify-file",
+}
+
+
+class _Response:
+    """A complete response captured from the app"""
+
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    async def send(self, send, replayed: bool = True):
+        headers = [(k, v) for k, v in self.headers if k.lower() != REPLAYED_HEADER]
+        if replayed:
+            headers.append((REPLAYED_HEADER, b"true"))
+        await send({"type": "http.response.start", "status": self.status, "headers": headers})
+        await send({"type": "http.response.body", "body": self.body})
+
+
+class _Capture:
+    """send() wrapper that passes the response through and keeps a copy of it"""
+
+    def __init__(self, send):
+        self._send = send
+        self.status: Optional[int] = None
+        self.headers: List[Tuple[bytes, bytes]] = []
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.storable = True
+        self.complete = False
+
+    async def send(self, message: Dict[str, Any]):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            self.headers = list(message.get("headers") or [])
+            content_type = dict((k.lower(), v) for k, v in self.headers).get(b"content-type", b"")
+            if content_type.startswith(b"text/event-stream"):
+                self.storable = False
+        elif message["type"] == "http.response.body":
+            body = message.get("body", b"")
+            self.size += len(body)
+            if self.storable and self.size <= MAX_STORED_RESPONSE:
+                self.chunks.append(body)
+            else:
+                self.storable = False
+                self.chunks = []
+            if not message.get("more_body", False):
+                self.complete = True
+        await self._send(message)
+
+    def response(self) -> Optional[_Response]:
+        if not (self.complete and self.storable) or self.status is None:
+            return None
+        return _Response(self.status, self.headers, b"".join(self.chunks))
+
+
+class _Flight:
+    """A request being served; duplicates wait for it"""
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done = asyncio.Event()
+        self.response: Optional[_Response] = None
+
+
+def _fingerprint(body: bytes) -> str:
+    """Hash of a request body; JSON is compared canonically, with prompt whitespace normalized"""
+    try:
+        payload = json.loads(body) if body else None
+    except ValueError:
+        return hashlib.sha256(body).hexdigest()
+    if isinstance(payload, dict) and isinstance(payload.get("prompt"), str):
+        payload = {**payload, "prompt": " ".join(payload["prompt"].split())}
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _send_json(send, status: int, payload: Dict[str, Any]):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class DeduplicationMiddleware:
+    def __init__(self, app, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        self.app = app
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "1000"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("IDEMPOTENCY_MAX_MB", "64")) * 1024 * 1024)
+        self._inflight: Dict[str, _Flight] = {}
+        # key -> (stored at, fingerprint, response)
+        self._completed: "OrderedDict[str, Tuple[float, str, _Response]]" = OrderedDict()
+        self._stored_bytes = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in MUTATING_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key = None
+        for name, value in scope["headers"]:
+            if name.lower() == IDEMPOTENCY_HEADER:
+                idempotency_key = value.decode("latin-1")
+        if idempotency_key is None and scope["path"] not in COALESCED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_KEY_LENGTH:
+            await _send_json(send, 400, {"detail": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"})
+            return
+
+        body = await _read_body(receive)
+        fingerprint = _fingerprint(body)
+        request = f"{scope['method']} {scope['path']}"
+        stored_key = f"key:{request}:{idempotency_key}" if idempotency_key is not None else None
+        # Requests in flight are found by their key, and identical requests to expensive endpoints
+        # by their body, so a double click coalesces even if each click sent its own key
+        flight_keys = [stored_key] if stored_key is not None else []
+        if scope["path"] in COALESCED_PATHS:
+            flight_keys.append(f"body:{request}:{fingerprint}")
+
+        while True:
+            stored = self._lookup(stored_key) if stored_key is not None else None
+            if stored is not None:
+                if stored[0] != fingerprint:
+                    await self._reject_reuse(send)
+                    return
+                DUPLICATE_REQUESTS.labels("replayed").inc()
+                await stored[1].send(send)
+                return
+            flight = next((self._inflight[k] for k in flight_keys if k in self._inflight), None)
+            if flight is None:
+                break
+            if flight.fingerprint != fingerprint:
+                await self._reject_reuse(send)
+                return
+            await flight.done.wait()
+            if flight.response is not None:
+                DUPLICATE_REQUESTS.labels("coalesced").inc()
+                if stored_key is not None:
+                    # Retries of this request replay the shared response too
+                    self._store(stored_key, fingerprint, flight.response)
+                await flight.response.send(send)
+                return
+            # The first attempt failed without a shareable response: run this one
+
+        await self._run(scope, body, receive, send, flight_keys, stored_key, fingerprint)
+
+    async def _run(self, scope, body: bytes, receive, send, flight_keys: List[str], stored_key: Optional[str],
+                   fingerprint: str):
+        flight = _Flight(fingerprint)
+        for key in flight_keys:
+            self._inflight[key] = flight
+        capture = _Capture(send)
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        try:
+            await self.app(scope, replay, capture.send)
+        finally:
+            for key in flight_keys:
+                del self._inflight[key]
+            response = capture.response()
+            if response is not None and response.status < 500:
+                flight.response = response
+                if stored_key is not None:
+                    self._store(stored_key, fingerprint, response)
+            flight.done.set()
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, _Response]]:
+        entry = self._completed.get(key)
+        if entry is None:
+            return None
+        stored_at, fingerprint, response = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            self._evict(key)
+            return None
+        return fingerprint, response
+
+    def _store(self, key: str, fingerprint: str, response: _Response):
+        self._evict(key)
+        self._completed[key] = (time.monotonic(), fingerprint, response)
+        self._stored_bytes += len(response.body)
+        while len(self._completed) > self.max_entries or self._stored_bytes > self.max_bytes:
+            self._evict(next(iter(self._completed)))
+
+    def _evict(self, key: str):
+        entry = self._completed.pop(key, None)
+        if entry is not None:
+            self._stored_bytes -= len(entry[2].body)
+
+    async def _reject_reuse(self, send):
+        DUPLICATE_REQUESTS.labels("conflict").inc()
+        await _send_json(send, 422, {"detail": "Idempotency-Key was already used for a different request"})
@@ -0,0 +1,408 @@
+"""
+Warm dev servers for React previews.
+
+Preview bundles (``app.services.preview``) are rebuilt in full for every
+version. While an app is being worked on, a dev server that keeps its
+module graph in memory is quicker: the pool keeps one per React app,
+started on the first request to ``/api/workspace/<name>/dev/`` and reused
+by later ones, so a recently used app opens without a boot.
+
+- ``esbuild`` (when available): ``esbuild --serve --watch``. It boots in
+  well under a second, rebuilds only changed modules, and the entry page
+  reloads itself after each rebuild.
+- ``npm`` otherwise: the app's ``npm start`` (create-react-app/webpack
+  dev server) with ``PUBLIC_URL`` set to the proxy path. This takes tens of
+  seconds to boot, which only the first request pays.
+
+At most ``DEV_SERVER_MAX`` servers run or start per instance; starting
+another stops the least recently used running one, and fails with
+``DevServersBusy`` while every slot is taken by a server still starting.
+Servers unused for
+``DEV_SERVER_IDLE_SECONDS`` are stopped. Servers run in the agent sandbox
+(scrubbed environment, memory and file limits, cgroup) without the
+CPU-time limit, and listen on loopback only.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from .metrics import CACHE_REQUESTS, DEV_SERVER_STARTUP, DEV_SERVERS_RUNNING
+from .preview import ASSET_LOADERS, REACT_ENTRIES, PreviewError, preview_service, react_shell
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_LINES = 200
+# Headers passed to and from a dev server
+REQUEST_HEADERS = {"accept", "accept-language", "cache-control", "if-none-match", "if-modified-since", "range"}
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "trailers", "transfer-encoding", "upgrade",
+}
+# Reloads the page when esbuild reports a rebuild
+LIVE_RELOAD = '<script>new EventSource("esbuild").addEventListener("change",function(){location.reload()})</script>'
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class DevServersBusy(PreviewError):
+    """Raised when every dev server slot is taken by a server still starting"""
+
+
+class DevServer:
+    """A running dev server of one app"""
+
+    def __init__(self, workspace_name: str, app_dir: Path, mode: str, port: int, prefix: str):
+        self.workspace_name = workspace_name
+        self.app_dir = app_dir
+        self.mode = mode
+        self.port = port
+        self.prefix = prefix
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.started = time.time()
+        self.last_used = time.monotonic()
+        self.startup_ms: Optional[float] = None
+        self.output: Deque[str] = deque(maxlen=OUTPUT_LINES)
+        self._reader: Optional[asyncio.Task] = None
+
+    async def launch(self, command: List[str], workspace_dir: Path, env: Dict[str, str], limits):
+        # Lazy import: the agents package pulls in LangChain
+        from ..agents.sandbox import start_sandboxed
+
+        self.process = await start_sandboxed(
+            command, workspace_dir=str(workspace_dir), cwd=str(self.app_dir), env=env, limits=limits,
+        )
+        self._reader = asyncio.ensure_future(self._read_output())
+        DEV_SERVERS_RUNNING.inc()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    @property
+    def serve_dir(self) -> Path:
+        """Directory esbuild serves static files from"""
+        public = self.app_dir / "public"
+        return public if public.is_dir() else self.app_dir
+
+    def upstream_path(self, path: str) -> str:
+        # npm dev servers serve under PUBLIC_URL; esbuild at its root
+        return (self.prefix if self.mode == "npm" else "/") + path
+
+    def tail(self, lines: int = 20) -> str:
+        return "".join(list(self.output)[-lines:])
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "workspace_name": self.workspace_name,
+            "app": self.app_dir.name,
+            "mode": self.mode,
+            "url": self.prefix,
+            "alive": self.alive,
+            "started": round(self.started),
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+            "startup_ms": self.startup_ms,
+        }
+
+    async def _read_output(self):
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                return
+            self.output.append(line.decode("utf-8", errors="replace"))
+
+    async def wait_ready(self, timeout: float):
+        """Wait until the server accepts connections"""
+        deadline = time.monotonic() + timeout
+        while True:
+            if not self.alive:
+                raise PreviewError(f"Dev server of {self.app_dir.name} exited: {self.tail()}")
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", self.port)
+                writer.close()
+                return
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                raise PreviewError(f"Dev server of {self.app_dir.name} did not start within {timeout:.0f}s: {self.tail()}")
+            await asyncio.sleep(0.05)
+
+    def _signal(self, sig: int):
+        try:
+            if os.name == "nt":
+                self.process.kill()
+            else:
+                # Own session: this also stops node/webpack children
+                os.killpg(self.process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    async def stop(self):
+        if self.process is None:
+            return
+        if self.alive:
+            self._signal(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(self.process.wait(), 5)
+            except asyncio.TimeoutError:
+                self._signal(signal.SIGKILL)
+                await self.process.wait()
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+            DEV_SERVERS_RUNNING.dec()
+
+
+class DevServerPool:
+    """
+    Starts, reuses and stops dev servers.
+
+    Args:
+        max_servers: Servers running at once on this instance
+        idle_seconds: Unused servers are stopped after this long
+        start_timeout: Seconds a server may take to accept connections
+    """
+
+    def __init__(self, max_servers: int = 4, idle_seconds: float = 600.0, start_timeout: float = 120.0):
+        self.max_servers = max_servers
+        self.idle_seconds = idle_seconds
+        self.start_timeout = start_timeout
+        self._servers: Dict[str, DevServer] = {}
+        self._starting: Dict[str, "asyncio.Future"] = {}
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _mode(self, app_dir: Path) -> Tuple[str, List[str]]:
+        """Mode and command of a dev server for app_dir"""
+        esbuild = preview_service.esbuild(app_dir)
+        if esbuild:
+            entry = next((e for e in REACT_ENTRIES if (app_dir / e).exists()), None)
+            if entry is None:
+                raise PreviewError(f"No entry module found in {app_dir.name} (expected src/index.js or similar)")
+            # Absolute, since esbuild runs in the app directory
+            serve_dir = ((app_dir / "public") if (app_dir / "public").is_dir() else app_dir).resolve()
+            return "esbuild", [
+                esbuild, entry, "--bundle", "--format=iife", "--target=es2018", "--sourcemap",
+                f"--servedir={serve_dir}", f"--outdir={serve_dir / 'static'}", "--entry-names=app",
+                "--asset-names=[name]-[hash]", "--public-path=static", "--jsx=automatic", "--loader:.js=jsx",
+                '--define:process.env.NODE_ENV="development"', "--watch", "--log-level=warning",
+            ] + [f"--loader:{suffix}=file" for suffix in ASSET_LOADERS]
+        try:
+            scripts = json.loads((app_dir / "package.json").read_text(encoding="utf-8")).get("scripts", {})
+        except (OSError, ValueError):
+            scripts = {}
+        if "start" not in scripts:
+            raise PreviewError(
+                f"{app_dir.name} has no start script; install esbuild (or set ESBUILD_PATH) for dev previews"
+            )
+        return "npm", ["npm", "run", "start"]
+
+    async def get(self, workspace_dir: Path, app: Optional[str] = None) -> DevServer:
+        """Running dev server of a workspace's React app, started if needed"""
+        kind, app_dir = preview_service.detect(workspace_dir, app)
+        if kind != "react":
+            raise PreviewError("Dev servers are only used for React apps; static sites are served as bundles")
+        key = str(app_dir.resolve())
+        server = self._servers.get(key)
+        if server is not None and server.alive:
+            CACHE_REQUESTS.labels("dev_server", "hit").inc()
+            server.last_used = time.monotonic()
+            return server
+
+        CACHE_REQUESTS.labels("dev_server", "miss").inc()
+        starting = self._starting.get(key)
+        if starting is None:
+            # The slot is taken before the first await, so concurrent starts cannot overshoot the cap
+            stopping = self._reserve(key)
+            starting = asyncio.ensure_future(self._start(key, workspace_dir, app_dir, stopping))
+            self._starting[key] = starting
+            starting.add_done_callback(lambda _: self._starting.pop(key, None))
+        # Requests for an app share its start; a cancelled request does not cancel it
+        return await asyncio.shield(starting)
+
+    def _reserve(self, key: str) -> List[DevServer]:
+        """
+        Take a slot for starting the server of key.
+
+        Running and starting servers share max_servers slots. Running servers are
+        taken out of the pool, least recently used first, until one is free.
+
+        Returns:
+            The servers to stop before starting
+
+        Raises:
+            DevServersBusy: Every slot is taken by a server still starting
+        """
+        # An exited server of this app is replaced, so its slot is reused
+        others = [k for k in self._servers if k != key]
+        excess = len(others) + len(self._starting) + 1 - self.max_servers
+        if excess > len(others):
+            raise DevServersBusy(
+                f"All {self.max_servers} dev server slots are taken by servers still starting; try again shortly"
+            )
+        stopping = [self._servers.pop(key)] if key in self._servers else []
+        for lru in sorted(others, key=lambda k: self._servers[k].last_used)[:max(excess, 0)]:
+            stopping.append(self._servers.pop(lru))
+        return stopping
+
+    async def _start(self, key: str, workspace_dir: Path, app_dir: Path, stopping: List[DevServer]) -> DevServer:
+        for server in stopping:
+            if server.alive:
+                logger.info(f"Stopping the least recently used dev server of {server.workspace_name}")
+            await server.stop()
+        if not (app_dir / "node_modules").is_dir():
+            raise PreviewError(f"Dependencies of {app_dir.name} are not installed yet (npm install)")
+        mode, command = self._mode(app_dir)
+
+        from ..agents.sandbox import ResourceLimits, sandbox_environment
+
+        port = _free_port()
+        prefix = f"/api/workspace/{workspace_dir.name}/dev/"
+        if mode == "esbuild":
+            command.append(f"--serve=127.0.0.1:{port}")
+        env = sandbox_environment(str(workspace_dir))
+        env.update({"PORT": str(port), "HOST": "127.0.0.1", "PUBLIC_URL": prefix.rstrip("/")})
+        limits = ResourceLimits.from_env()
+        # Servers run until stopped
+        limits.cpu_seconds = None
+
+        server = DevServer(workspace_dir.name, app_dir, mode, port, prefix)
+        start = time.perf_counter()
+        with span("dev_server.start", workspace=workspace_dir.name, mode=mode) as start_span:
+            await server.launch(command, workspace_dir, env, limits)
+            try:
+                await server.wait_ready(self.start_timeout)
+            except BaseException:
+                await server.stop()
+                raise
+            server.startup_ms = round((time.perf_counter() - start) * 1000, 1)
+            start_span.set_attribute("dev_server.startup_ms", server.startup_ms)
+        DEV_SERVER_STARTUP.labels(mode).observe(server.startup_ms / 1000.0)
+        logger.info(f"Started {mode} dev server of {workspace_dir.name}/{app_dir.name} in {server.startup_ms} ms")
+        server.last_used = time.monotonic()
+        # Moves from starting to running without holding two slots
+        self._starting.pop(key, None)
+        self._servers[key] = server
+        return server
+
+    async def stop_workspace(self, workspace_name: str) -> int:
+        """Stop the dev servers of a workspace; returns how many were running"""
+        keys = [k for k, s in self._servers.items() if s.workspace_name == workspace_name]
+        for key in keys:
+            await self._servers.pop(key).stop()
+        return len(keys)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [server.describe() for server in self._servers.values()]
+
+    # Proxying
+
+    def client(self):
+        if self._client is None:
+            # Only needed once a dev server is used
+            import httpx
+
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=2.0))
+        return self._client
+
+    async def fetch(self, server: DevServer, path: str, query: str,
+                    headers: Dict[str, str]) -> Tuple[int, Dict[str, str], AsyncIterator[bytes]]:
+        """Status, headers and body stream of a dev server response"""
+        server.last_used = time.monotonic()
+        if server.mode == "esbuild" and path in ("", "index.html"):
+            body = await self._entry_page(server)
+            return 200, {"content-type": "text/html; charset=utf-8", "cache-control": "no-cache"}, self._chunks(body)
+
+        client = self.client()
+        url = f"http://127.0.0.1:{server.port}{server.upstream_path(path)}"
+        if query:
+            url += "?" + query
+        forwarded = {name: value for name, value in headers.items() if name.lower() in REQUEST_HEADERS}
+        response = await client.send(client.build_request("GET", url, headers=forwarded), stream=True)
+        response_headers = {
+            name: value for name, value in response.headers.items() if name.lower() not in HOP_BY_HOP
+        }
+
+        async def body() -> AsyncIterator[bytes]:
+            try:
+                async for chunk in response.aiter_raw():
+                    server.last_used = time.monotonic()
+                    yield chunk
+            finally:
+                await response.aclose()
+
+        return response.status_code, response_headers, body()
+
+    async def _entry_page(self, server: DevServer) -> bytes:
+        """public/index.html with the in-memory bundle and live reload linked"""
+        # Builds the bundle if needed and tells whether it has a stylesheet
+        response = await self.client().head(f"http://127.0.0.1:{server.port}/static/app.css")
+        stylesheets = ["static/app.css"] if response.status_code == 200 else []
+        index = server.serve_dir / "index.html"
+        html = await asyncio.to_thread(index.read_text, encoding="utf-8") if index.exists() else None
+        return react_shell(html, stylesheets, ['<script src="static/app.js"></script>', LIVE_RELOAD]).encode("utf-8")
+
+    @staticmethod
+    async def _chunks(body: bytes) -> AsyncIterator[bytes]:
+        yield body
+
+    # Lifecycle
+
+    async def stop_idle(self) -> List[str]:
+        """Stop servers unused for idle_seconds and forget exited ones"""
+        now = time.monotonic()
+        stopped = []
+        for key, server in list(self._servers.items()):
+            if not server.alive or now - server.last_used > self.idle_seconds:
+                del self._servers[key]
+                await server.stop()
+                stopped.append(server.workspace_name)
+        return stopped
+
+    def start(self):
+        """Stop idle servers periodically on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for key in list(self._servers):
+            await self._servers.pop(key).stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(min(60.0, max(1.0, self.idle_seconds / 4)))
+            try:
+                stopped = await self.stop_idle()
+                if stopped:
+                    logger.info(f"Stopped idle dev servers: {', '.join(stopped)}")
+            except Exception as e:
+                logger.error(f"Error stopping idle dev servers: {e}")
+
+
+# Shared instance started with the app
+dev_servers = DevServerPool(
+    max_servers=int(os.getenv("DEV_SERVER_MAX", "4")),
+    idle_seconds=float(os.getenv("DEV_SERVER_IDLE_SECONDS", "600")),
+    start_timeout=float(os.getenv("DEV_SERVER_START_TIMEOUT", "120")),
+)
@@ -0,0 +1,125 @@
+"""
+In-process publish/subscribe for pushing live events to clients.
+
+Publishers may run on any thread (agent tools run in worker threads);
+subscribers are asyncio consumers such as streaming HTTP responses and
+WebSocket connections. A subscription may cover several channels and has
+one bounded queue: when a slow client falls behind, the oldest events are
+dropped and counted instead of growing memory without limit.
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def workspace_channel(workspace_name: str) -> str:
+    """Channel carrying all live events of one workspace"""
+    return f"workspace:{workspace_name}"
+
+
+class Subscription:
+    def __init__(self, bus: "EventBus", channels: Set[str], max_queue: int):
+        self.bus = bus
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    @property
+    def channel(self) -> Optional[str]:
+        return next(iter(self.channels), None)
+
+    def put(self, channel: str, event: Dict[str, Any]):
+        """Queue an event; must run on the subscriber's loop"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait((channel, event))
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event, or None if nothing arrived within timeout"""
+        item = await self.get_with_channel(timeout)
+        return item[1] if item is not None else None
+
+    async def get_with_channel(self, timeout: Optional[float] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Next (channel, event), or None if nothing arrived within timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def get_nowait(self) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Next queued (channel, event) without waiting"""
+        try:
+            return self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+    def take_dropped(self) -> int:
+        """Events dropped since the last call"""
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    def __init__(self, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, *channels: str) -> Subscription:
+        """Subscribe from async code; close the subscription when done"""
+        subscription = Subscription(self, set(channels), self.max_queue)
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def add_channel(self, subscription: Subscription, channel: str):
+        with self._lock:
+            subscription.channels.add(channel)
+            self._subscribers[channel].add(subscription)
+
+    def remove_channel(self, subscription: Subscription, channel: str):
+        with self._lock:
+            subscription.channels.discard(channel)
+            self._remove(subscription, channel)
+
+    def _remove(self, subscription: Subscription, channel: str):
+        subscribers = self._subscribers.get(channel)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[channel]
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                self._remove(subscription, channel)
+
+    def has_subscribers(self, channel: str) -> bool:
+        with self._lock:
+            return bool(self._subscribers.get(channel))
+
+    def publish(self, channel: str, event: Dict[str, Any]):
+        """Deliver an event to every subscriber of the channel; safe from any thread"""
+        with self._lock:
+            subscribers: List[Subscription] = list(self._subscribers.get(channel, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, channel, event)
+            except RuntimeError:
+                # Subscriber's loop is closed
+                self.unsubscribe(subscription)
+
+
+# Shared bus for the app
+event_bus = EventBus()
@@ -0,0 +1,226 @@
+"""
+Single entry point for Groq chat completion calls made with ``requests``.
+
+Keeping every call site on this helper gives one place to time the call,
+record model, token usage and status on an LLM span and update the LLM
+Prometheus metrics. Callers that pass ``on_token`` get the completion
+streamed to them as it is generated; the returned response still carries
+the complete body.
+
+Calls share one pool of keep-alive connections, so only the first call
+(or ``warm_connection``) pays for connection and TLS setup. Every call is
+admitted by the rate-limit scheduler (``app.services.llm_scheduler``) and
+retried after a 429.
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from dotenv import load_dotenv
+
+from app.services.llm_scheduler import (
+    INTERACTIVE, LLMRateLimited, estimate_tokens, llm_scheduler, retry_after_seconds,
+)
+from app.services.metrics import llm_status, record_llm_call
+from app.services.tracing import span
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Groq API configuration
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com")  # Override to point at a local OpenAI-compatible server
+GROQ_API_URL = f"{GROQ_API_BASE}/openai/v1/chat/completions"
+GROQ_HEADERS = {
+    "Authorization": f"Bearer {GROQ_API_KEY}",
+    "Content-Type": "application/json"
+}
+GROQ_MODELS_URL = f"{GROQ_API_BASE}/openai/v1/models"
+# Retries of a call the API answered with 429
+MAX_RATE_LIMIT_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "2"))
+
+# Shared by the worker threads making calls; one pooled connection per concurrent call
+_session = requests.Session()
+_session.mount(GROQ_API_BASE, requests.adapters.HTTPAdapter(pool_maxsize=int(os.getenv("GROQ_POOL_SIZE", "16"))))
+
+# Idle connections are kept open by the API for about a minute
+WARM_INTERVAL = 30.0
+_warmed_at = 0.0
+
+
+def warm_connection() -> bool:
+    """
+    Open a pooled connection to the API ahead of a call (e.g. while the
+    user is still typing); no-op if done within the last WARM_INTERVAL.
+
+    Returns:
+        Whether a request was made and succeeded
+    """
+    global _warmed_at
+    now = time.monotonic()
+    if now - _warmed_at < WARM_INTERVAL:
+        return False
+    _warmed_at = now
+    try:
+        # Any response will do; the body is read so the connection returns to the pool
+        _session.get(GROQ_MODELS_URL, headers=GROQ_HEADERS, timeout=5).close()
+    except requests.RequestException as e:
+        logger.warning(f"Could not warm the Groq connection: {e}")
+        return False
+    return True
+
+
+def cached_tokens(usage: Dict[str, Any]) -> Optional[int]:
+    """Prompt tokens served from the provider's prompt cache, if reported"""
+    return (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+
+
+def _post_streaming(payload: Dict[str, Any], on_token: Callable[[str], None]) -> requests.Response:
+    """Stream a completion into on_token; the response body is the assembled completion"""
+    response = _session.post(GROQ_API_URL, headers=GROQ_HEADERS, json={**payload, "stream": True}, stream=True)
+    if response.status_code != 200:
+        # Reads the error body
+        response.content
+        return response
+
+    response.encoding = "utf-8"
+    parts = []
+    first: Dict[str, Any] = {}
+    finish_reason = None
+    usage = None
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            first = first or chunk
+            # Groq reports usage in x_groq on the last chunk
+            usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage") or usage
+            for choice in chunk.get("choices") or []:
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    parts.append(text)
+                    on_token(text)
+                finish_reason = choice.get("finish_reason") or finish_reason
+    finally:
+        response.close()
+
+    body = {
+        "id": first.get("id"),
+        "object": "chat.completion",
+        "model": first.get("model", payload.get("model")),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "".join(parts)},
+            "finish_reason": finish_reason,
+        }],
+        "usage": usage or {},
+    }
+    # Callers read the assembled completion like a non-streamed one
+    response._content = json.dumps(body).encode("utf-8")
+    return response
+
+
+def post_chat_completion(payload: Dict[str, Any], span_name: str = "llm",
+                         on_token: Optional[Callable[[str], None]] = None,
+                         priority: int = INTERACTIVE) -> requests.Response:
+    """
+    POST a chat completion request to Groq and return the raw response.
+
+    Args:
+        payload: The chat completions request body
+        span_name: Name of the tracing span, e.g. "llm.html"
+        on_token: Called with each piece of content as it is generated
+            (streams the request); runs on the calling thread
+        priority: Admission priority when the rate limits are reached
+            (INTERACTIVE, BACKGROUND or SPECULATIVE from llm_scheduler)
+
+    Returns:
+        The ``requests.Response``; callers keep handling non-200 statuses
+
+    Raises:
+        LLMRateLimited: if the rate limits do not admit the call within the
+            maximum wait of its priority, or it is still answered with 429
+            after MAX_RATE_LIMIT_RETRIES retries
+    """
+    estimated_tokens = estimate_tokens(payload)
+    with span(span_name, **{
+        "llm.model": payload.get("model"),
+        "llm.temperature": payload.get("temperature"),
+        "llm.max_tokens": payload.get("max_tokens"),
+        "llm.messages": len(payload.get("messages") or []),
+    }) as llm_span:
+        admission_wait = 0.0
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            try:
+                reservation = llm_scheduler.acquire(estimated_tokens, priority)
+            except LLMRateLimited:
+                llm_span.status = "error"
+                llm_span.set_attribute("llm.shed", True)
+                raise
+            admission_wait += reservation.waited
+            llm_span.set_attribute("llm.admission_wait_ms", round(admission_wait * 1000, 1))
+
+            start = time.perf_counter()
+            try:
+                if on_token is None:
+                    response = _session.post(GROQ_API_URL, headers=GROQ_HEADERS, json=payload)
+                else:
+                    response = _post_streaming(payload, on_token)
+            except requests.RequestException:
+                record_llm_call(span_name, llm_status(None), time.perf_counter() - start)
+                raise
+            llm_scheduler.observe(response.headers)
+            if response.status_code != 429:
+                break
+
+            # Rejected calls use no tokens; admit nothing until the API is ready again
+            retry_after = retry_after_seconds(response.headers, default=2.0 ** attempt)
+            llm_scheduler.settle(reservation, 0)
+            llm_scheduler.pause(retry_after)
+            record_llm_call(span_name, llm_status(429), time.perf_counter() - start)
+            logger.warning(f"Groq rate limit hit by {span_name}; admission paused for {retry_after:.1f}s")
+        else:
+            llm_span.status = "error"
+            llm_span.set_attribute("http.status_code", 429)
+            raise LLMRateLimited(
+                f"Groq rate limit reached after {MAX_RATE_LIMIT_RETRIES} retries", retry_after=retry_after
+            )
+        llm_span.set_attribute("http.status_code", response.status_code)
+
+        usage = {}
+        if response.status_code == 200:
+            try:
+                usage = response.json().get("usage") or {}
+            except ValueError:
+                pass
+            llm_span.set_attributes({
+                "llm.prompt_tokens": usage.get("prompt_tokens"),
+                "llm.completion_tokens": usage.get("completion_tokens"),
+                "llm.total_tokens": usage.get("total_tokens"),
+                "llm.cached_tokens": cached_tokens(usage),
+                # Groq reports its own queue and generation timings in seconds
+                "llm.queue_time_ms": round((usage.get("queue_time") or 0) * 1000, 1),
+                "llm.completion_time_ms": round((usage.get("completion_time") or 0) * 1000, 1),
+            })
+        else:
+            llm_span.status = "error"
+        llm_scheduler.settle(reservation, usage.get("total_tokens"))
+
+        record_llm_call(
+            span_name,
+            llm_status(response.status_code),
+            time.perf_counter() - start,
+            usage.get("prompt_tokens"),
+            usage.get("completion_tokens"),
+            cached_tokens(usage),
+        )
+        return response
@@ -0,0 +1,266 @@
+"""
+Live updates pushed to clients over a WebSocket (``/api/ws``).
+
+Clients subscribe to workspaces and receive, as JSON messages, the events
+published on their channels:
+
+- ``files_changed``: paths written or deleted by a committed workspace write
+  (generation, saves, autosaves, restores);
+- ``generation_started`` / ``generation_tokens`` / ``generation_finished``:
+  LLM output of generate and update-from-prompt requests as it is produced;
+- ``agent_started`` / ``agent_progress`` / ``agent_finished``: agent task
+  progress, and ``command_*`` output of the commands agents run;
+- ``rehydrate_*``: restoring an archived workspace.
+
+Fan-out is per workspace, so publishers only do work for workspaces that
+somebody watches. Each connection has one bounded queue. Queued token and
+file events are merged before sending, a client that cannot keep up is
+disconnected after ``LIVE_SEND_TIMEOUT`` seconds, and a client whose
+events were dropped gets an ``overflow`` message telling it to refetch.
+With several instances, workspaces owned by another instance are relayed
+from that instance's event stream.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cluster import ROUTED_HEADER, cluster
+from .event_bus import event_bus, workspace_channel
+from .metrics import LIVE_CONNECTIONS, LIVE_EVENTS
+from .storage import valid_workspace_name
+from .workspace_store import workspace_store
+
+logger = logging.getLogger(__name__)
+
+# Tokens are published at most this often per generation
+TOKEN_FLUSH_INTERVAL = 0.05
+PING_INTERVAL = 20.0
+SEND_TIMEOUT = float(os.getenv("LIVE_SEND_TIMEOUT", "10"))
+MAX_SUBSCRIPTIONS = 32
+MAX_BATCH = 200
+CHANNEL_PREFIX = workspace_channel("")
+
+
+# Publishing
+
+def _publish_file_changes(workspace_dir: Path, written: List[str], deleted: List[str]):
+    channel = workspace_channel(Path(workspace_dir).name)
+    if event_bus.has_subscribers(channel):
+        event_bus.publish(channel, {"type": "files_changed", "written": written, "deleted": deleted})
+
+
+workspace_store.change_listeners.append(_publish_file_changes)
+
+
+class GenerationJob:
+    """
+    Publishes the progress and LLM output of one generation request.
+
+    Tokens are buffered and published every TOKEN_FLUSH_INTERVAL seconds, so
+    a fast model does not turn into one message per token.
+    """
+
+    def __init__(self, workspace_name: str, kind: str):
+        # Clients watch the workspace they asked for, even if the request ends up renaming it
+        self.channel = workspace_channel(workspace_name)
+        self.kind = kind
+        self.job_id = uuid.uuid4().hex[:12]
+        self._buffer: List[str] = []
+        self._stage: Optional[str] = None
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.publish("generation_started")
+
+    def publish(self, event_type: str, **fields: Any):
+        event_bus.publish(self.channel, {"type": event_type, "job_id": self.job_id, "kind": self.kind, **fields})
+
+    def tokens(self, stage: str) -> Callable[[str], None]:
+        """on_token callback for post_chat_completion; safe from worker threads"""
+
+        def on_token(text: str):
+            if not event_bus.has_subscribers(self.channel):
+                return
+            with self._lock:
+                if self._stage != stage:
+                    self._flush()
+                    self._stage = stage
+                self._buffer.append(text)
+                if time.monotonic() - self._flushed_at >= TOKEN_FLUSH_INTERVAL:
+                    self._flush()
+
+        return on_token
+
+    def _flush(self):
+        if self._buffer:
+            self.publish("generation_tokens", stage=self._stage, text="".join(self._buffer))
+            self._buffer = []
+        self._flushed_at = time.monotonic()
+
+    def finish(self, error: Optional[BaseException] = None, **fields: Any):
+        with self._lock:
+            self._flush()
+        if error is not None:
+            fields["error"] = getattr(error, "detail", None) or str(error)
+        self.publish("generation_finished", success=error is None, **fields)
+
+
+# Connections
+
+def _merge(previous: Dict[str, Any], event: Dict[str, Any]) -> bool:
+    """Fold event into the previous message of the same stream; False if they cannot be merged"""
+    if previous["type"] != event["type"] or previous["workspace"] != event["workspace"]:
+        return False
+    if event["type"] == "generation_tokens":
+        if previous["job_id"] != event["job_id"] or previous["stage"] != event["stage"]:
+            return False
+        previous["text"] += event["text"]
+        return True
+    if event["type"] == "files_changed":
+        # New lists: the event dicts are shared with other subscribers
+        written = [p for p in previous["written"] if p not in event["deleted"]]
+        deleted = [p for p in previous["deleted"] if p not in event["written"]]
+        previous["written"] = written + [p for p in event["written"] if p not in written]
+        previous["deleted"] = deleted + [p for p in event["deleted"] if p not in deleted]
+        return True
+    return False
+
+
+def coalesce(items: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Messages for queued (channel, event) pairs, merging consecutive tokens and file changes"""
+    messages: List[Dict[str, Any]] = []
+    for channel, event in items:
+        message = {**event, "workspace": channel[len(CHANNEL_PREFIX):]}
+        if messages and _merge(messages[-1], message):
+            LIVE_EVENTS.labels("coalesced").inc()
+            continue
+        messages.append(message)
+    return messages
+
+
+class LiveConnection:
+    """
+    One WebSocket client: its subscriptions and send loop.
+
+    Client messages: ``{"action": "subscribe" | "unsubscribe", "workspace": name}``
+    and ``{"action": "ping"}``.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.subscription = event_bus.subscribe()
+        self.workspaces: Dict[str, Optional[asyncio.Task]] = {}
+
+    async def send(self, message: Dict[str, Any]):
+        # A client that stops reading must not hold events (and a task) forever
+        await asyncio.wait_for(self.websocket.send_text(json.dumps(message)), SEND_TIMEOUT)
+
+    async def subscribe(self, name: str):
+        if not isinstance(name, str) or not valid_workspace_name(name):
+            await self.send({"type": "error", "detail": f"Invalid workspace name: {name!r}"})
+            return
+        if name not in self.workspaces:
+            if len(self.workspaces) >= MAX_SUBSCRIPTIONS:
+                await self.send({"type": "error", "detail": f"At most {MAX_SUBSCRIPTIONS} workspaces per connection"})
+                return
+            self.workspaces[name] = self._watch(name)
+        await self.send({"type": "subscribed", "workspace": name})
+
+    def _watch(self, name: str) -> Optional[asyncio.Task]:
+        """Follow a workspace locally, or relay it from the instance that owns it"""
+        if cluster.enabled:
+            owner = cluster.owner(name)
+            if owner != cluster.self_url:
+                return asyncio.ensure_future(self._relay(name, owner))
+        event_bus.add_channel(self.subscription, workspace_channel(name))
+        return None
+
+    async def unsubscribe(self, name: str):
+        if name in self.workspaces:
+            relay = self.workspaces.pop(name)
+            if relay is not None:
+                relay.cancel()
+            event_bus.remove_channel(self.subscription, workspace_channel(name))
+        await self.send({"type": "unsubscribed", "workspace": name})
+
+    async def _relay(self, name: str, owner: str):
+        """Copy events of a workspace from its owner's event stream into this connection"""
+        import httpx
+
+        channel = workspace_channel(name)
+        url = f"{owner}/agent/logs/{name}"
+        headers = {ROUTED_HEADER.decode(): cluster.self_url}
+        try:
+            async with cluster.client().stream("GET", url, headers=headers) as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("data: "):
+                        self.subscription.put(channel, json.loads(line[6:]))
+        except httpx.TransportError as e:
+            logger.warning(f"Lost the event stream of {name} from {owner}: {e}")
+            cluster.mark_down(owner)
+        await asyncio.sleep(1)
+        if name in self.workspaces:
+            # The owner went away or closed the stream: follow the new owner, and
+            # have the client refetch what it may have missed
+            self.subscription.put(channel, {"type": "overflow", "dropped": 0})
+            self.workspaces[name] = self._watch(name)
+
+    async def _receive(self):
+        while True:
+            try:
+                message = json.loads(await self.websocket.receive_text())
+            except ValueError:
+                await self.send({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            action = message.get("action") if isinstance(message, dict) else None
+            if action == "subscribe":
+                await self.subscribe(message.get("workspace"))
+            elif action == "unsubscribe":
+                await self.unsubscribe(message.get("workspace"))
+            elif action == "ping":
+                await self.send({"type": "pong"})
+            else:
+                await self.send({"type": "error", "detail": f"Unknown action: {action!r}"})
+
+    async def _send_events(self):
+        while True:
+            item = await self.subscription.get_with_channel(timeout=PING_INTERVAL)
+            if item is None:
+                await self.send({"type": "ping"})
+                continue
+            items = [item]
+            while len(items) < MAX_BATCH:
+                item = self.subscription.get_nowait()
+                if item is None:
+                    break
+                items.append(item)
+            dropped = self.subscription.take_dropped()
+            if dropped:
+                LIVE_EVENTS.labels("dropped").inc(dropped)
+                await self.send({"type": "overflow", "dropped": dropped})
+            for message in coalesce(items):
+                await self.send(message)
+                LIVE_EVENTS.labels("sent").inc()
+
+    async def run(self):
+        """Serve the connection until the client disconnects or stops reading"""
+        LIVE_CONNECTIONS.inc()
+        tasks = [asyncio.ensure_future(self._receive()), asyncio.ensure_future(self._send_events())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if isinstance(error, asyncio.TimeoutError):
+                    logger.info("Closing a live update connection that stopped reading")
+        finally:
+            for task in tasks + [relay for relay in self.workspaces.values() if relay is not None]:
+                task.cancel()
+            self.subscription.close()
+            LIVE_CONNECTIONS.dec()
@@ -0,0 +1,248 @@
+"""
+Admission control for Groq API calls.
+
+Groq limits requests and tokens per minute. Every LLM call is admitted
+through one scheduler per process that keeps a token bucket for each
+limit (``GROQ_REQUESTS_PER_MINUTE``, ``GROQ_TOKENS_PER_MINUTE``; 0 disables
+a limit). A call reserves one request and its estimated tokens (prompt
+plus ``max_tokens``); the reservation is settled with the actual usage
+afterwards.
+
+Calls that cannot be admitted yet wait in one queue ordered by priority:
+interactive calls (generation and edits) before background work (agent
+runs, scaffolding), before speculative prefetches. Each priority has a
+maximum wait; a call whose wait would exceed it is shed with
+``LLMRateLimited`` instead of queueing, so clients get a fast 429 with
+``Retry-After`` rather than a timeout. A 429 from Groq pauses admission for
+its ``retry-after`` and the remaining-budget headers of every response
+correct the buckets, so other processes sharing the API key are accounted
+for.
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional
+
+from .metrics import LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT, LLM_SHED
+
+logger = logging.getLogger(__name__)
+
+# Priorities, most urgent first
+INTERACTIVE = 0
+BACKGROUND = 1
+SPECULATIVE = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background", SPECULATIVE: "speculative"}
+
+# Completion reserved for calls that do not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1024
+
+
+class LLMRateLimited(Exception):
+    """The call was shed: the rate limits do not admit it within its maximum wait"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, int(self.retry_after + 0.999)))
+
+
+def estimate_tokens(payload: Dict[str, Any]) -> int:
+    """Prompt tokens (about 4 characters each) plus the completion the call may produce"""
+    prompt_chars = 0
+    for message in payload.get("messages") or []:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        # A few tokens of per-message overhead
+        prompt_chars += len(content or "") + 16
+    return prompt_chars // 4 + int(payload.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+class TokenBucket:
+    """Budget of one per-minute limit, refilled continuously"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until amount is available (amounts above capacity wait for a full bucket)"""
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+
+class Reservation:
+    def __init__(self, tokens: int, priority: int, waited: float = 0.0):
+        self.tokens = tokens
+        self.priority = priority
+        self.waited = waited
+
+
+class LLMScheduler:
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, max_wait: Dict[int, float],
+                 max_queue: int = 100):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        # Heap of [priority, sequence, tokens]
+        self._queue: List[List[int]] = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    def _buckets(self) -> List[TokenBucket]:
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        """Seconds until a call of this size can be admitted; requires the lock"""
+        for bucket in self._buckets():
+            bucket.refill(now)
+        wait = self._paused_until - now
+        if self.requests is not None:
+            wait = max(wait, self.requests.time_until(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.time_until(tokens))
+        return max(0.0, wait)
+
+    def _estimated_wait(self, tokens: int, priority: int, now: float) -> float:
+        """Wait for a new call, counting the calls queued ahead of it; requires the lock"""
+        ahead = [entry for entry in self._queue if entry[0] <= priority]
+        wait = self._wait_time(tokens + sum(entry[2] for entry in ahead), now)
+        if self.requests is not None and ahead:
+            wait = max(wait, self.requests.time_until(len(ahead) + 1))
+        return wait
+
+    def acquire(self, tokens: int, priority: int = INTERACTIVE, max_wait: Optional[float] = None) -> Reservation:
+        """
+        Wait until a call of about tokens tokens may be made.
+
+        Raises:
+            LLMRateLimited: if it would have to wait longer than max_wait
+                (default: the maximum wait of its priority)
+        """
+        if not self.enabled:
+            return Reservation(0, priority)
+        if max_wait is None:
+            max_wait = self.max_wait.get(priority, 0.0)
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        start = time.monotonic()
+        deadline = start + max_wait
+
+        with self._cond:
+            estimate = self._estimated_wait(tokens, priority, start)
+            if estimate > max_wait or len(self._queue) >= self.max_queue:
+                LLM_SHED.labels(name).inc()
+                raise LLMRateLimited(
+                    f"Groq rate limit reached; {name} call not admitted (estimated wait {estimate:.1f}s)",
+                    retry_after=estimate,
+                )
+
+            entry = [priority, next(self._sequence), tokens]
+            heapq.heappush(self._queue, entry)
+            LLM_QUEUE_DEPTH.labels(name).inc()
+            try:
+                while True:
+                    now = time.monotonic()
+                    head = self._queue[0] is entry
+                    wait = self._wait_time(tokens, now) if head else deadline - now
+                    if head and wait <= 0:
+                        for bucket in self._buckets():
+                            bucket.level -= tokens if bucket is self.tokens else 1
+                        waited = now - start
+                        LLM_QUEUE_WAIT.labels(name).observe(waited)
+                        return Reservation(tokens, priority, waited)
+                    if now + (wait if head else 0) > deadline:
+                        LLM_SHED.labels(name).inc()
+                        raise LLMRateLimited(
+                            f"Groq rate limit reached; {name} call waited {now - start:.1f}s", retry_after=wait
+                        )
+                    # Woken early when the queue or the budget changes
+                    self._cond.wait(min(wait, deadline - now))
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                LLM_QUEUE_DEPTH.labels(name).dec()
+                self._cond.notify_all()
+
+    def settle(self, reservation: Reservation, used_tokens: Optional[int]):
+        """Replace the reserved tokens by the tokens the call actually used (None: keep the estimate)"""
+        if self.tokens is None or used_tokens is None:
+            return
+        with self._cond:
+            self.tokens.refill(time.monotonic())
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + reservation.tokens - used_tokens)
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """Admit nothing for seconds (the API answered 429)"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def observe(self, headers: Mapping[str, str]):
+        """Lower the token bucket to the remaining budget reported by the API"""
+        # (Groq's remaining-requests header counts per day, so only tokens are compared)
+        value = headers.get("x-ratelimit-remaining-tokens")
+        if self.tokens is None or value is None:
+            return
+        try:
+            remaining = float(value)
+        except ValueError:
+            return
+        with self._cond:
+            self.tokens.refill(time.monotonic())
+            self.tokens.level = min(self.tokens.level, remaining)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            for bucket in self._buckets():
+                bucket.refill(now)
+            queued: Dict[str, int] = {name: 0 for name in PRIORITY_NAMES.values()}
+            for entry in self._queue:
+                queued[PRIORITY_NAMES.get(entry[0], str(entry[0]))] += 1
+            return {
+                "enabled": self.enabled,
+                "queued": queued,
+                "requests_available": round(self.requests.level, 1) if self.requests is not None else None,
+                "tokens_available": round(self.tokens.level) if self.tokens is not None else None,
+                "paused_seconds": round(max(0.0, self._paused_until - now), 2),
+            }
+
+
+def retry_after_seconds(headers: Mapping[str, str], default: float) -> float:
+    """Delay requested by a 429 response"""
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return default
+
+
+llm_scheduler = LLMScheduler(
+    requests_per_minute=float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30")),
+    tokens_per_minute=float(os.getenv("GROQ_TOKENS_PER_MINUTE", "12000")),
+    max_wait={
+        INTERACTIVE: float(os.getenv("GROQ_INTERACTIVE_MAX_WAIT", "30")),
+        BACKGROUND: float(os.getenv("GROQ_BACKGROUND_MAX_WAIT", "300")),
+        # Prefetches only run on spare budget
+        SPECULATIVE: 0.0,
+    },
+    max_queue=int(os.getenv("GROQ_MAX_QUEUE", "200")),
+)
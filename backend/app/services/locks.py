@@ -0,0 +1,281 @@
+"""
+Per-workspace locks.
+
+Every commit to a workspace and short mutating requests (saves, restores)
+hold the lock of their workspace, across worker processes and nodes. Long
+requests (generation, prompt edits) only hold it while committing, so a
+save never waits for an LLM call. Agent runs additionally hold the
+workspace's agent lease (``agent_lease``), which excludes other agent runs
+but not plain saves. Backends (``WORKSPACE_LOCKS``):
+
+- ``file`` (default): ``flock`` on ``workspaces/.locks/<name>.lock``. Covers
+  every worker process on one host; released by the kernel if a process dies.
+- ``redis``: a lease (``SET key token NX PX ttl``) renewed while it is held
+  and released with compare-and-delete, so a crashed node loses its locks
+  after the TTL. Works with any Redis-compatible server at
+  ``WORKSPACE_LOCK_REDIS_URL`` (``benchmarks/mock_redis.py`` for local
+  runs); requires ``pip install redis``.
+- ``none``: no locking.
+
+Locks are re-entrant within a request: held names are tracked in a context
+variable, which ``asyncio.to_thread`` carries into worker threads, so code
+that runs while the lock is held (flushing autosaves, evicting) does not
+wait for itself.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import AsyncIterator, Dict, FrozenSet, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .metrics import WORKSPACE_LOCK_WAIT
+from .workspace_store import workspace_store
+
+logger = logging.getLogger(__name__)
+
+# Compare-and-delete / compare-and-extend, so a lock is only touched by its holder
+RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+RENEW_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+
+_held: ContextVar[FrozenSet[str]] = ContextVar("held_workspace_locks", default=frozenset())
+
+
+class WorkspaceBusy(Exception):
+    """Raised when a workspace lock could not be acquired in time"""
+
+    def __init__(self, name: str, message: Optional[str] = None):
+        super().__init__(message or f"Workspace '{name}' is busy with another operation")
+        self.name = name
+
+
+def agent_lease(name: str) -> str:
+    """Lock name of a workspace's agent lease (workspace names never start with a dot)"""
+    return f".agent-{name}"
+
+
+class LockBackend:
+    """Non-blocking lock primitives; waiting is done by WorkspaceLocks"""
+
+    name = "none"
+    needs_renewal = False
+
+    def try_acquire(self, key: str, token: str, ttl: float) -> bool:
+        return True
+
+    def renew(self, key: str, token: str, ttl: float) -> bool:
+        return True
+
+    def release(self, key: str, token: str):
+        pass
+
+
+class FileLockBackend(LockBackend):
+    """flock-based locks shared by all processes on this host"""
+
+    name = "file"
+
+    def __init__(self, root: str = "workspaces"):
+        self.lock_dir = Path(root) / ".locks"
+        self._files: Dict[str, object] = {}
+        self._guard = threading.Lock()
+        # Without fcntl only threads of this process are excluded
+        self._local: set = set()
+
+    def try_acquire(self, key: str, token: str, ttl: float) -> bool:
+        if fcntl is None:
+            with self._guard:
+                if key in self._local:
+                    return False
+                self._local.add(key)
+                self._files[token] = key
+                return True
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.lock_dir / f"{key}.lock", "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        with self._guard:
+            self._files[token] = lock_file
+        return True
+
+    def release(self, key: str, token: str):
+        with self._guard:
+            lock_file = self._files.pop(token, None)
+            if fcntl is None:
+                self._local.discard(key)
+                return
+        if lock_file is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+
+class RedisLockBackend(LockBackend):
+    """Leases in a Redis-compatible server, shared by all nodes"""
+
+    name = "redis"
+    needs_renewal = True
+
+    def __init__(self, url: str, prefix: str = "codegen:lock:"):
+        # Only needed for this backend
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=5)
+        self.prefix = prefix
+
+    def try_acquire(self, key: str, token: str, ttl: float) -> bool:
+        return bool(self.client.set(self.prefix + key, token, nx=True, px=int(ttl * 1000)))
+
+    def renew(self, key: str, token: str, ttl: float) -> bool:
+        return bool(self.client.eval(RENEW_SCRIPT, 1, self.prefix + key, token, int(ttl * 1000)))
+
+    def release(self, key: str, token: str):
+        self.client.eval(RELEASE_SCRIPT, 1, self.prefix + key, token)
+
+
+class _Renewer(threading.Thread):
+    """Extends a lease every ttl/3 seconds until stopped"""
+
+    def __init__(self, backend: LockBackend, key: str, token: str, ttl: float):
+        super().__init__(name=f"lock-renew-{key}", daemon=True)
+        self.backend, self.key, self.token, self.ttl = backend, key, token, ttl
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.ttl / 3):
+            try:
+                if not self.backend.renew(self.key, self.token, self.ttl):
+                    logger.error(f"Lost the lock of workspace {self.key}")
+                    return
+            except Exception as e:
+                logger.warning(f"Could not renew the lock of workspace {self.key}: {e}")
+
+
+class WorkspaceLocks:
+    """
+    Waits for and holds workspace locks.
+
+    Args:
+        backend: Lock primitives
+        timeout: Default seconds to wait for a lock before raising WorkspaceBusy
+        ttl: Lease duration for backends that expire locks
+    """
+
+    def __init__(self, backend: LockBackend, timeout: float = 30.0, ttl: float = 30.0):
+        self.backend = backend
+        self.timeout = timeout
+        self.ttl = ttl
+
+    @staticmethod
+    def held(name: str) -> bool:
+        return name in _held.get()
+
+    def _acquired(self, name: str, token: str) -> Optional[_Renewer]:
+        renewer = None
+        if self.backend.needs_renewal:
+            renewer = _Renewer(self.backend, name, token, self.ttl)
+            renewer.start()
+        return renewer
+
+    def _release(self, name: str, token: str, renewer: Optional[_Renewer]):
+        if renewer is not None:
+            renewer.stopped.set()
+        try:
+            self.backend.release(name, token)
+        except Exception as e:
+            logger.warning(f"Could not release the lock of workspace {name}: {e}")
+
+    @asynccontextmanager
+    async def hold(self, name: str, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold the lock of a workspace for the duration of the block"""
+        if self.held(name):
+            yield
+            return
+        timeout = self.timeout if timeout is None else timeout
+        token = uuid.uuid4().hex
+        start = time.monotonic()
+        delay = 0.005
+        while not await asyncio.to_thread(self.backend.try_acquire, name, token, self.ttl):
+            if time.monotonic() - start + delay > timeout:
+                raise WorkspaceBusy(name)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        WORKSPACE_LOCK_WAIT.labels(self.backend.name).observe(time.monotonic() - start)
+
+        renewer = self._acquired(name, token)
+        reset = _held.set(_held.get() | {name})
+        try:
+            yield
+        finally:
+            _held.reset(reset)
+            await asyncio.to_thread(self._release, name, token, renewer)
+
+    @asynccontextmanager
+    async def hold_agent(self, name: str, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold the agent lease of a workspace: one agent run at a time, saves are not blocked"""
+        try:
+            async with self.hold(agent_lease(name), timeout):
+                yield
+        except WorkspaceBusy as e:
+            if e.name != agent_lease(name):
+                raise
+            raise WorkspaceBusy(name, f"Workspace '{name}' is busy with another agent task")
+
+    @contextmanager
+    def hold_sync(self, name: str, timeout: Optional[float] = None) -> Iterator[None]:
+        """Blocking variant of hold() for worker threads"""
+        if self.held(name):
+            yield
+            return
+        timeout = self.timeout if timeout is None else timeout
+        token = uuid.uuid4().hex
+        start = time.monotonic()
+        delay = 0.005
+        while not self.backend.try_acquire(name, token, self.ttl):
+            if time.monotonic() - start + delay > timeout:
+                raise WorkspaceBusy(name)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        WORKSPACE_LOCK_WAIT.labels(self.backend.name).observe(time.monotonic() - start)
+
+        renewer = self._acquired(name, token)
+        reset = _held.set(_held.get() | {name})
+        try:
+            yield
+        finally:
+            _held.reset(reset)
+            self._release(name, token, renewer)
+
+
+def _create_locks() -> WorkspaceLocks:
+    backend_name = os.getenv("WORKSPACE_LOCKS", "file").lower()
+    if backend_name == "file":
+        backend = FileLockBackend()
+    elif backend_name == "redis":
+        backend = RedisLockBackend(os.getenv("WORKSPACE_LOCK_REDIS_URL", "redis://localhost:6379/0"))
+    elif backend_name == "none":
+        backend = LockBackend()
+    else:
+        raise ValueError(f"Unknown WORKSPACE_LOCKS backend: {backend_name}")
+    return WorkspaceLocks(
+        backend,
+        timeout=float(os.getenv("WORKSPACE_LOCK_TIMEOUT", "30")),
+        ttl=float(os.getenv("WORKSPACE_LOCK_TTL", "30")),
+    )
+
+
+workspace_locks = _create_locks()
+
+# Every commit, including buffered autosaves (and their push), runs under the workspace lock
+workspace_store.commit_guard = lambda workspace_dir: workspace_locks.hold_sync(Path(workspace_dir).name)
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag: how late a periodic sleep wakes up.
+
+    Blocking work on the loop (synchronous HTTP calls, file IO, subprocesses)
+    shows up directly as lag, which delays every other request.
+    """
+
+    def __init__(self, interval: float = 0.1, window: int = 1000):
+        self.interval = interval
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.max_lag_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start sampling on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.interval) * 1000.0)
+            self.samples.append(lag_ms)
+            if lag_ms > self.max_lag_ms:
+                self.max_lag_ms = lag_ms
+            if lag_ms > 500:
+                logger.warning(f"Event loop blocked for {lag_ms:.0f} ms")
+
+    def reset(self):
+        self.samples.clear()
+        self.max_lag_ms = 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """Lag statistics over the current window"""
+        if not self.samples:
+            return {"samples": 0, "mean_ms": 0.0, "p99_ms": 0.0, "max_ms": round(self.max_lag_ms, 1)}
+
+        ordered = sorted(self.samples)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        return {
+            "samples": len(ordered),
+            "mean_ms": round(sum(ordered) / len(ordered), 1),
+            "p99_ms": round(p99, 1),
+            "max_ms": round(self.max_lag_ms, 1),
+        }
+
+
+# Shared instance started with the app
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,244 @@
+"""
+Prometheus metrics for LLM calls, agent runs, tools and workspaces.
+
+Recording on the hot path is a lock-protected increment per sample.
+Workspace count and disk usage are computed lazily at scrape time and
+cached, so serving requests never walks the workspaces directory.
+
+With several uvicorn workers set ``PROMETHEUS_MULTIPROC_DIR`` so the
+``/metrics`` endpoint aggregates samples from every worker process.
+"""
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+TOOL_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 15, 30, 60, 180, 600)
+HTTP_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# LLM calls
+LLM_REQUESTS = Counter(
+    "codegen_llm_requests_total", "LLM completion calls (status: HTTP status code, or error without a response)",
+    ["call_site", "status"]
+)
+LLM_LATENCY = Histogram(
+    "codegen_llm_request_duration_seconds", "LLM completion latency", ["call_site"], buckets=LLM_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "codegen_llm_tokens_total", "Tokens sent to and received from the LLM (kind: prompt, completion, cached prompt)", ["call_site", "kind"]
+)
+PROMPT_TOKENS = Histogram(
+    "codegen_prompt_tokens", "Estimated tokens of rendered prompts by template and part (system, history, input)",
+    ["prompt", "part"], buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+
+# Caches (hit/miss per named cache)
+CACHE_REQUESTS = Counter(
+    "codegen_cache_requests_total", "Cache lookups by result", ["cache", "result"]
+)
+
+# Agent
+AGENT_TASKS = Counter("codegen_agent_tasks_total", "Agent tasks by outcome", ["status"])
+AGENT_TASK_DURATION = Histogram(
+    "codegen_agent_task_duration_seconds", "End-to-end agent task duration", buckets=TOOL_BUCKETS
+)
+AGENT_STEPS = Histogram(
+    "codegen_agent_steps", "LLM turns per agent task", buckets=(1, 2, 3, 5, 8, 13, 20, 30)
+)
+AGENT_TOOL_CALLS = Counter(
+    "codegen_agent_tool_calls_total", "Agent tool invocations", ["tool", "status"]
+)
+AGENT_TOOL_DURATION = Histogram(
+    "codegen_agent_tool_duration_seconds", "Agent tool call duration", ["tool"], buckets=TOOL_BUCKETS
+)
+SUBPROCESS_DURATION = Histogram(
+    "codegen_subprocess_duration_seconds", "Duration of subprocesses started by agent tools",
+    ["tool"], buckets=TOOL_BUCKETS
+)
+SUBPROCESS_EXITS = Counter(
+    "codegen_subprocess_exits_total", "Subprocess results started by agent tools", ["tool", "outcome"]
+)
+COMMAND_QUEUE_WAIT = Histogram(
+    "codegen_agent_command_queue_seconds", "Time agent commands waited for a sandbox slot",
+    ["kind"], buckets=TOOL_BUCKETS
+)
+COMMANDS_RUNNING = Gauge(
+    "codegen_agent_commands_running", "Agent commands currently running", ["kind"], multiprocess_mode="livesum"
+)
+
+# HTTP and workspaces
+HTTP_REQUESTS = Histogram(
+    "codegen_http_request_duration_seconds", "HTTP request duration by route",
+    ["method", "route", "status"], buckets=HTTP_BUCKETS
+)
+WORKSPACE_MUTATIONS = Counter(
+    "codegen_workspace_mutations_total", "Workspace create/write operations", ["operation"]
+)
+WORKSPACE_LOCK_WAIT = Histogram(
+    "codegen_workspace_lock_wait_seconds", "Time spent waiting for workspace locks", ["backend"],
+    buckets=HTTP_BUCKETS
+)
+ROUTED_REQUESTS = Counter(
+    "codegen_routed_requests_total", "Workspace requests by routing outcome", ["outcome"]
+)
+DEV_SERVERS_RUNNING = Gauge(
+    "codegen_dev_servers_running", "Preview dev servers currently running", multiprocess_mode="livesum"
+)
+DEV_SERVER_STARTUP = Histogram(
+    "codegen_dev_server_startup_seconds", "Time until a preview dev server accepted connections", ["mode"],
+    buckets=TOOL_BUCKETS
+)
+LIVE_CONNECTIONS = Gauge(
+    "codegen_live_connections", "Open live update WebSocket connections", multiprocess_mode="livesum"
+)
+LIVE_EVENTS = Counter(
+    "codegen_live_events_total", "Live update events by outcome (sent, coalesced, dropped)", ["outcome"]
+)
+DUPLICATE_REQUESTS = Counter(
+    "codegen_duplicate_requests_total",
+    "Duplicate mutating requests by how they were handled (coalesced, replayed, conflict)", ["outcome"]
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "codegen_llm_queue_depth", "LLM calls waiting for rate-limit budget", ["priority"], multiprocess_mode="livesum"
+)
+LLM_QUEUE_WAIT = Histogram(
+    "codegen_llm_queue_wait_seconds", "Time LLM calls waited for rate-limit budget", ["priority"],
+    buckets=(0.01, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+LLM_SHED = Counter(
+    "codegen_llm_shed_total", "LLM calls rejected because the rate limits would not admit them in time", ["priority"]
+)
+PREFETCHES = Counter(
+    "codegen_prefetches_total", "Speculative prefetches of draft prompts by outcome", ["outcome"]
+)
+IN_FLIGHT_REQUESTS = Gauge(
+    "codegen_http_requests_in_flight", "Requests currently being served", multiprocess_mode="livesum"
+)
+
+
+def llm_status(status_code: Optional[int]) -> str:
+    """Status label of an LLM call: its HTTP status code, or "error" when no response arrived"""
+    return str(status_code) if status_code is not None else "error"
+
+
+def record_llm_call(call_site: str, status: str, duration: float,
+                    prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None,
+                    cached_tokens: Optional[int] = None):
+    LLM_REQUESTS.labels(call_site, status).inc()
+    LLM_LATENCY.labels(call_site).observe(duration)
+    if prompt_tokens:
+        LLM_TOKENS.labels(call_site, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(call_site, "completion").inc(completion_tokens)
+    if cached_tokens:
+        LLM_TOKENS.labels(call_site, "cached").inc(cached_tokens)
+
+
+def record_subprocess(tool: str, duration: float, returncode: Optional[int]):
+    SUBPROCESS_DURATION.labels(tool).observe(duration)
+    if returncode is None:
+        outcome = "error"
+    else:
+        outcome = "success" if returncode == 0 else "failure"
+    SUBPROCESS_EXITS.labels(tool, outcome).inc()
+
+
+# Installed dependencies and build output are not workspace content, and walking them is slow
+UNCOUNTED_DIRS = {"node_modules", ".git", "build", "dist", "coverage", ".cache", "__pycache__"}
+
+
+class WorkspaceCollector:
+    """
+    Workspace count and disk usage, recomputed at most every `ttl` seconds.
+
+    The scan walks every workspace (except UNCOUNTED_DIRS), so collect() is
+    called off the event loop; describe() lets the collector be registered
+    without scanning.
+    """
+
+    def __init__(self, root: str = "workspaces", ttl: float = 60.0):
+        self.root = Path(root)
+        self.ttl = ttl
+        self._cached: Optional[Tuple[float, int, int, int, int]] = None
+        self._lock = threading.Lock()
+
+    def _scan(self) -> Tuple[int, int, int, int]:
+        count, size, archived, archived_size = 0, 0, 0, 0
+        if not self.root.exists():
+            return count, size, archived, archived_size
+        for workspace in self.root.iterdir():
+            if not workspace.is_dir():
+                continue
+            if workspace.name.startswith("."):
+                # Archive tier (see app.services.tiering)
+                for archive in workspace.glob("*.tar.*"):
+                    archived += 1
+                    try:
+                        archived_size += archive.stat().st_size
+                    except OSError:
+                        pass
+                continue
+            count += 1
+            for dirpath, dirnames, filenames in os.walk(workspace):
+                dirnames[:] = [d for d in dirnames if d not in UNCOUNTED_DIRS]
+                for filename in filenames:
+                    try:
+                        size += os.lstat(os.path.join(dirpath, filename)).st_size
+                    except OSError:
+                        pass
+        return count, size, archived, archived_size
+
+    @staticmethod
+    def _families(values: Optional[Tuple[int, int, int, int]] = None) -> List[GaugeMetricFamily]:
+        families = [
+            GaugeMetricFamily("codegen_workspaces", "Number of hot workspaces"),
+            GaugeMetricFamily(
+                "codegen_workspaces_disk_bytes", "Disk usage of all hot workspaces, without dependencies and build output"
+            ),
+            GaugeMetricFamily("codegen_workspaces_archived", "Number of archived workspaces"),
+            GaugeMetricFamily("codegen_workspaces_archive_bytes", "Disk usage of workspace archives"),
+        ]
+        if values is not None:
+            for family, value in zip(families, values):
+                family.add_metric([], value)
+        return families
+
+    def describe(self):
+        return self._families()
+
+    def collect(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._cached is None or now - self._cached[0] > self.ttl:
+                self._cached = (now, *self._scan())
+            values = self._cached[1:]
+        return self._families(values)
+
+
+_workspace_collector = WorkspaceCollector()
+REGISTRY.register(_workspace_collector)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Serialize all metrics in the Prometheus text format"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_workspace_collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,99 @@
+"""
+Speculative work for prompts that are still being typed.
+
+The UI posts debounced drafts to ``/api/prefetch``. After a short quiet
+period the draft's template match is computed (and cached by the template
+manager) and the connection to the LLM API is warmed, so that a submitted
+prompt only waits for the model. A newer draft from the same client
+cancels work that has not started yet; work that has started is finished,
+since a submit of the same prompt waits for it instead of starting over.
+"""
+import asyncio
+import logging
+import os
+from typing import Dict
+
+from .groq_client import warm_connection
+from .llm_scheduler import SPECULATIVE
+from .metrics import PREFETCHES
+from .template_manager import TemplateManager
+
+logger = logging.getLogger(__name__)
+
+# Shorter drafts are too vague to match
+MIN_PROMPT_CHARS = 20
+
+
+class Prefetcher:
+    def __init__(self, template_manager: TemplateManager, delay: float = 0.2, max_inflight: int = 4):
+        self.template_manager = template_manager
+        self.delay = delay
+        self.max_inflight = max_inflight
+        # client id -> its latest scheduled prefetch
+        self._scheduled: Dict[str, asyncio.Task] = {}
+        self._inflight = 0
+
+    def schedule(self, client_id: str, prompt: str) -> bool:
+        """
+        Prefetch for a draft prompt, superseding the client's previous draft.
+
+        Returns:
+            Whether work was scheduled (False for short or already matched drafts)
+        """
+        previous = self._scheduled.pop(client_id, None)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            PREFETCHES.labels("superseded").inc()
+
+        if len(prompt.strip()) < MIN_PROMPT_CHARS:
+            return False
+        if self.template_manager.is_match_pending(prompt):
+            PREFETCHES.labels("cached").inc()
+            return False
+
+        task = asyncio.ensure_future(self._run(prompt))
+        self._scheduled[client_id] = task
+
+        def done(_):
+            if self._scheduled.get(client_id) is task:
+                del self._scheduled[client_id]
+
+        task.add_done_callback(done)
+        return True
+
+    async def _run(self, prompt: str):
+        # Drafts superseded within the delay cost nothing
+        await asyncio.sleep(self.delay)
+        if self._inflight >= self.max_inflight:
+            # Speculation must not compete with real requests for the API
+            PREFETCHES.labels("skipped").inc()
+            return
+        await asyncio.shield(self._speculate(prompt))
+
+    async def _speculate(self, prompt: str):
+        self._inflight += 1
+        PREFETCHES.labels("started").inc()
+        try:
+            await asyncio.gather(
+                # Only runs on spare rate-limit budget
+                self.template_manager.find_matching_template(prompt, SPECULATIVE),
+                asyncio.to_thread(warm_connection),
+            )
+        except Exception as e:
+            logger.warning(f"Prefetch failed: {e}")
+        finally:
+            self._inflight -= 1
+
+    def stop(self):
+        """Cancel prefetches that have not started"""
+        for task in self._scheduled.values():
+            task.cancel()
+        self._scheduled.clear()
+
+
+def create_prefetcher(template_manager: TemplateManager) -> Prefetcher:
+    return Prefetcher(
+        template_manager,
+        delay=float(os.getenv("PREFETCH_DELAY", "0.2")),
+        max_inflight=int(os.getenv("PREFETCH_MAX_INFLIGHT", "4")),
+    )
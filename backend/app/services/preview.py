@@ -0,0 +1,535 @@
+"""
+Preview bundles.
+
+Previews are built per workspace version into ``.codegen/preview/<hash>/``
+and served from ``/api/workspace/<name>/preview/<hash>/``. The hash covers
+every source the bundle is built from, so a bundle URL never changes
+content and can be cached forever; a new version gets a new URL. Each
+bundle is built once:
+
+- Static sites: the workspace files, with HTML and CSS minified (JS too
+  when esbuild is available). Root stylesheets that the entry page does
+  not reference yet are linked from it.
+- React apps: esbuild bundles the app's entry module (JSX, CSS imports,
+  images and fonts) into one minified script and stylesheet, served next
+  to ``public/index.html``. esbuild is found via ``ESBUILD_PATH``, ``PATH``
+  or the app's ``node_modules``.
+
+Text files are stored precompressed with gzip, and with brotli when the
+``brotli`` package is installed. The newest ``PREVIEW_KEEP`` bundles of a
+workspace are kept.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .metrics import CACHE_REQUESTS
+from .tracing import span
+from .workspace_files import SKIP_DIRS
+from .workspace_store import workspace_store
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_DIR = Path(".codegen") / "preview"
+# Part of every bundle hash; bump when the build output format changes
+BUILD_FORMAT = "2"
+MAX_FILE_BYTES = 5 * 1024 * 1024
+TEXT_SUFFIXES = {".html", ".htm", ".css", ".js", ".mjs", ".json", ".svg", ".txt", ".map", ".xml", ".webmanifest"}
+COMPRESS_MIN_BYTES = 512
+REACT_ENTRIES = ["src/index.js", "src/index.jsx", "src/index.tsx", "src/index.ts", "src/main.jsx", "src/main.js", "src/main.tsx"]
+REACT_SOURCES = ["src", "public", "package.json", "package-lock.json"]
+ASSET_LOADERS = [".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".ico", ".woff", ".woff2", ".ttf", ".eot"]
+HASH_PATTERN = re.compile(r"^[0-9a-f]{16,64}$")
+
+_STRING_OR_COMMENT = re.compile(r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')|/\*.*?\*/", re.DOTALL)
+_CSS_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+_WHITESPACE_PRE = re.compile(r"white-space\s*:\s*(?:pre|pre-wrap|pre-line|break-spaces)\b", re.IGNORECASE)
+# A comment, or a tag with its attributes (quoted values may contain ">")
+_HTML_MARKUP = re.compile(
+    r"(?P<comment><!--.*?-->)"
+    r"|<(?P<close>/?)(?P<name>[a-zA-Z][\w:-]*)(?P<attrs>(?:\"[^\"]*\"|'[^']*'|[^'\">])*)>",
+    re.DOTALL,
+)
+_HTML_ATTRIBUTE = re.compile(r"([^\s=/>]+)(?:\s*=\s*(\"[^\"]*\"|'[^']*'|[^\s>]+))?")
+_QUOTED = re.compile(r"(\"[^\"]*\"|'[^']*')")
+_STYLE_CONTENT = re.compile(r"<style\b[^>]*>(.*?)</style\s*>", re.IGNORECASE | re.DOTALL)
+_STYLESHEET_HREF = re.compile(r"<link\b[^>]*href=[\"']?\.?/?([^\"'\s>]+\.css)", re.IGNORECASE)
+RAW_TEXT_ELEMENTS = {"script", "style", "textarea"}
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class PreviewError(Exception):
+    """The workspace cannot be previewed: no entry page, no bundler or a failed build"""
+
+
+def minify_css(css: str) -> str:
+    """Strip comments and redundant whitespace; strings are left untouched"""
+    strings: List[str] = []
+
+    def keep(match: re.Match) -> str:
+        if match.group(1) is None:
+            return ""
+        strings.append(match.group(1))
+        return f"\x00{len(strings) - 1}\x00"
+
+    code = _minify_css_code(_STRING_OR_COMMENT.sub(keep, css))
+    return re.sub(r"\x00(\d+)\x00", lambda m: strings[int(m.group(1))], code).strip()
+
+
+def _minify_css_code(code: str) -> str:
+    code = re.sub(r"\s+", " ", code)
+    # Spaces around + and - are significant in calc(), and before ":" in selectors
+    code = re.sub(r" ?([{};,>]) ?", r"\1", code)
+    code = re.sub(r": ", ":", code)
+    pieces = re.split(r"([{};])", code)
+    # A piece followed by ";" or "}" is a declaration, whose first ":" ends the property name
+    for i in range(0, len(pieces) - 1, 2):
+        if pieces[i + 1] in (";", "}"):
+            pieces[i] = pieces[i].replace(" :", ":", 1)
+    return "".join(pieces).replace(";}", "}")
+
+
+def preformatted_selectors(css: str) -> Set[str]:
+    """
+    Tag names and class names (as ".name") that rules of the stylesheet give
+    white-space: pre (or pre-wrap, pre-line, break-spaces)
+    """
+    selectors = set()
+    for selector_list, body in _CSS_RULE.findall(_STRING_OR_COMMENT.sub(lambda m: m.group(1) or "", css)):
+        if not _WHITESPACE_PRE.search(body):
+            continue
+        for selector in selector_list.split(","):
+            # The element the rule applies to is described by the last compound selector
+            subject = re.split(r"[\s>+~]+", selector.strip())[-1]
+            selectors.update("." + name for name in re.findall(r"\.([\w-]+)", subject))
+            tag = re.match(r"[a-zA-Z][\w-]*", subject)
+            if tag:
+                selectors.add(tag.group(0).lower())
+    return selectors
+
+
+def _keeps_whitespace(name: str, attrs: str, preformatted: Set[str]) -> bool:
+    if name == "pre" or name in preformatted:
+        return True
+    for attribute, value in _HTML_ATTRIBUTE.findall(attrs):
+        value = value.strip("\"'")
+        attribute = attribute.lower()
+        if attribute == "style" and _WHITESPACE_PRE.search(value):
+            return True
+        if attribute == "class" and any("." + c in preformatted for c in value.split()):
+            return True
+    return False
+
+
+def _element_end(html: str, pos: int, name: str) -> int:
+    """Start of the tag closing the element whose content starts at pos"""
+    depth = 1
+    same_name = re.compile(rf"<(/?){re.escape(name)}\b(?:\"[^\"]*\"|'[^']*'|[^'\">])*>", re.IGNORECASE)
+    for match in same_name.finditer(html, pos):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return match.start()
+    return len(html)
+
+
+def _minify_tag(tag: str) -> str:
+    """Collapse whitespace between attributes; quoted values are left untouched"""
+    parts = _QUOTED.split(tag)
+    # Odd parts are the values captured by the split
+    tag = "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts))
+    return re.sub(r" (/?>)$", r"\1", tag)
+
+
+def minify_html(html: str, preformatted: Iterable[str] = ()) -> str:
+    """
+    Drop comments and collapse whitespace in text and between attributes.
+
+    Attribute values, script/style/textarea content and elements that keep
+    their whitespace are left as they are: pre, elements with an inline
+    white-space: pre, and elements matching ``preformatted`` (see
+    preformatted_selectors; rules of the page's own style blocks are added).
+    """
+    preformatted = set(preformatted)
+    for css in _STYLE_CONTENT.findall(html):
+        preformatted |= preformatted_selectors(css)
+
+    parts: List[str] = []
+    text = ""
+    pos = 0
+    while True:
+        match = _HTML_MARKUP.search(html, pos)
+        text += html[pos:match.start() if match else len(html)]
+        if match is None:
+            parts.append(re.sub(r"\s+", " ", text))
+            break
+        pos = match.end()
+        if match.group("comment") is not None:
+            # Conditional comments are markup for old browsers
+            if match.group(0).startswith("<!--[if"):
+                text += match.group(0)
+            continue
+        parts.append(re.sub(r"\s+", " ", text))
+        text = ""
+        parts.append(_minify_tag(match.group(0)))
+
+        name, attrs = match.group("name").lower(), match.group("attrs")
+        if match.group("close") or name in VOID_ELEMENTS or attrs.rstrip().endswith("/"):
+            continue
+        if name in RAW_TEXT_ELEMENTS:
+            close = re.compile(rf"</{name}\s*>", re.IGNORECASE).search(html, pos)
+            end = close.start() if close else len(html)
+            parts.append(minify_css(html[pos:end]) if name == "style" else html[pos:end])
+            pos = end
+        elif _keeps_whitespace(name, attrs, preformatted):
+            end = _element_end(html, pos, name)
+            parts.append(html[pos:end])
+            pos = end
+    return "".join(parts).strip()
+
+
+def inject_head(html: str, markup: str, fallback_end: bool = False) -> str:
+    """Insert markup before </head>; without a head, at the start (or end) of the page"""
+    if re.search(r"</head\s*>", html, re.IGNORECASE):
+        return re.sub(r"</head\s*>", lambda m: markup + m.group(0), html, count=1, flags=re.IGNORECASE)
+    return html + markup if fallback_end else markup + html
+
+
+def link_stylesheets(html: str, stylesheets: List[str]) -> str:
+    """Link the stylesheets the page does not reference yet"""
+    referenced = {href.lstrip("./") for href in _STYLESHEET_HREF.findall(html)}
+    links = "".join(f'<link rel="stylesheet" href="{name}">' for name in stylesheets if name not in referenced)
+    return inject_head(html, links) if links else html
+
+
+def react_shell(html: Optional[str], stylesheets: List[str], scripts: List[str]) -> str:
+    """Entry page of a bundled React app: public/index.html (or a bare page) with the bundle linked"""
+    if html is None:
+        html = (
+            '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">'
+            '<meta name="viewport" content="width=device-width, initial-scale=1"></head>'
+            '<body><div id="root"></div></body></html>'
+        )
+    html = link_stylesheets(html.replace("%PUBLIC_URL%", "."), stylesheets)
+    return inject_head(html, "".join(scripts), fallback_end=True)
+
+
+def _compress(path: Path):
+    """Write .gz (and .br) next to a text file when that saves space"""
+    if path.suffix not in TEXT_SUFFIXES:
+        return
+    data = path.read_bytes()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data):
+        path.with_name(path.name + ".gz").write_bytes(compressed)
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data):
+            path.with_name(path.name + ".br").write_bytes(compressed)
+
+
+class PreviewService:
+    """
+    Builds and locates preview bundles.
+
+    Args:
+        keep: Bundles kept per workspace
+        build_timeout: Seconds an esbuild run may take
+        esbuild_path: esbuild binary (default: found on PATH or in node_modules)
+    """
+
+    def __init__(self, keep: int = 3, build_timeout: float = 120.0, esbuild_path: Optional[str] = None):
+        self.keep = keep
+        self.build_timeout = build_timeout
+        self.esbuild_path = esbuild_path
+        # Hashes are reused while a file's mtime and size are unchanged
+        self._stat_cache: Dict[str, Tuple[float, int, str]] = {}
+        self._stat_lock = threading.Lock()
+        self._builds: Dict[str, "asyncio.Future"] = {}
+
+    def esbuild(self, app_dir: Optional[Path] = None) -> Optional[str]:
+        if self.esbuild_path:
+            return self.esbuild_path
+        if app_dir is not None:
+            local = app_dir / "node_modules" / ".bin" / "esbuild"
+            if local.exists():
+                return str(local)
+        return shutil.which("esbuild")
+
+    # Sources
+
+    def detect(self, workspace_dir: Path, app: Optional[str] = None) -> Tuple[str, Path]:
+        """("react" | "static", directory the preview is built from)"""
+        if app:
+            app_dir = workspace_store.resolve(workspace_dir, app)
+            if not (app_dir / "package.json").exists():
+                raise PreviewError(f"'{app}' is not an app directory (no package.json)")
+            return "react", app_dir
+        if any(workspace_dir.glob("*.html")):
+            return "static", workspace_dir
+        if (workspace_dir / "package.json").exists():
+            return "react", workspace_dir
+        for child in sorted(workspace_dir.iterdir()):
+            if child.is_dir() and not child.name.startswith(".") and (child / "package.json").exists():
+                return "react", child
+        raise PreviewError("Nothing to preview: no HTML page or React app in this workspace")
+
+    def _sources(self, kind: str, source_dir: Path) -> List[Tuple[str, Path]]:
+        roots = [source_dir / name for name in REACT_SOURCES] if kind == "react" else [source_dir]
+        files = []
+        for root in roots:
+            if root.is_file():
+                files.append((root.relative_to(source_dir).as_posix(), root))
+                continue
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith("."))
+                for filename in sorted(filenames):
+                    if filename.startswith(".") or filename.endswith(".md"):
+                        continue
+                    path = Path(dirpath) / filename
+                    files.append((path.relative_to(source_dir).as_posix(), path))
+        return files
+
+    def _file_hash(self, path: Path) -> Optional[str]:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        if stat.st_size > MAX_FILE_BYTES:
+            return None
+        key = str(path)
+        with self._stat_lock:
+            cached = self._stat_cache.get(key)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        with self._stat_lock:
+            self._stat_cache[key] = (stat.st_mtime, stat.st_size, digest)
+        return digest
+
+    def fingerprint(self, kind: str, source_dir: Path) -> Tuple[List[Tuple[str, Path]], str]:
+        """Source files and the bundle hash derived from them"""
+        hasher = hashlib.sha256(f"{BUILD_FORMAT}:{kind}".encode("utf-8"))
+        files = []
+        for rel, path in self._sources(kind, source_dir):
+            digest = self._file_hash(path)
+            if digest is None:
+                continue
+            files.append((rel, path))
+            hasher.update(f"{rel}\0{digest}\0".encode("utf-8"))
+        if kind == "static":
+            hasher.update(f"esbuild:{bool(self.esbuild())}".encode("utf-8"))
+        return files, hasher.hexdigest()[:20]
+
+    # Bundles
+
+    @staticmethod
+    def bundle_root(workspace_dir: Path) -> Path:
+        return workspace_dir / PREVIEW_DIR
+
+    def _info(self, workspace_dir: Path, bundle_hash: str, cached: bool, build_ms: Optional[float] = None) -> Dict[str, Any]:
+        manifest = json.loads((self.bundle_root(workspace_dir) / bundle_hash / ".bundle.json").read_text(encoding="utf-8"))
+        base_url = f"/api/workspace/{workspace_dir.name}/preview/{bundle_hash}/"
+        return {
+            "workspace_name": workspace_dir.name,
+            "kind": manifest["kind"],
+            "hash": bundle_hash,
+            "base_url": base_url,
+            "url": base_url + manifest["entry"],
+            "stylesheets": manifest["stylesheets"],
+            "files": manifest["files"],
+            "cached": cached,
+            "build_ms": build_ms,
+        }
+
+    async def get(self, workspace_dir: Path, app: Optional[str] = None) -> Dict[str, Any]:
+        """Bundle of the current workspace version, built if needed"""
+        # Buffered autosaves belong to the current version
+        await asyncio.to_thread(workspace_store.flush, workspace_dir)
+        kind, source_dir = self.detect(workspace_dir, app)
+        files, bundle_hash = await asyncio.to_thread(self.fingerprint, kind, source_dir)
+        if (self.bundle_root(workspace_dir) / bundle_hash).is_dir():
+            CACHE_REQUESTS.labels("preview_bundle", "hit").inc()
+            return await asyncio.to_thread(self._info, workspace_dir, bundle_hash, True)
+
+        CACHE_REQUESTS.labels("preview_bundle", "miss").inc()
+        key = f"{workspace_dir.resolve()}:{bundle_hash}"
+        build = self._builds.get(key)
+        if build is None:
+            build = asyncio.ensure_future(self._build(workspace_dir, kind, source_dir, files, bundle_hash))
+            self._builds[key] = build
+            build.add_done_callback(lambda _: self._builds.pop(key, None))
+        # Waiters share one build; a cancelled request does not cancel it
+        return await asyncio.shield(build)
+
+    async def _build(self, workspace_dir: Path, kind: str, source_dir: Path,
+                     files: List[Tuple[str, Path]], bundle_hash: str) -> Dict[str, Any]:
+        root = self.bundle_root(workspace_dir)
+        # Absolute, since esbuild runs in the app directory
+        staging = (root / f".{bundle_hash}.{os.getpid()}.tmp").resolve()
+        start = time.perf_counter()
+        with span("preview.build", kind=kind, workspace=workspace_dir.name) as build_span:
+            await asyncio.to_thread(shutil.rmtree, staging, True)
+            staging.mkdir(parents=True)
+            try:
+                if kind == "react":
+                    entry, stylesheets = await self._build_react(workspace_dir, source_dir, staging)
+                else:
+                    entry, stylesheets = await asyncio.to_thread(self._build_static, workspace_dir, files, staging)
+                await asyncio.to_thread(self._finish, staging, root / bundle_hash, kind, entry, stylesheets)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+            build_ms = round((time.perf_counter() - start) * 1000, 1)
+            build_span.set_attribute("preview.build_ms", build_ms)
+        await asyncio.to_thread(self._prune, root, bundle_hash)
+        return await asyncio.to_thread(self._info, workspace_dir, bundle_hash, False, build_ms)
+
+    def _finish(self, staging: Path, target: Path, kind: str, entry: str, stylesheets: List[str]):
+        files = []
+        for path in sorted(staging.rglob("*")):
+            if path.is_file():
+                _compress(path)
+                files.append(path.relative_to(staging).as_posix())
+        (staging / ".bundle.json").write_text(
+            json.dumps({"kind": kind, "entry": entry, "stylesheets": stylesheets, "files": len(files),
+                        "built": time.time()}),
+            encoding="utf-8",
+        )
+        try:
+            os.replace(staging, target)
+        except OSError:
+            # Built concurrently by another worker; keep theirs
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _prune(self, root: Path, current: str):
+        bundles = [p for p in root.iterdir() if p.is_dir() and HASH_PATTERN.match(p.name)]
+        bundles.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in [p for p in bundles if p.name != current][max(0, self.keep - 1):]:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def _build_static(self, workspace_dir: Path, files: List[Tuple[str, Path]], staging: Path) -> Tuple[str, List[str]]:
+        """Entry page and root stylesheets of a static bundle"""
+        pages = [rel for rel, _ in files if rel.endswith((".html", ".htm"))]
+        entry = next((p for p in ("index.html", "preview.html") if p in pages), pages[0] if pages else None)
+        if entry is None:
+            raise PreviewError("Nothing to preview: no HTML page in this workspace")
+        stylesheets = [rel for rel, _ in files if rel.endswith(".css") and "/" not in rel]
+        # Pages keep the whitespace of elements any stylesheet makes preformatted
+        preformatted = set()
+        for rel, path in files:
+            if rel.endswith(".css"):
+                preformatted |= preformatted_selectors(path.read_text(encoding="utf-8", errors="replace"))
+
+        scripts = []
+        for rel, path in files:
+            target = staging / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if rel.endswith((".html", ".htm")):
+                html = path.read_text(encoding="utf-8", errors="replace")
+                if rel == entry:
+                    html = link_stylesheets(html, stylesheets)
+                target.write_text(minify_html(html, preformatted), encoding="utf-8")
+            elif rel.endswith(".css"):
+                target.write_text(minify_css(path.read_text(encoding="utf-8", errors="replace")), encoding="utf-8")
+            else:
+                shutil.copyfile(path, target)
+                if rel.endswith((".js", ".mjs")):
+                    scripts.append(rel)
+
+        esbuild = self.esbuild()
+        if scripts and esbuild:
+            # Lazy import: the agents package pulls in LangChain
+            from ..agents.sandbox import run_sandboxed_sync
+
+            result = run_sandboxed_sync(
+                [esbuild, *scripts, "--minify", f"--outdir={staging}", "--outbase=.", "--allow-overwrite", "--log-level=error"],
+                workspace_dir=str(workspace_dir), cwd=str(staging), timeout=self.build_timeout, heavy=False,
+            )
+            if result.returncode != 0:
+                # Unminified scripts still work
+                logger.warning(f"Could not minify scripts of {workspace_dir.name}: {result.output[-500:]}")
+        return entry, stylesheets
+
+    async def _build_react(self, workspace_dir: Path, app_dir: Path, staging: Path) -> Tuple[str, List[str]]:
+        """Entry page and stylesheets of a React bundle"""
+        esbuild = self.esbuild(app_dir)
+        if esbuild is None:
+            raise PreviewError("React previews need esbuild: npm install -g esbuild, or set ESBUILD_PATH")
+        if not (app_dir / "node_modules").is_dir():
+            raise PreviewError(f"Dependencies of {app_dir.name} are not installed yet (npm install)")
+        entry = next((e for e in REACT_ENTRIES if (app_dir / e).exists()), None)
+        if entry is None:
+            raise PreviewError(f"No entry module found in {app_dir.name} (expected src/index.js or similar)")
+
+        from ..agents.sandbox import run_sandboxed
+
+        command = [
+            esbuild, entry, "--bundle", "--minify", "--format=iife", "--target=es2018",
+            f"--outdir={staging / 'static'}", "--entry-names=app", "--asset-names=[name]-[hash]",
+            "--public-path=static", "--jsx=automatic", "--loader:.js=jsx",
+            '--define:process.env.NODE_ENV="production"', "--log-level=error",
+        ] + [f"--loader:{suffix}=file" for suffix in ASSET_LOADERS]
+        result = await run_sandboxed(
+            command, workspace_dir=str(workspace_dir), cwd=str(app_dir), timeout=self.build_timeout, heavy=False,
+        )
+        if result.returncode != 0:
+            raise PreviewError(f"esbuild failed: {result.output[-2000:]}")
+
+        public = app_dir / "public"
+        if public.is_dir():
+            await asyncio.to_thread(shutil.copytree, public, staging, dirs_exist_ok=True)
+        index = staging / "index.html"
+        stylesheets = ["static/app.css"] if (staging / "static" / "app.css").exists() else []
+        html = react_shell(
+            index.read_text(encoding="utf-8") if index.exists() else None,
+            stylesheets, ['<script defer src="static/app.js"></script>'],
+        )
+        preformatted = preformatted_selectors((staging / "static" / "app.css").read_text(encoding="utf-8")) if stylesheets else set()
+        index.write_text(minify_html(html, preformatted), encoding="utf-8")
+        return "index.html", stylesheets
+
+    # Serving
+
+    def asset(self, workspace_dir: Path, bundle_hash: str, rel_path: str,
+              accept_encoding: str = "") -> Tuple[Path, str, Optional[str]]:
+        """
+        (file to send, media type, content encoding) of a bundle file, preferring
+        a precompressed variant the client accepts
+        """
+        if not HASH_PATTERN.match(bundle_hash):
+            raise FileNotFoundError(rel_path)
+        bundle = self.bundle_root(workspace_dir) / bundle_hash
+        path = (bundle / rel_path).resolve()
+        if bundle.resolve() not in path.parents or path.name.startswith(".") or not path.is_file():
+            raise FileNotFoundError(rel_path)
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            variant = path.with_name(path.name + suffix)
+            if encoding in accepted and variant.exists():
+                return variant, media_type, encoding
+        return path, media_type, None
+
+
+preview_service = PreviewService(
+    keep=int(os.getenv("PREVIEW_KEEP", "3")),
+    build_timeout=float(os.getenv("PREVIEW_BUILD_TIMEOUT", "120")),
+    esbuild_path=os.getenv("ESBUILD_PATH") or None,
+)
@@ -0,0 +1,283 @@
+"""
+Versioned prompt templates for the LLM calls of the app.
+
+A template has a static part, the system message (role plus instructions),
+and input sections rendered per call into the user message. The static
+part is cleaned once (source indentation and trailing whitespace removed,
+blank-line runs collapsed) and the same string is sent with every call, so
+consecutive requests share a byte-identical prefix that provider-side
+prompt caching can reuse. Everything that varies (user prompt, file
+contents, chat history) follows it.
+
+Fields of the system text that depend on deployment data rather than on
+the request (e.g. the list of templates) are bound once with ``partial``.
+Change a template's text only together with its ``version``; the
+``/api/prompts`` endpoint lists versions and static sizes, and every
+rendered prompt records its estimated tokens per part (system, history,
+input) in ``codegen_prompt_tokens``.
+"""
+import copy
+import hashlib
+import re
+import textwrap
+from string import Formatter
+from typing import Any, Dict, List, Optional
+
+from .metrics import PROMPT_TOKENS
+
+# Rough token estimate, the same as the rate limiter's (about 4 characters per token)
+CHARS_PER_TOKEN = 4
+
+
+def clean_text(text: str) -> str:
+    """Remove source indentation, trailing whitespace and repeated blank lines"""
+    lines = [line.rstrip() for line in textwrap.dedent(text).strip().splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+def count_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def _fields(text: str) -> List[str]:
+    return [field for _, field, _, _ in Formatter().parse(text) if field]
+
+
+class PromptTemplate:
+    """
+    One prompt, identified by name and version.
+
+    Args:
+        system: Role of the model, first line of the system message
+        instructions: Static rules appended to the system message
+        sections: Format strings rendered into the user message, in order;
+            a section whose fields are all empty is left out
+    """
+
+    def __init__(self, name: str, version: int, system: str, instructions: str = "",
+                 sections: Optional[List[str]] = None):
+        self.name = name
+        self.version = version
+        self._system_text = "\n\n".join(clean_text(part) for part in (system, instructions) if part)
+        self.sections = [clean_text(section) for section in sections or []]
+        # Precomputed once; templates with unbound fields get theirs from partial()
+        self.prefix: Optional[str] = None if _fields(self._system_text) else self._system_text.format()
+
+    @property
+    def id(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def partial(self, **values: Any) -> "PromptTemplate":
+        """Copy with the fields of the system text bound, e.g. to data loaded at startup"""
+        bound = copy.copy(self)
+        bound.prefix = self._system_text.format(**values)
+        return bound
+
+    def render(self, **values: Any) -> str:
+        """The user message; values are inserted verbatim"""
+        parts = []
+        for section in self.sections:
+            fields = _fields(section)
+            if fields and not any(values[field] for field in fields):
+                continue
+            parts.append(section.format(**values))
+        return "\n\n".join(parts)
+
+    def messages(self, history: Optional[List[Dict[str, Any]]] = None, **values: Any) -> List[Dict[str, str]]:
+        """
+        Chat messages: the static system message, the previous turns of
+        history (entries without role or content are skipped), then the input.
+        """
+        if self.prefix is None:
+            raise ValueError(f"Prompt {self.id} has unbound fields: {', '.join(_fields(self._system_text))}")
+        user = self.render(**values)
+        turns = [{"role": msg["role"], "content": msg["content"]}
+                 for msg in history or [] if "role" in msg and "content" in msg]
+
+        PROMPT_TOKENS.labels(self.id, "system").observe(count_tokens(self.prefix))
+        if turns:
+            PROMPT_TOKENS.labels(self.id, "history").observe(sum(count_tokens(str(m["content"])) for m in turns))
+        PROMPT_TOKENS.labels(self.id, "input").observe(count_tokens(user))
+        return [{"role": "system", "content": self.prefix}, *turns, {"role": "user", "content": user}]
+
+    def describe(self) -> Dict[str, Any]:
+        static = self.prefix if self.prefix is not None else self._system_text
+        return {
+            "name": self.name,
+            "version": self.version,
+            "system_tokens": count_tokens(static),
+            "system_sha256": hashlib.sha256(static.encode("utf-8")).hexdigest()[:16] if self.prefix is not None else None,
+            "sections": len(self.sections),
+        }
+
+
+# Static page generation (app.routers.generation)
+
+HTML_DEVELOPER = "You are a professional web developer who creates clean, semantic HTML using Bootstrap Css."
+CSS_DEVELOPER = "You are a professional web developer who creates clean, modern CSS using Bootstrap Css."
+
+GENERATE_HTML = PromptTemplate(
+    "generate_html", 1,
+    system=HTML_DEVELOPER,
+    instructions="""
+        Include proper HTML5 structure with doctype, html, head, body tags.
+        Add viewport meta tags and other necessary head elements.
+        Only return the complete HTML code without any explanations.
+        Use semantic HTML elements where appropriate.
+        Add comments to explain the structure.
+        Don't include any styling in the HTML file itself (no inline styles or style tags).
+        Use class names that work well with CSS.
+        Use Bootstrap Css and make the design interactive and user friendly.
+        Use relevant icons from BootStrap in different sizes in place of images.
+        """,
+    sections=["Generate a clean, modern HTML file based on this description:\n{description}"],
+)
+
+GENERATE_CSS = PromptTemplate(
+    "generate_css", 1,
+    system=CSS_DEVELOPER,
+    instructions="""
+        Create a responsive design that looks good on all devices.
+        Use modern CSS features like flexbox and grid where appropriate.
+        Add hover effects and transitions for interactive elements.
+        Include media queries for responsive design.
+        Add comments to explain the CSS sections.
+        Only return the complete CSS code without any explanations.
+        Use Bootstrap Css and make the design interactive and user friendly.
+        Use relevant icons from BootStrap in different sizes in place of images.
+        """,
+    sections=[
+        "Generate a modern, clean CSS file for this HTML:\n```html\n{html}\n```",
+        "Based on this description:\n{description}",
+    ],
+)
+
+MODIFY_TEMPLATE_HTML = PromptTemplate(
+    "modify_template_html", 1,
+    system=HTML_DEVELOPER,
+    instructions="""
+        Modify the existing HTML template to match the user's requirements.
+        Return the modified HTML code only.
+        Keep the same structure but update content, classes, and elements as needed.
+        """,
+    # The template comes first: requests for the same template share it as a prefix
+    sections=[
+        "Original template HTML:\n```html\n{template_html}\n```",
+        "User's requirements:\n{requirements}",
+    ],
+)
+
+MODIFY_TEMPLATE_CSS = PromptTemplate(
+    "modify_template_css", 1,
+    system=CSS_DEVELOPER,
+    instructions="""
+        Modify the existing CSS template to match the user's requirements.
+        Return the modified CSS code only.
+        Keep the same structure but update styles, colors, and layouts as needed.
+        """,
+    sections=[
+        "Original template CSS:\n```css\n{template_css}\n```",
+        "User's requirements:\n{requirements}",
+    ],
+)
+
+UPDATE_PAGE = PromptTemplate(
+    "update_page", 1,
+    system="You are a professional web developer who updates HTML and CSS files together and uses only Bootstrap Css.",
+    instructions="Return ONLY the new index.html and styles.css code blocks.",
+    sections=[
+        "Here is the previous index.html:\n```html\n{html}\n```",
+        "Here is the previous styles.css:\n```css\n{css}\n```",
+        "Update BOTH files according to this request:\n{request}",
+    ],
+)
+
+UPDATE_FILE = PromptTemplate(
+    "update_file", 1,
+    system="You are a helpful assistant that modifies code.",
+    instructions="Return only the updated code.",
+    sections=[
+        "I have the following {file_name} file:\n```\n{content}\n```",
+        "For reference, related code from other files in the project (do not return it):\n{project_context}",
+        "Please modify the file according to this request:\n{request}",
+    ],
+)
+
+# Task text for the agent (it brings its own system prompt), rendered with render()
+AGENT_MODIFY_FILE = PromptTemplate(
+    "agent_modify_file", 1,
+    system="",
+    sections=[
+        "In the React application '{app_name}', modify the file '{file_name}' according to this request:\n{request}",
+        "The current content of the file is:\n```\n{content}\n```",
+        "Relevant code from other files of the project (no need to read these files again):\n{project_context}",
+    ],
+)
+
+# Template matching (app.services.template_manager); bind template_names with partial()
+
+TEMPLATE_MATCH = PromptTemplate(
+    "template_match", 1,
+    system="You are a JSON-only response bot. You must return only valid JSON objects, no other text.",
+    instructions="""
+        Given a user's request for a website and a list of available template categories, determine if the request matches any category.
+        Consider ONLY the semantic meaning and purpose, not specific design elements.
+
+        You must respond with ONLY a valid JSON object, no other text, using this exact format:
+        {{"match": "exact_template_name", "score": 0.95, "confidence": 0.9}}
+
+        Where:
+        - match: must be one of the exact template names listed below, or "NO_MATCH"
+        - score: a number between 0 and 1 indicating match quality
+        - confidence: a number between 0 and 1 indicating confidence in the match
+
+        Do not include any explanation or additional text, only the JSON object.
+
+        Available template categories:
+        {template_names}
+        """,
+    sections=["User's request:\n{request}"],
+)
+
+# Chunked template processing (app.services.code_processor)
+
+CHUNK_INSTRUCTIONS = """
+    Process the {language} chunk while maintaining the overall {scope} and incorporating user requirements.
+    Modify the chunk to meet user requirements while maintaining {consistency} and compatibility with other chunks.
+    Return only the modified {language}, no explanations.
+    """
+
+PROCESS_HTML_CHUNK = PromptTemplate(
+    "process_html_chunk", 1,
+    system="You are a specialized HTML processor. Return only valid HTML code, no explanations.",
+    instructions=CHUNK_INSTRUCTIONS.format(language="HTML", scope="structure", consistency="structure"),
+    # Context and requirements are the same for every chunk of a template, so they come first
+    sections=[
+        "Structure Context: {context}\nUser Requirements: {requirements}",
+        "Special Instructions:\n{position}",
+        "Original Chunk:\n{chunk}",
+    ],
+)
+
+PROCESS_CSS_CHUNK = PromptTemplate(
+    "process_css_chunk", 1,
+    system="You are a specialized CSS processor. Return only valid CSS code, no explanations.",
+    instructions=CHUNK_INSTRUCTIONS.format(language="CSS", scope="style scheme", consistency="style consistency"),
+    sections=[
+        "Style Context: {context}\nUser Requirements: {requirements}",
+        "Special Instructions:\n{position}",
+        "Original Chunk:\n{chunk}",
+    ],
+)
+
+PROMPTS: Dict[str, PromptTemplate] = {
+    template.name: template
+    for template in (
+        GENERATE_HTML, GENERATE_CSS, MODIFY_TEMPLATE_HTML, MODIFY_TEMPLATE_CSS, UPDATE_PAGE, UPDATE_FILE,
+        AGENT_MODIFY_FILE, TEMPLATE_MATCH, PROCESS_HTML_CHUNK, PROCESS_CSS_CHUNK,
+    )
+}
+
+
+def describe_prompts() -> List[Dict[str, Any]]:
+    return [template.describe() for template in PROMPTS.values()]
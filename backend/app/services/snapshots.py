@@ -0,0 +1,347 @@
+"""
+Content-addressed version history per workspace.
+
+Every mutation records a version: a mapping of workspace paths to blob
+hashes, appended as one line to ``.codegen/snapshots/versions.jsonl``.
+Blobs live in ``.codegen/snapshots/objects`` keyed by SHA-256, so content
+that did not change between versions is stored once. A new blob of a path
+is stored as a delta against the previous blob of that path when that is
+smaller: zlib compression with the previous content as preset dictionary
+(effective for the last 32 KB of the base, which covers typical generated
+files). Delta chains are capped, so reading a blob decompresses at most
+MAX_DELTA_CHAIN objects.
+
+Listing, diffing and restoring are local file operations; restoring
+writes through the workspace store as one transaction.
+"""
+import difflib
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from .tracing import span
+from .workspace_files import scan, unchanged
+from .workspace_store import workspace_store
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = Path(".codegen") / "snapshots"
+VERSIONS_FILE = "versions.jsonl"
+MAX_FILE_BYTES = int(os.getenv("SNAPSHOT_MAX_FILE_BYTES", str(2 * 1024 * 1024)))
+MAX_FILES = int(os.getenv("SNAPSHOT_MAX_FILES", "2000"))
+MAX_DELTA_CHAIN = 16
+ZDICT_BYTES = 32 * 1024
+
+FULL = b"F"
+DELTA = b"D"
+
+
+class VersionNotFound(KeyError):
+    """Raised for unknown version ids"""
+
+
+class SnapshotStore:
+    def __init__(self, workspace_dir: str):
+        self.workspace_dir = Path(workspace_dir)
+        self.root = self.workspace_dir / SNAPSHOT_DIR
+        self.objects_dir = self.root / "objects"
+        self.versions_path = self.root / VERSIONS_FILE
+        self._lock = threading.Lock()
+        # rel path -> mtime, size and hash, so unchanged files are not re-hashed
+        self._stat_cache: Dict[str, Dict[str, Any]] = {}
+        self._blob_cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._truncation_logged = False
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(self.root / "lock", "a+") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Blobs
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest[2:]
+
+    def _read_object(self, digest: str) -> Tuple[bytes, int, Optional[str], bytes]:
+        """(kind, chain depth, base digest, compressed payload)"""
+        raw = self._object_path(digest).read_bytes()
+        kind = raw[:1]
+        if kind == DELTA:
+            depth = raw[1]
+            base = raw[2:66].decode("ascii")
+            return kind, depth, base, raw[66:]
+        return kind, 0, None, raw[1:]
+
+    def read_blob(self, digest: str) -> bytes:
+        cached = self._blob_cache.get(digest)
+        if cached is not None:
+            self._blob_cache.move_to_end(digest)
+            return cached
+        kind, _, base, payload = self._read_object(digest)
+        if kind == DELTA:
+            decompressor = zlib.decompressobj(zdict=self.read_blob(base)[-ZDICT_BYTES:])
+            content = decompressor.decompress(payload) + decompressor.flush()
+        else:
+            content = zlib.decompress(payload)
+        self._blob_cache[digest] = content
+        if len(self._blob_cache) > 64:
+            self._blob_cache.popitem(last=False)
+        return content
+
+    def _write_blob(self, content: bytes, base: Optional[str]) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._object_path(digest)
+        if path.exists():
+            return digest
+
+        data = FULL + zlib.compress(content, 6)
+        if base and base != digest:
+            try:
+                _, base_depth, _, _ = self._read_object(base)
+                if base_depth + 1 <= MAX_DELTA_CHAIN:
+                    compressor = zlib.compressobj(6, zdict=self.read_blob(base)[-ZDICT_BYTES:])
+                    delta = compressor.compress(content) + compressor.flush()
+                    if len(delta) + 65 < len(data):
+                        data = DELTA + bytes([base_depth + 1]) + base.encode("ascii") + delta
+            except (OSError, zlib.error) as e:
+                logger.warning(f"Could not delta-compress against {base}: {e}")
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        return digest
+
+    # Versions
+
+    def versions(self) -> List[Dict[str, Any]]:
+        if not self.versions_path.exists():
+            return []
+        versions = []
+        with open(self.versions_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    versions.append(json.loads(line))
+                except ValueError:
+                    # Torn last line of a crashed append
+                    continue
+        return versions
+
+    def get_version(self, version_id: int) -> Dict[str, Any]:
+        for version in self.versions():
+            if version["id"] == version_id:
+                return version
+        raise VersionNotFound(version_id)
+
+    def _current_files(self, previous: Dict[str, str]) -> Tuple[Dict[str, str], bool]:
+        """Hashes of the workspace files, and whether MAX_FILES left some out"""
+        found, truncated = scan(self.workspace_dir, MAX_FILES)
+        if truncated and not self._truncation_logged:
+            self._truncation_logged = True
+            logger.warning(
+                f"{self.workspace_dir} has more than {MAX_FILES} files; versions only cover the first "
+                f"{MAX_FILES} (raise SNAPSHOT_MAX_FILES to include the rest)"
+            )
+        files = {}
+        for rel, path, stat in found:
+            if stat.st_size > MAX_FILE_BYTES:
+                continue
+            cached = self._stat_cache.get(rel)
+            if unchanged(cached, stat):
+                files[rel] = cached["hash"]
+                continue
+            try:
+                content = path.read_bytes()
+            except OSError:
+                continue
+            digest = self._write_blob(content, previous.get(rel))
+            self._stat_cache[rel] = {"mtime": stat.st_mtime, "size": stat.st_size, "hash": digest}
+            files[rel] = digest
+        return files, truncated
+
+    def record(self, source: str, message: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Record the current workspace state as a new version.
+
+        Returns:
+            The new version, or None if nothing changed since the latest one
+        """
+        with span("snapshot.record", source=source), self._locked():
+            return self._record(source, message)
+
+    def _record(self, source: str, message: str = "") -> Optional[Dict[str, Any]]:
+        """record() for callers that hold the lock"""
+        versions = self.versions()
+        latest = versions[-1] if versions else None
+        previous = latest["files"] if latest else {}
+        files, truncated = self._current_files(previous)
+        if latest and files == previous and truncated == latest.get("truncated", False):
+            return None
+        version = {
+            "id": latest["id"] + 1 if latest else 1,
+            "parent": latest["id"] if latest else None,
+            "time": round(time.time(), 3),
+            "source": source,
+            "message": message[:300],
+            "files": files,
+        }
+        if truncated:
+            version["truncated"] = True
+        with open(self.versions_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(version, separators=(",", ":")) + "\n")
+        return version
+
+    # Queries
+
+    @staticmethod
+    def changed_paths(old: Dict[str, str], new: Dict[str, str]) -> Dict[str, List[str]]:
+        return {
+            "added": sorted(set(new) - set(old)),
+            "modified": sorted(p for p in set(old) & set(new) if old[p] != new[p]),
+            "deleted": sorted(set(old) - set(new)),
+        }
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        """Versions without their file maps, newest first"""
+        summaries = []
+        previous: Dict[str, str] = {}
+        for version in self.versions():
+            summaries.append({
+                "id": version["id"],
+                "time": version["time"],
+                "source": version["source"],
+                "message": version["message"],
+                "file_count": len(version["files"]),
+                "truncated": version.get("truncated", False),
+                "changes": self.changed_paths(previous, version["files"]),
+            })
+            previous = version["files"]
+        summaries.reverse()
+        return summaries
+
+    def file_content(self, version_id: int, rel_path: str) -> str:
+        digest = self.get_version(version_id)["files"].get(rel_path)
+        if digest is None:
+            raise FileNotFoundError(rel_path)
+        return self.read_blob(digest).decode("utf-8", errors="replace")
+
+    def diff(self, version_id: int, against: Optional[int] = None,
+             rel_path: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Unified diffs from version ``against`` (default: its parent) to ``version_id``
+        """
+        new = self.get_version(version_id)
+        base_id = against if against is not None else new["parent"]
+        old = self.get_version(base_id) if base_id is not None else {"id": None, "files": {}}
+
+        changes = self.changed_paths(old["files"], new["files"])
+        paths = sorted(p for kind in changes.values() for p in kind)
+        if rel_path is not None:
+            paths = [p for p in paths if p == rel_path]
+
+        diffs = []
+        for path in paths:
+            old_digest, new_digest = old["files"].get(path), new["files"].get(path)
+            old_text = self.read_blob(old_digest).decode("utf-8", errors="replace") if old_digest else ""
+            new_text = self.read_blob(new_digest).decode("utf-8", errors="replace") if new_digest else ""
+            diff = "".join(difflib.unified_diff(
+                old_text.splitlines(keepends=True), new_text.splitlines(keepends=True),
+                fromfile=f"v{old['id']}/{path}" if old_digest else "/dev/null",
+                tofile=f"v{new['id']}/{path}" if new_digest else "/dev/null",
+            ))
+            status = "added" if not old_digest else "deleted" if not new_digest else "modified"
+            diffs.append({"path": path, "status": status, "diff": diff})
+        return diffs
+
+    def restore(self, version_id: int, rel_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Make the workspace (or one file of it) match a version and record the result
+        """
+        target = self.get_version(version_id)
+        # Unsaved autosaves become their own version so the restore can be undone
+        workspace_store.flush(self.workspace_dir)
+
+        # Held throughout, like in record(), so no version is recorded between reading the
+        # latest one and recording the restore. Callers holding the workspace lock take it first.
+        with span("snapshot.restore", version=version_id), self._locked():
+            self._record("autosave")
+            versions = self.versions()
+            current = versions[-1] if versions else {"files": {}}
+            changes = self.changed_paths(current["files"], target["files"])
+            if rel_path is not None:
+                changes = {kind: [p for p in paths if p == rel_path] for kind, paths in changes.items()}
+            # A file missing from a capped map may still exist, so nothing is deleted on its account
+            partial = current.get("truncated", False) or target.get("truncated", False)
+            if partial and changes["deleted"]:
+                logger.warning(
+                    f"Not deleting {len(changes['deleted'])} files while restoring version {version_id}: "
+                    f"the versions of {self.workspace_dir} do not cover every file"
+                )
+                changes["deleted"] = []
+            with workspace_store.transaction(self.workspace_dir) as txn:
+                for path in changes["added"] + changes["modified"]:
+                    txn.write(path, self.read_blob(target["files"][path]))
+                # Files added after the target version are removed
+                for path in changes["deleted"]:
+                    txn.delete(path)
+
+            version = self._record("restore", f"Restored {rel_path or 'workspace'} from version {version_id}")
+            latest = version or (versions or [{"id": None}])[-1]
+        return {
+            "restored_from": version_id,
+            "version": latest["id"],
+            "changes": changes,
+            "partial": partial,
+        }
+
+
+_stores: "OrderedDict[str, SnapshotStore]" = OrderedDict()
+_stores_lock = threading.Lock()
+MAX_OPEN_STORES = 32
+
+
+def get_snapshots(workspace_dir: str) -> SnapshotStore:
+    """Shared snapshot store of a workspace, kept in memory for the most recently used workspaces"""
+    key = str(Path(workspace_dir).resolve())
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = SnapshotStore(workspace_dir)
+            _stores[key] = store
+            if len(_stores) > MAX_OPEN_STORES:
+                _stores.popitem(last=False)
+        else:
+            _stores.move_to_end(key)
+        return store
+
+
+def record_version(workspace_dir: str, source: str, message: str = "") -> Optional[int]:
+    """Record a version after a mutation; failures are logged, never raised"""
+    try:
+        version = get_snapshots(workspace_dir).record(source, message)
+        return version["id"] if version else None
+    except Exception as e:
+        logger.warning(f"Could not record version of {workspace_dir}: {e}")
+        return None
@@ -0,0 +1,411 @@
+"""
+Workspace storage backends.
+
+Agents, npm and the preview all work on workspace directories, so a local
+directory per workspace is always the working copy. Where the workspaces
+are kept durably is pluggable:
+
+- ``local`` (default): the directories under ``workspaces/`` are the
+  storage; syncing is a no-op.
+- ``s3``: an S3-compatible object store (AWS S3, MinIO, ...) is the source
+  of truth and ``workspaces/`` is a read-through cache. Several stateless
+  API replicas can share the same bucket.
+
+In the object store each workspace is a manifest
+(``<prefix><name>/manifest.json``: path -> SHA-256 and size) plus
+content-addressed blobs (``<prefix><name>/blobs/<sha256>``). Pushing uploads
+the missing blobs, then replaces the manifest, so readers always see a
+complete version. Pulling revalidates the manifest with a conditional GET
+(at most every ``WORKSPACE_STORAGE_REVALIDATE`` seconds) and downloads only
+the blobs that changed. Blobs are uploaded and downloaded in parallel.
+Dependency and cache directories (``node_modules``, ...) and local
+bookkeeping are not synced.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .metrics import CACHE_REQUESTS
+from .tiering import workspace_tiering
+from .tracing import span
+from .workspace_store import workspace_store
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = Path(".codegen") / "storage_state.json"
+SKIP_DIRS = {"node_modules", ".cache", "__pycache__"}
+# Per-node bookkeeping and derived data under .codegen that is not shared
+LOCAL_ONLY = {
+    ".codegen/journal", ".codegen/write.lock", ".codegen/last_access", ".codegen/storage_state.json",
+    ".codegen/code_index.json", ".codegen/code_index.tmp", ".codegen/snapshots/lock", ".codegen/preview",
+}
+TRANSFER_THREADS = int(os.getenv("WORKSPACE_STORAGE_THREADS", "8"))
+
+
+class NotModified(Exception):
+    """Raised by conditional gets when the object still has the given ETag"""
+
+
+class ObjectStore:
+    """Minimal object store interface used by ObjectStorage"""
+
+    def get(self, key: str, if_none_match: Optional[str] = None) -> Tuple[bytes, str]:
+        """(content, etag); raises KeyError if missing and NotModified if the etag matches"""
+        raise NotImplementedError
+
+    def put(self, key: str, data: bytes) -> str:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def list_prefixes(self, prefix: str) -> List[str]:
+        """Names directly below prefix (like directories), without the prefix"""
+        raise NotImplementedError
+
+
+class S3ObjectStore(ObjectStore):
+    """S3-compatible store; requires ``pip install boto3``"""
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None):
+        import boto3
+        from botocore.config import Config
+        from botocore.exceptions import ClientError
+
+        self._client_error = ClientError
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3", endpoint_url=endpoint_url, region_name=region or "us-east-1",
+            config=Config(max_pool_connections=max(10, TRANSFER_THREADS * 2), retries={"max_attempts": 3},
+                          s3={"addressing_style": "path"} if endpoint_url else None),
+        )
+
+    def _status(self, error) -> str:
+        return str(error.response.get("Error", {}).get("Code", ""))
+
+    def ensure_bucket(self):
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except self._client_error as e:
+            if self._status(e) not in {"404", "NoSuchBucket"}:
+                raise
+            self.client.create_bucket(Bucket=self.bucket)
+
+    def get(self, key: str, if_none_match: Optional[str] = None) -> Tuple[bytes, str]:
+        kwargs = {"IfNoneMatch": if_none_match} if if_none_match else {}
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key, **kwargs)
+        except self._client_error as e:
+            status = self._status(e)
+            if status in {"304", "NotModified"}:
+                raise NotModified(key)
+            if status in {"404", "NoSuchKey"}:
+                raise KeyError(key)
+            raise
+        return response["Body"].read(), response["ETag"]
+
+    def put(self, key: str, data: bytes) -> str:
+        return self.client.put_object(Bucket=self.bucket, Key=key, Body=data)["ETag"]
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self._client_error as e:
+            if self._status(e) in {"404", "NoSuchKey", "NotFound"}:
+                return False
+            raise
+
+    def list_prefixes(self, prefix: str) -> List[str]:
+        names = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter="/"):
+            for common in page.get("CommonPrefixes", []):
+                names.append(common["Prefix"][len(prefix):].rstrip("/"))
+        return names
+
+
+class LocalStorage:
+    """Workspaces stored as plain directories"""
+
+    remote = False
+
+    def __init__(self, root: str = "workspaces"):
+        self.root = Path(root)
+
+    def path(self, name: str) -> Path:
+        return self.root / name
+
+    def names(self) -> List[str]:
+        if not self.root.exists():
+            return []
+        return sorted(d.name for d in self.root.iterdir() if d.is_dir() and not d.name.startswith("."))
+
+    def exists(self, name: str) -> bool:
+        return self.path(name).is_dir()
+
+    def pull(self, name: str) -> bool:
+        return self.exists(name)
+
+    def push(self, name: str):
+        pass
+
+    def evict(self, name: str) -> bool:
+        return False
+
+
+class ObjectStorage(LocalStorage):
+    """Workspaces kept in an object store, with the local directories as read-through cache"""
+
+    remote = True
+
+    def __init__(self, store: ObjectStore, root: str = "workspaces", prefix: str = "workspaces/",
+                 revalidate_seconds: float = 1.0):
+        super().__init__(root)
+        self.store = store
+        self.prefix = prefix
+        self.revalidate_seconds = revalidate_seconds
+        self._checked: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=TRANSFER_THREADS, thread_name_prefix="storage")
+
+    def _lock(self, name: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _manifest_key(self, name: str) -> str:
+        return f"{self.prefix}{name}/manifest.json"
+
+    def _blob_key(self, name: str, digest: str) -> str:
+        return f"{self.prefix}{name}/blobs/{digest}"
+
+    # Local sync state: the manifest this copy was last synced with, plus stat info
+
+    def _load_state(self, name: str) -> Dict[str, Any]:
+        try:
+            return json.loads((self.path(name) / STATE_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {"etag": None, "generation": 0, "files": {}, "retired": []}
+
+    def _save_state(self, name: str, state: Dict[str, Any]):
+        path = self.path(name) / STATE_FILE
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(state), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def _walk(self, name: str) -> Iterator[Tuple[str, Path]]:
+        workspace = self.path(name)
+        for dirpath, dirnames, filenames in os.walk(workspace):
+            rel_dir = Path(dirpath).relative_to(workspace).as_posix()
+            rel_dir = "" if rel_dir == "." else rel_dir + "/"
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and f"{rel_dir}{d}" not in LOCAL_ONLY]
+            for filename in filenames:
+                rel = f"{rel_dir}{filename}"
+                if rel not in LOCAL_ONLY and not filename.endswith(".tmp"):
+                    yield rel, Path(dirpath) / filename
+
+    def _scan(self, name: str, known: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Current local files; hashes are reused while mtime and size are unchanged"""
+        files = {}
+        for rel, path in self._walk(name):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entry = known.get(rel)
+            if entry and entry.get("mtime") == stat.st_mtime and entry.get("size") == stat.st_size:
+                files[rel] = entry
+                continue
+            files[rel] = {"sha256": hashlib.sha256(path.read_bytes()).hexdigest(),
+                          "size": stat.st_size, "mtime": stat.st_mtime}
+        return files
+
+    # Operations
+
+    def names(self) -> List[str]:
+        return sorted(set(super().names()) | set(self.store.list_prefixes(self.prefix)))
+
+    def exists(self, name: str) -> bool:
+        return super().exists(name) or self.store.exists(self._manifest_key(name))
+
+    def pull(self, name: str) -> bool:
+        """Bring the local copy up to date with the object store; False if the workspace does not exist"""
+        now = time.monotonic()
+        if self.path(name).is_dir() and now - self._checked.get(name, float("-inf")) < self.revalidate_seconds:
+            CACHE_REQUESTS.labels("workspace_storage", "hit").inc()
+            return True
+
+        with self._lock(name), span("storage.pull", workspace=name) as pull_span:
+            state = self._load_state(name) if self.path(name).is_dir() else {"etag": None, "files": {}, "retired": []}
+            try:
+                raw, etag = self.store.get(self._manifest_key(name), if_none_match=state.get("etag"))
+            except NotModified:
+                self._checked[name] = time.monotonic()
+                CACHE_REQUESTS.labels("workspace_storage", "hit").inc()
+                return True
+            except KeyError:
+                # Not pushed yet (or only ever local)
+                return self.path(name).is_dir()
+            CACHE_REQUESTS.labels("workspace_storage", "miss").inc()
+
+            manifest = json.loads(raw)
+            remote_files = manifest["files"]
+            local_files = self._scan(name, state["files"]) if self.path(name).is_dir() else {}
+            wanted = [rel for rel, entry in remote_files.items()
+                      if local_files.get(rel, {}).get("sha256") != entry["sha256"]]
+            for rel in wanted:
+                if rel in local_files and local_files[rel] != state["files"].get(rel):
+                    logger.warning(f"Local change to {name}/{rel} was overwritten by a newer remote version")
+
+            def download(rel: str):
+                data, _ = self.store.get(self._blob_key(name, remote_files[rel]["sha256"]))
+                return rel, data
+
+            with workspace_store.transaction(self.path(name), allow_reserved=True) as txn:
+                for rel, data in self._pool.map(download, wanted):
+                    txn.write(rel, data)
+                for rel in set(state["files"]) - set(remote_files):
+                    # Deleted remotely; local files that were never synced are kept
+                    if rel in local_files and local_files[rel] == state["files"][rel]:
+                        txn.delete(rel)
+
+            files = self._scan(name, local_files)
+            self._save_state(name, {
+                "etag": etag, "generation": manifest.get("generation", 0),
+                "files": {rel: files[rel] for rel in remote_files if rel in files},
+                "retired": state.get("retired", []),
+            })
+            self._checked[name] = time.monotonic()
+            pull_span.set_attribute("storage.downloaded", len(wanted))
+            return True
+
+    def push(self, name: str):
+        """Upload local changes and publish them as a new manifest"""
+        if not self.path(name).is_dir():
+            return
+        with self._lock(name), span("storage.push", workspace=name) as push_span:
+            state = self._load_state(name)
+            files = self._scan(name, state["files"])
+            if {rel: e["sha256"] for rel, e in files.items()} == \
+                    {rel: e["sha256"] for rel, e in state["files"].items()} and state.get("etag"):
+                return
+
+            uploaded = {e["sha256"] for e in state["files"].values()}
+            missing = {}
+            for rel, entry in files.items():
+                if entry["sha256"] not in uploaded:
+                    missing[entry["sha256"]] = rel
+
+            def upload(item: Tuple[str, str]):
+                digest, rel = item
+                self.store.put(self._blob_key(name, digest), (self.path(name) / rel).read_bytes())
+
+            list(self._pool.map(upload, missing.items()))
+            manifest = {
+                "generation": state.get("generation", 0) + 1,
+                "files": {rel: {"sha256": e["sha256"], "size": e["size"]} for rel, e in files.items()},
+            }
+            etag = self.store.put(self._manifest_key(name), json.dumps(manifest).encode("utf-8"))
+
+            # Blobs dropped by this push are deleted one push later, so replicas
+            # still reading the previous manifest can finish
+            current = {e["sha256"] for e in files.values()}
+            for digest in set(state.get("retired", [])) - current:
+                self.store.delete(self._blob_key(name, digest))
+            retired = sorted(uploaded - current)
+            self._save_state(name, {"etag": etag, "generation": manifest["generation"],
+                                    "files": files, "retired": retired})
+            self._checked[name] = time.monotonic()
+            push_span.set_attribute("storage.uploaded", len(missing))
+
+    def evict(self, name: str) -> bool:
+        """Drop the local copy after pushing it; it is pulled again on the next access"""
+        workspace_store.flush(self.path(name))
+        self.push(name)
+        with self._lock(name):
+            shutil.rmtree(self.path(name), ignore_errors=True)
+            self._checked.pop(name, None)
+        return True
+
+
+def _create_storage() -> LocalStorage:
+    backend = os.getenv("WORKSPACE_STORAGE", "local").lower()
+    if backend == "local":
+        return LocalStorage()
+    if backend == "s3":
+        store = S3ObjectStore(
+            bucket=os.getenv("WORKSPACE_S3_BUCKET", "codegen-workspaces"),
+            endpoint_url=os.getenv("WORKSPACE_S3_ENDPOINT") or None,
+            region=os.getenv("WORKSPACE_S3_REGION") or None,
+        )
+        store.ensure_bucket()
+        return ObjectStorage(
+            store, prefix=os.getenv("WORKSPACE_S3_PREFIX", "workspaces/"),
+            revalidate_seconds=float(os.getenv("WORKSPACE_STORAGE_REVALIDATE", "1.0")),
+        )
+    raise ValueError(f"Unknown WORKSPACE_STORAGE backend: {backend}")
+
+
+workspace_storage = _create_storage()
+
+if workspace_storage.remote:
+    # The object store keeps idle workspaces; dropping the local copy replaces archiving
+    workspace_tiering.evictor = workspace_storage.evict
+    # Buffered autosaves are committed after their request returned
+    workspace_store.flush_listeners.append(lambda workspace_dir: workspace_storage.push(Path(workspace_dir).name))
+
+
+def valid_workspace_name(name: str) -> bool:
+    return bool(name) and not name.startswith(".") and "/" not in name and "\\" not in name
+
+
+def workspace_path(name: str) -> Path:
+    """Local working copy of a workspace"""
+    return workspace_storage.path(name)
+
+
+async def open_workspace(name: str) -> Path:
+    """
+    Local working copy of a workspace, made current first: rehydrated from the
+    archive tier and/or pulled from the object store.
+    """
+    if valid_workspace_name(name):
+        await workspace_tiering.ensure_hot(name)
+        await asyncio.to_thread(workspace_storage.pull, name)
+    return workspace_storage.path(name)
+
+
+async def sync_workspace(name: str):
+    """Publish local changes of a workspace to the storage backend"""
+    await asyncio.to_thread(workspace_storage.push, name)
+
+
+def workspace_exists(name: str) -> bool:
+    return workspace_tiering.exists(name) or workspace_storage.exists(name)
+
+
+def list_workspace_names() -> List[str]:
+    return sorted(set(workspace_tiering.list_names()) | set(workspace_storage.names()))
+
+
+def workspace_state(name: str) -> Dict[str, Any]:
+    state = workspace_tiering.state(name)
+    if state["state"] == "missing" and workspace_storage.remote and workspace_storage.exists(name):
+        return {"name": name, "state": "remote"}
+    return state
@@ -1,12 +1,18 @@
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
+import asyncio
 import os
+import time
 from app.models.template import Template, TemplateMatch
 import logging
-import requests
 from dotenv import load_dotenv
 import json
 from .code_processor import CodeProcessor
+from .groq_client import post_chat_completion
+from .llm_scheduler import INTERACTIVE, LLMRateLimited
+from .metrics import CACHE_REQUESTS
+from .prompts import TEMPLATE_MATCH, PromptTemplate
 
 # Load environment variables
 load_dotenv()
@@ -16,19 +22,30 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Set up Groq API for template matching
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
-GROQ_HEADERS = {
-    "Authorization": f"Bearer {GROQ_API_KEY}",
-    "Content-Type": "application/json"
-}
 GROQ_MODEL = "llama-3.3-70b-versatile"
 
+# Template matches are cached per prompt (drafts prefetched while typing are usually submitted unchanged)
+MATCH_CACHE_SIZE = int(os.getenv("TEMPLATE_MATCH_CACHE_SIZE", "256"))
+MATCH_CACHE_SECONDS = float(os.getenv("TEMPLATE_MATCH_CACHE_SECONDS", "600"))
+
+def normalize_prompt(prompt: str) -> str:
+    """Cache key of a prompt: whitespace differences do not change the match"""
+    return " ".join(prompt.split())
+
+class TemplateMatchError(Exception):
+    """The template match could not be computed (API error or unusable answer)"""
+    pass
+
 class TemplateManager:
     def __init__(self, templates_dir: str = "templates"):
         self.templates_dir = Path(templates_dir)
         self.templates: Dict[str, Template] = {}
         self.code_processor = CodeProcessor()
+        # normalized prompt -> (time computed, match)
+        self._matches: "OrderedDict[str, Tuple[float, Optional[TemplateMatch]]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._match_prompt_for: Optional[Tuple[str, ...]] = None
+        self._bound_match_prompt: Optional[PromptTemplate] = None
         self.load_templates()
 
     def load_templates(self):
@@ -65,88 +82,118 @@ class TemplateManager:
             except Exception as e:
                 logger.error(f"Error loading template {template_dir.name}: {str(e)}")
 
-    async def find_matching_template(self, prompt: str) -> Optional[TemplateMatch]:
-        """Find the best matching template based on directory name and prompt content"""
+    async def find_matching_template(self, prompt: str, priority: int = INTERACTIVE) -> Optional[TemplateMatch]:
+        """
+        Find the best matching template based on directory name and prompt content.
+
+        Matches are cached per prompt, and a prompt whose match is already
+        being computed (e.g. by a prefetch) waits for that computation.
+        priority is the rate-limit priority of the LLM call.
+        """
         if not self.templates:
             return None
+        key = normalize_prompt(prompt)
+        cached = self._matches.get(key)
+        if cached is not None and time.monotonic() - cached[0] < MATCH_CACHE_SECONDS:
+            self._matches.move_to_end(key)
+            CACHE_REQUESTS.labels("template_match", "hit").inc()
+            return cached[1]
+
+        task = self._pending.get(key)
+        joined = task is not None
+        if joined:
+            CACHE_REQUESTS.labels("template_match", "hit").inc()
+        else:
+            CACHE_REQUESTS.labels("template_match", "miss").inc()
+            task = asyncio.ensure_future(self._match(key, prompt, priority))
+            self._pending[key] = task
+
+            def done(finished: asyncio.Task):
+                self._pending.pop(key, None)
+                # Retrieved here in case every caller was cancelled
+                if not finished.cancelled():
+                    finished.exception()
+
+            task.add_done_callback(done)
         try:
-            # Create a simpler prompt for template matching that focuses on directory names
-            template_names = "\n".join([
-                f"- {template.name}"
-                for template in self.templates.values()
-            ])
-
-            matching_prompt = f"""Given a user's request for a website and a list of available template categories, determine if the request matches any category.
-            Consider ONLY the semantic meaning and purpose, not specific design elements.
-
-            Available template categories:
-            {template_names}
-
-            User's request:
-            {prompt}
-
-            You must respond with ONLY a valid JSON object, no other text, using this exact format:
-            {{
-                "match": "exact_template_name",
-                "score": 0.95,
-                "confidence": 0.9
-            }}
-
-            Where:
-            - match: must be one of the exact template names listed above, or "NO_MATCH"
-            - score: a number between 0 and 1 indicating match quality
-            - confidence: a number between 0 and 1 indicating confidence in the match
-
-            Do not include any explanation or additional text, only the JSON object.
-            """
-
-            # Call Groq API for template matching
-            payload = {
-                "model": GROQ_MODEL,
-                "messages": [
-                    {"role": "system", "content": "You are a JSON-only response bot. You must return only valid JSON objects, no other text."},
-                    {"role": "user", "content": matching_prompt}
-                ],
-                "temperature": 0.1,  # Lower temperature for more consistent JSON formatting
-                "max_tokens": 500
-            }
-
-            response = requests.post(GROQ_API_URL, headers=GROQ_HEADERS, json=payload)
-            if response.status_code != 200:
-                logger.error(f"Groq API error: {response.status_code} - {response.text}")
-                return None
-                
-            result = response.json()
-            content = result['choices'][0]['message']['content'].strip()
-            
-            # Parse the JSON response
-            match_result = json.loads(content)
-            
-            # Require a minimum match score for valid matches
-            if match_result["match"] == "NO_MATCH" or match_result["score"] < 0.6:
-                return None
-
-            # Validate the response structure
-            required_fields = ['match', 'score', 'confidence']
-            if not all(field in match_result for field in required_fields):
-                logger.error(f"Invalid response structure: {match_result}")
-                return None
-
-            # Validate match exists in templates
-            if match_result['match'] != "NO_MATCH" and match_result['match'] not in self.templates:
-                logger.error(f"Matched template '{match_result['match']}' not found in available templates")
-                return None
-
-            return TemplateMatch(
-                template_name=match_result["match"],
-                match_score=float(match_result["score"]),
-                confidence=float(match_result["confidence"])
-            )
-
+            # A cancelled caller (e.g. a superseded prefetch) must not cancel the match for the others
+            return await asyncio.shield(task)
         except Exception as e:
-            logger.error(f"Error finding matching template: {str(e)}")
+            if joined:
+                # The match this call waited for failed, e.g. a prefetch shed by the
+                # rate limiter: try again at this call's priority
+                return await self.find_matching_template(prompt, priority)
+            if isinstance(e, LLMRateLimited):
+                logger.info(f"Template matching skipped: {e}")
+            else:
+                logger.error(f"Error finding matching template: {str(e)}")
+            # Failures are not cached
             return None
 
+    def is_match_pending(self, prompt: str) -> bool:
+        """Whether the match of this prompt is cached or being computed"""
+        key = normalize_prompt(prompt)
+        cached = self._matches.get(key)
+        fresh = cached is not None and time.monotonic() - cached[0] < MATCH_CACHE_SECONDS
+        return fresh or key in self._pending
+
+    async def _match(self, key: str, prompt: str, priority: int) -> Optional[TemplateMatch]:
+        match = await asyncio.to_thread(self._request_match, prompt, priority)
+        self._matches[key] = (time.monotonic(), match)
+        self._matches.move_to_end(key)
+        while len(self._matches) > MATCH_CACHE_SIZE:
+            self._matches.popitem(last=False)
+        return match
+
+    def _match_prompt(self) -> PromptTemplate:
+        """The matching prompt with the template names bound; rebuilt only when the templates change"""
+        # Sorted, so every instance sends the same prefix
+        names = tuple(sorted(self.templates))
+        if self._match_prompt_for != names:
+            template_names = "\n".join(f"- {name}" for name in names)
+            self._bound_match_prompt = TEMPLATE_MATCH.partial(template_names=template_names)
+            self._match_prompt_for = names
+        return self._bound_match_prompt
+
+    def _request_match(self, prompt: str, priority: int = INTERACTIVE) -> Optional[TemplateMatch]:
+        """Ask the model for the best template; raises TemplateMatchError if it cannot tell"""
+        # Call Groq API for template matching
+        payload = {
+            "model": GROQ_MODEL,
+            "messages": self._match_prompt().messages(request=prompt),
+            "temperature": 0.1,  # Lower temperature for more consistent JSON formatting
+            "max_tokens": 500
+        }
+
+        response = post_chat_completion(payload, span_name="llm.template_match", priority=priority)
+        if response.status_code != 200:
+            raise TemplateMatchError(f"Groq API error: {response.status_code} - {response.text}")
+            
+        result = response.json()
+        content = result['choices'][0]['message']['content'].strip()
+        
+        # Parse the JSON response
+        match_result = json.loads(content)
+        
+        # Require a minimum match score for valid matches
+        if match_result["match"] == "NO_MATCH" or match_result["score"] < 0.6:
+            return None
+
+        # Validate the response structure
+        required_fields = ['match', 'score', 'confidence']
+        if not all(field in match_result for field in required_fields):
+            raise TemplateMatchError(f"Invalid response structure: {match_result}")
+
+        # Validate match exists in templates
+        if match_result['match'] != "NO_MATCH" and match_result['match'] not in self.templates:
+            raise TemplateMatchError(f"Matched template '{match_result['match']}' not found in available templates")
+
+        return TemplateMatch(
+            template_name=match_result["match"],
+            match_score=float(match_result["score"]),
+            confidence=float(match_result["confidence"])
+        )
+
     def get_template(self, template_name: str) -> Optional[Template]:
         """Get a template by name"""
         return self.templates.get(template_name)
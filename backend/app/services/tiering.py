@@ -0,0 +1,424 @@
+"""
+Cold storage for idle workspaces.
+
+Workspaces not accessed for ``WORKSPACE_ARCHIVE_AFTER_DAYS`` are packed
+into one compressed tar per workspace under ``workspaces/.archive``:
+zstd when the ``zstandard`` package is installed, gzip otherwise.
+``node_modules`` directories are left out by default and reinstalled in
+the background after rehydration, since they are usually most of a
+React workspace and can be rebuilt from ``package.json``. A small JSON
+record next to each archive keeps the workspace listed.
+
+The first access to an archived workspace rehydrates it. Concurrent
+requests wait for the same rehydration. Progress is published on the
+workspace event channel and reported by ``state``.
+
+Archiving and rehydrating switch states with renames and treat the
+metadata record as the commit point, so ``recover`` can finish or undo
+either operation after a crash.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tarfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .event_bus import event_bus, workspace_channel
+from .locks import WorkspaceBusy, agent_lease, workspace_locks
+from .metrics import WORKSPACE_MUTATIONS
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = ".archive"
+ACCESS_FILE = Path(".codegen") / "last_access"
+# Access times are persisted at most this often per workspace
+TOUCH_INTERVAL = 60.0
+DEPENDENCY_DIRS = {"node_modules"}
+CACHE_DIRS = {".cache", "__pycache__"}
+
+
+class WorkspaceTiering:
+    def __init__(self, root: str = "workspaces", idle_days: float = 30.0, interval: float = 3600.0,
+                 keep_dependencies: bool = False, zstd_level: int = 10):
+        self.root = Path(root)
+        self.archive_root = self.root / ARCHIVE_DIR
+        self.idle_seconds = idle_days * 86400
+        self.interval = interval
+        self.keep_dependencies = keep_dependencies
+        self.zstd_level = zstd_level
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._locks_guard = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self._rehydrations: Dict[str, asyncio.Future] = {}
+        self._progress: Dict[str, float] = {}
+        self._installing: Dict[str, int] = defaultdict(int)
+        self._task: Optional[asyncio.Task] = None
+        # Set when a remote storage backend keeps the workspaces (see app.services.storage):
+        # idle workspaces are then dropped locally instead of archived
+        self.evictor: Optional[Callable[[str], bool]] = None
+
+    def _lock(self, name: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks[name]
+
+    def _metadata_path(self, name: str) -> Path:
+        return self.archive_root / f"{name}.json"
+
+    def _read_metadata(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self._metadata_path(name).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _valid_name(name: str) -> bool:
+        return bool(name) and not name.startswith(".") and "/" not in name and "\\" not in name
+
+    # Access tracking
+
+    def touch(self, name: str):
+        """Record an access; written to disk at most every TOUCH_INTERVAL seconds"""
+        now = time.time()
+        if now - self._touched.get(name, 0.0) < TOUCH_INTERVAL:
+            return
+        self._touched[name] = now
+        path = self.root / name / ACCESS_FILE
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+        except OSError:
+            pass
+
+    def last_access(self, name: str) -> float:
+        workspace = self.root / name
+        for path in (workspace / ACCESS_FILE, workspace):
+            try:
+                return path.stat().st_mtime
+            except OSError:
+                continue
+        return 0.0
+
+    # Listing
+
+    def archived_names(self) -> List[str]:
+        if not self.archive_root.exists():
+            return []
+        return sorted(p.stem for p in self.archive_root.glob("*.json"))
+
+    def list_names(self) -> List[str]:
+        """Hot and archived workspace names"""
+        names = set(self.archived_names())
+        if self.root.exists():
+            names.update(d.name for d in self.root.iterdir() if d.is_dir() and not d.name.startswith("."))
+        return sorted(names)
+
+    def exists(self, name: str) -> bool:
+        return (self.root / name).is_dir() or self._metadata_path(name).exists()
+
+    def state(self, name: str) -> Dict[str, Any]:
+        if name in self._progress:
+            return {"name": name, "state": "rehydrating", "progress": round(self._progress[name], 3)}
+        if (self.root / name).is_dir():
+            return {"name": name, "state": "hot", "installing_dependencies": self._installing.get(name, 0) > 0}
+        metadata = self._read_metadata(name)
+        if metadata is not None:
+            return {"name": name, "state": "archived", **{k: metadata[k] for k in (
+                "archived_at", "last_access", "size", "archive_size", "file_count"
+            ) if k in metadata}}
+        return {"name": name, "state": "missing"}
+
+    # Archiving
+
+    def _archive_path(self, name: str, fmt: str) -> Path:
+        return self.archive_root / f"{name}.tar.{fmt}"
+
+    def _open_writer(self, path: Path):
+        """(tarfile, closers) writing a compressed stream to path"""
+        if zstandard is not None:
+            raw = open(path, "wb")
+            writer = zstandard.ZstdCompressor(level=self.zstd_level).stream_writer(raw)
+            return tarfile.open(fileobj=writer, mode="w|"), [writer, raw]
+        return tarfile.open(path, mode="w:gz", compresslevel=6), []
+
+    def archive(self, name: str) -> Optional[Dict[str, Any]]:
+        """Pack a workspace into the archive tier; return its metadata, or None if skipped"""
+        workspace = self.root / name
+        if self.evictor is not None:
+            with self._lock(name), span("workspace.evict", workspace=name):
+                if not workspace.is_dir() or name in self._installing or not self.evictor(name):
+                    return None
+            WORKSPACE_MUTATIONS.labels("evict").inc()
+            return {"name": name, "evicted_at": round(time.time())}
+
+        with self._lock(name), span("workspace.archive", workspace=name):
+            if not workspace.is_dir() or name in self._installing:
+                return None
+            self.archive_root.mkdir(parents=True, exist_ok=True)
+            fmt = "zst" if zstandard is not None else "gz"
+            archive_path = self._archive_path(name, fmt)
+            tmp_path = archive_path.with_name(archive_path.name + ".tmp")
+
+            size = file_count = 0
+            reinstall = []
+            tar, closers = self._open_writer(tmp_path)
+            try:
+                for dirpath, dirnames, filenames in os.walk(workspace):
+                    rel_dir = Path(dirpath).relative_to(workspace)
+                    if not self.keep_dependencies and DEPENDENCY_DIRS.intersection(dirnames):
+                        if (Path(dirpath) / "package.json").exists():
+                            reinstall.append(rel_dir.as_posix())
+                    dirnames[:] = sorted(d for d in dirnames if d not in CACHE_DIRS and (
+                        self.keep_dependencies or d not in DEPENDENCY_DIRS))
+                    for filename in sorted(filenames):
+                        path = Path(dirpath) / filename
+                        info = tar.gettarinfo(str(path), arcname=(rel_dir / filename).as_posix())
+                        if info.isreg():
+                            with open(path, "rb") as f:
+                                tar.addfile(info, f)
+                            size += info.size
+                            file_count += 1
+                        elif info.issym():
+                            tar.addfile(info)
+            finally:
+                tar.close()
+                for closer in closers:
+                    closer.close()
+            os.replace(tmp_path, archive_path)
+
+            metadata = {
+                "name": name,
+                "format": fmt,
+                "archived_at": round(time.time()),
+                "last_access": round(self.last_access(name)),
+                "size": size,
+                "archive_size": archive_path.stat().st_size,
+                "file_count": file_count,
+                "reinstall": reinstall,
+            }
+            # Move the directory out of the way first, then commit with the metadata record
+            removing = self.archive_root / f"{name}.removing"
+            os.replace(workspace, removing)
+            tmp_metadata = self._metadata_path(name).with_suffix(".json.tmp")
+            tmp_metadata.write_text(json.dumps(metadata), encoding="utf-8")
+            os.replace(tmp_metadata, self._metadata_path(name))
+            shutil.rmtree(removing, ignore_errors=True)
+            self._touched.pop(name, None)
+
+        WORKSPACE_MUTATIONS.labels("archive").inc()
+        logger.info(f"Archived workspace {name}: {size} bytes in {file_count} files -> {metadata['archive_size']} bytes")
+        return metadata
+
+    def archive_idle(self, idle_seconds: Optional[float] = None) -> List[str]:
+        """Archive every hot workspace not accessed for idle_seconds"""
+        idle_seconds = self.idle_seconds if idle_seconds is None else idle_seconds
+        if not self.root.exists():
+            return []
+        cutoff = time.time() - idle_seconds
+        archived = []
+        for workspace in sorted(self.root.iterdir()):
+            name = workspace.name
+            if not workspace.is_dir() or name.startswith(".") or self.last_access(name) > cutoff:
+                continue
+            try:
+                # Workspaces in use (on any worker), including by an agent run, are skipped until the next run
+                with workspace_locks.hold_sync(agent_lease(name), timeout=0), \
+                        workspace_locks.hold_sync(name, timeout=0):
+                    if self.archive(name):
+                        archived.append(name)
+            except WorkspaceBusy:
+                continue
+            except Exception as e:
+                logger.error(f"Error archiving workspace {name}: {e}")
+        return archived
+
+    # Rehydration
+
+    def _open_reader(self, path: Path, fmt: str):
+        if fmt == "zst":
+            if zstandard is None:
+                raise RuntimeError("Archive is zstd-compressed but the zstandard package is not installed")
+            raw = open(path, "rb")
+            reader = zstandard.ZstdDecompressor().stream_reader(raw)
+            return tarfile.open(fileobj=reader, mode="r|"), [reader, raw]
+        return tarfile.open(path, mode="r|gz"), []
+
+    def _rehydrate(self, name: str, on_progress: Callable[[float], None]) -> Optional[Dict[str, Any]]:
+        with self._lock(name), span("workspace.rehydrate", workspace=name):
+            workspace = self.root / name
+            metadata = self._read_metadata(name)
+            if workspace.is_dir() or metadata is None:
+                return None
+
+            restoring = self.archive_root / f"{name}.restoring"
+            shutil.rmtree(restoring, ignore_errors=True)
+            restoring.mkdir(parents=True)
+            total = max(1, metadata.get("size", 0))
+            done = 0
+            reported = 0.0
+            extract_args = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+            tar, closers = self._open_reader(self._archive_path(name, metadata["format"]), metadata["format"])
+            try:
+                for member in tar:
+                    tar.extract(member, restoring, **extract_args)
+                    done += member.size
+                    progress = done / total
+                    if progress - reported >= 0.05:
+                        reported = progress
+                        on_progress(min(progress, 1.0))
+            finally:
+                tar.close()
+                for closer in closers:
+                    closer.close()
+
+            os.replace(restoring, workspace)
+            self._metadata_path(name).unlink()
+            self._archive_path(name, metadata["format"]).unlink(missing_ok=True)
+            self.touch(name)
+
+        WORKSPACE_MUTATIONS.labels("rehydrate").inc()
+        logger.info(f"Rehydrated workspace {name} ({metadata.get('file_count', 0)} files)")
+        return metadata
+
+    async def _run_rehydration(self, name: str):
+        loop = asyncio.get_running_loop()
+        channel = workspace_channel(name)
+        self._progress[name] = 0.0
+        event_bus.publish(channel, {"type": "rehydrate_started", "workspace": name})
+
+        def on_progress(progress: float):
+            self._progress[name] = progress
+            event_bus.publish(channel, {"type": "rehydrate_progress", "workspace": name, "progress": round(progress, 3)})
+
+        start = time.perf_counter()
+        try:
+            metadata = await loop.run_in_executor(None, self._rehydrate, name, on_progress)
+        except Exception as e:
+            event_bus.publish(channel, {"type": "rehydrate_failed", "workspace": name, "error": str(e)})
+            raise
+        finally:
+            self._progress.pop(name, None)
+        event_bus.publish(channel, {
+            "type": "rehydrate_finished", "workspace": name,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+        if metadata and metadata.get("reinstall"):
+            loop.create_task(self._reinstall_dependencies(name, metadata["reinstall"]))
+
+    async def _reinstall_dependencies(self, name: str, directories: List[str]):
+        """Rebuild node_modules left out of the archive"""
+        from app.agents.sandbox import run_sandboxed
+
+        workspace = str(self.root / name)
+        self._installing[name] += 1
+        try:
+            for directory in directories:
+                result = await run_sandboxed(
+                    ["npm", "install", "--no-audit", "--no-fund"], workspace_dir=workspace,
+                    cwd=str(Path(workspace) / directory), heavy=True, log_channel=workspace_channel(name)
+                )
+                if result.returncode != 0 or result.timed_out:
+                    logger.warning(f"Reinstalling dependencies of {name}/{directory} failed: {result.observation()}")
+        except Exception as e:
+            logger.error(f"Error reinstalling dependencies of {name}: {e}")
+        finally:
+            self._installing[name] -= 1
+            if not self._installing[name]:
+                del self._installing[name]
+
+    async def ensure_hot(self, name: str) -> bool:
+        """
+        Make a workspace available on disk, rehydrating it if it is archived.
+
+        Returns:
+            False if no such workspace exists
+        """
+        if not self._valid_name(name):
+            return False
+        if (self.root / name).is_dir() and name not in self._progress:
+            self.touch(name)
+            return True
+        if not self._metadata_path(name).exists() and not (self.archive_root / f"{name}.removing").exists():
+            return False
+
+        future = self._rehydrations.get(name)
+        if future is None:
+            future = asyncio.ensure_future(self._run_rehydration(name))
+            self._rehydrations[name] = future
+            future.add_done_callback(lambda _: self._rehydrations.pop(name, None))
+        # Shielded so a disconnecting client does not abort the rehydration for everyone
+        await asyncio.shield(future)
+        return (self.root / name).is_dir()
+
+    # Recovery and background archiving
+
+    def recover(self):
+        """Finish or undo archive and rehydrate operations interrupted by a crash"""
+        if not self.archive_root.exists():
+            return
+        for path in self.archive_root.iterdir():
+            name, _, suffix = path.name.rpartition(".")
+            if suffix == "removing":
+                if self._metadata_path(name).exists():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.replace(path, self.root / name)
+            elif suffix == "restoring":
+                shutil.rmtree(path, ignore_errors=True)
+            elif suffix == "tmp":
+                path.unlink()
+        for name in self.archived_names():
+            metadata = self._read_metadata(name)
+            if (self.root / name).is_dir() or metadata is None:
+                # Rehydration finished but was not cleaned up
+                if metadata is not None:
+                    self._archive_path(name, metadata["format"]).unlink(missing_ok=True)
+                self._metadata_path(name).unlink()
+        for archive in list(self.archive_root.glob("*.tar.*")):
+            if not self._metadata_path(archive.name.split(".tar.")[0]).exists():
+                archive.unlink()
+
+    def start(self):
+        """Archive idle workspaces periodically on the running event loop"""
+        if self.idle_seconds <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                archived = await asyncio.to_thread(self.archive_idle)
+                if archived:
+                    logger.info(f"Archived idle workspaces: {', '.join(archived)}")
+            except Exception as e:
+                logger.error(f"Error archiving idle workspaces: {e}")
+            await asyncio.sleep(self.interval)
+
+
+# Shared instance started with the app
+workspace_tiering = WorkspaceTiering(
+    idle_days=float(os.getenv("WORKSPACE_ARCHIVE_AFTER_DAYS", "30")),
+    interval=float(os.getenv("WORKSPACE_TIERING_INTERVAL", "3600")),
+    keep_dependencies=os.getenv("WORKSPACE_ARCHIVE_NODE_MODULES", "0") == "1",
+)
@@ -0,0 +1,231 @@
+"""
+Lightweight request tracing.
+
+Spans are tracked with contextvars so nested ``with span(...)`` blocks form a
+tree per request, in async handlers as well as in worker threads started
+with ``asyncio.to_thread``. When the root span of a trace ends, the whole
+trace is handed to the configured exporters:
+
+- ``JsonFileExporter``: one JSON line per trace, enabled with ``TRACE_JSON_PATH``
+- ``OpenTelemetryExporter``: re-emits spans through the OpenTelemetry SDK when
+  it is installed and ``OTEL_EXPORTER_OTLP_ENDPOINT`` is set
+
+The request middleware also turns the spans into a ``Server-Timing`` header.
+"""
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """A timed operation with attributes, part of a trace"""
+
+    def __init__(self, name: str, trace: "Trace", parent: Optional["Span"] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self._start_perf = time.perf_counter()
+        self.end_ns: Optional[int] = None
+        self.duration_ms: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.attributes["error.type"] = type(error).__name__
+        self.attributes["error.message"] = str(error)[:500]
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.duration_ms = (time.perf_counter() - self._start_perf) * 1000.0
+        self.end_ns = self.start_ns + int(self.duration_ms * 1e6)
+        self.trace._on_span_end(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms or 0.0, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """All spans of one request"""
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+        self.root: Optional[Span] = None
+        self._lock = threading.Lock()
+
+    def _on_span_end(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+        if span is self.root:
+            self.tracer._export(self)
+
+    def server_timing(self) -> str:
+        """Format the finished spans as a Server-Timing header value"""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            if span is self.root or span.duration_ms is None:
+                continue
+            key = re.sub(r"[^A-Za-z0-9_-]", "_", span.name)
+            totals[key] = totals.get(key, 0.0) + span.duration_ms
+
+        entries = [f"{name};dur={duration:.1f}" for name, duration in totals.items()]
+        if self.root is not None and self.root.duration_ms is not None:
+            entries.append(f"total;dur={self.root.duration_ms:.1f}")
+        return ", ".join(entries)
+
+
+class JsonFileExporter:
+    """Append each finished trace as one JSON line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, trace: Trace):
+        record = {
+            "trace_id": trace.trace_id,
+            "spans": [span.to_dict() for span in sorted(trace.spans, key=lambda s: s.start_ns)],
+        }
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class OpenTelemetryExporter:
+    """Replay finished traces into the OpenTelemetry SDK (OTLP export)"""
+
+    def __init__(self, service_name: str = "codegen-backend"):
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        self._otel_trace = otel_trace
+        self._tracer = provider.get_tracer(__name__)
+
+    def export(self, trace: Trace):
+        created: Dict[str, Any] = {}
+        for span in sorted(trace.spans, key=lambda s: s.start_ns):
+            parent = created.get(span.parent_id)
+            context = self._otel_trace.set_span_in_context(parent) if parent is not None else None
+            otel_span = self._tracer.start_span(
+                span.name,
+                context=context,
+                start_time=span.start_ns,
+                attributes={k: v for k, v in span.attributes.items() if isinstance(v, (str, bool, int, float))},
+            )
+            if span.status == "error":
+                otel_span.set_status(self._otel_trace.Status(self._otel_trace.StatusCode.ERROR))
+            created[span.span_id] = otel_span
+
+        for span in trace.spans:
+            created[span.span_id].end(end_time=span.end_ns)
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self):
+        self.exporters: List[Any] = []
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    def _export(self, trace: Trace):
+        for exporter in self.exporters:
+            try:
+                exporter.export(trace)
+            except Exception as e:
+                logger.error(f"Error exporting trace: {e}")
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        """
+        Start a span without making it current; call ``end()`` when done.
+        Used for callback-style instrumentation (LangChain handlers).
+        """
+        parent = parent or _current_span.get()
+        if parent is None:
+            trace = Trace(self)
+            span = Span(name, trace, attributes=attributes)
+            trace.root = span
+        else:
+            span = Span(name, parent.trace, parent=parent, attributes=attributes)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Time a block of code as a child of the current span"""
+        current = self.start_span(name, **attributes)
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            current.end()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def _configure(tracer: Tracer):
+    json_path = os.getenv("TRACE_JSON_PATH")
+    if json_path:
+        tracer.add_exporter(JsonFileExporter(json_path))
+
+    if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        try:
+            tracer.add_exporter(OpenTelemetryExporter(os.getenv("OTEL_SERVICE_NAME", "codegen-backend")))
+        except ImportError:
+            logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk is not installed")
+
+
+tracer = Tracer()
+_configure(tracer)
+
+# Shorthand for instrumenting code: `with span("stage", key=value): ...`
+span = tracer.span
@@ -0,0 +1,68 @@
+"""
+Source files of a workspace, shared by the code index, agent memory and snapshots.
+
+``scan`` lists the files those services track: dependency, build and cache
+directories, hidden files and lockfiles are skipped, and at most
+``max_files`` are returned (sorted, so a capped scan is deterministic).
+Callers keep the size/mtime of each file they processed and use
+``unchanged`` to skip files not touched since.
+"""
+import os
+import re
+from pathlib import Path
+from typing import Any, Collection, Dict, List, NamedTuple, Optional, Tuple
+
+SKIP_DIRS = {"node_modules", ".git", "build", "dist", "coverage", "__pycache__", ".cache"}
+SKIP_FILES = {"package-lock.json"}
+
+EXPORT_PATTERN = re.compile(
+    r"export\s+(?:default\s+)?(?:async\s+)?(?:function|class|const|let|var)\s+([A-Za-z_$][\w$]*)"
+)
+DEFAULT_EXPORT_PATTERN = re.compile(r"export\s+default\s+([A-Za-z_$][\w$]*)\s*;")
+
+
+class WorkspaceFile(NamedTuple):
+    rel: str
+    path: Path
+    stat: os.stat_result
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def exported_names(content: str) -> List[str]:
+    """Names a JS/TS module exports, in order of appearance"""
+    return list(dict.fromkeys(EXPORT_PATTERN.findall(content) + DEFAULT_EXPORT_PATTERN.findall(content)))
+
+
+def scan(workspace_dir: Path, max_files: int,
+         suffixes: Optional[Collection[str]] = None) -> Tuple[List[WorkspaceFile], bool]:
+    """
+    Files of a workspace, optionally only those with one of the given suffixes.
+
+    Returns:
+        The files, and whether max_files cut the list short
+    """
+    files: List[WorkspaceFile] = []
+    for dirpath, dirnames, filenames in os.walk(workspace_dir):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith("."))
+        for filename in sorted(filenames):
+            if filename.startswith(".") or filename in SKIP_FILES:
+                continue
+            if suffixes is not None and os.path.splitext(filename)[1].lower() not in suffixes:
+                continue
+            path = Path(dirpath) / filename
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if len(files) >= max_files:
+                return files, True
+            files.append(WorkspaceFile(path.relative_to(workspace_dir).as_posix(), path, stat))
+    return files, False
+
+
+def unchanged(entry: Optional[Dict[str, Any]], stat: os.stat_result) -> bool:
+    """Whether a file still has the mtime and size recorded in entry"""
+    return bool(entry) and entry.get("mtime") == stat.st_mtime and entry.get("size") == stat.st_size
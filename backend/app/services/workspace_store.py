@@ -0,0 +1,402 @@
+"""
+Atomic, journaled writes to workspace files.
+
+Writes are grouped into transactions. Committing one:
+
+1. writes a journal record in ``<workspace>/.codegen/journal`` in state
+   "prepared" listing the staged temp files,
+2. writes every new file to a temp file next to its target and fsyncs it,
+3. atomically switches the journal record to "committed" (the commit point),
+4. renames the temp files over their targets, applies deletes, and
+5. removes the journal record.
+
+After a crash ``recover`` rolls committed transactions forward and
+discards the temp files of prepared ones, so readers only ever see
+complete files from whole transactions. Commits of one workspace are
+serialized (threads and processes) and run under ``commit_guard`` when
+one is set (the workspace lock, see locks.py); different workspaces commit
+in parallel.
+
+Rapid successive writes such as editor autosaves can be coalesced: they
+are buffered per workspace, reads see them immediately, and they are
+committed as one transaction once the writes pause.
+``change_listeners`` learn the paths changed by every commit (live
+updates, see live_updates.py).
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+META_DIR = ".codegen"
+JOURNAL_DIR = "journal"
+LOCK_FILE = "write.lock"
+
+Content = Union[str, bytes]
+
+
+class WorkspacePathError(ValueError):
+    """Raised for paths that resolve outside their workspace"""
+
+
+def _fsync_dir(path: Path):
+    if os.name == "nt":
+        return
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteTransaction:
+    """Writes and deletes that are committed together"""
+
+    def __init__(self, workspace_dir: Path, allow_reserved: bool = False):
+        self.workspace_dir = workspace_dir
+        self.allow_reserved = allow_reserved
+        self.ops: "OrderedDict[str, Optional[bytes]]" = OrderedDict()
+
+    def write(self, rel_path: str, content: Content):
+        self.ops[rel_path] = content.encode("utf-8") if isinstance(content, str) else content
+
+    def delete(self, rel_path: str):
+        self.ops[rel_path] = None
+
+
+class WorkspaceStore:
+    def __init__(self, fsync: bool = True, coalesce_delay: float = 0.5, coalesce_max_delay: float = 2.0):
+        self.fsync = fsync
+        self.coalesce_delay = coalesce_delay
+        self.coalesce_max_delay = coalesce_max_delay
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._locks_guard = threading.Lock()
+        # workspace key -> (workspace dir, pending rel path -> content, first pending write time, timer)
+        self._pending: Dict[str, Dict] = {}
+        self._pending_lock = threading.Lock()
+        # Called with the workspace dir after buffered writes were committed
+        self.flush_listeners: List[Callable[[Path], None]] = []
+        # Held around every commit (e.g. the workspace lock)
+        self.commit_guard: Optional[Callable[[Path], ContextManager]] = None
+        # Called with the workspace dir, written and deleted paths after every commit (.codegen excluded)
+        self.change_listeners: List[Callable[[Path, List[str], List[str]], None]] = []
+
+    # Paths and locking
+
+    @staticmethod
+    def _key(workspace_dir: Union[str, Path]) -> str:
+        return str(Path(workspace_dir).resolve())
+
+    def resolve(self, workspace_dir: Union[str, Path], rel_path: str, allow_reserved: bool = False) -> Path:
+        """Absolute target path, refusing anything outside the workspace"""
+        root = Path(workspace_dir).resolve()
+        target = (root / rel_path).resolve()
+        if target != root and root not in target.parents:
+            raise WorkspacePathError(f"Path {rel_path!r} is outside the workspace")
+        if not allow_reserved and META_DIR in target.relative_to(root).parts:
+            raise WorkspacePathError(f"Path {rel_path!r} is reserved")
+        return target
+
+    @contextmanager
+    def _locked(self, workspace_dir: Path) -> Iterator[None]:
+        with self._locks_guard:
+            lock = self._locks[self._key(workspace_dir)]
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            meta = workspace_dir / META_DIR
+            meta.mkdir(parents=True, exist_ok=True)
+            with open(meta / LOCK_FILE, "a+") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Journal
+
+    def _journal_dir(self, workspace_dir: Path) -> Path:
+        return workspace_dir / META_DIR / JOURNAL_DIR
+
+    def _write_record(self, path: Path, record: Dict):
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if self.fsync:
+            _fsync_dir(path.parent)
+
+    def _apply(self, workspace_dir: Path, record: Dict):
+        """Move staged files into place and apply deletes (idempotent)"""
+        touched_dirs = set()
+        for op in record["ops"]:
+            target = workspace_dir / op["path"]
+            if op.get("staged"):
+                staged = workspace_dir / op["staged"]
+                if staged.exists():
+                    os.replace(staged, target)
+                    touched_dirs.add(target.parent)
+            else:
+                try:
+                    target.unlink()
+                    touched_dirs.add(target.parent)
+                except FileNotFoundError:
+                    pass
+        if self.fsync:
+            for directory in touched_dirs:
+                _fsync_dir(directory)
+
+    @staticmethod
+    def _discard(workspace_dir: Path, record: Dict):
+        for op in record["ops"]:
+            if op.get("staged"):
+                try:
+                    (workspace_dir / op["staged"]).unlink()
+                except FileNotFoundError:
+                    pass
+
+    # Transactions
+
+    def commit(self, txn: WriteTransaction):
+        if not txn.ops:
+            return
+        workspace_dir = Path(txn.workspace_dir)
+        txid = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        targets = [(rel, self.resolve(workspace_dir, rel, txn.allow_reserved), content)
+                   for rel, content in txn.ops.items()]
+        root = workspace_dir.resolve()
+
+        guard = self.commit_guard(workspace_dir) if self.commit_guard is not None else nullcontext()
+        with guard, self._locked(workspace_dir):
+            journal_dir = self._journal_dir(workspace_dir)
+            journal_dir.mkdir(parents=True, exist_ok=True)
+            record_path = journal_dir / f"{txid}.json"
+
+            ops = []
+            for rel, target, content in targets:
+                staged = target.parent / f".{target.name}.{txid}.tmp" if content is not None else None
+                ops.append({
+                    "path": target.relative_to(root).as_posix(),
+                    "staged": staged.relative_to(root).as_posix() if staged else None,
+                })
+            record = {"txid": txid, "state": "prepared", "ops": ops}
+            self._write_record(record_path, record)
+
+            try:
+                for (rel, target, content), op in zip(targets, ops):
+                    if content is None:
+                        continue
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    with open(root / op["staged"], "wb") as f:
+                        f.write(content)
+                        if self.fsync:
+                            f.flush()
+                            os.fsync(f.fileno())
+            except BaseException:
+                self._discard(root, record)
+                record_path.unlink()
+                raise
+
+            # Commit point: from here on the transaction is rolled forward after a crash
+            record["state"] = "committed"
+            self._write_record(record_path, record)
+            self._apply(root, record)
+            record_path.unlink()
+
+        if self.change_listeners:
+            written = [op["path"] for op in ops if op["staged"] and not op["path"].startswith(META_DIR + "/")]
+            deleted = [op["path"] for op in ops if not op["staged"] and not op["path"].startswith(META_DIR + "/")]
+            if written or deleted:
+                for listener in self.change_listeners:
+                    try:
+                        listener(workspace_dir, written, deleted)
+                    except Exception as e:
+                        logger.error(f"Error in change listener for {workspace_dir}: {e}")
+
+    @contextmanager
+    def transaction(self, workspace_dir: Union[str, Path], allow_reserved: bool = False) -> Iterator[WriteTransaction]:
+        """
+        Collect writes and commit them atomically when the block exits without error.
+        allow_reserved permits paths under .codegen (for internal state such as synced snapshots).
+        """
+        txn = WriteTransaction(Path(workspace_dir), allow_reserved)
+        yield txn
+        # Committed writes supersede buffered autosaves of the same files
+        self._drop_pending(workspace_dir, txn.ops.keys())
+        self.commit(txn)
+
+    def write_file(self, workspace_dir: Union[str, Path], rel_path: str, content: Content):
+        with self.transaction(workspace_dir) as txn:
+            txn.write(rel_path, content)
+
+    def write_files(self, workspace_dir: Union[str, Path], files: Dict[str, Content]):
+        with self.transaction(workspace_dir) as txn:
+            for rel_path, content in files.items():
+                txn.write(rel_path, content)
+
+    # Recovery
+
+    def recover(self, workspace_dir: Union[str, Path]) -> Tuple[int, int]:
+        """Finish or discard interrupted transactions; return (rolled forward, rolled back)"""
+        workspace_dir = Path(workspace_dir)
+        journal_dir = self._journal_dir(workspace_dir)
+        if not journal_dir.exists():
+            return 0, 0
+        forward = back = 0
+        with self._locked(workspace_dir):
+            root = workspace_dir.resolve()
+            for record_path in sorted(journal_dir.glob("*.json")):
+                try:
+                    record = json.loads(record_path.read_text(encoding="utf-8"))
+                except (OSError, ValueError):
+                    # A torn record was never committed (records are replaced atomically)
+                    record_path.unlink()
+                    continue
+                if record.get("state") == "committed":
+                    self._apply(root, record)
+                    forward += 1
+                else:
+                    self._discard(root, record)
+                    back += 1
+                record_path.unlink()
+            for tmp_path in journal_dir.glob("*.tmp"):
+                tmp_path.unlink()
+        if forward or back:
+            logger.info(f"Recovered workspace {workspace_dir}: {forward} rolled forward, {back} rolled back")
+        return forward, back
+
+    def recover_all(self, root: Union[str, Path] = "workspaces") -> int:
+        recovered = 0
+        for journal_dir in Path(root).glob(f"*/{META_DIR}/{JOURNAL_DIR}"):
+            forward, back = self.recover(journal_dir.parent.parent)
+            recovered += forward + back
+        return recovered
+
+    # Coalesced writes
+
+    def write_coalesced(self, workspace_dir: Union[str, Path], rel_path: str, content: Content):
+        """
+        Buffer a write and commit it with other buffered writes of the workspace
+        once writes pause for coalesce_delay (at most coalesce_max_delay later).
+        """
+        self.resolve(workspace_dir, rel_path)
+        key = self._key(workspace_dir)
+        with self._pending_lock:
+            entry = self._pending.get(key)
+            now = time.monotonic()
+            if entry is None:
+                entry = {"dir": Path(workspace_dir), "files": {}, "first": now, "timer": None}
+                self._pending[key] = entry
+            entry["files"][rel_path] = content
+            if entry["timer"] is not None:
+                entry["timer"].cancel()
+            delay = min(self.coalesce_delay, max(0.0, entry["first"] + self.coalesce_max_delay - now))
+            self._schedule(entry, key, delay)
+
+    def _schedule(self, entry: Dict, key: str, delay: float):
+        timer = threading.Timer(delay, self._flush_key, args=(key,))
+        timer.daemon = True
+        entry["timer"] = timer
+        timer.start()
+
+    def _flush_key(self, key: str):
+        with self._pending_lock:
+            entry = self._pending.get(key)
+        if entry is None:
+            return
+        guard = self.commit_guard(entry["dir"]) if self.commit_guard is not None else nullcontext()
+        try:
+            with guard:
+                self._commit_pending(key)
+        except Exception as e:
+            # The guard could not be acquired; the writes stay buffered and are retried
+            logger.warning(f"Could not commit buffered writes for {entry['dir']} yet: {e}")
+            with self._pending_lock:
+                if self._pending.get(key) is entry:
+                    self._schedule(entry, key, self.coalesce_delay)
+
+    def _commit_pending(self, key: str):
+        with self._pending_lock:
+            entry = self._pending.pop(key, None)
+            if entry is None:
+                return
+            if entry["timer"] is not None:
+                entry["timer"].cancel()
+        try:
+            txn = WriteTransaction(entry["dir"])
+            for rel_path, content in entry["files"].items():
+                txn.write(rel_path, content)
+            self.commit(txn)
+        except Exception as e:
+            logger.error(f"Error committing buffered writes for {entry['dir']}: {e}")
+            return
+        for listener in self.flush_listeners:
+            try:
+                listener(entry["dir"])
+            except Exception as e:
+                logger.error(f"Error in flush listener for {entry['dir']}: {e}")
+
+    def _drop_pending(self, workspace_dir: Union[str, Path], rel_paths):
+        key = self._key(workspace_dir)
+        with self._pending_lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                return
+            for rel_path in rel_paths:
+                entry["files"].pop(rel_path, None)
+
+    def flush(self, workspace_dir: Optional[Union[str, Path]] = None):
+        """Commit buffered writes now (of one workspace, or all)"""
+        if workspace_dir is not None:
+            self._flush_key(self._key(workspace_dir))
+            return
+        with self._pending_lock:
+            keys = list(self._pending)
+        for key in keys:
+            self._flush_key(key)
+
+    def pending(self, workspace_dir: Union[str, Path]) -> List[str]:
+        with self._pending_lock:
+            entry = self._pending.get(self._key(workspace_dir))
+            return list(entry["files"]) if entry else []
+
+    # Reads
+
+    def read_bytes(self, workspace_dir: Union[str, Path], rel_path: str) -> bytes:
+        """Read a file, including writes that are still buffered"""
+        with self._pending_lock:
+            entry = self._pending.get(self._key(workspace_dir))
+            if entry and rel_path in entry["files"]:
+                content = entry["files"][rel_path]
+                return content.encode("utf-8") if isinstance(content, str) else content
+        return self.resolve(workspace_dir, rel_path).read_bytes()
+
+    def read_text(self, workspace_dir: Union[str, Path], rel_path: str) -> str:
+        return self.read_bytes(workspace_dir, rel_path).decode("utf-8")
+
+
+workspace_store = WorkspaceStore(
+    fsync=os.getenv("WORKSPACE_FSYNC", "1") != "0",
+    coalesce_delay=float(os.getenv("WORKSPACE_COALESCE_DELAY", "0.5")),
+    coalesce_max_delay=float(os.getenv("WORKSPACE_COALESCE_MAX_DELAY", "2.0")),
+)
@@ -0,0 +1,232 @@
+"""
+Concurrency check for the React agent tools.
+
+Runs many simultaneous tool sequences across distinct workspaces, both on
+threads and on asyncio, and verifies every command and file landed in its
+own workspace. Any leak of process-global state (working directory,
+environment) between tasks shows up as a mismatch. It also checks the
+sandbox: server secrets are not visible to commands, the node-wide
+concurrency cap holds and heavy commands do not starve interactive ones.
+
+No LLM or network access is needed: ``npx`` and ``npm`` are replaced by
+stub scripts that record the directory they were run in.
+
+Usage (from the backend directory):
+    python -m benchmarks.concurrency_check --tasks 48
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+from app.agents.sandbox import run_sandboxed_sync, scheduler
+from app.agents.shell_agent import ReactToolkit
+
+STUB_SCRIPT = """#!/bin/sh
+# Stub for npx/npm: simulate some work, then record where it ran
+sleep 0.2
+if [ "$1" = "create-react-app" ]; then
+    mkdir -p "$2/src"
+    pwd > "$2/.created_in"
+else
+    pwd > .installed_in
+fi
+"""
+
+
+def install_stubs(bin_dir: Path):
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for name in ("npx", "npm"):
+        path = bin_dir / name
+        path.write_text(STUB_SCRIPT)
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+
+
+def _tools(workspace_dir: str):
+    return {t.name: t for t in ReactToolkit(workspace_dir=workspace_dir).get_tools()}
+
+
+def _verify(workspace: Path) -> List[str]:
+    """Return a list of problems found in one workspace"""
+    errors = []
+    expected = str(workspace.resolve())
+    app_dir = workspace / "app"
+
+    created_in = app_dir / ".created_in"
+    if not created_in.exists() or created_in.read_text().strip() != expected:
+        errors.append(f"create_react_app ran outside {workspace.name}")
+    installed_in = app_dir / ".installed_in"
+    if not installed_in.exists() or installed_in.read_text().strip() != str(app_dir.resolve()):
+        errors.append(f"npm install ran outside {workspace.name}/app")
+    component = app_dir / "src" / "components" / "Marker.jsx"
+    if not component.exists() or workspace.name not in component.read_text():
+        errors.append(f"component missing or wrong in {workspace.name}")
+    marker = workspace / "shell_marker.txt"
+    if not marker.exists() or marker.read_text().strip() != workspace.name:
+        errors.append(f"shell command wrote outside {workspace.name}")
+    return errors
+
+
+# Arguments a model might add to point a tool at another workspace; the tools must ignore them
+FOREIGN = {"workspace_dir": "/tmp/concurrency-check-foreign"}
+
+
+def run_task_sync(workspace: Path) -> List[str]:
+    tools = _tools(str(workspace))
+    tools["create_react_app"].invoke({"app_name": "app", **FOREIGN})
+    tools["install_react_dependencies"].invoke({"app_name": "app", "packages": ["left-pad"], **FOREIGN})
+    tools["create_react_component"].invoke({
+        "app_name": "app", "component_name": "Marker",
+        "component_code": f"export default () => '{workspace.name}';", **FOREIGN,
+    })
+    output = tools["shell"].invoke({"command": f"sleep 0.1; echo {workspace.name} > shell_marker.txt; pwd"})
+
+    errors = _verify(workspace)
+    if output.strip() != str(workspace.resolve()):
+        errors.append(f"shell tool reported cwd {output.strip()!r} for {workspace.name}")
+    return errors
+
+
+async def run_task_async(workspace: Path) -> List[str]:
+    tools = _tools(str(workspace))
+    await tools["create_react_app"].ainvoke({"app_name": "app", **FOREIGN})
+    await tools["install_react_dependencies"].ainvoke({"app_name": "app", "packages": ["left-pad"], **FOREIGN})
+    await tools["create_react_component"].ainvoke({
+        "app_name": "app", "component_name": "Marker",
+        "component_code": f"export default () => '{workspace.name}';", **FOREIGN,
+    })
+    output = await tools["shell"].ainvoke(
+        {"command": f"sleep 0.1; echo {workspace.name} > shell_marker.txt; pwd"}
+    )
+
+    errors = _verify(workspace)
+    if output.strip() != str(workspace.resolve()):
+        errors.append(f"shell tool reported cwd {output.strip()!r} for {workspace.name}")
+    return errors
+
+
+def check_foreign_paths(root: Path) -> List[str]:
+    """The React tools stay in their workspace whatever directory or path the model names"""
+    errors = []
+    own, other = _workspaces(root, "own", 1)[0], _workspaces(root, "other", 1)[0]
+    tools = _tools(str(own))
+    for schema_tool in ("create_react_app", "install_react_dependencies", "create_react_component", "modify_react_app"):
+        if "workspace_dir" in tools[schema_tool].get_input_schema().model_json_schema().get("properties", {}):
+            errors.append(f"{schema_tool} lets the model choose workspace_dir")
+
+    foreign = {"workspace_dir": str(other)}
+    tools["create_react_component"].invoke({
+        "app_name": "app", "component_name": "Leak", "component_code": "x", **foreign,
+    })
+    tools["modify_react_app"].invoke({"app_name": "app", "file_path": "src/App.js", "file_content": "x", **foreign})
+    if not (own / "app" / "src" / "components" / "Leak.jsx").exists():
+        errors.append("create_react_component did not write into its own workspace")
+    # Paths that climb out of the workspace are refused
+    escapes = [
+        tools["create_react_app"].invoke({"app_name": f"../{other.name}/app"}),
+        tools["install_react_dependencies"].invoke({"app_name": str(other), "packages": ["left-pad"]}),
+        tools["create_react_component"].invoke({
+            "app_name": f"../{other.name}", "component_name": "Leak", "component_code": "x",
+        }),
+        tools["modify_react_app"].invoke({"app_name": "..", "file_path": f"{other.name}/index.html", "file_content": "x"}),
+    ]
+    for output in escapes:
+        if not output.startswith("Error"):
+            errors.append(f"escaping path accepted: {output}")
+    if any(path.is_file() for path in other.rglob("*")) or Path(FOREIGN["workspace_dir"]).exists():
+        errors.append("a tool wrote into another workspace")
+    print(f"foreign paths: {len(escapes)} escaping calls refused" if not errors else "foreign paths: leaks found")
+    return errors
+
+
+def check_sandbox(root: Path) -> List[str]:
+    errors = []
+
+    os.environ["GROQ_API_KEY"] = "concurrency-check-secret"
+    result = run_sandboxed_sync("echo ${GROQ_API_KEY:-unset}", workspace_dir=str(root))
+    if result.output.strip() != "unset":
+        errors.append("GROQ_API_KEY is visible to sandboxed commands")
+
+    # Saturate the heavy slots from many workspaces, then time an interactive command
+    heavy_count = scheduler.max_concurrent * 2
+    _workspaces(root, "heavy", heavy_count)
+    _workspaces(root, "interactive", 1)
+    peak = 0
+    with ThreadPoolExecutor(max_workers=heavy_count) as pool:
+        futures = [
+            pool.submit(run_sandboxed_sync, "sleep 1", workspace_dir=str(root / f"heavy-{i}"), heavy=True)
+            for i in range(heavy_count)
+        ]
+        time.sleep(0.2)
+        start = time.perf_counter()
+        run_sandboxed_sync("true", workspace_dir=str(root / "interactive-0"))
+        interactive_latency = time.perf_counter() - start
+        while not all(f.done() for f in futures):
+            peak = max(peak, scheduler.stats()["running"])
+            time.sleep(0.05)
+
+    if interactive_latency > 0.5:
+        errors.append(f"interactive command waited {interactive_latency:.2f}s behind heavy commands")
+    if peak > scheduler.max_concurrent:
+        errors.append(f"{peak} commands ran at once, limit is {scheduler.max_concurrent}")
+    print(f"sandbox: interactive latency {interactive_latency * 1000:.0f}ms under {heavy_count} heavy commands, "
+          f"peak {peak}/{scheduler.max_concurrent} slots")
+    return errors
+
+
+def _workspaces(root: Path, prefix: str, count: int) -> List[Path]:
+    paths = [root / f"{prefix}-{i}" for i in range(count)]
+    for path in paths:
+        path.mkdir(parents=True)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run agent tools concurrently across workspaces")
+    parser.add_argument("--tasks", type=int, default=48, help="Simultaneous tasks per mode")
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix="concurrency-check-"))
+    original_cwd = os.getcwd()
+    failures: List[str] = []
+    try:
+        install_stubs(root / "bin")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.tasks) as pool:
+            for errors in pool.map(run_task_sync, _workspaces(root, "thread", args.tasks)):
+                failures.extend(errors)
+        print(f"threads: {args.tasks} tasks in {time.perf_counter() - start:.2f}s")
+
+        async def run_all():
+            return await asyncio.gather(*(run_task_async(w) for w in _workspaces(root, "async", args.tasks)))
+
+        start = time.perf_counter()
+        for errors in asyncio.run(run_all()):
+            failures.extend(errors)
+        print(f"asyncio: {args.tasks} tasks in {time.perf_counter() - start:.2f}s")
+
+        failures.extend(check_foreign_paths(root))
+        failures.extend(check_sandbox(root))
+
+        if os.getcwd() != original_cwd:
+            failures.append(f"process working directory changed to {os.getcwd()}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    print("OK" if not failures else f"{len(failures)} failures")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
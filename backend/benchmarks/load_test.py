@@ -0,0 +1,267 @@
+"""
+End-to-end load test of the FastAPI app against the mock Groq server.
+
+Starts the mock LLM (configurable latency, token rate and error injection)
+and the app under uvicorn, then drives a mixed workload of ``/api/generate``,
+``/api/update-from-prompt`` and ``/agent/run`` at increasing concurrency.
+For every stage it reports throughput, p50/p95/p99 latency, error rate and
+the app's event loop lag (from ``/api/health``).
+
+Usage (from the backend directory):
+    python -m benchmarks.load_test --stages 1,4,16 --duration 20 --out load.json
+    python -m benchmarks.load_test --mix generate=1,update=3,agent=1 --max-p95-ms 5000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .mock_llm import MockLLMServer
+from .run_benchmark import BACKEND_DIR, BENCHMARK_DIR, _git_commit, _percentile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIX = {"generate": 2, "update": 5, "agent": 1}
+
+
+def _http(method: str, url: str, body: Optional[Dict[str, Any]] = None, timeout: float = 300) -> Tuple[int, Any]:
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+class AppProcess:
+    """The app under uvicorn in a scratch directory, pointed at the mock LLM"""
+
+    def __init__(self, port: int, llm_base_url: str, workers: int = 1):
+        self.port = port
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.sandbox = Path(tempfile.mkdtemp(prefix="codegen-load-"))
+        (self.sandbox / "workspaces").mkdir()
+        if (BACKEND_DIR / "templates").exists():
+            os.symlink(BACKEND_DIR / "templates", self.sandbox / "templates", target_is_directory=True)
+
+        env = dict(os.environ)
+        env["GROQ_API_BASE"] = llm_base_url
+        env.setdefault("GROQ_API_KEY", "load-test")
+        # Measure the server, not the client-side Groq rate limits
+        env.setdefault("GROQ_REQUESTS_PER_MINUTE", "0")
+        env.setdefault("GROQ_TOKENS_PER_MINUTE", "0")
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(BACKEND_DIR), env.get("PYTHONPATH")]))
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=self.sandbox, env=env,
+        )
+
+    def wait_ready(self, timeout: float = 60.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError("App process exited during startup")
+            try:
+                status, _ = _http("GET", f"{self.base_url}/api/health", timeout=2)
+                if status == 200:
+                    return
+            except Exception:
+                pass
+            time.sleep(0.25)
+        raise TimeoutError("App did not become ready")
+
+    def stop(self):
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+        shutil.rmtree(self.sandbox, ignore_errors=True)
+
+
+class Workload:
+    """Builds realistic requests for each endpoint"""
+
+    def __init__(self, base_url: str, prompts: List[Dict[str, str]], mix: Dict[str, int], seed: int = 0):
+        self.base_url = base_url
+        self.prompts = prompts
+        self.kinds = [kind for kind, weight in mix.items() for _ in range(weight)]
+        self.random = random.Random(seed)
+        self.seed_workspaces: List[str] = []
+        self.counter = 0
+
+    def seed(self, count: int):
+        """Create workspaces the update requests can edit"""
+        for index in range(count):
+            status, body = _http("POST", f"{self.base_url}/api/generate", {
+                "prompt": self.prompts[index % len(self.prompts)]["prompt"],
+                "workspace_name": f"load-seed-{index}",
+            })
+            if status != 200:
+                raise RuntimeError(f"Seeding workspace failed with HTTP {status}")
+            self.seed_workspaces.append(body["workspace_name"])
+
+    def next_request(self) -> Tuple[str, str, Dict[str, Any]]:
+        kind = self.random.choice(self.kinds)
+        prompt = self.random.choice(self.prompts)["prompt"]
+        self.counter += 1
+
+        if kind == "generate":
+            return kind, "/api/generate", {"prompt": prompt, "workspace_name": f"load-{self.counter}"}
+        if kind == "update":
+            return kind, "/api/update-from-prompt", {
+                "workspace_name": self.random.choice(self.seed_workspaces),
+                "file_name": self.random.choice(["index.html", "styles.css"]),
+                "prompt": "Make the header sticky and use a darker color scheme",
+            }
+        return kind, "/agent/run", {
+            "workspace_name": f"load-agent-{self.counter % 8}",
+            "task": "List the files in the workspace and summarize the project",
+        }
+
+
+async def run_stage(workload: Workload, concurrency: int, duration: float) -> Dict[str, Any]:
+    """Keep `concurrency` requests in flight for `duration` seconds"""
+    loop = asyncio.get_running_loop()
+    results: List[Tuple[str, float, bool]] = []
+    deadline = time.perf_counter() + duration
+
+    _http("GET", f"{workload.base_url}/api/health?reset=true")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        async def user():
+            while time.perf_counter() < deadline:
+                kind, path, body = workload.next_request()
+                start = time.perf_counter()
+                try:
+                    status, _ = await loop.run_in_executor(pool, _http, "POST", workload.base_url + path, body)
+                    ok = status == 200
+                except Exception:
+                    ok = False
+                results.append((kind, (time.perf_counter() - start) * 1000.0, ok))
+
+        stage_start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - stage_start
+
+    _, health = _http("GET", f"{workload.base_url}/api/health")
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "overall": _summarize(results, elapsed),
+        "endpoints": {
+            kind: _summarize([r for r in results if r[0] == kind], elapsed)
+            for kind in sorted({r[0] for r in results})
+        },
+        "event_loop_lag": (health or {}).get("event_loop_lag"),
+    }
+
+
+def _summarize(results: List[Tuple[str, float, bool]], elapsed: float) -> Dict[str, Any]:
+    latencies = [latency for _, latency, ok in results if ok]
+    errors = sum(1 for _, _, ok in results if not ok)
+    return {
+        "requests": len(results),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(errors / len(results), 3) if results else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 1),
+        "p95_ms": round(_percentile(latencies, 95), 1),
+        "p99_ms": round(_percentile(latencies, 99), 1),
+    }
+
+
+def _parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown workload kind: {kind}")
+        mix[kind.strip()] = int(weight or 1)
+    return mix
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the app against a mock Groq server")
+    parser.add_argument("--stages", default="1,2,4,8,16", help="Comma separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per stage")
+    parser.add_argument("--mix", type=_parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--ttft-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=300.0)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--out", default="load-report.json")
+    parser.add_argument("--max-p95-ms", type=float, default=None,
+                        help="Exit non-zero if any stage's overall p95 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    prompts = json.loads((BENCHMARK_DIR / "prompts.json").read_text(encoding="utf-8"))
+    stages = [int(s) for s in args.stages.split(",") if s.strip()]
+
+    mock = MockLLMServer(ttft_ms=args.ttft_ms, tokens_per_sec=args.tokens_per_sec,
+                         jitter=args.jitter, error_rate=args.llm_error_rate).start()
+    app = AppProcess(args.port, mock.base_url, workers=args.workers)
+    report: Dict[str, Any] = {
+        "commit": _git_commit(),
+        "config": {
+            "mix": args.mix, "duration_s": args.duration, "workers": args.workers,
+            "ttft_ms": args.ttft_ms, "tokens_per_sec": args.tokens_per_sec,
+            "jitter": args.jitter, "llm_error_rate": args.llm_error_rate,
+        },
+        "stages": [],
+    }
+
+    try:
+        app.wait_ready()
+        workload = Workload(app.base_url, prompts, args.mix)
+        workload.seed(4)
+
+        for concurrency in stages:
+            logger.info(f"Running stage with concurrency {concurrency} for {args.duration}s")
+            stage = asyncio.run(run_stage(workload, concurrency, args.duration))
+            stage["llm"] = mock.snapshot_stats()
+            mock.reset_stats()
+            report["stages"].append(stage)
+
+            overall = stage["overall"]
+            lag = stage["event_loop_lag"] or {}
+            print(f"c={concurrency:<4} rps={overall['throughput_rps']:<8} p50={overall['p50_ms']:<8} "
+                  f"p95={overall['p95_ms']:<8} p99={overall['p99_ms']:<8} err={overall['error_rate']:<6} "
+                  f"loop_lag_max={lag.get('max_ms')}")
+    finally:
+        app.stop()
+        mock.stop()
+
+    Path(args.out).write_text(json.dumps(report, indent=2, sort_keys=True), encoding="utf-8")
+    print(f"Report written to {args.out}")
+
+    failed = False
+    for stage in report["stages"]:
+        if args.max_p95_ms is not None and stage["overall"]["p95_ms"] > args.max_p95_ms:
+            print(f"FAIL: p95 {stage['overall']['p95_ms']} ms > {args.max_p95_ms} ms at concurrency {stage['concurrency']}")
+            failed = True
+        if args.max_error_rate is not None and stage["overall"]["error_rate"] > args.max_error_rate:
+            print(f"FAIL: error rate {stage['overall']['error_rate']} > {args.max_error_rate} at concurrency {stage['concurrency']}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
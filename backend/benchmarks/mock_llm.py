@@ -0,0 +1,401 @@
+"""
+Replaying mock of the Groq (OpenAI-compatible) chat completions API.
+
+Responses come from a recordings file keyed by a hash of the request, or are
+synthesized deterministically from the prompt when no recording exists.
+Latency is simulated as ``ttft_ms + completion_tokens / tokens_per_sec`` so
+timings are reproducible across runs and machines.
+
+Point the app at it with ``GROQ_API_BASE=http://127.0.0.1:<port>``.
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+COMPLETIONS_PATH = "/openai/v1/chat/completions"
+STREAM_CHUNK_CHARS = 16
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough, deterministic token estimate (about 4 characters per token)"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def request_key(payload: Dict[str, Any]) -> str:
+    """Stable key for a completion request, used to look up recordings"""
+    relevant = {
+        "model": payload.get("model"),
+        "messages": payload.get("messages"),
+        "temperature": payload.get("temperature"),
+        "max_tokens": payload.get("max_tokens"),
+    }
+    encoded = json.dumps(relevant, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def _title_from(prompt: str) -> str:
+    words = re.findall(r"[A-Za-z0-9]+", prompt)[:6]
+    return " ".join(words).title() or "Generated Page"
+
+
+def _synthesize_html(prompt: str) -> str:
+    title = _title_from(prompt)
+    return f"""```html
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title}</title>
+    <link rel="stylesheet" href="styles.css">
+</head>
+<body>
+    <!-- Header -->
+    <header class="site-header">
+        <nav class="navbar">
+            <a class="brand" href="#">{title}</a>
+            <ul class="nav-links">
+                <li><a href="#about">About</a></li>
+                <li><a href="#features">Features</a></li>
+                <li><a href="#contact">Contact</a></li>
+            </ul>
+        </nav>
+    </header>
+    <!-- Main content -->
+    <main class="content">
+        <section id="about" class="hero">
+            <h1 class="hero-title">{title}</h1>
+            <p class="hero-text">A page generated for: {prompt[:120]}</p>
+            <button class="btn btn-primary">Get started</button>
+        </section>
+        <section id="features" class="features">
+            <div class="feature-card"><h2>Fast</h2><p>Loads quickly.</p></div>
+            <div class="feature-card"><h2>Responsive</h2><p>Works on all devices.</p></div>
+        </section>
+    </main>
+    <footer id="contact" class="site-footer">
+        <p>Contact us</p>
+    </footer>
+</body>
+</html>
+```"""
+
+
+def _synthesize_css(prompt: str) -> str:
+    classes = sorted(set(re.findall(r'class="([^"]+)"', prompt)))
+    names = sorted({name for value in classes for name in value.split()})
+    if not names:
+        names = ["site-header", "content", "site-footer"]
+    rules = "\n\n".join(f".{name} {{\n    display: block;\n    margin: 0 auto;\n}}" for name in names)
+    return f"""```css
+/* Base styles */
+body {{
+    font-family: system-ui, sans-serif;
+    margin: 0;
+}}
+
+{rules}
+
+@media (max-width: 768px) {{
+    .content {{
+        padding: 1rem;
+    }}
+}}
+```"""
+
+
+def _synthesize_template_match(system: str, prompt: str) -> str:
+    categories = system.split("Available template categories:", 1)[-1]
+    names = re.findall(r"^\s*- (.+)$", categories, re.MULTILINE)
+    request = prompt.split("User's request:", 1)[-1].lower()
+    for name in names:
+        keyword = name.strip().split()[0].lower()
+        if keyword and keyword in request:
+            return json.dumps({"match": name.strip(), "score": 0.9, "confidence": 0.9})
+    return json.dumps({"match": "NO_MATCH", "score": 0.0, "confidence": 0.9})
+
+
+def synthesize_response(messages: List[Dict[str, Any]]) -> str:
+    """Deterministic stand-in content for the prompts the app sends"""
+    full_system = _message_text(messages[0]) if messages else ""
+    # The role is the first line; instructions follow it
+    system = full_system.split("\n", 1)[0].lower()
+    user = _message_text(messages[-1]) if messages else ""
+
+    if "react developer assistant" in system:
+        # Agent turn: finish without tool calls
+        return "Task completed."
+    if "json" in system:
+        return _synthesize_template_match(full_system, user)
+    if "specialized" in system and "processor" in system:
+        # CodeProcessor chunk prompts: echo the original chunk back
+        return user.split("Original Chunk:", 1)[-1].split("Modify the chunk", 1)[0].strip()
+    if "html and css files together" in system:
+        return _synthesize_html(user) + "\n" + _synthesize_css(user)
+    if "css" in system and "html" not in system:
+        return _synthesize_css(user)
+    if "html" in system:
+        return _synthesize_html(user)
+    if "react developer" in system and "component named" in user:
+        name = re.search(r"component named (\w+)", user).group(1)
+        return f"```jsx\nimport React from 'react';\n\nexport default function {name}() {{\n    return <div className=\"{name.lower()}\">{name}</div>;\n}}\n```"
+    if "modifies code" in system:
+        return f"```\n{user.split('```', 2)[1] if user.count('```') >= 2 else user}\n```"
+    return "Task completed."
+
+
+class MockLLMServer:
+    """
+    Threaded HTTP server speaking the chat completions API.
+
+    Args:
+        recordings_path: JSON file mapping request keys to response content
+        ttft_ms: Simulated time to first token
+        tokens_per_sec: Simulated completion speed (0 disables the delay)
+        jitter: Relative random latency jitter, seeded for reproducibility
+        error_rate: Fraction of requests answered with HTTP 429
+        upstream_url: Real completions URL; unrecorded requests are forwarded
+            there and their responses recorded (see ``save_recordings``)
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        recordings_path: Optional[str] = None,
+        ttft_ms: float = 50.0,
+        tokens_per_sec: float = 500.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        upstream_url: Optional[str] = None,
+        upstream_headers: Optional[Dict[str, str]] = None,
+    ):
+        self.recordings: Dict[str, str] = {}
+        if recordings_path and Path(recordings_path).exists():
+            self.recordings = json.loads(Path(recordings_path).read_text(encoding="utf-8"))
+
+        self.ttft_ms = ttft_ms
+        self.tokens_per_sec = tokens_per_sec
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.upstream_url = upstream_url
+        self.upstream_headers = upstream_headers or {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {
+                "requests": 0,
+                "errors": 0,
+                "replayed": 0,
+                "synthesized": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "simulated_latency_ms": 0.0,
+            }
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats)
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Mock LLM server listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def save_recordings(self, path: str):
+        with self._lock:
+            data = json.dumps(self.recordings, indent=2, sort_keys=True, ensure_ascii=False)
+        Path(path).write_text(data, encoding="utf-8")
+
+    def _fetch_upstream(self, payload: Dict[str, Any]) -> str:
+        request = urllib.request.Request(
+            self.upstream_url,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json", **self.upstream_headers},
+        )
+        with urllib.request.urlopen(request, timeout=300) as response:
+            body = json.loads(response.read())
+        return body["choices"][0]["message"]["content"]
+
+    def complete(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the completion response and sleep for the simulated latency"""
+        messages = payload.get("messages") or []
+        key = request_key(payload)
+        content = self.recordings.get(key)
+        replayed = content is not None
+        if content is None and self.upstream_url:
+            content = self._fetch_upstream(payload)
+            with self._lock:
+                self.recordings[key] = content
+        elif content is None:
+            content = synthesize_response(messages)
+
+        prompt_tokens = sum(estimate_tokens(_message_text(m)) for m in messages)
+        completion_tokens = estimate_tokens(content)
+
+        with self._lock:
+            jitter = 1.0 + self._random.uniform(-self.jitter, self.jitter) if self.jitter else 1.0
+        latency_ms = self.ttft_ms
+        if self.tokens_per_sec > 0:
+            latency_ms += completion_tokens / self.tokens_per_sec * 1000.0
+        latency_ms *= jitter
+        time.sleep(latency_ms / 1000.0)
+
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["replayed" if replayed else "synthesized"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+            self.stats["simulated_latency_ms"] += latency_ms
+
+        return {
+            "id": f"chatcmpl-{key[:12]}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": payload.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _should_fail(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: Dict[str, Any]):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    self._send_json(200, server.snapshot_stats())
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if self.path != COMPLETIONS_PATH:
+                    self._send_json(404, {"error": "not found"})
+                    return
+
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+
+                if server._should_fail():
+                    with server._lock:
+                        server.stats["errors"] += 1
+                    self._send_json(429, {"error": {"message": "Rate limit reached (mock)"}})
+                    return
+
+                body = server.complete(payload)
+                if payload.get("stream"):
+                    self._send_stream(body)
+                else:
+                    self._send_json(200, body)
+
+            def _send_stream(self, body: Dict[str, Any]):
+                # Streamed in small pieces, like the real API (the latency is simulated before the first one)
+                choice = body["choices"][0]
+                content = choice["message"]["content"]
+                chunks = [{"delta": {"role": "assistant", "content": ""}, "finish_reason": None}]
+                chunks += [
+                    {"delta": {"content": content[i:i + STREAM_CHUNK_CHARS]}, "finish_reason": None}
+                    for i in range(0, len(content), STREAM_CHUNK_CHARS)
+                ]
+                chunks.append({"delta": {}, "finish_reason": choice["finish_reason"]})
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for chunk in chunks:
+                    event = {
+                        "id": body["id"], "object": "chat.completion.chunk", "created": body["created"],
+                        "model": body["model"], "choices": [{"index": 0, **chunk}],
+                    }
+                    if chunk["finish_reason"]:
+                        event["x_groq"] = {"usage": body["usage"]}
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the mock Groq server")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--recordings", default=None)
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=500.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    mock = MockLLMServer(port=args.port, recordings_path=args.recordings,
+                         ttft_ms=args.ttft_ms, tokens_per_sec=args.tokens_per_sec)
+    mock.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,216 @@
+"""
+Minimal in-process Redis stand-in for the workspace lock backend.
+
+Speaks RESP2 (RESP3 after ``HELLO 3``) and implements the commands
+``app.services.locks`` uses: ``SET`` (with ``NX``/``XX``/``PX``/``EX``),
+``GET``, ``DEL``, ``PEXPIRE``, ``PTTL``, ``PING`` and ``EVAL`` for the
+lock's compare-and-delete and compare-and-extend scripts (recognized by
+what they call; other scripts are rejected). Keys are kept in memory with millisecond expiry, so several app
+instances pointed at one server share their locks.
+
+Point the app at it with::
+
+    WORKSPACE_LOCKS=redis WORKSPACE_LOCK_REDIS_URL=redis://127.0.0.1:<port>/0 uvicorn app.main:app
+"""
+import logging
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class RespError(Exception):
+    pass
+
+
+def _encode(value, resp3: bool = False) -> bytes:
+    if value is None:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    if isinstance(value, RespError):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, bool):
+        return b"+OK\r\n" if value else _encode(None, resp3)
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, dict):
+        # RESP3 map (only sent to clients that asked for protocol 3)
+        return b"%%%d\r\n" % len(value) + b"".join(_encode(k, resp3) + _encode(v, resp3) for k, v in value.items())
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(item, resp3) for item in value)
+    raise TypeError(type(value))
+
+
+class MockRedisServer:
+    """
+    Threaded TCP server holding string keys with expiry.
+
+    Args:
+        latency_ms: Simulated latency added to every command
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.commands: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> "MockRedisServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Commands (called with self._lock held)
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def _set(self, args: List[bytes]):
+        key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+        ttl = None
+        for i, option in enumerate(options):
+            if option == b"PX":
+                ttl = int(args[3 + i]) / 1000.0
+            elif option == b"EX":
+                ttl = int(args[3 + i])
+        exists = self._get(key) is not None
+        if (b"NX" in options and exists) or (b"XX" in options and not exists):
+            return None
+        self.data[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        return True
+
+    def _pexpire(self, key: bytes, ms: int) -> int:
+        if self._get(key) is None:
+            return 0
+        self.data[key] = (self.data[key][0], time.monotonic() + ms / 1000.0)
+        return 1
+
+    def _eval(self, args: List[bytes]):
+        script, key_count = args[0].decode(), int(args[1])
+        keys, argv = args[2:2 + key_count], args[2 + key_count:]
+        # Only the lock scripts: "if get(KEYS[1]) == ARGV[1] then del / pexpire"
+        if "redis.call('get', KEYS[1]) == ARGV[1]" not in script:
+            return RespError("ERR unsupported script")
+        if self._get(keys[0]) != argv[0]:
+            return 0
+        if "'del'" in script:
+            del self.data[keys[0]]
+            return 1
+        if "'pexpire'" in script:
+            return self._pexpire(keys[0], int(argv[1]))
+        return RespError("ERR unsupported script")
+
+    def execute(self, args: List[bytes]):
+        command = args[0].decode().upper()
+        with self._lock:
+            self.commands[command] = self.commands.get(command, 0) + 1
+            if command == "PING":
+                return "PONG"
+            if command == "GET":
+                return self._get(args[1])
+            if command == "SET":
+                return self._set(args[1:])
+            if command == "DEL":
+                return sum(1 for key in args[1:] if self._get(key) is not None and self.data.pop(key))
+            if command == "PEXPIRE":
+                return self._pexpire(args[1], int(args[2]))
+            if command == "PTTL":
+                if self._get(args[1]) is None:
+                    return -2
+                expires = self.data[args[1]][1]
+                return -1 if expires is None else int((expires - time.monotonic()) * 1000)
+            if command == "EVAL":
+                return self._eval(args[1:])
+            if command == "SELECT":
+                return "OK"
+            if command == "HELLO":
+                info = {b"server": b"redis", b"version": b"7.0.0", b"proto": int(args[1]) if len(args) > 1 else 2}
+                if info[b"proto"] not in (2, 3):
+                    return RespError("NOPROTO unsupported protocol version")
+                if info[b"proto"] == 2:
+                    return [item for pair in info.items() for item in pair]
+                return info
+            return RespError(f"ERR unknown command '{command}'")
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def _read_command(self) -> Optional[List[bytes]]:
+                line = self.rfile.readline()
+                if not line:
+                    return None
+                if not line.startswith(b"*"):
+                    return line.strip().split()
+                args = []
+                for _ in range(int(line[1:])):
+                    size = int(self.rfile.readline()[1:])
+                    args.append(self.rfile.read(size + 2)[:-2])
+                return args
+
+            def handle(self):
+                resp3 = False
+                while True:
+                    args = self._read_command()
+                    if args is None:
+                        return
+                    if not args:
+                        continue
+                    if server.latency_ms:
+                        time.sleep(server.latency_ms / 1000.0)
+                    reply = server.execute(args)
+                    if isinstance(reply, dict):  # HELLO 3 switches the connection to RESP3
+                        resp3 = True
+                    self.wfile.write(_encode(reply, resp3))
+                    self.wfile.flush()
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the mock Redis server")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    mock = MockRedisServer(port=args.port, latency_ms=args.latency_ms)
+    mock.start()
+    logger.info(f"Mock Redis listening on {mock.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
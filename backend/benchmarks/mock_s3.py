@@ -0,0 +1,220 @@
+"""
+Minimal in-process S3-compatible object store (a MinIO stand-in).
+
+Speaks enough of the S3 REST API with path-style addressing for
+``app.services.storage.S3ObjectStore``: bucket create/head, object
+PUT/GET/HEAD/DELETE with ETags and ``If-None-Match``, and ListObjectsV2
+with prefix and delimiter. Requests are not authenticated. Objects are
+kept in memory, so several app instances pointed at one server behave like
+replicas sharing a bucket.
+
+Point the app at it with::
+
+    WORKSPACE_STORAGE=s3 WORKSPACE_S3_ENDPOINT=http://127.0.0.1:<port> \\
+    AWS_ACCESS_KEY_ID=test AWS_SECRET_ACCESS_KEY=test uvicorn app.main:app
+"""
+import hashlib
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger(__name__)
+
+
+def _decode_aws_chunked(body: bytes) -> bytes:
+    """Strip aws-chunked framing (``<hex size>[;ext]\\r\\n<data>\\r\\n`` ... trailers)"""
+    data = bytearray()
+    position = 0
+    while True:
+        line_end = body.index(b"\r\n", position)
+        size = int(body[position:line_end].split(b";")[0], 16)
+        position = line_end + 2
+        if size == 0:
+            return bytes(data)
+        data += body[position:position + size]
+        position += size + 2
+
+
+class MockS3Server:
+    """
+    Threaded HTTP server holding buckets of objects in memory.
+
+    Args:
+        latency_ms: Simulated latency added to every request
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.buckets: Dict[str, Dict[str, Tuple[bytes, str]]] = {}
+        self.requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def endpoint_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockS3Server":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, operation: str):
+        with self._lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+            def _parse(self):
+                parsed = urlparse(self.path)
+                bucket, _, key = unquote(parsed.path).lstrip("/").partition("/")
+                return bucket, key, {k: v[0] for k, v in parse_qs(parsed.query, keep_blank_values=True).items()}
+
+            def _send(self, status: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None,
+                      content_type: str = "application/xml"):
+                if server.latency_ms:
+                    time.sleep(server.latency_ms / 1000.0)
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if body or status not in (204, 304):
+                    self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body and self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _error(self, status: int, code: str):
+                body = f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><Error><Code>{code}</Code></Error>".encode()
+                self._send(status, body)
+
+            def _read_body(self) -> bytes:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if "aws-chunked" in self.headers.get("Content-Encoding", "") or self.headers.get("x-amz-decoded-content-length"):
+                    body = _decode_aws_chunked(body)
+                return body
+
+            def do_PUT(self):
+                bucket, key, _ = self._parse()
+                body = self._read_body()
+                if not key:
+                    with server._lock:
+                        server.buckets.setdefault(bucket, {})
+                    server._count("create_bucket")
+                    self._send(200)
+                    return
+                etag = f"\"{hashlib.md5(body).hexdigest()}\""
+                with server._lock:
+                    server.buckets.setdefault(bucket, {})[key] = (body, etag)
+                server._count("put")
+                self._send(200, headers={"ETag": etag})
+
+            def _get(self, head: bool):
+                bucket, key, query = self._parse()
+                objects = server.buckets.get(bucket)
+                if objects is None:
+                    self._error(404, "NoSuchBucket")
+                    return
+                if not key:
+                    if head:
+                        self._send(200)
+                    else:
+                        self._list(objects, query)
+                    return
+                server._count("head" if head else "get")
+                entry = objects.get(key)
+                if entry is None:
+                    if head:
+                        self._send(404)
+                    else:
+                        self._error(404, "NoSuchKey")
+                    return
+                body, etag = entry
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, headers={"ETag": etag})
+                    return
+                self._send(200, body, {"ETag": etag}, content_type="application/octet-stream")
+
+            def _list(self, objects: Dict[str, Tuple[bytes, str]], query: Dict[str, str]):
+                server._count("list")
+                prefix = query.get("prefix", "")
+                delimiter = query.get("delimiter", "")
+                keys, prefixes = [], set()
+                for key in sorted(objects):
+                    if not key.startswith(prefix):
+                        continue
+                    rest = key[len(prefix):]
+                    if delimiter and delimiter in rest:
+                        prefixes.add(prefix + rest.split(delimiter)[0] + delimiter)
+                    else:
+                        keys.append(key)
+                contents = "".join(
+                    f"<Contents><Key>{escape(key)}</Key><ETag>{escape(objects[key][1])}</ETag>"
+                    f"<Size>{len(objects[key][0])}</Size></Contents>" for key in keys
+                )
+                common = "".join(f"<CommonPrefixes><Prefix>{escape(p)}</Prefix></CommonPrefixes>" for p in sorted(prefixes))
+                body = (
+                    "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
+                    "<ListBucketResult xmlns=\"http://s3.amazonaws.com/doc/2006-03-01/\">"
+                    f"<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(keys) + len(prefixes)}</KeyCount>"
+                    f"<IsTruncated>false</IsTruncated>{contents}{common}</ListBucketResult>"
+                ).encode("utf-8")
+                self._send(200, body)
+
+            def do_GET(self):
+                self._get(head=False)
+
+            def do_HEAD(self):
+                self._get(head=True)
+
+            def do_DELETE(self):
+                bucket, key, _ = self._parse()
+                with server._lock:
+                    server.buckets.get(bucket, {}).pop(key, None)
+                server._count("delete")
+                self._send(204)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the mock S3 server")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    mock = MockS3Server(port=args.port, latency_ms=args.latency_ms)
+    mock.start()
+    logger.info(f"Mock S3 listening on {mock.endpoint_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
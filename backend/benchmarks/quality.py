@@ -0,0 +1,190 @@
+"""
+Offline quality metrics for generated HTML and CSS.
+
+Only the standard library is used so reports are reproducible anywhere:
+``html.parser`` for structural validity and a small tokenizer for CSS.
+"""
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Set
+
+# Elements that never have a closing tag
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+# Elements whose end tag may legally be omitted
+OPTIONAL_END = {"li", "p", "td", "th", "tr", "thead", "tbody", "tfoot", "option", "dt", "dd"}
+
+# Common framework prefixes whose classes are styled outside styles.css (Bootstrap)
+EXTERNAL_CLASS_PATTERN = re.compile(
+    r"^(container|row|col|btn|navbar|nav|card|d-|m[tbsexy]?-|p[tbsexy]?-|text-|bg-|bi|fs-|"
+    r"justify-|align-|flex-|g-|gap-|w-|h-|shadow|rounded|border|list-|form-|input-|display-|lead|fw-)"
+)
+
+
+class _StructureChecker(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack: List[str] = []
+        self.errors: List[str] = []
+        self.has_doctype = False
+        self.classes: Set[str] = set()
+        self.tag_count = 0
+
+    def handle_decl(self, decl):
+        if decl.lower().startswith("doctype"):
+            self.has_doctype = True
+
+    def handle_starttag(self, tag, attrs):
+        self.tag_count += 1
+        for name, value in attrs:
+            if name == "class" and value:
+                self.classes.update(value.split())
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.tag_count += 1
+        for name, value in attrs:
+            if name == "class" and value:
+                self.classes.update(value.split())
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        if tag not in self.stack:
+            self.errors.append(f"unexpected </{tag}>")
+            return
+        while self.stack:
+            open_tag = self.stack.pop()
+            if open_tag == tag:
+                break
+            if open_tag not in OPTIONAL_END:
+                self.errors.append(f"<{open_tag}> closed by </{tag}>")
+
+
+def html_metrics(html: str) -> Dict[str, object]:
+    """Structural validity of an HTML document"""
+    checker = _StructureChecker()
+    try:
+        checker.feed(html)
+        checker.close()
+    except Exception as e:
+        checker.errors.append(f"parser error: {e}")
+
+    unclosed = [tag for tag in checker.stack if tag not in OPTIONAL_END]
+    errors = checker.errors + [f"unclosed <{tag}>" for tag in unclosed]
+    lowered = html.lower()
+    return {
+        "valid": not errors and checker.has_doctype,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "has_doctype": checker.has_doctype,
+        "has_head": "<head" in lowered,
+        "has_body": "<body" in lowered,
+        "tags": checker.tag_count,
+        "classes": sorted(checker.classes),
+    }
+
+
+def _strip_css_comments(css: str, errors: List[str]) -> str:
+    result, index = [], 0
+    while True:
+        start = css.find("/*", index)
+        if start == -1:
+            result.append(css[index:])
+            break
+        result.append(css[index:start])
+        end = css.find("*/", start + 2)
+        if end == -1:
+            errors.append("unterminated comment")
+            break
+        index = end + 2
+    return "".join(result)
+
+
+def css_metrics(css: str) -> Dict[str, object]:
+    """Parse errors and selector inventory of a stylesheet"""
+    errors: List[str] = []
+    text = _strip_css_comments(css, errors)
+
+    depth, rules, selector_start = 0, 0, 0
+    declaration_blocks: List[str] = []
+    selectors: List[str] = []
+    block_start = 0
+
+    for index, ch in enumerate(text):
+        if ch == "{":
+            selector = text[selector_start:index].strip()
+            if not selector:
+                errors.append(f"empty selector at offset {index}")
+            selectors.append(selector)
+            depth += 1
+            block_start = index + 1
+        elif ch == "}":
+            if depth == 0:
+                errors.append(f"unmatched '}}' at offset {index}")
+            else:
+                depth -= 1
+                rules += 1
+                declaration_blocks.append(text[block_start:index])
+            selector_start = index + 1
+            block_start = index + 1
+        elif ch == ";" and depth == 0:
+            # Top-level at-rules such as @import end with a semicolon
+            selector_start = index + 1
+
+    if depth:
+        errors.append(f"{depth} unclosed block(s)")
+
+    for block in declaration_blocks:
+        # Nested blocks (media queries) contain selectors, skip those
+        if "{" in block:
+            continue
+        for declaration in block.split(";"):
+            declaration = declaration.strip()
+            if declaration and ":" not in declaration:
+                errors.append(f"declaration without ':' ({declaration[:30]})")
+
+    defined = set()
+    for selector in selectors:
+        if selector.startswith("@"):
+            continue
+        defined.update(re.findall(r"\.(-?[_a-zA-Z][\w-]*)", selector))
+
+    return {
+        "parse_errors": len(errors),
+        "error_samples": errors[:5],
+        "rules": rules,
+        "classes": sorted(defined),
+    }
+
+
+def class_coverage(html_classes: List[str], css_classes: List[str]) -> Dict[str, object]:
+    """
+    How well the HTML and CSS agree on class names.
+
+    ``html_styled`` is the share of (non-framework) HTML classes that have a
+    rule in the stylesheet, ``css_used`` the share of stylesheet classes that
+    appear in the HTML.
+    """
+    own_html = {c for c in html_classes if not EXTERNAL_CLASS_PATTERN.match(c)}
+    css = set(css_classes)
+    html_all = set(html_classes)
+
+    return {
+        "html_styled": round(len(own_html & css) / len(own_html), 3) if own_html else 1.0,
+        "css_used": round(len(css & html_all) / len(css), 3) if css else 1.0,
+        "unstyled_classes": sorted(own_html - css)[:10],
+        "unused_css_classes": sorted(css - html_all)[:10],
+    }
+
+
+def evaluate(html: str, css: str) -> Dict[str, object]:
+    """All quality metrics for one generated HTML/CSS pair"""
+    html_result = html_metrics(html)
+    css_result = css_metrics(css)
+    coverage = class_coverage(html_result.pop("classes"), css_result.pop("classes"))
+    return {"html": html_result, "css": css_result, "coverage": coverage}
@@ -0,0 +1,259 @@
+"""
+Deterministic generation benchmark.
+
+Runs the fixed prompt set in ``prompts.json`` through ``generate_code`` (and
+optionally the chunked ``CodeProcessor`` path for every template) against the
+replaying mock LLM, then writes a JSON report with latency, token and quality
+metrics that can be diffed across commits.
+
+Usage (from the backend directory):
+    python -m benchmarks.run_benchmark --out report.json
+    python -m benchmarks.run_benchmark --out new.json --baseline report.json
+    python -m benchmarks.run_benchmark --live-base-url http://localhost:8001   # e.g. a vLLM server with the fine-tuned model
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .mock_llm import MockLLMServer
+from .quality import evaluate
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCHMARK_DIR.parent
+REPORT_VERSION = 1
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _llm_stats(mock: Optional[MockLLMServer]) -> Dict[str, Any]:
+    return mock.snapshot_stats() if mock else {}
+
+
+def _prepare_sandbox() -> Path:
+    """Run in a scratch directory so benchmark workspaces never touch real ones"""
+    sandbox = Path(tempfile.mkdtemp(prefix="codegen-bench-"))
+    (sandbox / "workspaces").mkdir()
+    templates = BACKEND_DIR / "templates"
+    if templates.exists():
+        os.symlink(templates, sandbox / "templates", target_is_directory=True)
+    os.chdir(sandbox)
+    return sandbox
+
+
+async def _bench_generation(prompts: List[Dict[str, str]], mock: Optional[MockLLMServer]) -> List[Dict[str, Any]]:
+    from app.models.workspace import GenerationRequest
+    from app.routers import generation
+
+    results = []
+    for case in prompts:
+        if mock:
+            mock.reset_stats()
+
+        start = time.perf_counter()
+        error = None
+        files: Dict[str, str] = {}
+        try:
+            response = await generation.generate_code(
+                GenerationRequest(prompt=case["prompt"], workspace_name=f"bench-{case['id']}")
+            )
+            files = {f.name: f.content for f in response.files}
+        except Exception as e:
+            error = str(e)
+        latency_ms = (time.perf_counter() - start) * 1000.0
+
+        stats = _llm_stats(mock)
+        result: Dict[str, Any] = {
+            "id": case["id"],
+            "latency_ms": round(latency_ms, 1),
+            "llm_calls": stats.get("requests"),
+            "prompt_tokens": stats.get("prompt_tokens"),
+            "completion_tokens": stats.get("completion_tokens"),
+            "llm_simulated_ms": round(stats.get("simulated_latency_ms", 0.0), 1),
+            "error": error,
+        }
+        if mock:
+            result["overhead_ms"] = round(latency_ms - stats.get("simulated_latency_ms", 0.0), 1)
+        if not error:
+            result["quality"] = evaluate(files.get("index.html", ""), files.get("styles.css", ""))
+        results.append(result)
+        logger.info(f"{case['id']}: {latency_ms:.0f} ms{' (error)' if error else ''}")
+
+    return results
+
+
+async def _bench_chunked(prompt: str, mock: Optional[MockLLMServer]) -> List[Dict[str, Any]]:
+    from app.routers import generation
+
+    manager = generation.template_manager
+    results = []
+    for name in sorted(manager.list_templates()):
+        if mock:
+            mock.reset_stats()
+
+        start = time.perf_counter()
+        processed = await manager.process_template_with_requirements(name, prompt)
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        stats = _llm_stats(mock)
+
+        result: Dict[str, Any] = {
+            "template": name,
+            "latency_ms": round(latency_ms, 1),
+            "llm_calls": stats.get("requests"),
+            "prompt_tokens": stats.get("prompt_tokens"),
+            "completion_tokens": stats.get("completion_tokens"),
+            "error": None if processed else "processing failed",
+        }
+        if processed:
+            result["quality"] = evaluate(processed.get("html") or "", processed.get("css") or "")
+        results.append(result)
+
+    return results
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    ok = [r for r in results if not r.get("error")]
+    latencies = [r["latency_ms"] for r in ok]
+    summary: Dict[str, Any] = {
+        "cases": len(results),
+        "errors": len(results) - len(ok),
+        "latency_ms_mean": round(statistics.mean(latencies), 1) if latencies else 0.0,
+        "latency_ms_p50": round(_percentile(latencies, 50), 1),
+        "latency_ms_p95": round(_percentile(latencies, 95), 1),
+        "llm_calls": sum(r.get("llm_calls") or 0 for r in results),
+        "prompt_tokens": sum(r.get("prompt_tokens") or 0 for r in results),
+        "completion_tokens": sum(r.get("completion_tokens") or 0 for r in results),
+    }
+
+    qualities = [r["quality"] for r in ok if "quality" in r]
+    if qualities:
+        summary["html_valid_rate"] = round(sum(q["html"]["valid"] for q in qualities) / len(qualities), 3)
+        summary["html_errors"] = sum(q["html"]["errors"] for q in qualities)
+        summary["css_parse_errors"] = sum(q["css"]["parse_errors"] for q in qualities)
+        summary["class_coverage_html_styled"] = round(
+            statistics.mean(q["coverage"]["html_styled"] for q in qualities), 3)
+        summary["class_coverage_css_used"] = round(
+            statistics.mean(q["coverage"]["css_used"] for q in qualities), 3)
+
+    return summary
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Human-readable deltas between the summaries of two reports"""
+    lines = []
+    for section in ("generation", "chunked"):
+        new = report.get(section, {}).get("summary", {})
+        old = baseline.get(section, {}).get("summary", {})
+        for key in sorted(set(new) & set(old)):
+            if not isinstance(new[key], (int, float)) or new[key] == old[key]:
+                continue
+            delta = new[key] - old[key]
+            pct = f" ({delta / old[key]:+.1%})" if old[key] else ""
+            lines.append(f"{section}.{key}: {old[key]} -> {new[key]}{pct}")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the generation benchmark")
+    parser.add_argument("--out", default="benchmark-report.json", help="Where to write the JSON report")
+    parser.add_argument("--prompts", default=str(BENCHMARK_DIR / "prompts.json"))
+    parser.add_argument("--recordings", default=str(BENCHMARK_DIR / "recordings.json"),
+                        help="Recorded responses to replay (missing entries are synthesized)")
+    parser.add_argument("--record-from", default=None,
+                        help="Real completions URL to record unrecorded responses from")
+    parser.add_argument("--live-base-url", default=None,
+                        help="Benchmark a real OpenAI-compatible server instead of the mock")
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=500.0)
+    parser.add_argument("--chunked", action="store_true", help="Also benchmark the CodeProcessor chunked path")
+    parser.add_argument("--baseline", default=None, help="Previous report to compare against")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    out_path = Path(args.out).resolve()
+    baseline_path = Path(args.baseline).resolve() if args.baseline else None
+    recordings_path = str(Path(args.recordings).resolve())
+    prompts = json.loads(Path(args.prompts).read_text(encoding="utf-8"))
+
+    mock = None
+    if args.live_base_url:
+        os.environ["GROQ_API_BASE"] = args.live_base_url.rstrip("/")
+    else:
+        upstream_headers = {"Authorization": f"Bearer {os.getenv('GROQ_API_KEY', '')}"}
+        mock = MockLLMServer(
+            recordings_path=recordings_path,
+            ttft_ms=args.ttft_ms,
+            tokens_per_sec=args.tokens_per_sec,
+            upstream_url=args.record_from,
+            upstream_headers=upstream_headers,
+        ).start()
+        os.environ["GROQ_API_BASE"] = mock.base_url
+        # The mock has no rate limits, so neither should the client
+        os.environ.setdefault("GROQ_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault("GROQ_TOKENS_PER_MINUTE", "0")
+
+    # The app reads GROQ_API_BASE at import time, so import only after it is set
+    sys.path.insert(0, str(BACKEND_DIR))
+    original_cwd = os.getcwd()
+    sandbox = _prepare_sandbox()
+
+    try:
+        generation_results = asyncio.run(_bench_generation(prompts, mock))
+        report: Dict[str, Any] = {
+            "version": REPORT_VERSION,
+            "commit": _git_commit(),
+            "mode": "live" if args.live_base_url else "mock",
+            "mock": {"ttft_ms": args.ttft_ms, "tokens_per_sec": args.tokens_per_sec} if mock else None,
+            "generation": {"summary": summarize(generation_results), "cases": generation_results},
+        }
+        if args.chunked:
+            chunked_results = asyncio.run(_bench_chunked(prompts[0]["prompt"], mock))
+            report["chunked"] = {"summary": summarize(chunked_results), "cases": chunked_results}
+    finally:
+        if mock:
+            if args.record_from:
+                mock.save_recordings(recordings_path)
+            mock.stop()
+        os.chdir(original_cwd)
+        shutil.rmtree(sandbox, ignore_errors=True)
+
+    out_path.write_text(json.dumps(report, indent=2, sort_keys=True), encoding="utf-8")
+    print(f"Report written to {out_path}")
+
+    if baseline_path:
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        for line in compare(report, baseline) or ["No changes in summary metrics"]:
+            print(line)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
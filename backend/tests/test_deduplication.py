@@ -0,0 +1,202 @@
+import asyncio
+import json
+
+import httpx
+
+from app.services.deduplication import DeduplicationMiddleware
+
+
+class StubApp:
+    """Counts calls and answers with the given statuses (then 200), after a delay"""
+
+    def __init__(self, statuses=(), delay: float = 0.0):
+        self.calls = 0
+        self.statuses = list(statuses)
+        self.delay = delay
+
+    async def __call__(self, scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        self.calls += 1
+        call = self.calls
+        await asyncio.sleep(self.delay)
+        status = self.statuses.pop(0) if self.statuses else 200
+        payload = json.dumps({"call": call, "body": body.decode()}).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": payload})
+
+
+def run(middleware, *requests):
+    """Send the requests ((path, body, key) tuples) concurrently, each slightly after the previous one"""
+
+    async def main():
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            async def send(i, path, body, key):
+                await asyncio.sleep(0.02 * i)
+                headers = {"Idempotency-Key": key} if key is not None else {}
+                return await client.post(path, json=body, headers=headers)
+
+            return await asyncio.gather(*(send(i, *request) for i, request in enumerate(requests)))
+
+    return asyncio.run(main())
+
+
+def test_retry_with_the_same_key_replays_the_stored_response():
+    app = StubApp()
+    middleware = DeduplicationMiddleware(app)
+    first, = run(middleware, ("/api/update-file", {"a": 1}, "k1"))
+    retry, = run(middleware, ("/api/update-file", {"a": 1}, "k1"))
+
+    assert app.calls == 1
+    assert retry.status_code == 200 and retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+
+
+def test_key_reused_for_a_different_body_is_rejected():
+    app = StubApp(delay=0.2)
+    middleware = DeduplicationMiddleware(app)
+    # While the first request is in flight, and after it was stored
+    first, in_flight = run(middleware, ("/api/update-file", {"a": 1}, "k1"), ("/api/update-file", {"a": 2}, "k1"))
+    stored, = run(middleware, ("/api/update-file", {"a": 3}, "k1"))
+
+    assert first.status_code == 200
+    assert in_flight.status_code == 422
+    assert stored.status_code == 422
+    assert app.calls == 1
+
+
+def test_same_key_on_another_endpoint_is_a_different_request():
+    app = StubApp()
+    middleware = DeduplicationMiddleware(app)
+    run(middleware, ("/api/update-file", {"a": 1}, "k1"))
+    other, = run(middleware, ("/api/archive", {"a": 2}, "k1"))
+    assert other.status_code == 200
+    assert app.calls == 2
+
+
+def test_waiter_reruns_when_the_first_attempt_fails():
+    app = StubApp(statuses=[500], delay=0.2)
+    middleware = DeduplicationMiddleware(app)
+    first, waiter = run(middleware, ("/api/update-file", {"a": 1}, "k1"), ("/api/update-file", {"a": 1}, "k1"))
+
+    assert first.status_code == 500
+    assert waiter.status_code == 200
+    assert waiter.json()["call"] == 2
+    assert "idempotent-replayed" not in waiter.headers
+    assert app.calls == 2
+
+
+def test_waiter_reruns_when_the_first_attempt_raises():
+    class FailingOnce(StubApp):
+        async def __call__(self, scope, receive, send):
+            if self.calls == 0:
+                self.calls += 1
+                await asyncio.sleep(0.2)
+                raise RuntimeError("boom")
+            await super().__call__(scope, receive, send)
+
+    app = FailingOnce()
+    middleware = DeduplicationMiddleware(app)
+
+    async def main():
+        transport = httpx.ASGITransport(app=middleware, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            headers = {"Idempotency-Key": "k1"}
+            first = asyncio.ensure_future(client.post("/api/update-file", json={"a": 1}, headers=headers))
+            await asyncio.sleep(0.02)
+            waiter = await client.post("/api/update-file", json={"a": 1}, headers=headers)
+            return await first, waiter
+
+    first, waiter = asyncio.run(main())
+    assert first.status_code == 500
+    assert waiter.status_code == 200
+    assert app.calls == 2
+
+
+def test_server_errors_are_not_stored():
+    app = StubApp(statuses=[503])
+    middleware = DeduplicationMiddleware(app)
+    failed, = run(middleware, ("/api/update-file", {"a": 1}, "k1"))
+    retry, = run(middleware, ("/api/update-file", {"a": 1}, "k1"))
+    replay, = run(middleware, ("/api/update-file", {"a": 1}, "k1"))
+
+    assert failed.status_code == 503
+    assert retry.status_code == 200 and "idempotent-replayed" not in retry.headers
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert app.calls == 2
+
+
+def test_client_errors_are_stored():
+    app = StubApp(statuses=[404])
+    middleware = DeduplicationMiddleware(app)
+    run(middleware, ("/api/update-file", {"a": 1}, "k1"))
+    retry, = run(middleware, ("/api/update-file", {"a": 1}, "k1"))
+    assert retry.status_code == 404 and retry.headers["idempotent-replayed"] == "true"
+    assert app.calls == 1
+
+
+def test_stored_responses_expire_after_the_ttl():
+    app = StubApp()
+    middleware = DeduplicationMiddleware(app, ttl_seconds=0.1)
+    run(middleware, ("/api/update-file", {"a": 1}, "k1"))
+    asyncio.run(asyncio.sleep(0.15))
+    retry, = run(middleware, ("/api/update-file", {"a": 1}, "k1"))
+
+    assert "idempotent-replayed" not in retry.headers
+    assert app.calls == 2
+    assert len(middleware._completed) == 1
+
+
+def test_oldest_responses_are_evicted_past_max_entries():
+    app = StubApp()
+    middleware = DeduplicationMiddleware(app, max_entries=2)
+    for key in ("k1", "k2", "k3"):
+        run(middleware, ("/api/update-file", {"a": 1}, key))
+    newest, = run(middleware, ("/api/update-file", {"a": 1}, "k3"))
+    oldest, = run(middleware, ("/api/update-file", {"a": 1}, "k1"))
+
+    assert newest.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in oldest.headers
+    assert app.calls == 4
+
+
+def test_oldest_responses_are_evicted_past_max_bytes():
+    app = StubApp()
+    response_size = len(json.dumps({"call": 1, "body": json.dumps({"a": 1}, separators=(",", ":"))}))
+    middleware = DeduplicationMiddleware(app, max_bytes=2 * response_size + 5)
+    for key in ("k1", "k2", "k3"):
+        run(middleware, ("/api/update-file", {"a": 1}, key))
+
+    assert list(middleware._completed) == ["key:POST /api/update-file:k2", "key:POST /api/update-file:k3"]
+    assert middleware._stored_bytes == sum(len(entry[2].body) for entry in middleware._completed.values())
+
+
+def test_concurrent_identical_generations_are_coalesced_without_a_key():
+    app = StubApp(delay=0.2)
+    middleware = DeduplicationMiddleware(app)
+    first, duplicate, different = run(
+        middleware,
+        ("/api/generate", {"prompt": "a  bakery\n page"}, None),
+        ("/api/generate", {"prompt": "a bakery page"}, None),
+        ("/api/generate", {"prompt": "a flower shop"}, None),
+    )
+
+    assert first.json() == duplicate.json()
+    assert duplicate.headers["idempotent-replayed"] == "true"
+    assert different.json()["call"] == 2
+    assert app.calls == 2
+
+
+def test_requests_to_other_endpoints_pass_through_without_a_key():
+    app = StubApp(delay=0.1)
+    middleware = DeduplicationMiddleware(app)
+    run(middleware, ("/api/update-file", {"a": 1}, None), ("/api/update-file", {"a": 1}, None))
+    assert app.calls == 2
+    assert not middleware._completed
@@ -0,0 +1,171 @@
+import threading
+import time
+import uuid
+
+import pytest
+from langchain_core.outputs import LLMResult
+
+from app.agents import rate_limiting
+from app.services.llm_scheduler import BACKGROUND, INTERACTIVE, SPECULATIVE, LLMRateLimited, LLMScheduler
+
+# 100 tokens per second, so waits in these tests are fractions of a second
+TOKENS_PER_MINUTE = 6000
+
+
+def make_scheduler(**kwargs) -> LLMScheduler:
+    options = {
+        "requests_per_minute": 0,
+        "tokens_per_minute": TOKENS_PER_MINUTE,
+        "max_wait": {INTERACTIVE: 5.0, BACKGROUND: 5.0, SPECULATIVE: 0.0},
+    }
+    options.update(kwargs)
+    return LLMScheduler(**options)
+
+
+def drain(scheduler: LLMScheduler):
+    scheduler.acquire(TOKENS_PER_MINUTE)
+
+
+def test_disabled_scheduler_admits_everything():
+    scheduler = make_scheduler(tokens_per_minute=0)
+    assert not scheduler.enabled
+    assert scheduler.acquire(10 ** 9).tokens == 0
+
+
+def test_interactive_calls_are_admitted_before_queued_background_calls():
+    scheduler = make_scheduler()
+    drain(scheduler)
+    admitted = []
+
+    def call(priority):
+        scheduler.acquire(50, priority)
+        admitted.append(priority)
+
+    background = threading.Thread(target=call, args=(BACKGROUND,))
+    background.start()
+    time.sleep(0.1)
+    interactive = threading.Thread(target=call, args=(INTERACTIVE,))
+    interactive.start()
+    background.join()
+    interactive.join()
+
+    assert admitted == [INTERACTIVE, BACKGROUND]
+
+
+def test_calls_that_would_wait_past_max_wait_are_shed():
+    scheduler = make_scheduler(max_wait={INTERACTIVE: 0.2, BACKGROUND: 5.0, SPECULATIVE: 0.0})
+    drain(scheduler)
+
+    start = time.monotonic()
+    with pytest.raises(LLMRateLimited) as shed:
+        scheduler.acquire(100, INTERACTIVE)
+    assert time.monotonic() - start < 0.1
+    assert shed.value.retry_after == pytest.approx(1.0, abs=0.1)
+    assert shed.value.retry_after_header == "1"
+
+    # Speculative calls only run on spare budget
+    with pytest.raises(LLMRateLimited):
+        scheduler.acquire(1, SPECULATIVE)
+    # An explicit max_wait overrides the priority's
+    assert scheduler.acquire(10, INTERACTIVE, max_wait=1.0).waited > 0
+
+
+def test_calls_queued_ahead_count_towards_the_estimated_wait():
+    scheduler = make_scheduler(max_wait={INTERACTIVE: 5.0, BACKGROUND: 0.8, SPECULATIVE: 0.0})
+    drain(scheduler)
+    queued = threading.Thread(target=scheduler.acquire, args=(50, INTERACTIVE))
+    queued.start()
+    time.sleep(0.05)
+    try:
+        # 0.5s alone, but 1s behind the interactive call
+        with pytest.raises(LLMRateLimited):
+            scheduler.acquire(50, BACKGROUND)
+    finally:
+        queued.join()
+
+
+def test_full_queue_sheds():
+    scheduler = make_scheduler(max_queue=1)
+    drain(scheduler)
+    queued = threading.Thread(target=scheduler.acquire, args=(20, INTERACTIVE))
+    queued.start()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(LLMRateLimited):
+            scheduler.acquire(1, INTERACTIVE)
+    finally:
+        queued.join()
+
+
+def test_settle_returns_unused_tokens():
+    scheduler = make_scheduler()
+    reservation = scheduler.acquire(1000)
+    assert scheduler.tokens.level == pytest.approx(TOKENS_PER_MINUTE - 1000, abs=10)
+
+    scheduler.settle(reservation, 200)
+    assert scheduler.tokens.level == pytest.approx(TOKENS_PER_MINUTE - 200, abs=10)
+
+    # Unknown usage keeps the estimate
+    scheduler.settle(scheduler.acquire(1000), None)
+    assert scheduler.tokens.level == pytest.approx(TOKENS_PER_MINUTE - 1200, abs=10)
+
+
+def test_settle_never_fills_the_bucket_past_its_capacity():
+    scheduler = make_scheduler()
+    scheduler.settle(scheduler.acquire(10), 0)
+    scheduler.tokens.level = TOKENS_PER_MINUTE - 5
+    scheduler.settle(scheduler.acquire(100), 0)
+    assert scheduler.tokens.level <= TOKENS_PER_MINUTE
+
+
+def test_settle_charges_calls_that_used_more_than_reserved():
+    scheduler = make_scheduler()
+    scheduler.settle(scheduler.acquire(100), 1100)
+    assert scheduler.tokens.level == pytest.approx(TOKENS_PER_MINUTE - 1100, abs=10)
+
+
+def test_pause_holds_admission():
+    scheduler = make_scheduler()
+    scheduler.pause(0.3)
+    assert scheduler.snapshot()["paused_seconds"] > 0
+    with pytest.raises(LLMRateLimited):
+        scheduler.acquire(1, INTERACTIVE, max_wait=0.0)
+    assert scheduler.acquire(1, INTERACTIVE).waited >= 0.25
+    # A shorter pause does not shorten the current one
+    scheduler.pause(1.0)
+    scheduler.pause(0.1)
+    assert scheduler.snapshot()["paused_seconds"] > 0.5
+
+
+def test_observe_only_lowers_the_token_bucket():
+    scheduler = make_scheduler()
+    scheduler.observe({"x-ratelimit-remaining-tokens": "100"})
+    assert scheduler.tokens.level == pytest.approx(100, abs=5)
+
+    scheduler.observe({"x-ratelimit-remaining-tokens": "999999"})
+    assert scheduler.tokens.level == pytest.approx(100, abs=5)
+
+    for headers in ({}, {"x-ratelimit-remaining-tokens": "soon"}):
+        scheduler.observe(headers)
+        assert scheduler.tokens.level == pytest.approx(100, abs=5)
+
+
+def test_agent_rate_limiter_settles_each_turn_with_the_reported_usage(monkeypatch):
+    scheduler = make_scheduler()
+    monkeypatch.setattr(rate_limiting, "llm_scheduler", scheduler)
+    limiter = rate_limiting.SchedulerRateLimiter(tokens_per_call=3000)
+
+    assert limiter.acquire()
+    assert scheduler.tokens.level == pytest.approx(TOKENS_PER_MINUTE - 3000, abs=10)
+    limiter.on_llm_end(LLMResult(generations=[], llm_output={"token_usage": {"total_tokens": 400}}),
+                       run_id=uuid.uuid4())
+    assert scheduler.tokens.level == pytest.approx(TOKENS_PER_MINUTE - 400, abs=10)
+
+    # A failed turn keeps its reservation
+    assert limiter.acquire()
+    limiter.on_llm_error(RuntimeError("boom"), run_id=uuid.uuid4())
+    assert scheduler.tokens.level == pytest.approx(TOKENS_PER_MINUTE - 3400, abs=10)
+    # Calls without a reservation (e.g. answered from a cache) settle nothing
+    limiter.on_llm_end(LLMResult(generations=[], llm_output={"token_usage": {"total_tokens": 1}}),
+                       run_id=uuid.uuid4())
+    assert scheduler.tokens.level == pytest.approx(TOKENS_PER_MINUTE - 3400, abs=10)
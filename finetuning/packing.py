@@ -0,0 +1,316 @@
+"""
+Packed-sequence training data pipeline for the HTML/CSS QLoRA fine-tune.
+
+Instead of padding every article to a fixed 1024 tokens, examples are
+tokenized without padding (in parallel, cached on disk by content hash) and
+packed several-per-sequence. Each packed row keeps per-example position ids,
+so the collator can hand the model proper attention boundaries: either a
+flattened batch with resetting ``position_ids`` (flash-attention varlen path)
+or a block-diagonal causal mask for the eager/sdpa attention implementations.
+"""
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import torch
+from datasets import Dataset, load_from_disk
+from transformers import TrainerCallback
+
+logger = logging.getLogger(__name__)
+
+# Bump when the tokenization or packing logic changes so stale caches are ignored
+PIPELINE_VERSION = "1"
+
+# Format used for every training example
+TEXT_FORMAT = "{title}\n<start_html>\n{html_code}\n<end_html>\n<start_css>\n{css_code}\n<end_css>"
+
+IGNORE_INDEX = -100
+
+
+def format_example(example: Dict[str, Any]) -> Dict[str, str]:
+    """Build the training text for a single article"""
+    return {
+        "text": TEXT_FORMAT.format(
+            title=example.get("title") or "",
+            html_code=example.get("html_code") or "",
+            css_code=example.get("css_code") or "",
+        )
+    }
+
+
+def dataset_fingerprint(data_files: Sequence[str], tokenizer, max_length: int) -> str:
+    """
+    Hash everything that influences the tokenized dataset: the raw file
+    contents, the tokenizer and the pipeline settings.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{PIPELINE_VERSION}|{TEXT_FORMAT}|{max_length}".encode("utf-8"))
+    digest.update(f"{tokenizer.name_or_path}|{len(tokenizer)}|{tokenizer.eos_token_id}".encode("utf-8"))
+
+    for data_file in sorted(data_files):
+        with open(data_file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+
+    return digest.hexdigest()[:16]
+
+
+def tokenize_dataset(
+    dataset: Dataset,
+    tokenizer,
+    max_length: int,
+    fingerprint: str,
+    cache_dir: str = "./tokenized-cache",
+    num_proc: Optional[int] = None,
+) -> Dataset:
+    """
+    Tokenize the ``text`` column without padding, using several processes.
+
+    The result is saved as an Arrow dataset under ``cache_dir/<fingerprint>``
+    and reloaded on later runs with the same data and tokenizer.
+    """
+    cache_path = Path(cache_dir) / fingerprint
+    if cache_path.exists():
+        logger.info(f"Loading tokenized dataset from cache: {cache_path}")
+        return load_from_disk(str(cache_path))
+
+    if num_proc is None:
+        num_proc = max(1, (os.cpu_count() or 1) - 1)
+
+    eos_token_id = tokenizer.eos_token_id
+
+    def tokenize(batch):
+        # Leave room for the EOS token that separates packed examples
+        encoded = tokenizer(
+            batch["text"],
+            truncation=True,
+            max_length=max_length - 1,
+            add_special_tokens=True,
+        )
+        input_ids = [ids + [eos_token_id] for ids in encoded["input_ids"]]
+        return {"input_ids": input_ids, "length": [len(ids) for ids in input_ids]}
+
+    start = time.perf_counter()
+    tokenized = dataset.map(
+        tokenize,
+        batched=True,
+        num_proc=num_proc,
+        remove_columns=dataset.column_names,
+        desc="Tokenizing",
+    )
+    logger.info(f"Tokenized {len(tokenized)} examples in {time.perf_counter() - start:.1f}s with {num_proc} processes")
+
+    tokenized.save_to_disk(str(cache_path))
+    return tokenized
+
+
+def _first_fit_decreasing(lengths: List[int], max_length: int) -> List[List[int]]:
+    """Group example indices into bins of at most max_length tokens"""
+    bins: List[List[int]] = []
+    remaining: List[int] = []
+
+    for index in sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True):
+        length = lengths[index]
+        for bin_index, space in enumerate(remaining):
+            if length <= space:
+                bins[bin_index].append(index)
+                remaining[bin_index] -= length
+                break
+        else:
+            bins.append([index])
+            remaining.append(max_length - length)
+
+    return bins
+
+
+def pack_token_lists(token_lists: List[List[int]], max_length: int) -> List[Dict[str, List[int]]]:
+    """Pack a group of tokenized examples into rows with resetting position ids"""
+    rows = []
+    for bin_indices in _first_fit_decreasing([len(ids) for ids in token_lists], max_length):
+        input_ids, position_ids, seq_lengths = [], [], []
+        for index in bin_indices:
+            ids = token_lists[index]
+            input_ids.extend(ids)
+            position_ids.extend(range(len(ids)))
+            seq_lengths.append(len(ids))
+        rows.append({"input_ids": input_ids, "position_ids": position_ids, "seq_lengths": seq_lengths})
+    return rows
+
+
+def pack_dataset(
+    tokenized: Dataset,
+    max_length: int,
+    num_proc: Optional[int] = None,
+    batch_size: int = 2000,
+) -> Dataset:
+    """
+    Pack tokenized examples into rows of up to max_length tokens.
+
+    Packing is done with first-fit-decreasing inside each map batch, which
+    keeps it parallel and memory bounded while reaching high fill rates.
+    Every row keeps ``position_ids`` that restart at zero for each example,
+    marking the attention boundaries between packed examples.
+    """
+    if num_proc is None:
+        num_proc = max(1, (os.cpu_count() or 1) - 1)
+
+    def pack(batch):
+        rows = pack_token_lists(batch["input_ids"], max_length)
+        return {
+            "input_ids": [row["input_ids"] for row in rows],
+            "position_ids": [row["position_ids"] for row in rows],
+            "seq_lengths": [row["seq_lengths"] for row in rows],
+        }
+
+    packed = tokenized.map(
+        pack,
+        batched=True,
+        batch_size=batch_size,
+        num_proc=num_proc,
+        remove_columns=tokenized.column_names,
+        desc="Packing",
+    )
+    total_tokens = sum(sum(lengths) for lengths in packed["seq_lengths"])
+    logger.info(
+        f"Packed {len(tokenized)} examples into {len(packed)} rows "
+        f"(fill rate {total_tokens / max(1, len(packed) * max_length):.1%})"
+    )
+    return packed
+
+
+class TokenCounter:
+    """Shared counters filled by the collator and reported by ThroughputCallback"""
+
+    def __init__(self):
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.examples = 0
+
+    def reset(self):
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.examples = 0
+
+
+class PackedDataCollator:
+    """
+    Collate packed rows while keeping examples from attending to each other.
+
+    With ``flatten=True`` (flash-attention 2) the whole batch becomes a single
+    row without padding, and the resetting ``position_ids`` tell the varlen
+    kernel where each example starts. Otherwise rows are right-padded and a
+    4D block-diagonal causal mask is built for each row.
+    """
+
+    def __init__(self, pad_token_id: int, flatten: bool = True, counter: Optional[TokenCounter] = None):
+        self.pad_token_id = pad_token_id
+        self.flatten = flatten
+        self.counter = counter or TokenCounter()
+
+    def __call__(self, features: List[Dict[str, Any]]) -> Dict[str, torch.Tensor]:
+        if self.flatten:
+            batch = self._flatten(features)
+        else:
+            batch = self._pad_with_block_mask(features)
+
+        self.counter.real_tokens += sum(sum(f["seq_lengths"]) for f in features)
+        self.counter.padded_tokens += batch["input_ids"].numel()
+        self.counter.examples += sum(len(f["seq_lengths"]) for f in features)
+        return batch
+
+    @staticmethod
+    def _labels_for(input_ids: List[int], seq_lengths: List[int]) -> List[int]:
+        # The first token of every example must not be predicted from the previous one
+        labels = list(input_ids)
+        offset = 0
+        for length in seq_lengths:
+            labels[offset] = IGNORE_INDEX
+            offset += length
+        return labels
+
+    def _flatten(self, features: List[Dict[str, Any]]) -> Dict[str, torch.Tensor]:
+        input_ids, position_ids, labels = [], [], []
+        for feature in features:
+            input_ids.extend(feature["input_ids"])
+            position_ids.extend(feature["position_ids"])
+            labels.extend(self._labels_for(feature["input_ids"], feature["seq_lengths"]))
+
+        return {
+            "input_ids": torch.tensor([input_ids], dtype=torch.long),
+            "position_ids": torch.tensor([position_ids], dtype=torch.long),
+            "labels": torch.tensor([labels], dtype=torch.long),
+        }
+
+    def _pad_with_block_mask(self, features: List[Dict[str, Any]]) -> Dict[str, torch.Tensor]:
+        width = max(len(f["input_ids"]) for f in features)
+        batch_size = len(features)
+
+        input_ids = torch.full((batch_size, width), self.pad_token_id, dtype=torch.long)
+        position_ids = torch.zeros((batch_size, width), dtype=torch.long)
+        labels = torch.full((batch_size, width), IGNORE_INDEX, dtype=torch.long)
+        allowed = torch.zeros((batch_size, 1, width, width), dtype=torch.bool)
+
+        for row, feature in enumerate(features):
+            length = len(feature["input_ids"])
+            input_ids[row, :length] = torch.tensor(feature["input_ids"])
+            position_ids[row, :length] = torch.tensor(feature["position_ids"])
+            labels[row, :length] = torch.tensor(self._labels_for(feature["input_ids"], feature["seq_lengths"]))
+
+            offset = 0
+            for seq_length in feature["seq_lengths"]:
+                end = offset + seq_length
+                allowed[row, 0, offset:end, offset:end] = torch.ones((seq_length, seq_length), dtype=torch.bool).tril()
+                offset = end
+
+            # Keep padding rows attending to themselves so softmax never sees an all-masked row
+            for position in range(length, width):
+                allowed[row, 0, position, position] = True
+
+        # Additive float mask as expected by the eager/sdpa attention paths
+        attention_mask = torch.zeros(allowed.shape, dtype=torch.float32)
+        attention_mask.masked_fill_(~allowed, torch.finfo(torch.float32).min)
+
+        return {
+            "input_ids": input_ids,
+            "position_ids": position_ids,
+            "labels": labels,
+            "attention_mask": attention_mask,
+        }
+
+
+class ThroughputCallback(TrainerCallback):
+    """
+    Log effective (non-padding) tokens/sec next to padded tokens/sec.
+
+    ``padded_tokens_per_sec`` counts every position fed to the model,
+    ``unpacked_tokens_per_sec_equivalent`` is what the old fixed-length
+    pipeline would have needed for the same examples.
+    """
+
+    def __init__(self, counter: TokenCounter, max_length: int):
+        self.counter = counter
+        self.max_length = max_length
+        self._window_start = None
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.counter.reset()
+        self._window_start = time.perf_counter()
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs is None or self._window_start is None:
+            return
+
+        elapsed = time.perf_counter() - self._window_start
+        if elapsed <= 0 or self.counter.padded_tokens == 0:
+            return
+
+        logs["effective_tokens_per_sec"] = round(self.counter.real_tokens / elapsed, 1)
+        logs["padded_tokens_per_sec"] = round(self.counter.padded_tokens / elapsed, 1)
+        logs["unpacked_tokens_per_sec_equivalent"] = round(self.counter.examples * self.max_length / elapsed, 1)
+        logs["packing_efficiency"] = round(self.counter.real_tokens / self.counter.padded_tokens, 3)
+
+        self.counter.reset()
+        self._window_start = time.perf_counter()
@@ -0,0 +1,212 @@
+"""
+Streaming ingestion for HTML/CSS corpora larger than memory.
+
+Sharded JSONL or Parquet files are read lazily with ``datasets`` streaming,
+filtered for length/quality, deduplicated with MinHash LSH, tokenized and
+packed on the fly, and handed to the Trainer as an ``IterableDataset``.
+Only the LSH band index is held in memory, never the corpus itself.
+"""
+import glob
+import hashlib
+import logging
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence
+
+import numpy as np
+from datasets import IterableDataset, load_dataset
+
+from .packing import format_example, pack_token_lists
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_#.-]+|[<>{}:;=]")
+_TAG_PATTERN = re.compile(r"<\s*[a-zA-Z][^>]*>")
+
+
+def expand_data_files(patterns: Sequence[str]) -> List[str]:
+    """Expand glob patterns like ``shards/*.jsonl`` into a sorted file list"""
+    files: List[str] = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        files.extend(matches if matches else [pattern])
+    return files
+
+
+def _builder_for(data_files: Sequence[str]) -> str:
+    suffixes = {Path(f).suffix.lower() for f in data_files}
+    if suffixes <= {".parquet"}:
+        return "parquet"
+    if suffixes <= {".json", ".jsonl"}:
+        return "json"
+    raise ValueError(f"Cannot mix or stream these file types: {sorted(suffixes)}")
+
+
+class QualityFilter:
+    """Cheap length and content checks applied before deduplication"""
+
+    def __init__(
+        self,
+        min_chars: int = 200,
+        max_chars: int = 60000,
+        min_css_chars: int = 20,
+        max_non_ascii_ratio: float = 0.3,
+    ):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.min_css_chars = min_css_chars
+        self.max_non_ascii_ratio = max_non_ascii_ratio
+
+    def __call__(self, example: Dict[str, Any]) -> bool:
+        html = example.get("html_code") or ""
+        css = example.get("css_code") or ""
+        total = len(html) + len(css)
+
+        if total < self.min_chars or total > self.max_chars:
+            return False
+        if len(css.strip()) < self.min_css_chars or "{" not in css:
+            return False
+        if not _TAG_PATTERN.search(html):
+            return False
+
+        non_ascii = sum(1 for ch in html if ord(ch) > 127)
+        return non_ascii / max(1, len(html)) <= self.max_non_ascii_ratio
+
+
+class MinHashDeduplicator:
+    """
+    Near-duplicate detection with MinHash signatures and LSH banding.
+
+    Documents are shingled into token n-grams; two documents sharing every
+    row of at least one band are treated as duplicates and the later one is
+    dropped. Memory grows with the number of unique documents times
+    ``num_bands`` 8-byte keys.
+    """
+
+    def __init__(self, num_perm: int = 128, num_bands: int = 16, shingle_size: int = 5, seed: int = 1):
+        if num_perm % num_bands != 0:
+            raise ValueError("num_perm must be divisible by num_bands")
+
+        generator = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.num_bands = num_bands
+        self.rows_per_band = num_perm // num_bands
+        self.shingle_size = shingle_size
+        self._a = generator.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = generator.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._bands: List[set] = [set() for _ in range(num_bands)]
+        self.seen = 0
+        self.duplicates = 0
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        size = self.shingle_size
+        if len(tokens) < size:
+            shingles = {" ".join(tokens)}
+        else:
+            shingles = {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+            for s in shingles
+        ]
+        return np.array(hashes, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """Compute the MinHash signature of a document"""
+        hashes = self._shingle_hashes(text)
+        # Same permutation scheme as datasketch: (a * h + b) mod p, truncated to 32 bits
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+    def is_duplicate(self, text: str) -> bool:
+        """Check a document against everything seen so far and remember it"""
+        self.seen += 1
+        signature = self.signature(text)
+        keys = [
+            hash(signature[band * self.rows_per_band:(band + 1) * self.rows_per_band].tobytes())
+            for band in range(self.num_bands)
+        ]
+
+        if any(key in self._bands[band] for band, key in enumerate(keys)):
+            self.duplicates += 1
+            return True
+
+        for band, key in enumerate(keys):
+            self._bands[band].add(key)
+        return False
+
+
+def stream_examples(
+    data_files: Sequence[str],
+    quality_filter: QualityFilter = None,
+    deduplicator: MinHashDeduplicator = None,
+) -> Iterator[Dict[str, str]]:
+    """Yield formatted training texts from the shards, filtered and deduplicated"""
+    files = expand_data_files(data_files)
+    raw = load_dataset(_builder_for(files), data_files=files, split="train", streaming=True)
+    quality_filter = quality_filter or QualityFilter()
+    dropped = 0
+
+    for example in raw:
+        if not quality_filter(example):
+            dropped += 1
+            continue
+        if deduplicator is not None and deduplicator.is_duplicate(
+            f"{example.get('html_code') or ''}\n{example.get('css_code') or ''}"
+        ):
+            continue
+        yield format_example(example)
+
+    if deduplicator is not None:
+        logger.info(f"Streaming pass done: {dropped} filtered, {deduplicator.duplicates}/{deduplicator.seen} near-duplicates")
+
+
+def _packed_rows(
+    data_files: List[str],
+    tokenizer,
+    max_length: int,
+    pack_buffer_size: int,
+    dedup: bool,
+) -> Iterator[Dict[str, List[int]]]:
+    deduplicator = MinHashDeduplicator() if dedup else None
+    eos_token_id = tokenizer.eos_token_id
+    buffer: List[List[int]] = []
+
+    for example in stream_examples(data_files, deduplicator=deduplicator):
+        ids = tokenizer(example["text"], truncation=True, max_length=max_length - 1)["input_ids"]
+        buffer.append(ids + [eos_token_id])
+        if len(buffer) >= pack_buffer_size:
+            yield from pack_token_lists(buffer, max_length)
+            buffer = []
+
+    if buffer:
+        yield from pack_token_lists(buffer, max_length)
+
+
+def build_streaming_dataset(
+    data_files: Sequence[str],
+    tokenizer,
+    max_length: int,
+    pack_buffer_size: int = 512,
+    dedup: bool = True,
+) -> IterableDataset:
+    """
+    Build a packed, deduplicated IterableDataset for the Trainer.
+
+    Rows have the same ``input_ids``/``position_ids``/``seq_lengths`` layout
+    as ``pack_dataset`` so ``PackedDataCollator`` works unchanged. The
+    Trainer needs ``max_steps`` set because the length is unknown.
+    """
+    return IterableDataset.from_generator(
+        _packed_rows,
+        gen_kwargs={
+            "data_files": expand_data_files(data_files),
+            "tokenizer": tokenizer,
+            "max_length": max_length,
+            "pack_buffer_size": pack_buffer_size,
+            "dedup": dedup,
+        },
+    )
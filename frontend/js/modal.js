@@ -29,6 +29,26 @@ document.addEventListener('DOMContentLoaded', () => {
     openWorkspaceBtn.addEventListener('click', handleOpenWorkspace);
     existingWorkspaceSelect.addEventListener('change', handleExistingWorkspaceSelection);
     
+    // Let the backend match a template and warm up while the description is typed
+    const prefetchClientId = Math.random().toString(36).slice(2);
+    let prefetchTimer = null;
+    newWorkspacePrompt.addEventListener('input', () => {
+        clearTimeout(prefetchTimer);
+        prefetchTimer = setTimeout(() => {
+            const prompt = newWorkspacePrompt.value.trim();
+            if (!prompt) return;
+            fetch(`${API_URL}/api/prefetch`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    prompt: prompt,
+                    workspace_name: newWorkspaceName.value.trim() || null,
+                    client_id: prefetchClientId
+                })
+            }).catch(() => {});
+        }, 400);
+    });
+    
     // Modal tab switching
     modalTabs.forEach(tab => {
         tab.addEventListener('click', () => {
@@ -158,6 +178,7 @@ document.addEventListener('DOMContentLoaded', () => {
         }
         
         console.log(`Creating workspace: ${workspaceName}`);
+        clearTimeout(prefetchTimer);
         
         try {
             // Hide modal
@@ -11,7 +11,13 @@ let currentWorkspace = '';
 let currentFile = '';
 let workspaceDescriptions = {};
 let currentWorkspaceDescription = '';
-window._otherFileContent = '';
+// Editor content as last loaded or saved, to tell local edits from server-side changes
+let savedContent = '';
+
+// One key per user action: retries of the same action are executed only once by the backend
+function newIdempotencyKey() {
+    return window.crypto && crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
 
 // --- Workspace Loading ---
 async function loadWorkspaces() {
@@ -23,11 +29,21 @@ async function loadWorkspaces() {
     try {
         const res = await fetch(`${API_URL}/api/workspaces`);
         const workspaces = await res.json();
+        // Archived workspaces are listed without touching their files (which would rehydrate them)
+        const archived = new Set();
+        try {
+            const statusRes = await fetch(`${API_URL}/api/workspaces/status`);
+            if (statusRes.ok) {
+                const statusData = await statusRes.json();
+                statusData.workspaces.filter(w => w.state === 'archived').forEach(w => archived.add(w.name));
+            }
+        } catch {}
         for (const ws of workspaces) {
             const o = document.createElement('option');
             o.value = ws;
-            o.textContent = ws;
+            o.textContent = archived.has(ws) ? `${ws} (archived)` : ws;
             workspaceSelector.appendChild(o);
+            if (archived.has(ws)) continue;
             // Try to fetch description from README.md
             try {
                 const readmeRes = await fetch(`${API_URL}/api/workspace/${ws}/file/README.md`);
@@ -45,45 +61,170 @@ async function loadWorkspaces() {
 }
 
 workspaceSelector.addEventListener('change', () => {
+    if (currentWorkspace) live.unsubscribe(currentWorkspace);
     currentWorkspace = workspaceSelector.value;
+    currentBundle = null;
     if (currentWorkspace) {
+        live.subscribe(currentWorkspace);
         loadFiles(currentWorkspace);
     } else {
         fileList.innerHTML = '';
         currentFileSpan.textContent = 'No file selected';
         if (editor) editor.setValue('');
-        previewFrame.srcdoc = '';
+        showPreviewDocument('');
     }
 });
 refreshBtn.addEventListener('click', loadWorkspaces);
 
+// --- Live Updates ---
+// One WebSocket pushes file changes, generation output and agent progress of subscribed workspaces
+const live = {
+    socket: null,
+    workspaces: new Set(),
+    handlers: [],
+    retryDelay: 1000,
+    connect() {
+        const socket = new WebSocket(`${API_URL.replace(/^http/, 'ws')}/api/ws`);
+        this.socket = socket;
+        socket.onopen = () => {
+            this.retryDelay = 1000;
+            this.workspaces.forEach(ws => this.send({ action: 'subscribe', workspace: ws }));
+            // Events may have been missed while disconnected
+            if (currentWorkspace) refreshFiles(currentWorkspace);
+        };
+        socket.onmessage = e => {
+            const event = JSON.parse(e.data);
+            this.handlers.forEach(handler => handler(event));
+        };
+        socket.onclose = () => {
+            this.socket = null;
+            setTimeout(() => this.connect(), this.retryDelay);
+            this.retryDelay = Math.min(this.retryDelay * 2, 30000);
+        };
+    },
+    get connected() {
+        return !!this.socket && this.socket.readyState === WebSocket.OPEN;
+    },
+    send(message) {
+        if (this.connected) this.socket.send(JSON.stringify(message));
+    },
+    subscribe(workspace) {
+        this.workspaces.add(workspace);
+        this.send({ action: 'subscribe', workspace });
+    },
+    unsubscribe(workspace) {
+        this.workspaces.delete(workspace);
+        this.send({ action: 'unsubscribe', workspace });
+    },
+    on(handler) {
+        this.handlers.push(handler);
+        return () => { this.handlers = this.handlers.filter(h => h !== handler); };
+    }
+};
+
+live.on(event => {
+    if (event.workspace !== currentWorkspace) return;
+    if (event.type === 'files_changed') {
+        if (event.written.length || event.deleted.length) {
+            refreshFiles(currentWorkspace, event.written);
+            // A new version: show its bundle (or splice unsaved edits into it)
+            currentBundle = null;
+            updatePreview();
+        }
+    } else if (event.type === 'overflow') {
+        // Some events were dropped: refetch instead of trusting the stream
+        refreshFiles(currentWorkspace);
+    } else if (event.type === 'rehydrate_progress') {
+        fileList.innerHTML = `<li>Restoring archived workspace... ${Math.round(event.progress * 100)}%</li>`;
+    } else if (event.type === 'agent_progress') {
+        currentFileSpan.textContent = `${currentFile} (agent: ${event.stage === 'tool' ? event.tool : event.stage})`;
+    } else if (event.type === 'agent_finished') {
+        currentFileSpan.textContent = currentFile || 'No file selected';
+    }
+});
+
+// Update the file list after a server-side change, and the open file unless it has local edits
+async function refreshFiles(workspace, changed) {
+    try {
+        const res = await fetch(`${API_URL}/api/workspace/${workspace}/files`);
+        if (!res.ok || workspace !== currentWorkspace) return;
+        renderFiles(await res.json());
+    } catch {
+        return;
+    }
+    if (!currentFile || !editor || editor.getValue() !== savedContent) return;
+    if (changed && !changed.includes(currentFile)) return;
+    try {
+        const res = await fetch(`${API_URL}/api/workspace/${workspace}/file/${currentFile}`);
+        if (!res.ok || workspace !== currentWorkspace) return;
+        const data = await res.json();
+        if ((data.content || '') !== editor.getValue()) {
+            savedContent = data.content || '';
+            editor.setValue(savedContent);
+        }
+    } catch {}
+}
+
 // --- File List Loading ---
+// Show rehydration progress while an archived workspace is restored by the request in flight
+function watchRehydration(workspace) {
+    let active = true;
+    (async () => {
+        // Rehydration progress is pushed over the live connection when there is one
+        while (active && !live.connected) {
+            try {
+                const res = await fetch(`${API_URL}/api/workspace/${workspace}/status`);
+                if (res.ok) {
+                    const status = await res.json();
+                    if (!active) break;
+                    if (status.state === 'rehydrating') {
+                        fileList.innerHTML = `<li>Restoring archived workspace... ${Math.round(status.progress * 100)}%</li>`;
+                    } else if (status.state === 'archived') {
+                        fileList.innerHTML = '<li>Restoring archived workspace...</li>';
+                    }
+                }
+            } catch {}
+            await new Promise(resolve => setTimeout(resolve, 500));
+        }
+    })();
+    return () => { active = false; };
+}
+
 async function loadFiles(workspace) {
     fileList.innerHTML = '<li>Loading...</li>';
     currentWorkspaceDescription = workspaceDescriptions[workspace] || '';
+    const stopWatching = watchRehydration(workspace);
     try {
         const res = await fetch(`${API_URL}/api/workspace/${workspace}/files`);
+        stopWatching();
         const files = await res.json();
-        fileList.innerHTML = '';
-        if (!files.length) {
-            fileList.innerHTML = '<li>No files found</li>';
-            return;
-        }
-        files.forEach(f => {
-            const li = document.createElement('li');
-            li.textContent = f;
-            li.dataset.file = f;
-            li.onclick = () => selectFile(f);
-            fileList.appendChild(li);
-        });
+        renderFiles(files);
+        if (!files.length) return;
         // Auto-select index.html or first file
         if (files.includes('index.html')) selectFile('index.html');
         else selectFile(files[0]);
     } catch (e) {
+        stopWatching();
         fileList.innerHTML = '<li>Error loading files</li>';
     }
 }
 
+function renderFiles(files) {
+    fileList.innerHTML = '';
+    if (!files.length) {
+        fileList.innerHTML = '<li>No files found</li>';
+        return;
+    }
+    files.forEach(f => {
+        const li = document.createElement('li');
+        li.textContent = f;
+        li.dataset.file = f;
+        li.classList.toggle('active', f === currentFile);
+        li.onclick = () => selectFile(f);
+        fileList.appendChild(li);
+    });
+}
+
 // --- File Selection and Editor ---
 function selectFile(file) {
     currentFile = file;
@@ -100,7 +241,8 @@ async function loadFileContent(workspace, file) {
     try {
         const res = await fetch(`${API_URL}/api/workspace/${workspace}/file/${file}`);
         const data = await res.json();
-        editor.setValue(data.content || '');
+        savedContent = data.content || '';
+        editor.setValue(savedContent);
         setEditorMode(file);
         saveBtn.disabled = false;
         updatePreview();
@@ -122,6 +264,7 @@ saveBtn.onclick = async function() {
     if (!currentWorkspace || !currentFile) return;
     saveBtn.disabled = true;
     try {
+        savedContent = editor.getValue();
         await fetch(`${API_URL}/api/update-file`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -139,37 +282,88 @@ saveBtn.onclick = async function() {
 };
 
 // --- Editor and Preview ---
-function updatePreview() {
-    if (!currentWorkspace) return;
-    if (currentFile.endsWith('.html')) {
-        // Use the latest styles.css content if available
-        let cssContent = window._otherFileContent || '';
-        fetch(`${API_URL}/api/workspace/${currentWorkspace}/file/styles.css`).then(r => r.ok ? r.json() : {content:''}).then(cssData => {
-            let html = editor.getValue();
-            if (cssContent) {
-                html = html.replace('</head>', `<style>${cssContent}</style></head>`);
-            } else if (cssData.content) {
-                html = html.replace('</head>', `<style>${cssData.content}</style></head>`);
-            }
-            previewFrame.srcdoc = html;
-            window._otherFileContent = '';
-        });
-    } else if (currentFile.endsWith('.css')) {
-        // Use the latest index.html content if available
-        let htmlContent = window._otherFileContent || '';
-        if (htmlContent) {
-            previewFrame.srcdoc = htmlContent.replace('</head>', `<style>${editor.getValue()}</style></head>`);
-            window._otherFileContent = '';
+// The preview shows the bundle of the saved workspace version (GET /api/workspace/{name}/preview),
+// loaded by URL so the browser caches it. Only unsaved editor content is spliced into srcdoc.
+let currentBundle = null;
+let bundlePage = null;
+let previewSeq = 0;
+
+// Bundle info of the current version; the server rebuilds it only when sources changed
+async function loadBundle(workspace) {
+    const res = await fetch(`${API_URL}/api/workspace/${workspace}/preview`);
+    if (!res.ok) {
+        const data = await res.json().catch(() => ({}));
+        throw new Error(data.detail || `Preview not available (${res.status})`);
+    }
+    currentBundle = await res.json();
+    return currentBundle;
+}
+
+// HTML of the bundle's entry page, kept per bundle
+async function loadBundlePage(bundle) {
+    if (!bundlePage || bundlePage.hash !== bundle.hash) {
+        const res = await fetch(`${API_URL}${bundle.url}`);
+        bundlePage = { hash: bundle.hash, html: res.ok ? await res.text() : '' };
+    }
+    return bundlePage.html;
+}
+
+function showPreviewUrl(url) {
+    previewFrame.removeAttribute('srcdoc');
+    // An unchanged URL is not reloaded
+    if (previewFrame.src !== url) previewFrame.src = url;
+}
+
+function showPreviewDocument(html) {
+    previewFrame.removeAttribute('src');
+    previewFrame.srcdoc = html;
+}
+
+// Resolve relative links of spliced HTML against the bundle; head is added markup
+function withBundleBase(html, bundle, head = '') {
+    head = `<base href="${API_URL}${bundle.base_url}">` + head;
+    return /<head[^>]*>/i.test(html) ? html.replace(/<head[^>]*>/i, match => match + head) : head + html;
+}
+
+// Page with the stylesheet being edited inlined from the editor in place of its link
+function withEditedStylesheet(html, bundle, css) {
+    const name = currentFile.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
+    const link = new RegExp(`<link\\b[^>]*href=["']?(?:\\./)?${name}["'\\s>][^>]*>`, 'gi');
+    let inlined = false;
+    html = html.replace(link, () => {
+        if (inlined) return '';
+        inlined = true;
+        return `<style>${css}</style>`;
+    });
+    return withBundleBase(html, bundle, inlined ? '' : `<style>${css}</style>`);
+}
+
+async function updatePreview() {
+    const seq = ++previewSeq;
+    const workspace = currentWorkspace;
+    if (!workspace) return;
+    try {
+        const edited = editor && editor.getValue() !== savedContent;
+        if (edited && currentFile.endsWith('.html')) {
+            const bundle = currentBundle || await loadBundle(workspace);
+            if (seq !== previewSeq) return;
+            const html = editor.getValue();
+            const links = (bundle.stylesheets || []).filter(s => !html.includes(s))
+                .map(s => `<link rel="stylesheet" href="${s}">`).join('');
+            showPreviewDocument(withBundleBase(html, bundle, links));
+        } else if (edited && currentFile.endsWith('.css')) {
+            const bundle = currentBundle || await loadBundle(workspace);
+            const page = await loadBundlePage(bundle);
+            if (seq !== previewSeq) return;
+            showPreviewDocument(withEditedStylesheet(page, bundle, editor.getValue()));
         } else {
-            fetch(`${API_URL}/api/workspace/${currentWorkspace}/file/index.html`).then(r => r.ok ? r.json() : {content:''}).then(htmlData => {
-                let html = htmlData.content || '';
-                html = html.replace('</head>', `<style>${editor.getValue()}</style></head>`);
-                previewFrame.srcdoc = html;
-            });
+            const bundle = await loadBundle(workspace);
+            if (seq !== previewSeq) return;
+            showPreviewUrl(`${API_URL}${bundle.url}`);
         }
-    } else {
-        previewFrame.srcdoc = '';
-        window._otherFileContent = '';
+    } catch (e) {
+        if (seq !== previewSeq) return;
+        showPreviewDocument(`<div style="padding: 20px; font-family: Arial, sans-serif;"><h3>Preview not available</h3><p>${e.message}</p></div>`);
     }
 }
 
@@ -192,6 +386,7 @@ window.onload = function() {
         if (currentFile.endsWith('.html') || currentFile.endsWith('.css')) updatePreview();
     });
     loadWorkspaces();
+    live.connect();
 };
 
 // --- New Workspace Modal ---
@@ -201,11 +396,47 @@ const createNewWorkspaceBtn = document.getElementById('create-new-workspace');
 const cancelNewWorkspaceBtn = document.getElementById('cancel-new-workspace');
 const newWorkspaceNameInput = document.getElementById('new-workspace-name');
 const newWorkspacePromptInput = document.getElementById('new-workspace-prompt');
+const newWorkspaceProgress = document.getElementById('new-workspace-progress');
+
+// Show generated code as it streams in, until the returned function is called
+function showGeneration(workspace, output) {
+    return live.on(event => {
+        if (event.workspace !== workspace) return;
+        if (event.type === 'generation_started') {
+            output.textContent = '';
+        } else if (event.type === 'generation_tokens') {
+            output.textContent += event.text;
+            output.scrollTop = output.scrollHeight;
+        }
+    });
+}
+
+// Let the backend match a template and warm up while the prompt is typed
+const prefetchClientId = Math.random().toString(36).slice(2);
+let prefetchTimer = null;
+function schedulePrefetch() {
+    clearTimeout(prefetchTimer);
+    prefetchTimer = setTimeout(() => {
+        const prompt = newWorkspacePromptInput.value.trim();
+        if (!prompt) return;
+        fetch(`${API_URL}/api/prefetch`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                prompt,
+                workspace_name: newWorkspaceNameInput.value.trim() || null,
+                client_id: prefetchClientId
+            })
+        }).catch(() => {});
+    }, 400);
+}
+newWorkspacePromptInput.addEventListener('input', schedulePrefetch);
 
 newWorkspaceBtn.onclick = () => {
     newWorkspaceModal.style.display = 'flex';
     newWorkspaceNameInput.value = '';
     newWorkspacePromptInput.value = '';
+    newWorkspaceProgress.style.display = 'none';
     newWorkspaceNameInput.focus();
 };
 cancelNewWorkspaceBtn.onclick = () => {
@@ -218,11 +449,16 @@ createNewWorkspaceBtn.onclick = async () => {
         alert('Please enter both a workspace name and a prompt.');
         return;
     }
+    clearTimeout(prefetchTimer);
     createNewWorkspaceBtn.disabled = true;
+    newWorkspaceProgress.textContent = 'Generating...';
+    newWorkspaceProgress.style.display = 'block';
+    live.subscribe(name);
+    const stopShowing = showGeneration(name, newWorkspaceProgress);
     try {
         const res = await fetch(`${API_URL}/api/generate`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': newIdempotencyKey() },
             body: JSON.stringify({ workspace_name: name, prompt })
         });
         if (!res.ok) throw new Error('Failed to create workspace');
@@ -234,6 +470,8 @@ createNewWorkspaceBtn.onclick = async () => {
     } catch (e) {
         alert('Failed to create workspace');
     }
+    stopShowing();
+    if (name !== currentWorkspace) live.unsubscribe(name);
     createNewWorkspaceBtn.disabled = false;
 };
 
@@ -250,6 +488,13 @@ updateFileBtn.onclick = async function() {
     if (!prompt) return;
     updateFileBtn.disabled = true;
     filePromptInput.disabled = true;
+    let generated = 0;
+    const stopShowing = live.on(event => {
+        if (event.workspace === currentWorkspace && event.type === 'generation_tokens') {
+            generated += event.text.length;
+            currentFileSpan.textContent = `${currentFile} (generating... ${generated} chars)`;
+        }
+    });
     try {
         // Get previous code and workspace description
         const previous_code = editor.getValue();
@@ -260,7 +505,7 @@ updateFileBtn.onclick = async function() {
         if (!workspace_description) workspace_description = '';
         const res = await fetch(`${API_URL}/api/update-from-prompt`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': newIdempotencyKey() },
             body: JSON.stringify({
                 workspace_name: currentWorkspace,
                 file_name: currentFile,
@@ -272,26 +517,25 @@ updateFileBtn.onclick = async function() {
         if (!res.ok) throw new Error('Failed to update file');
         const data = await res.json();
 
-        // If backend returns both files' content:
+        // If backend returns both files' content (both are saved, so the preview bundle has them)
         if (data.files && Array.isArray(data.files)) {
             data.files.forEach(f => {
                 if (f.file_name === currentFile) {
-                    editor.setValue(f.content || '');
-                }
-                // If the other file (index.html or styles.css) is returned, update preview accordingly
-                if ((currentFile.endsWith('.html') && f.file_name === 'styles.css') ||
-                    (currentFile.endsWith('.css') && f.file_name === 'index.html')) {
-                    window._otherFileContent = f.content;
+                    savedContent = f.content || '';
+                    editor.setValue(savedContent);
                 }
             });
         } else if (data.content) {
-            editor.setValue(data.content || '');
+            savedContent = data.content || '';
+            editor.setValue(savedContent);
         }
         updatePreview();
         filePromptInput.value = '';
     } catch (e) {
         alert('Failed to update file');
     }
+    stopShowing();
+    currentFileSpan.textContent = currentFile;
     updateFileBtn.disabled = false;
     filePromptInput.disabled = false;
 }; 
\ No newline at end of file
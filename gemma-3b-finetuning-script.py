@@ -13,18 +13,36 @@ Original file is located at
 
 
 # 1. Imports
+import importlib.util
 from datasets import load_dataset
-from transformers import AutoTokenizer, AutoModelForCausalLM, TrainingArguments, Trainer, DataCollatorForLanguageModeling
+from transformers import AutoTokenizer, AutoModelForCausalLM, TrainingArguments, Trainer
 from peft import prepare_model_for_kbit_training, LoraConfig, get_peft_model, TaskType
 import torch
+from finetuning.packing import (
+    format_example,
+    dataset_fingerprint,
+    tokenize_dataset,
+    pack_dataset,
+    PackedDataCollator,
+    ThroughputCallback,
+)
+from finetuning.streaming import build_streaming_dataset
+
+MAX_LENGTH = 1024
+DATA_FILES = ["/content/gfg_html_css_articles_concurrency.json"]
+
+# Stream sharded corpora (e.g. ["/content/corpus/*.jsonl"] or Parquet shards) instead of loading them into RAM
+STREAMING = False
+
+# Flash-attention 2 handles packed rows natively via position_ids; otherwise fall back to block-diagonal masks
+USE_FLASH_ATTENTION = torch.cuda.is_available() and importlib.util.find_spec("flash_attn") is not None
 
 # 2. Load your dataset (replace with your path or use `load_dataset` with a script or file)
-dataset = load_dataset("json", data_files="/content/gfg_html_css_articles_concurrency.json", split="train")
+if not STREAMING:
+    dataset = load_dataset("json", data_files=DATA_FILES, split="train")
 
-# Keep only relevant fields
-dataset = dataset.map(lambda x: {
-    "text": f"{x['title']}\n<start_html>\n{x['html_code']}\n<end_html>\n<start_css>\n{x['css_code']}\n<end_css>"
-})
+    # Keep only relevant fields
+    dataset = dataset.map(format_example, remove_columns=dataset.column_names, num_proc=4)
 
 # 3. Load tokenizer and model (using Gemma 2B as an example; substitute with a 4-bit-supported model if needed)
 model_name = "google/gemma-2b"
@@ -44,7 +62,8 @@ model = AutoModelForCausalLM.from_pretrained(
     model_name,
     quantization_config=bnb_config,
     device_map="auto",
-    trust_remote_code=True
+    trust_remote_code=True,
+    attn_implementation="flash_attention_2" if USE_FLASH_ATTENTION else "eager"
 )
 
 model = prepare_model_for_kbit_training(model)
@@ -60,11 +79,14 @@ peft_config = LoraConfig(
 
 model = get_peft_model(model, peft_config)
 
-# 5. Tokenize data
-def tokenize(example):
-    return tokenizer(example["text"], truncation=True, padding="max_length", max_length=1024)
-
-tokenized_dataset = dataset.map(tokenize, batched=True, remove_columns=["text"])
+# 5. Tokenize (multiprocess, cached by content hash) and pack several examples per sequence
+if STREAMING:
+    # Lazily filtered, MinHash-deduplicated and packed; max_steps below bounds the run
+    packed_dataset = build_streaming_dataset(DATA_FILES, tokenizer, MAX_LENGTH)
+else:
+    fingerprint = dataset_fingerprint(DATA_FILES, tokenizer, MAX_LENGTH)
+    tokenized_dataset = tokenize_dataset(dataset, tokenizer, MAX_LENGTH, fingerprint)
+    packed_dataset = pack_dataset(tokenized_dataset, MAX_LENGTH)
 
 # 6. Training arguments
 training_args = TrainingArguments(
@@ -77,19 +99,21 @@ training_args = TrainingArguments(
     fp16=True,
     logging_steps=10,
     save_steps=100,
-    save_total_limit=2
+    save_total_limit=2,
+    remove_unused_columns=False  # The collator needs position_ids and seq_lengths
 )
 
-# 7. Data collator
-data_collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
+# 7. Data collator (keeps attention inside each packed example)
+data_collator = PackedDataCollator(pad_token_id=tokenizer.pad_token_id, flatten=USE_FLASH_ATTENTION)
 
 # 8. Trainer
 trainer = Trainer(
     model=model,
     args=training_args,
-    train_dataset=tokenized_dataset,
+    train_dataset=packed_dataset,
     tokenizer=tokenizer,
-    data_collator=data_collator
+    data_collator=data_collator,
+    callbacks=[ThroughputCallback(data_collator.counter, MAX_LENGTH)]
 )
 
 # 9. Train